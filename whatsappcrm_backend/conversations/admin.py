@@ -1,7 +1,7 @@
 # whatsappcrm_backend/conversations/admin.py
 
 from django.contrib import admin
-from .models import Contact, Message, ContactSession
+from .models import Contact, Message, MessageArchive, ContactSession
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
@@ -77,6 +77,12 @@ class MessageAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('contact') # 'app_config'
 
 
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('partition_name', 'range_start', 'range_end', 'row_count', 'contact_count', 'size_bytes', 'created_at')
+    readonly_fields = ('partition_name', 'range_start', 'range_end', 'path', 'row_count', 'contact_count', 'size_bytes', 'created_at')
+
+
 @admin.register(ContactSession)
 class ContactSessionAdmin(admin.ModelAdmin):
     list_display = ('contact', 'is_authenticated', 'authenticated_at', 'expires_at', 'last_activity_at')
@@ -0,0 +1,293 @@
+# whatsappcrm_backend/conversations/archive.py
+"""
+Cold archive of expired message partitions, and conversation history that
+reads through to it.
+
+Once every message in a partition (partitions.py) is older than
+CONVERSATION_EXPIRY_DAYS, retire_partition() streams its rows, ordered by
+contact and time, into MESSAGE_ARCHIVE_DIR/<partition>.jsonl.gz -- one JSON
+object per line with every Message column -- records a MessageArchive row
+and drops the partition, all in one transaction with the partition locked
+against writes. WebhookEventLog rows pointing at the archived messages are
+unlinked, as the ORM's SET_NULL would have done.
+
+The legacy partition (everything from before the table was partitioned) and
+the DEFAULT partition cannot be dropped month by month, so their expired
+months are trimmed instead: trim_month() archives one month to its own file
+(named after the partition holding it) and then deletes its rows a batch at
+a time, each batch in its own short transaction. By the time the legacy
+partition expires as a whole it has been trimmed empty, and dropping it
+streams nothing.
+
+Each contact's rows are written as their own gzip members (a file of
+concatenated members is still one valid gzip stream), and
+<partition>.index.json maps contact id to the byte offset and length of
+them, so one contact's month is read back by seeking to it and inflating a
+few kilobytes rather than the whole file.
+
+contact_history() pages through a contact's conversation newest first: live
+rows from the database, then, once those run out, the archived months
+rebuilt as unsaved Message instances (with `archived = True`), so a caller
+serialises both alike.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import partitions
+from .models import Contact, Message, MessageArchive
+
+logger = logging.getLogger(__name__)
+
+FIELDS = [f.attname for f in Message._meta.concrete_fields]
+DATETIME_FIELDS = [f.attname for f in Message._meta.concrete_fields if f.get_internal_type() == 'DateTimeField']
+MEMBER_ROWS = 1000  # rows per gzip member, so a very long conversation is not buffered whole
+SUFFIX = '.jsonl.gz'
+
+
+def _archive_dir() -> str:
+    return str(getattr(settings, 'MESSAGE_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'message_archive')))
+
+
+def _index_path(path: str) -> str:
+    return path[:-len(SUFFIX)] + '.index.json'
+
+
+def _messages_in(partition: partitions.Partition):
+    messages = Message.objects.filter(timestamp__lt=partition.end)
+    if partition.start is not None:
+        messages = messages.filter(timestamp__gte=partition.start)
+    return messages
+
+
+# --- Writing ------------------------------------------------------------------ #
+
+def _write_archive(partition: partitions.Partition, messages=None) -> MessageArchive:
+    """Stream the partition (or `messages`, rows within it) to its archive file
+    and index; returns the unsaved MessageArchive."""
+    directory = _archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, partition.name + SUFFIX)
+    index, rows = {}, 0
+
+    with open(path + '.tmp', 'wb') as out:
+        buffer, contact_id = [], None
+
+        def flush():
+            if buffer:
+                entry = index.setdefault(str(contact_id), [out.tell(), 0])
+                out.write(gzip.compress(b''.join(buffer)))
+                entry[1] = out.tell() - entry[0]
+                buffer.clear()
+
+        for row in ((messages if messages is not None else _messages_in(partition))
+                    .order_by('contact_id', 'timestamp', 'id')
+                    .values(*FIELDS).iterator(chunk_size=2000)):
+            if row['contact_id'] != contact_id or len(buffer) >= MEMBER_ROWS:
+                flush()
+                contact_id = row['contact_id']
+            buffer.append(json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')).encode() + b'\n')
+            rows += 1
+        flush()
+        out.flush()
+        os.fsync(out.fileno())
+
+    with open(_index_path(path) + '.tmp', 'w') as out:
+        json.dump(index, out, separators=(',', ':'))
+    os.replace(_index_path(path) + '.tmp', _index_path(path))
+    os.replace(path + '.tmp', path)
+    return MessageArchive(partition_name=partition.name, range_start=partition.start, range_end=partition.end,
+                          path=path, row_count=rows, contact_count=len(index), size_bytes=os.path.getsize(path))
+
+
+def retire_partition(partition: partitions.Partition, archive: bool = True) -> Optional[MessageArchive]:
+    """Archive (unless `archive` is False) and drop one expired partition."""
+    from meta_integration.models import WebhookEventLog
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {connection.ops.quote_name(partition.name)} IN SHARE MODE")
+        record = None
+        expected = _messages_in(partition).count() if archive else 0
+        if expected:
+            record = _write_archive(partition)
+            if record.row_count != expected:
+                raise RuntimeError(f"Archived {record.row_count} of {expected} messages from {partition.name}; not dropping it.")
+            MessageArchive.objects.filter(partition_name=partition.name).delete()
+            record.save()
+        WebhookEventLog.objects.filter(message_id__in=_messages_in(partition).values('id')).update(message=None)
+        partitions.drop_partition(partition)
+    if record is not None:
+        logger.info(f"Archived {record.row_count} messages from {partition.name} to {record.path}.")
+    return record
+
+
+def expired_months(cutoff: datetime) -> List[partitions.Partition]:
+    """
+    The whole months older than `cutoff` that hold messages but cannot be
+    dropped as a partition: those in the legacy partition or, once it is
+    gone, in the DEFAULT partition below the oldest monthly partition.
+    """
+    ranged = partitions.list_partitions()
+    if not ranged:
+        return []
+    if ranged[0].start is None:
+        holder, below = partitions.LEGACY_TABLE, ranged[0].end
+    else:
+        holder, below = partitions.DEFAULT_PARTITION, ranged[0].start
+    end = min(below, partitions.month_start(cutoff))
+    oldest = Message.objects.filter(timestamp__lt=end).aggregate(oldest=Min('timestamp'))['oldest']
+    months = []
+    start = partitions.month_start(oldest) if oldest else end
+    while start < end:
+        stop = partitions.next_month(start)
+        if Message.objects.filter(timestamp__gte=start, timestamp__lt=stop).exists():
+            months.append(partitions.Partition(f'{holder}_{start:%Y_%m}', start, stop))
+        start = stop
+    return months
+
+
+def trim_month(month: partitions.Partition, archive: bool = True, batch_size: int = 1000) -> Optional[MessageArchive]:
+    """Archive (unless `archive` is False) one expired month of a partition
+    that is not dropped whole, then delete its rows in batches."""
+    messages = _messages_in(month)
+    # Rows arriving for this month from here on are left for the next run.
+    last_id = messages.aggregate(last=Max('id'))['last']
+    if last_id is None:
+        return None
+    messages = messages.filter(id__lte=last_id)
+    record = None
+    if archive:
+        # A month trimmed again (late rows) gets a file of its own.
+        earlier = MessageArchive.objects.filter(partition_name__startswith=month.name).count()
+        if earlier:
+            month = partitions.Partition(f'{month.name}_{earlier + 1}', month.start, month.end)
+        record = _write_archive(month, messages)
+        record.save()
+
+    deleted = 0
+    while True:
+        ids = list(messages.order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            # The ORM's SET_NULL unlinks WebhookEventLog rows.
+            deleted += Message.objects.filter(id__in=ids).delete()[1].get(Message._meta.label, 0)
+    if record is not None and deleted != record.row_count:
+        logger.warning(f"Archived {record.row_count} but deleted {deleted} messages from {month.name}.")
+    logger.info(f"Trimmed {deleted} expired messages from {month.name}"
+                + (f", archived to {record.path}." if record is not None else "."))
+    return record
+
+
+def retire_expired_partitions(now: Optional[datetime] = None, days: Optional[int] = None,
+                              archive: bool = True) -> List[partitions.Partition]:
+    """Trim the expired months of the legacy/default partitions, then archive
+    and drop every partition older than the retention period. Returns the
+    months and partitions retired."""
+    days = days if days is not None else int(getattr(settings, 'CONVERSATION_EXPIRY_DAYS', 60))
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    months = expired_months(cutoff)
+    for month in months:
+        trim_month(month, archive=archive)
+    expired = partitions.expired_partitions(cutoff)
+    for partition in expired:
+        retire_partition(partition, archive=archive)
+    return months + expired
+
+
+# --- Reading ------------------------------------------------------------------ #
+
+@lru_cache(maxsize=32)
+def _load_index(path: str, mtime: float) -> dict:
+    with open(path) as index_file:
+        return json.load(index_file)
+
+
+def _archived_rows(record: MessageArchive, contact_id: int) -> List[dict]:
+    try:
+        index_path = _index_path(record.path)
+        entry = _load_index(index_path, os.path.getmtime(index_path)).get(str(contact_id))
+        if entry is None:
+            return []
+        with open(record.path, 'rb') as archive_file:
+            archive_file.seek(entry[0])
+            data = gzip.decompress(archive_file.read(entry[1]))
+    except OSError:
+        logger.warning(f"Message archive {record.path} is unreadable; its history is left out.", exc_info=True)
+        return []
+    rows = []
+    for line in data.splitlines():
+        row = json.loads(line)
+        for name in DATETIME_FIELDS:
+            if row.get(name):
+                row[name] = parse_datetime(row[name])
+        rows.append(row)
+    return rows
+
+
+def _is_older(row: dict, before: Optional[datetime], before_id: Optional[int]) -> bool:
+    if before is None:
+        return True
+    if before_id is None:
+        return row['timestamp'] < before
+    return (row['timestamp'], row['id']) < (before, before_id)
+
+
+@dataclass
+class HistoryPage:
+    messages: List[Message] = field(default_factory=list)
+    # Pass both back as before/before_id for the next (older) page; None when there is none.
+    next_before: Optional[datetime] = None
+    next_before_id: Optional[int] = None
+
+
+def contact_history(contact: Contact, before: Optional[datetime] = None, before_id: Optional[int] = None,
+                    limit: int = 50) -> HistoryPage:
+    """
+    Up to `limit` of the contact's messages, newest first, older than the
+    (before, before_id) cursor: from the database, then from the archives.
+    """
+    live = Message.objects.filter(contact=contact)
+    if before is not None:
+        older = Q(timestamp__lt=before)
+        if before_id is not None:
+            older |= Q(timestamp=before, id__lt=before_id)
+        live = live.filter(older)
+    messages = list(live.order_by('-timestamp', '-id')[:limit])
+    for message in messages:
+        message.contact = contact
+
+    if len(messages) < limit:
+        records = MessageArchive.objects.all()
+        if before is not None:
+            records = records.filter(Q(range_start__isnull=True) | Q(range_start__lte=before))
+        for record in records:
+            rows = [row for row in _archived_rows(record, contact.pk) if _is_older(row, before, before_id)]
+            rows.sort(key=lambda row: (row['timestamp'], row['id']), reverse=True)
+            for row in rows[:limit - len(messages)]:
+                message = Message(**row)
+                message.contact = contact
+                message.archived = True
+                messages.append(message)
+            if len(messages) >= limit:
+                break
+
+    page = HistoryPage(messages=messages)
+    if len(messages) == limit:
+        page.next_before, page.next_before_id = messages[-1].timestamp, messages[-1].id
+    return page
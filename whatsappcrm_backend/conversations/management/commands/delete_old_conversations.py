@@ -7,12 +7,17 @@ from datetime import timedelta
 from django.conf import settings
 from django.db import transaction
 
+from conversations import partitions
+from conversations.archive import expired_months, retire_partition, trim_month
 from conversations.models import Message, Contact # Ensure your models are correctly imported
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Deletes messages older than a specified number of days (defined in settings.CONVERSATION_EXPIRY_DAYS).'
+    help = (
+        'Deletes messages older than a specified number of days (defined in settings.CONVERSATION_EXPIRY_DAYS). '
+        'Once the message table is partitioned (partition_messages), expired months are archived and dropped instead.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -36,6 +41,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Simulate the deletion process without actually deleting any data.'
         )
+        parser.add_argument(
+            '--no-archive',
+            action='store_true',
+            help='On a partitioned message table, drop expired months without archiving them first.'
+        )
 
     def handle(self, *args, **options):
         expiry_days = options['days'] if options['days'] is not None else settings.CONVERSATION_EXPIRY_DAYS
@@ -54,40 +64,16 @@ class Command(BaseCommand):
         if dry_run:
             self.stdout.write(self.style.WARNING("DRY RUN active. No data will be deleted."))
 
+        partitioned = partitions.is_partitioned()
+        if partitioned:
+            # Whole expired months are archived and dropped (conversations/archive.py).
+            self.retire_partitions(cutoff_date, archive=not options['no_archive'], dry_run=dry_run,
+                                   batch_size=batch_size)
+
         try:
             with transaction.atomic(): # Ensure all or nothing if an error occurs mid-process
-                # Delete old messages in batches
-                messages_to_delete_qs = Message.objects.filter(timestamp__lt=cutoff_date)
-                total_messages_to_delete = messages_to_delete_qs.count()
-
-                if total_messages_to_delete == 0:
-                    self.stdout.write(self.style.SUCCESS("No messages found older than the cutoff date."))
-                else:
-                    self.stdout.write(f"Found {total_messages_to_delete} messages to delete.")
-                    
-                    deleted_messages_count = 0
-                    # Iterating over a queryset with delete() in batches
-                    # Slicing creates new querysets, so we loop until no more matching records
-                    while True:
-                        batch_to_delete_ids = list(messages_to_delete_qs.values_list('id', flat=True)[:batch_size])
-                        if not batch_to_delete_ids:
-                            break
-                        
-                        if not dry_run:
-                            num_deleted, _ = Message.objects.filter(id__in=batch_to_delete_ids).delete()
-                            deleted_messages_count += num_deleted
-                        else:
-                            # In dry run, just count them as if they were deleted
-                            deleted_messages_count += len(batch_to_delete_ids)
-                        
-                        self.stdout.write(f"Processed batch. Total messages deleted so far: {deleted_messages_count}/{total_messages_to_delete}")
-                        if dry_run and deleted_messages_count >= total_messages_to_delete : # Ensure dry run loop terminates
-                            break
-
-
-                    self.stdout.write(self.style.SUCCESS(
-                        f"Successfully {'simulated deletion of' if dry_run else 'deleted'} {deleted_messages_count} old messages."
-                    ))
+                if not partitioned:
+                    self.delete_messages_in_batches(cutoff_date, batch_size, dry_run)
 
                 # Optionally, delete contacts with no remaining messages and old last_seen
                 if delete_contacts_flag:
@@ -135,6 +121,64 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS("Old conversation deletion process finished."))
 
+    def retire_partitions(self, cutoff_date, archive, dry_run, batch_size):
+        # Months of the legacy/default partitions are trimmed in batches; they cannot be dropped yet.
+        for month in expired_months(cutoff_date):
+            if dry_run:
+                self.stdout.write(f"Would {'archive and ' if archive else ''}delete {month.name} in batches.")
+                continue
+            record = trim_month(month, archive=archive, batch_size=batch_size)
+            if record is not None:
+                self.stdout.write(f"Archived {record.row_count} messages from {month.name} to {record.path}.")
+            self.stdout.write(self.style.SUCCESS(f"Deleted the expired messages of {month.name}."))
+
+        expired = partitions.expired_partitions(cutoff_date)
+        if not expired:
+            self.stdout.write(self.style.SUCCESS("No message partitions are entirely older than the cutoff date."))
+            return
+        for partition in expired:
+            if dry_run:
+                self.stdout.write(f"Would {'archive and ' if archive else ''}drop {partition.name}.")
+                continue
+            record = retire_partition(partition, archive=archive)
+            if record is not None:
+                self.stdout.write(f"Archived {record.row_count} messages from {partition.name} to {record.path}.")
+            self.stdout.write(self.style.SUCCESS(f"Dropped message partition {partition.name}."))
+
+    def delete_messages_in_batches(self, cutoff_date, batch_size, dry_run):
+        """Row-by-row retention, for a table not yet converted with partition_messages."""
+        messages_to_delete_qs = Message.objects.filter(timestamp__lt=cutoff_date)
+        total_messages_to_delete = messages_to_delete_qs.count()
+
+        if total_messages_to_delete == 0:
+            self.stdout.write(self.style.SUCCESS("No messages found older than the cutoff date."))
+        else:
+            self.stdout.write(f"Found {total_messages_to_delete} messages to delete.")
+            
+            deleted_messages_count = 0
+            # Iterating over a queryset with delete() in batches
+            # Slicing creates new querysets, so we loop until no more matching records
+            while True:
+                batch_to_delete_ids = list(messages_to_delete_qs.values_list('id', flat=True)[:batch_size])
+                if not batch_to_delete_ids:
+                    break
+                
+                if not dry_run:
+                    num_deleted, _ = Message.objects.filter(id__in=batch_to_delete_ids).delete()
+                    deleted_messages_count += num_deleted
+                else:
+                    # In dry run, just count them as if they were deleted
+                    deleted_messages_count += len(batch_to_delete_ids)
+                
+                self.stdout.write(f"Processed batch. Total messages deleted so far: {deleted_messages_count}/{total_messages_to_delete}")
+                if dry_run and deleted_messages_count >= total_messages_to_delete : # Ensure dry run loop terminates
+                    break
+
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Successfully {'simulated deletion of' if dry_run else 'deleted'} {deleted_messages_count} old messages."
+            ))
+
     def queryset_iterator(self, queryset, chunk_size=1000):
         """
         Iterate over a Django Queryset ordered by the primary key
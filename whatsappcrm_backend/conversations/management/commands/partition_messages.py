@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from conversations.partitions import LEGACY_TABLE, convert_to_partitioned, ensure_partitions, is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts conversations_message into monthly range partitions "
+        "(conversations/partitions.py), so expired months are archived and "
+        "dropped instead of deleted row by row. Existing rows stay where they "
+        f"are, as the {LEGACY_TABLE} partition. Takes an exclusive lock on the "
+        "table while it runs; safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--list', action='store_true', help='Only list the partitions.')
+
+    def handle(self, *args, **options):
+        if not options['list']:
+            try:
+                if is_partitioned():
+                    ensure_partitions()
+                else:
+                    convert_to_partitioned()
+            except RuntimeError as e:
+                raise CommandError(str(e))
+        partitions = list_partitions()
+        if not partitions:
+            self.stdout.write("conversations_message is not partitioned.")
+        for partition in partitions:
+            start = f"{partition.start:%Y-%m-%d}" if partition.start else "(start)"
+            self.stdout.write(f"{partition.name}: {start} .. {partition.end:%Y-%m-%d}")
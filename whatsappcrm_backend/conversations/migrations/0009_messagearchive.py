@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0008_contactsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition_name', models.CharField(max_length=63, unique=True)),
+                ('range_start', models.DateTimeField(blank=True, help_text='First instant covered (empty: no lower bound).', null=True)),
+                ('range_end', models.DateTimeField(help_text='End of the range covered (exclusive).')),
+                ('path', models.CharField(help_text='The .jsonl.gz file; its contact index sits next to it.', max_length=500)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('contact_count', models.PositiveIntegerField(default=0)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Message Archive',
+                'verbose_name_plural': 'Message Archives',
+                'ordering': ['-range_end'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0009_messagearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation_id_from_meta',
+            field=models.CharField(blank=True, help_text='Meta conversation ID reported in status updates.', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='pricing_model_from_meta',
+            field=models.CharField(blank=True, help_text='Meta pricing model reported in status updates (e.g. CBP).', max_length=50, null=True),
+        ),
+    ]
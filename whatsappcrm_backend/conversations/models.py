@@ -163,6 +163,8 @@ class Message(models.Model):
     )
     status_timestamp = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the last status update.")
     error_details = models.JSONField(null=True, blank=True, help_text="Error details if message sending failed.")
+    conversation_id_from_meta = models.CharField(max_length=255, null=True, blank=True, help_text="Meta conversation ID reported in status updates.")
+    pricing_model_from_meta = models.CharField(max_length=50, null=True, blank=True, help_text="Meta pricing model reported in status updates (e.g. CBP).")
 
     # Timestamps for specific statuses (optional, can be derived from status_timestamp and status)
     # sent_at = models.DateTimeField(null=True, blank=True)
@@ -209,6 +211,30 @@ class Message(models.Model):
         ]
 
 
+class MessageArchive(models.Model):
+    """
+    A month of messages that was streamed to a compressed JSONL file and
+    dropped from the database (conversations/archive.py). Old conversation
+    history is read back from these files.
+    """
+    partition_name = models.CharField(max_length=63, unique=True)
+    range_start = models.DateTimeField(null=True, blank=True, help_text="First instant covered (empty: no lower bound).")
+    range_end = models.DateTimeField(help_text="End of the range covered (exclusive).")
+    path = models.CharField(max_length=500, help_text="The .jsonl.gz file; its contact index sits next to it.")
+    row_count = models.PositiveIntegerField(default=0)
+    contact_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive {self.partition_name} ({self.row_count} messages)"
+
+    class Meta:
+        ordering = ['-range_end']
+        verbose_name = "Message Archive"
+        verbose_name_plural = "Message Archives"
+
+
 class ContactSession(models.Model):
     """
     Tracks authentication sessions for WhatsApp contacts.
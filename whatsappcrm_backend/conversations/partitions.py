@@ -0,0 +1,236 @@
+# whatsappcrm_backend/conversations/partitions.py
+"""
+Monthly range partitions for conversations_message (PostgreSQL).
+
+Message is the largest table in the system -- every message in and out, each
+with its raw content_payload -- and retention used to be
+`delete_old_conversations` deleting expired rows a thousand primary keys at
+a time: slow, WAL-heavy, and leaving the table and its indexes bloated for
+autovacuum to clean up.
+
+Partitioned by month on "timestamp", retention becomes dropping a whole
+month once it has expired (archive.retire_expired_partitions archives it
+first). The table is converted once, with `manage.py partition_messages`:
+
+  * the existing table is renamed to conversations_message_legacy and
+    attached, unchanged, as the partition for everything before the start
+    of next month, so no rows are copied;
+  * the new parent keeps the table name, column defaults, indexes and
+    foreign keys, and continues the id sequence. Its primary key becomes
+    (id, timestamp) -- PostgreSQL requires the partition key in it -- and
+    the foreign key from meta_integration's WebhookEventLog.message is
+    dropped, as PostgreSQL cannot reference a key that is not unique on its
+    own. Django still treats id as the primary key and ids still come from
+    one sequence, so the ORM is unaffected;
+  * monthly partitions from next month on are created ahead of time by
+    ensure_partitions() (MESSAGE_PARTITION_MONTHS_AHEAD months), which the
+    daily conversations.maintain_message_partitions task runs;
+  * a DEFAULT partition, conversations_message_default, takes any message
+    outside every range -- a timestamp past the months created so far, or
+    older than the oldest partition left after retention -- so such an
+    insert never fails. When the month a default row belongs to is created,
+    ensure_partitions() moves the row into it.
+
+The legacy partition is dropped once its last month has expired; until then
+archive.trim_month() deletes its expired months in batches.
+Everything here is a no-op on an unpartitioned table or another database.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+TABLE = Message._meta.db_table
+LEGACY_TABLE = f'{TABLE}_legacy'
+PARTITION_NAME = TABLE + '_p{:%Y_%m}'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    start: Optional[datetime]  # None: from MINVALUE (the legacy partition)
+    end: datetime
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start: datetime) -> datetime:
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+
+def _quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [TABLE])
+        return cursor.fetchone()[0]
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    return None if value == 'MINVALUE' else datetime.fromisoformat(value.strip("'"))
+
+
+def list_partitions() -> List[Partition]:
+    """The range partitions of conversations_message, oldest first (not the
+    DEFAULT partition)."""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass", [TABLE])
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        if bound == 'DEFAULT':
+            continue
+        # FOR VALUES FROM ('2026-11-01 00:00:00+00') TO ('2026-12-01 00:00:00+00')
+        match = re.search(r"FROM \((MINVALUE|'[^']+')\) TO \(('[^']+')\)", bound)
+        if match is None:
+            logger.warning(f"Unexpected partition bound on {name}: {bound}")
+            continue
+        partitions.append(Partition(name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda p: p.end)
+
+
+def convert_to_partitioned(now: Optional[datetime] = None):
+    """
+    Turn conversations_message into a partitioned table (see the module
+    docstring). Holds an exclusive lock on the table while the primary key
+    of the legacy partition is rebuilt; run it in a quiet period.
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError("Message partitioning needs PostgreSQL.")
+    if is_partitioned():
+        return
+    boundary = next_month(month_start(now or timezone.now()))
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Deferred foreign key checks still queued would block the ALTERs below.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {_quote(TABLE)} IN ACCESS EXCLUSIVE MODE")
+
+        # Foreign keys into the table cannot survive: the new key is (id, timestamp).
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE confrelid = %s::regclass AND contype = 'f'", [TABLE])
+        for referencing_table, constraint in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {_quote(constraint)}")
+
+        cursor.execute(
+            "SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid), i.indisprimary "
+            "FROM pg_index i WHERE i.indrelid = %s::regclass", [TABLE])
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'", [TABLE])
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT last_value + CASE WHEN is_called THEN 1 ELSE 0 END FROM {sequence}")
+        next_id = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {_quote(TABLE)} RENAME TO {_quote(LEGACY_TABLE)}")
+        cursor.execute(f"ALTER TABLE {_quote(LEGACY_TABLE)} ALTER COLUMN id DROP IDENTITY")
+        for name, _, primary in indexes:
+            legacy_name = f'{name[:55]}_legacy'
+            if primary:
+                # Rebuilt on (id, timestamp) so ATTACH adopts it as the partition's key.
+                cursor.execute(f"ALTER TABLE {_quote(LEGACY_TABLE)} DROP CONSTRAINT {_quote(name)}")
+                cursor.execute(f'ALTER TABLE {_quote(LEGACY_TABLE)} ADD CONSTRAINT {_quote(legacy_name)} PRIMARY KEY (id, "timestamp")')
+            else:
+                cursor.execute(f"ALTER INDEX {_quote(name)} RENAME TO {_quote(legacy_name)}")
+
+        cursor.execute(
+            f'CREATE TABLE {_quote(TABLE)} (LIKE {_quote(LEGACY_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f"ALTER TABLE {_quote(TABLE)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {int(next_id)})")
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} ADD CONSTRAINT {_quote(TABLE + "_pkey")} PRIMARY KEY (id, "timestamp")')
+        for name, definition, primary in indexes:
+            if not primary:
+                # The definition still names the table, which is now the parent.
+                cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {_quote(TABLE)} ADD CONSTRAINT {_quote(name)} {definition}")
+
+        cursor.execute(
+            f"ALTER TABLE {_quote(TABLE)} ATTACH PARTITION {_quote(LEGACY_TABLE)} "
+            f"FOR VALUES FROM (MINVALUE) TO (%s)", [boundary])
+    logger.info(f"Partitioned {TABLE}; existing rows are in {LEGACY_TABLE} (before {boundary:%Y-%m-%d}).")
+    ensure_partitions(now)
+
+
+def ensure_partitions(now: Optional[datetime] = None) -> List[str]:
+    """Create the monthly partitions missing up to MESSAGE_PARTITION_MONTHS_AHEAD
+    months after the current one. Returns the names created."""
+    partitions = list_partitions()
+    if not partitions:
+        return []
+    current = month_start(now or timezone.now())
+    last = current
+    for _ in range(int(getattr(settings, 'MESSAGE_PARTITION_MONTHS_AHEAD', 2))):
+        last = next_month(last)
+    start, created = partitions[-1].end, []
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {_quote(DEFAULT_PARTITION)} PARTITION OF {_quote(TABLE)} DEFAULT")
+        while start <= last:
+            end = next_month(start)
+            name = PARTITION_NAME.format(start)
+            _create_partition(cursor, name, start, end)
+            created.append(name)
+            start = end
+    if created:
+        logger.info(f"Created message partitions: {', '.join(created)}")
+    return created
+
+
+def _create_partition(cursor, name: str, start: datetime, end: datetime):
+    with transaction.atomic():
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {_quote(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s)',
+            [start, end])
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(name)} PARTITION OF {_quote(TABLE)} FOR VALUES FROM (%s) TO (%s)",
+                [start, end])
+            return
+        # PostgreSQL refuses the new range while the default partition holds
+        # rows in it: move them into the new table first, then attach it.
+        cursor.execute(f"LOCK TABLE {_quote(DEFAULT_PARTITION)} IN EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TABLE {_quote(name)} (LIKE {_quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {_quote(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s '
+            f'RETURNING *) INSERT INTO {_quote(name)} SELECT * FROM moved', [start, end])
+        moved = cursor.rowcount
+        cursor.execute(
+            f"ALTER TABLE {_quote(TABLE)} ATTACH PARTITION {_quote(name)} FOR VALUES FROM (%s) TO (%s)", [start, end])
+    logger.info(f"Moved {moved} messages from {DEFAULT_PARTITION} into the new partition {name}.")
+
+
+def expired_partitions(cutoff: datetime) -> List[Partition]:
+    """Partitions whose every message is older than `cutoff`."""
+    return [partition for partition in list_partitions() if partition.end <= cutoff]
+
+
+def drop_partition(partition: Partition):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {_quote(partition.name)}")
+    logger.info(f"Dropped message partition {partition.name}.")
@@ -0,0 +1,23 @@
+# whatsappcrm_backend/conversations/tasks.py
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="conversations.maintain_message_partitions")
+def maintain_message_partitions_task():
+    """Create the coming months' message partitions, then archive and drop (or,
+    in the legacy and default partitions, trim) the expired months
+    (partitions.py, archive.py). Does nothing until the table has been
+    converted with `manage.py partition_messages`."""
+    from .archive import retire_expired_partitions
+    from .partitions import ensure_partitions, is_partitioned
+
+    if not is_partitioned():
+        return {'partitioned': False}
+    created = ensure_partitions()
+    retired = [partition.name for partition in retire_expired_partitions()]
+    logger.info(f"[Message Partitions] Created {len(created)}, archived and dropped {len(retired)}: {retired}")
+    return {'partitioned': True, 'created': created, 'retired': retired}
@@ -0,0 +1,148 @@
+# whatsappcrm_backend/conversations/test_message_partitions.py
+"""
+Coverage for the partitioned message store (partitions.py, archive.py):
+converting the table keeps every row and id where it was and routes new
+messages into monthly partitions, retention archives and drops whole
+expired months, and a contact's history pages from the database into the
+archive.
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from meta_integration.models import WebhookEventLog
+from . import partitions
+from .models import Contact, Message, MessageArchive
+
+
+def _partition_of(message):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT tableoid::regclass::text FROM conversations_message WHERE id = %s", [message.id])
+        return cursor.fetchone()[0]
+
+
+class MessagePartitionTests(TestCase):
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        settings_override = override_settings(MESSAGE_ARCHIVE_DIR=self.archive_dir, CONVERSATION_EXPIRY_DAYS=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.now = timezone.now()
+        self.contact = Contact.objects.create(whatsapp_id='263772220000')
+
+    def _message(self, ago, body):
+        return Message.objects.create(contact=self.contact, direction='in', message_type='text',
+                                      content_payload={'text': {'body': body}}, timestamp=self.now - ago)
+
+    def test_conversion_keeps_rows_and_routes_new_messages_by_month(self):
+        old = self._message(timedelta(days=90), 'old')
+        log = WebhookEventLog.objects.create(event_type='message', payload={}, message=old)
+
+        partitions.convert_to_partitioned(self.now)
+
+        this_month = partitions.month_start(self.now)
+        self.assertEqual([p.name for p in partitions.list_partitions()], [
+            partitions.LEGACY_TABLE,
+            partitions.PARTITION_NAME.format(partitions.next_month(this_month)),
+            partitions.PARTITION_NAME.format(partitions.next_month(partitions.next_month(this_month))),
+        ])
+        self.assertEqual(_partition_of(old), partitions.LEGACY_TABLE)
+        self.assertEqual(WebhookEventLog.objects.get(pk=log.pk).message, old)
+
+        later = Message.objects.create(contact=self.contact, direction='out', message_type='text', content_payload={},
+                                       timestamp=partitions.next_month(this_month) + timedelta(days=3))
+        self.assertGreater(later.id, old.id)
+        self.assertEqual(_partition_of(later), partitions.PARTITION_NAME.format(partitions.next_month(this_month)))
+        self.assertEqual(list(self.contact.messages.values_list('id', flat=True)), [old.id, later.id])
+
+    def test_messages_outside_every_partition_land_in_the_default_one(self):
+        partitions.convert_to_partitioned(self.now)
+        last = partitions.list_partitions()[-1]
+        ahead = self._message(-(last.end - self.now) - timedelta(days=40), 'ahead')
+        self.assertEqual(_partition_of(ahead), partitions.DEFAULT_PARTITION)
+
+        # Its month is created later: the row moves into it.
+        created = partitions.ensure_partitions(self.now + timedelta(days=62))
+        month = partitions.month_start(ahead.timestamp)
+        self.assertIn(partitions.PARTITION_NAME.format(month), created)
+        self.assertEqual(_partition_of(ahead), partitions.PARTITION_NAME.format(month))
+        self.assertEqual(Message.objects.get(pk=ahead.pk).text_content, 'ahead')
+
+    def test_expired_months_are_archived_dropped_and_read_back(self):
+        ancient = self._message(timedelta(days=200), 'ancient')
+        # Partitioned five months ago: later messages went into monthly partitions.
+        partitions.convert_to_partitioned(self.now - timedelta(days=150))
+        partitions.ensure_partitions(self.now)
+        old = self._message(timedelta(days=100), 'old')
+        recent = self._message(timedelta(days=1), 'recent')
+        log = WebhookEventLog.objects.create(event_type='message', payload={}, message=old)
+        self.assertNotEqual(_partition_of(old), partitions.LEGACY_TABLE)
+
+        call_command('delete_old_conversations', stdout=StringIO())
+
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [recent.id])
+        self.assertIsNone(WebhookEventLog.objects.get(pk=log.pk).message_id)
+        # The legacy partition was trimmed month by month before it was dropped.
+        self.assertNotIn(partitions.LEGACY_TABLE, [p.name for p in partitions.list_partitions()])
+        legacy = MessageArchive.objects.get(partition_name__startswith=partitions.LEGACY_TABLE)
+        self.assertEqual(legacy.range_start, partitions.month_start(ancient.timestamp))
+        self.assertEqual(sum(MessageArchive.objects.values_list('row_count', flat=True)), 2)
+        self.assertFalse([p for p in partitions.list_partitions() if p.end <= self.now - timedelta(days=60)])
+        with gzip.open(legacy.path, 'rt') as archived:
+            self.assertEqual(json.loads(archived.readline())['content_payload'], {'text': {'body': 'ancient'}})
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        url = f'/crm-api/conversations/contacts/{self.contact.pk}/history/'
+        first = client.get(url, {'limit': 2}).json()
+        self.assertEqual([m['id'] for m in first['results']], [recent.id, old.id])
+        self.assertEqual(first['results'][1]['content_preview'], 'old')
+        self.assertTrue(first['next_before'].endswith('Z'))
+        # The cursor survives being pasted into a query string unescaped.
+        second = client.get(f"{url}?limit=2&before={first['next_before']}&before_id={first['next_before_id']}").json()
+        self.assertEqual([m['id'] for m in second['results']], [ancient.id])
+        self.assertIsNone(second['next_before'])
+        self.assertEqual(client.get(f"{url}?before=2026-01-01T00:00:00+00:00").status_code, 400)
+        self.assertEqual(client.get(url, {'before': 'yesterday'}).status_code, 400)
+
+    def test_expired_legacy_rows_are_trimmed_before_the_partition_expires(self):
+        old = self._message(timedelta(days=100), 'old')
+        log = WebhookEventLog.objects.create(event_type='message', payload={}, message=old)
+        kept = self._message(timedelta(days=10), 'kept')
+        partitions.convert_to_partitioned(self.now)
+
+        call_command('delete_old_conversations', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(_partition_of(kept), partitions.LEGACY_TABLE)
+        self.assertIsNone(WebhookEventLog.objects.get(pk=log.pk).message_id)
+        record = MessageArchive.objects.get()
+        self.assertEqual((record.partition_name, record.row_count),
+                         (f'{partitions.LEGACY_TABLE}_{partitions.month_start(old.timestamp):%Y_%m}', 1))
+
+        # A late row for the same month is archived to a file of its own.
+        late = self._message(timedelta(days=100), 'late')
+        call_command('delete_old_conversations', stdout=StringIO())
+        self.assertFalse(Message.objects.filter(pk=late.pk).exists())
+        self.assertEqual(MessageArchive.objects.count(), 2)
+        self.assertEqual(len({record.path for record in MessageArchive.objects.all()}), 2)
+
+    def test_unpartitioned_table_is_still_deleted_in_batches(self):
+        self._message(timedelta(days=100), 'old')
+        recent = self._message(timedelta(days=1), 'recent')
+        call_command('delete_old_conversations', stdout=StringIO())
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [recent.id])
+        self.assertFalse(os.listdir(self.archive_dir))
@@ -6,9 +6,12 @@ from rest_framework.response import Response
 from django.db.models import Q, Prefetch
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
+from datetime import timezone as dt_timezone
 import logging 
 
 from .models import Contact, Message 
+from .archive import contact_history
 from .serializers import (
     ContactSerializer,
     MessageSerializer,
@@ -81,6 +84,38 @@ class ContactViewSet(viewsets.ModelViewSet):
         serializer = MessageListSerializer(messages_queryset, many=True, context={'request': request})
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'], url_path='history', permission_classes=[permissions.IsAdminUser])
+    def message_history(self, request, pk=None):
+        """
+        The contact's conversation, newest first, including months that have
+        been archived out of the database (conversations/archive.py). Page
+        back with ?before=<next_before>&before_id=<next_before_id>; the
+        cursor is UTC with a 'Z' suffix, so it needs no escaping in a URL.
+        """
+        contact = get_object_or_404(Contact, pk=pk)
+        before = request.query_params.get('before')
+        before_id = request.query_params.get('before_id')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+            before = parse_datetime(before) if before else None
+            before_id = int(before_id) if before_id else None
+        except ValueError:
+            return Response({'detail': "Invalid 'before', 'before_id' or 'limit'."}, status=status.HTTP_400_BAD_REQUEST)
+        if before is None and request.query_params.get('before'):
+            # Unparseable, e.g. a '+00:00' offset whose '+' arrived as a space.
+            return Response({'detail': "Invalid 'before'."}, status=status.HTTP_400_BAD_REQUEST)
+        if before is not None and timezone.is_naive(before):
+            before = timezone.make_aware(before)
+
+        page = contact_history(contact, before=before, before_id=before_id, limit=limit)
+        serializer = MessageListSerializer(page.messages, many=True, context={'request': request})
+        return Response({
+            'results': serializer.data,
+            'next_before': (page.next_before.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                            if page.next_before else None),
+            'next_before_id': page.next_before_id,
+        })
+
     @action(detail=True, methods=['post'], url_path='toggle-block', permission_classes=[permissions.IsAdminUser])
     def toggle_block_status(self, request, pk=None):
         contact = get_object_or_404(Contact, pk=pk)
@@ -6,3 +6,6 @@ class CustomerDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customer_data'
     verbose_name = "Customer Data & Profiles"
+
+    def ready(self):
+        from . import signals  # noqa: F401
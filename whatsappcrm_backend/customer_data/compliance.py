@@ -17,16 +17,57 @@ user-facing reason. Limits/exclusion default to "off" (no limit, not excluded)
 so existing behaviour is unchanged until a user or admin sets them; the age gate
 is on by default (configurable via settings.RG_MIN_AGE), and KYC gating is
 off by default (settings.RG_REQUIRE_KYC) since verification is operator-driven.
+
+The daily limits are rolling 24h windows. Summing the user's DEPOSIT or
+BET_PLACED transactions for every check grew with their history. The totals
+are now kept per user in Redis as a hash with one field per counted
+transaction ("<minute>:<transaction id>" -> cents), so a check is one
+HGETALL of a day's transactions:
+
+- a user's hash is seeded from SQL the first time a limit check needs it
+  (users without limits never get one) and expires a day after it was last
+  written, so it is reseeded if it is no longer being maintained;
+- committed transactions update it (signals.py): a deposit counts from the
+  moment it is requested, until it FAILS (its field is then zeroed); a
+  stake when it is placed. Updates to a hash that does not exist are
+  dropped, never starting a partial one;
+- seeding first creates the hash with a "seeding" marker, then reads SQL and
+  fills in the fields it does not already have. A transaction committing
+  meanwhile is either seen by the read or lands in the marked hash, and
+  writing the same transaction from both sides is harmless; a hash is only
+  read once it is marked "seeded";
+- the window starts on a minute boundary, identically for the counters and
+  the SQL, so both give the same answer.
+
+The counters lag commits slightly (they are written in on_commit), so
+ticket placement does not trust them alone. Under the wallet lock it calls
+reserve_stake(), which checks the stake against the counter plus any
+reservations and, if it fits, adds it to the hash as a reservation field
+("<minute>:r:<token>") in one script. The committed BET_PLACED transaction
+replaces the reservation once the ticket commits; a placement that fails
+releases it, and one whose outer transaction rolls back leaves a
+reservation that stops counting after RESERVATION_MINUTES. Reservations
+are not part of window_total(). If Redis is unavailable the checks fall
+back to the SQL sum. The sum also remains the reference:
+tasks.check_limit_counters_task compares it with the counters of every user
+with a limit and drops the ones that disagree.
 """
 from __future__ import annotations
 
+import logging
+import uuid
 from datetime import timedelta
 from decimal import Decimal
+from typing import Dict, Iterable, Optional
 
 from django.conf import settings
 from django.db.models import Sum
 from django.utils import timezone
 
+from whatsappcrm_backend.redis_client import database_key, get_redis
+
+logger = logging.getLogger(__name__)
+
 
 def _min_age() -> int:
     return int(getattr(settings, 'RG_MIN_AGE', 18))
@@ -43,7 +84,7 @@ def get_controls(user):
     return controls
 
 
-def _age_from_dob(dob):
+def age_from_dob(dob):
     if not dob:
         return None
     today = timezone.localdate()
@@ -53,19 +94,22 @@ def _age_from_dob(dob):
 def user_age(user):
     """Age derived from the linked CustomerProfile's date_of_birth, or None."""
     profile = getattr(user, 'customer_profile', None)
-    return _age_from_dob(getattr(profile, 'date_of_birth', None)) if profile else None
+    return age_from_dob(getattr(profile, 'date_of_birth', None)) if profile else None
 
 
 def check_can_bet(user, controls=None) -> tuple[bool, str]:
     """Age, KYC and self-exclusion gate for placing a bet."""
-    controls = controls or get_controls(user)
+    return check_bet_gate(controls or get_controls(user), user_age(user))
+
 
+def check_bet_gate(controls, age) -> tuple[bool, str]:
+    """check_can_bet for a caller that already has the controls and age (the
+    placement path reads both from its cached player context)."""
     if controls.is_self_excluded():
         until = timezone.localtime(controls.self_excluded_until).strftime('%d %b %Y %H:%M')
         return False, (f"🛡️ You are self-excluded until {until}. Betting and deposits are blocked "
                        f"until then. If you need support, please contact us.")
 
-    age = user_age(user)
     min_age = _min_age()
     if age is None:
         return False, (f"To bet you must confirm your date of birth (you must be {min_age}+). "
@@ -80,24 +124,243 @@ def check_can_bet(user, controls=None) -> tuple[bool, str]:
     return True, ""
 
 
-def deposits_today(user) -> Decimal:
+# --- Rolling 24h deposit and stake totals ------------------------------------ #
+
+DEPOSITS = 'deposits'
+STAKES = 'stakes'
+WINDOW_MINUTES = 24 * 60
+WINDOW_KEY = 'rg:window:{}:{}:{}'  # database, DEPOSITS/STAKES, user id
+_SEEDED_FIELD = 'seeded'
+_SEEDING_FIELD = 'seeding'
+_KEY_TTL_SECONDS = (WINDOW_MINUTES + 60) * 60
+_RESERVATION_MARK = ':r:'
+# How long a stake reservation counts if its transaction never commits or
+# releases it.
+RESERVATION_MINUTES = 5
+
+# Set a transaction's field only if the hash is being kept (seeded or seeding).
+_ADD = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# Finish a seed: fill in the fields not written meanwhile, then mark it seeded.
+_FINISH_SEED = """
+for i = 2, #ARGV, 2 do
+    redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[1], 'seeded', 1)
+redis.call('HDEL', KEYS[1], 'seeding')
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Check a stake against the window (committed fields from ARGV[1]'s minute on,
+# reservations from ARGV[2]'s) and reserve it if it fits. ARGV: those minutes,
+# reservation field, stake cents, limit cents, TTL. Returns {1 reserved / 0 over
+# the limit / -1 not seeded, cents already used}.
+_RESERVE = """
+local fields = redis.call('HGETALL', KEYS[1])
+local seeded = false
+local used = 0
+for i = 1, #fields, 2 do
+    local name = fields[i]
+    if name == 'seeded' then
+        seeded = true
+    elseif name ~= 'seeding' then
+        local minute = tonumber(string.match(name, '^(%d+):'))
+        local since = string.find(name, ':r:', 1, true) and ARGV[2] or ARGV[1]
+        if minute and minute >= tonumber(since) then
+            used = used + tonumber(fields[i + 1])
+        end
+    end
+end
+if not seeded then
+    return {-1, 0}
+end
+if used + tonumber(ARGV[4]) > tonumber(ARGV[5]) then
+    return {0, used}
+end
+redis.call('HSET', KEYS[1], ARGV[3], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return {1, used}
+"""
+
+_scripts = {}
+
+
+def _script(redis_client, source):
+    if source not in _scripts:
+        _scripts[source] = redis_client.register_script(source)
+    return _scripts[source]
+
+
+def _window_key(kind: str, user_id: int) -> str:
+    return database_key(WINDOW_KEY, kind, user_id)
+
+
+def _window_start(now=None):
+    """Start of the rolling window, on a minute boundary."""
+    return ((now or timezone.now()) - timedelta(minutes=WINDOW_MINUTES)).replace(second=0, microsecond=0)
+
+
+def _minute(moment) -> int:
+    return int(moment.timestamp()) // 60
+
+
+def _counted_transactions(kind: str):
+    """The transactions a window adds up (their amounts, not yet signed)."""
     from .models import WalletTransaction
-    since = timezone.now() - timedelta(hours=24)
-    total = (WalletTransaction.objects
-             .filter(wallet__user=user, transaction_type='DEPOSIT', created_at__gte=since)
-             .exclude(status='FAILED')
-             .aggregate(s=Sum('amount'))['s'])
-    return total or Decimal('0.00')
+    if kind == DEPOSITS:
+        return WalletTransaction.objects.filter(transaction_type='DEPOSIT').exclude(status='FAILED')
+    return WalletTransaction.objects.filter(transaction_type='BET_PLACED')
+
+
+def _cents(kind: str, amount) -> int:
+    # Stakes are stored as negative BET_PLACED amounts.
+    cents = int((Decimal(str(amount)) * 100).to_integral_value())
+    return -cents if kind == STAKES else cents
+
+
+def sql_window_totals(kind: str, user_ids: Iterable[int], since=None) -> Dict[int, Decimal]:
+    """Window totals per user straight from the transactions (users with none are left out)."""
+    rows = (_counted_transactions(kind)
+            .filter(wallet__user_id__in=list(user_ids), created_at__gte=since or _window_start())
+            .values('wallet__user_id').annotate(total=Sum('amount')).order_by())
+    return {row['wallet__user_id']: Decimal(_cents(kind, row['total'])) / 100 for row in rows}
+
+
+def _field(created_at, transaction_id) -> str:
+    return f'{_minute(created_at)}:{transaction_id}'
+
+
+def _seed_window(redis_client, kind: str, user_id: int, since):
+    """Build the user's hash from SQL (see the module docstring)."""
+    key = _window_key(kind, user_id)
+    pipe = redis_client.pipeline()
+    pipe.hsetnx(key, _SEEDING_FIELD, 1)
+    pipe.expire(key, _KEY_TTL_SECONDS)
+    pipe.execute()
+    args = [_KEY_TTL_SECONDS]
+    for row in (_counted_transactions(kind)
+                .filter(wallet__user_id=user_id, created_at__gte=since)
+                .values_list('id', 'amount', 'created_at')):
+        args += [_field(row[2], row[0]), _cents(kind, row[1])]
+    _script(redis_client, _FINISH_SEED)(keys=[key], args=args)
+
+
+def _read_window(redis_client, kind: str, user_id: int, since):
+    """The user's window total in cents from Redis, or None if no seeded hash is kept."""
+    key = _window_key(kind, user_id)
+    fields = redis_client.hgetall(key)
+    if _SEEDED_FIELD not in fields:
+        return None
+    first = _minute(since)
+    first_reservation = _minute(timezone.now()) - RESERVATION_MINUTES
+    total, expired = 0, []
+    for field, cents in fields.items():
+        if field in (_SEEDED_FIELD, _SEEDING_FIELD):
+            continue
+        minute = int(field.split(':', 1)[0])
+        if _RESERVATION_MARK in field:
+            if minute < first_reservation:
+                expired.append(field)
+        elif minute < first:
+            expired.append(field)
+        else:
+            total += int(cents)
+    if expired:
+        redis_client.hdel(key, *expired)
+    return total
+
+
+def window_total(user, kind: str) -> Decimal:
+    """The user's deposits or stakes over the rolling 24h window."""
+    since = _window_start()
+    try:
+        redis_client = get_redis()
+        cents = _read_window(redis_client, kind, user.pk, since)
+        if cents is None:
+            _seed_window(redis_client, kind, user.pk, since)
+            cents = _read_window(redis_client, kind, user.pk, since)
+    except Exception:
+        logger.warning("Redis unavailable for the rolling limit counters; summing transactions instead.",
+                       exc_info=True)
+        cents = None
+    if cents is None:
+        return sql_window_totals(kind, [user.pk], since).get(user.pk, Decimal('0.00'))
+    return Decimal(cents) / 100
+
+
+def record_window_amount(user_id: int, kind: str, transaction_id: int, amount, created_at):
+    """
+    Set a committed transaction's field (amount 0 to take it back out) if
+    the user's counter is being kept.
+    """
+    if created_at < _window_start():
+        return
+    try:
+        redis_client = get_redis()
+        _script(redis_client, _ADD)(keys=[_window_key(kind, user_id)],
+                                    args=[_field(created_at, transaction_id), _cents(kind, amount), _KEY_TTL_SECONDS])
+    except Exception:
+        # The hash stays a day and the consistency check drops it if it is off.
+        logger.warning(f"Redis unavailable recording {kind} for user {user_id}; dropping its counter.",
+                       exc_info=True)
+        drop_window_counters([user_id], kind)
+
+
+def drop_window_counters(user_ids: Iterable[int], kind: str):
+    """Forget users' counters; the next limit check reseeds them from SQL."""
+    keys = [_window_key(kind, user_id) for user_id in user_ids]
+    if not keys:
+        return
+    try:
+        get_redis().delete(*keys)
+    except Exception:
+        logger.warning(f"Redis unavailable dropping {len(keys)} {kind} counter(s).", exc_info=True)
+
+
+def check_window_counters() -> int:
+    """
+    Compare the counters of users with a daily limit against the SQL sums and
+    drop the ones that disagree; returns how many were dropped. A transaction
+    committed but not yet recorded can show up as a mismatch, which only
+    costs a reseed.
+    """
+    from .models import ResponsibleGamblingControls
+    since = _window_start()
+    redis_client = get_redis()
+    dropped = 0
+    for kind, limit_field in ((DEPOSITS, 'daily_deposit_limit'), (STAKES, 'daily_stake_limit')):
+        user_ids = list(ResponsibleGamblingControls.objects.filter(**{f'{limit_field}__isnull': False})
+                        .values_list('user_id', flat=True))
+        expected = sql_window_totals(kind, user_ids, since)
+        mismatched = []
+        for user_id in user_ids:
+            cents = _read_window(redis_client, kind, user_id, since)
+            if cents is None:
+                continue
+            if Decimal(cents) / 100 != expected.get(user_id, Decimal('0.00')):
+                logger.warning(f"Rolling {kind} counter for user {user_id} is {Decimal(cents) / 100}, "
+                               f"transactions say {expected.get(user_id, Decimal('0.00'))}; dropping it.")
+                mismatched.append(user_id)
+        drop_window_counters(mismatched, kind)
+        dropped += len(mismatched)
+    return dropped
+
+
+def deposits_today(user) -> Decimal:
+    return window_total(user, DEPOSITS)
 
 
 def stakes_today(user) -> Decimal:
-    """Total staked in the last 24h (BET_PLACED transactions are stored negative)."""
-    from .models import WalletTransaction
-    since = timezone.now() - timedelta(hours=24)
-    total = (WalletTransaction.objects
-             .filter(wallet__user=user, transaction_type='BET_PLACED', created_at__gte=since)
-             .aggregate(s=Sum('amount'))['s'])
-    return abs(total) if total else Decimal('0.00')
+    """Total staked in the last 24h."""
+    return window_total(user, STAKES)
 
 
 def check_deposit_within_limit(user, amount, controls=None) -> tuple[bool, str]:
@@ -115,18 +378,66 @@ def check_deposit_within_limit(user, amount, controls=None) -> tuple[bool, str]:
     return True, ""
 
 
+def _stake_limit_message(limit, used) -> str:
+    remaining = max(Decimal('0.00'), limit - used)
+    return (f"That stake would exceed your daily stake limit of ${limit:.2f}. "
+            f"You have ${remaining:.2f} left today.")
+
+
 def check_stake_within_limit(user, stake, controls=None) -> tuple[bool, str]:
     controls = controls or get_controls(user)
     limit = controls.daily_stake_limit
     if limit is not None:
         used = stakes_today(user)
         if used + Decimal(str(stake)) > limit:
-            remaining = max(Decimal('0.00'), limit - used)
-            return False, (f"That stake would exceed your daily stake limit of ${limit:.2f}. "
-                           f"You have ${remaining:.2f} left today.")
+            return False, _stake_limit_message(limit, used)
     return True, ""
 
 
+def reserve_stake(user, stake, limit) -> tuple[bool, str, Optional[str]]:
+    """
+    Check `stake` against the daily stake `limit`, counting stakes placed but
+    not yet committed, and reserve it in the user's counter if it fits (see
+    the module docstring). For a caller holding the user's wallet lock.
+    Returns (allowed, message, reservation); pass the reservation to
+    release_stake() once the stake has committed or failed. Without Redis
+    the committed stakes are summed in SQL and the reservation is None.
+    """
+    stake_cents = int((Decimal(str(stake)) * 100).to_integral_value())
+    now = timezone.now()
+    since = _window_start(now)
+    reservation = f'{_minute(now)}{_RESERVATION_MARK}{uuid.uuid4().hex}'
+    args = [_minute(since), _minute(now) - RESERVATION_MINUTES, reservation, stake_cents,
+            int((Decimal(str(limit)) * 100).to_integral_value()), _KEY_TTL_SECONDS]
+    key = _window_key(STAKES, user.pk)
+    try:
+        redis_client = get_redis()
+        reserved, used_cents = _script(redis_client, _RESERVE)(keys=[key], args=args)
+        if reserved == -1:
+            _seed_window(redis_client, STAKES, user.pk, since)
+            reserved, used_cents = _script(redis_client, _RESERVE)(keys=[key], args=args)
+    except Exception:
+        logger.warning("Redis unavailable for the stake limit counter; summing stakes instead.", exc_info=True)
+        used = sql_window_totals(STAKES, [user.pk], since).get(user.pk, Decimal('0.00'))
+        if used + Decimal(str(stake)) > limit:
+            return False, _stake_limit_message(limit, used), None
+        return True, "", None
+    if reserved != 1:
+        return False, _stake_limit_message(limit, Decimal(used_cents) / 100), None
+    return True, "", reservation
+
+
+def release_stake(user_id: int, reservation: Optional[str]):
+    """Drop a reservation made by reserve_stake()."""
+    if not reservation:
+        return
+    try:
+        get_redis().hdel(_window_key(STAKES, user_id), reservation)
+    except Exception:
+        # It stops counting after RESERVATION_MINUTES.
+        logger.warning(f"Redis unavailable releasing a stake reservation for user {user_id}.", exc_info=True)
+
+
 # --- Controls management (used by the WhatsApp "Safer gambling" flow) -------- #
 
 def set_self_exclusion(user, days: int):
@@ -0,0 +1,173 @@
+# whatsappcrm_backend/customer_data/ledger.py
+"""
+Append-only wallet ledger.
+
+UserWallet.add_funds / deduct_funds used to add to self.balance in Python and
+save the whole row, so every caller -- ticket placement, settlement, agent
+commissions and win deductions, Paynow polling, withdrawal approvals -- had
+to hold a select_for_update lock on the wallet from its read to its write,
+or lose updates. Agent wallets, credited for every referred player in a big
+settlement run, serialised whole batches behind that lock.
+
+Every balance change now goes through this module as:
+
+  * one atomic UPDATE ... SET balance = balance + <delta> (an F()
+    expression; debits that must not overdraw carry the floor in the WHERE
+    clause, so the check and the write are one statement), and
+  * one WalletLedgerEntry row recording the signed delta, in the same
+    transaction.
+
+post_to_ledger() posts one change; post_many() applies changes to many
+wallets with one UPDATE and one bulk INSERT (settlement credits a whole
+batch this way).
+
+Periodically, tasks.reconcile_wallet_ledger_task checks every wallet
+against its last WalletBalanceSnapshot -- balance == snapshot + sum(ledger
+entries since) -- logs any mismatch and takes new snapshots of the wallets
+that agree. A
+snapshot only covers entries older than LEDGER_SNAPSHOT_SETTLE_SECONDS, so
+no transaction that could still commit an entry below its cut-off is open;
+each check and snapshot reads a wallet's balance and its entries in one
+statement, so entries being written concurrently are either in both or in
+neither. Balances changed outside this module (admin edits, raw updates)
+show up as mismatches.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import UserWallet, WalletBalanceSnapshot, WalletLedgerEntry, WalletTransaction
+
+logger = logging.getLogger(__name__)
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+@dataclass
+class LedgerPosting:
+    """A signed change to one wallet, optionally tied to the WalletTransaction
+    that explains it."""
+    wallet_id: int
+    amount: Decimal
+    entry_type: str
+    wallet_transaction_id: Optional[int] = None
+
+
+def post_to_ledger(wallet_id: int, amount: Decimal, entry_type: str,
+                   wallet_transaction: Optional[WalletTransaction] = None,
+                   floor: Optional[Decimal] = None) -> Decimal:
+    """
+    Change a wallet's balance by `amount` (signed) and record it; returns the
+    new balance. With `floor`, the change is refused with ValueError
+    ("Insufficient funds") if it would take the balance below it.
+    """
+    amount = Decimal(str(amount))
+    with transaction.atomic():
+        wallets = UserWallet.objects.filter(pk=wallet_id)
+        if floor is not None:
+            wallets = wallets.filter(balance__gte=floor - amount)
+        if not wallets.update(balance=F('balance') + amount, updated_at=timezone.now()):
+            if floor is not None and UserWallet.objects.filter(pk=wallet_id).exists():
+                raise ValueError("Insufficient funds")
+            raise UserWallet.DoesNotExist(f"Wallet {wallet_id} does not exist.")
+        WalletLedgerEntry.objects.create(wallet_id=wallet_id, amount=amount, entry_type=entry_type,
+                                         wallet_transaction=wallet_transaction)
+        # Our UPDATE holds the row until commit, so this is the balance it left.
+        return UserWallet.objects.filter(pk=wallet_id).values_list('balance', flat=True).get()
+
+
+def post_many(postings: Iterable[LedgerPosting]) -> Dict[int, Decimal]:
+    """
+    Apply `postings` (no floor: credits, or system debits that may go
+    negative) with one balance UPDATE and one ledger INSERT. Returns the net
+    change per wallet.
+    """
+    postings = [posting for posting in postings if posting.amount]
+    totals: Dict[int, Decimal] = {}
+    for posting in postings:
+        totals[posting.wallet_id] = totals.get(posting.wallet_id, Decimal('0.00')) + Decimal(str(posting.amount))
+    if not totals:
+        return totals
+    with transaction.atomic():
+        UserWallet.objects.filter(id__in=totals).update(
+            balance=F('balance') + Case(
+                *[When(id=wallet_id, then=Value(amount)) for wallet_id, amount in totals.items()],
+                output_field=_MONEY,
+            ),
+            updated_at=timezone.now(),
+        )
+        WalletLedgerEntry.objects.bulk_create([
+            WalletLedgerEntry(wallet_id=posting.wallet_id, amount=posting.amount, entry_type=posting.entry_type,
+                              wallet_transaction_id=posting.wallet_transaction_id)
+            for posting in postings
+        ], batch_size=1000)
+    return totals
+
+
+def _entries_after(entry_id) -> Subquery:
+    """Sum of the outer wallet's entries with id > `entry_id`, 0 if none."""
+    return Coalesce(
+        Subquery(
+            WalletLedgerEntry.objects.filter(wallet=OuterRef('pk'), id__gt=entry_id)
+            .order_by().values('wallet').annotate(total=Sum('amount')).values('total')
+        ),
+        Value(Decimal('0.00')), output_field=_MONEY,
+    )
+
+
+@dataclass
+class LedgerMismatch:
+    wallet_id: int
+    balance: Decimal
+    expected: Decimal
+
+
+def reconcile_wallets() -> List[LedgerMismatch]:
+    """Wallets whose balance is not their last snapshot plus the ledger
+    entries posted since."""
+    latest = WalletBalanceSnapshot.objects.filter(wallet=OuterRef('pk')).order_by('-id')
+    wallets = (
+        UserWallet.objects.order_by()
+        .annotate(snapshot_balance=Subquery(latest.values('balance')[:1]),
+                  snapshot_entry=Subquery(latest.values('last_entry_id')[:1]))
+        .filter(snapshot_entry__isnull=False)
+        .annotate(since=_entries_after(OuterRef('snapshot_entry')))
+        .values_list('id', 'balance', 'snapshot_balance', 'since')
+    )
+    return [
+        LedgerMismatch(wallet_id=wallet_id, balance=balance, expected=snapshot_balance + since)
+        for wallet_id, balance, snapshot_balance, since in wallets.iterator(chunk_size=2000)
+        if balance != snapshot_balance + since
+    ]
+
+
+def snapshot_wallets(exclude: Iterable[int] = ()) -> int:
+    """Snapshot every wallet (but `exclude`) as of the last settled ledger
+    entry; returns the number of snapshots written."""
+    settle = int(getattr(settings, 'LEDGER_SNAPSHOT_SETTLE_SECONDS', 300))
+    last_entry_id = (
+        WalletLedgerEntry.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=settle))
+        .aggregate(last=Max('id'))['last'] or 0
+    )
+    exclude = set(exclude)
+    wallets = (
+        UserWallet.objects.order_by()
+        .annotate(after=_entries_after(last_entry_id))
+        .values_list('id', 'balance', 'after')
+    )
+    snapshots = [
+        WalletBalanceSnapshot(wallet_id=wallet_id, balance=balance - after, last_entry_id=last_entry_id)
+        for wallet_id, balance, after in wallets.iterator(chunk_size=2000)
+        if wallet_id not in exclude
+    ]
+    WalletBalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_data', '0006_alter_betticket_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='customer_data.userwallet')),
+            ],
+            options={
+                'verbose_name': 'Wallet Balance Snapshot',
+                'verbose_name_plural': 'Wallet Balance Snapshots',
+                'indexes': [models.Index(fields=['wallet', '-id'], name='customer_da_wallet__b60570_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WalletLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Signed change to the balance.', max_digits=12)),
+                ('entry_type', models.CharField(help_text='The WalletTransaction type that caused it.', max_length=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='customer_data.userwallet')),
+                ('wallet_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='customer_data.wallettransaction')),
+            ],
+            options={
+                'verbose_name': 'Wallet Ledger Entry',
+                'verbose_name_plural': 'Wallet Ledger Entries',
+                'indexes': [models.Index(fields=['wallet', 'id'], name='customer_da_wallet__5e4cd0_idx')],
+            },
+        ),
+    ]
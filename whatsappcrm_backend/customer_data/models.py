@@ -1,5 +1,5 @@
 # models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -57,41 +57,36 @@ class UserWallet(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Wallet - ${self.balance}"
 
+    def _post(self, amount: Decimal, transaction_type: str, floor: Decimal = None, **transaction_fields):
+        # Record the transaction and apply it through the ledger (ledger.py):
+        # an atomic UPDATE of the balance, no read-modify-save of the row.
+        from .ledger import post_to_ledger
+
+        with transaction.atomic():
+            wallet_transaction = WalletTransaction.objects.create(
+                wallet=self, amount=amount, transaction_type=transaction_type,
+                status='COMPLETED', **transaction_fields,
+            )
+            self.balance = post_to_ledger(self.pk, amount, transaction_type,
+                                          wallet_transaction=wallet_transaction, floor=floor)
+        return self.balance
+
     def add_funds(self, amount: Decimal, description: str, transaction_type: str = 'DEPOSIT', payment_method: str = 'manual', reference: str = None, external_reference: str = None):
         """Add funds to wallet"""
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        self.balance += Decimal(str(amount))
-        WalletTransaction.objects.create(
-            wallet=self,
-            amount=amount,
-            transaction_type=transaction_type,
-            description=description,
-            status='COMPLETED',
-            payment_method=payment_method,
-            reference=reference,
-            external_reference=external_reference
-        )
-        self.save()
-        return self.balance
+        return self._post(Decimal(str(amount)), transaction_type, description=description,
+                          payment_method=payment_method, reference=reference,
+                          external_reference=external_reference)
 
     def deduct_funds(self, amount: Decimal, description: str, transaction_type: str = 'WITHDRAWAL', payment_method: str = 'manual'):
         """Deduct funds from wallet"""
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        if self.balance < amount:
-            raise ValueError("Insufficient funds")
-        self.balance -= Decimal(str(amount))
-        WalletTransaction.objects.create(
-            wallet=self,
-            amount=-amount, # Store deductions as negative amounts for easier accounting
-            transaction_type=transaction_type,
-            description=description, # Corrected: This was missing in the original diff, but should be there.
-            status='COMPLETED',
-            payment_method=payment_method
-        )
-        self.save()
-        return self.balance
+        # Store deductions as negative amounts for easier accounting. The
+        # insufficient-funds check is part of the balance UPDATE itself.
+        return self._post(-Decimal(str(amount)), transaction_type, floor=Decimal('0.00'),
+                          description=description, payment_method=payment_method)
 
     def deduct_funds_allow_negative(self, amount: Decimal, description: str, transaction_type: str):
         """Deduct funds unconditionally, allowing the balance to go negative.
@@ -102,17 +97,8 @@ class UserWallet(models.Model):
         """
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        self.balance -= Decimal(str(amount))
-        WalletTransaction.objects.create(
-            wallet=self,
-            amount=-amount,  # Store deductions as negative amounts for easier accounting
-            transaction_type=transaction_type,
-            description=description,
-            status='COMPLETED',
-            payment_method='system',
-        )
-        self.save()
-        return self.balance
+        return self._post(-Decimal(str(amount)), transaction_type, description=description,
+                          payment_method='system')
 
     class Meta:
         ordering = ['-updated_at']
@@ -152,6 +138,14 @@ class WalletTransaction(models.Model):
     external_reference = models.CharField(max_length=255, null=True, blank=True, db_index=True, help_text="Reference from the external payment gateway (e.g., Paynow).")
     payment_details = models.JSONField(default=dict, blank=True, help_text="Stores details for the payment method, e.g., phone number for mobile money.")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The status as loaded, so signals.py can tell a deposit that has
+        # just FAILED from one saved again.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def __str__(self):
         return f"{self.transaction_type} - ${self.amount} - {self.created_at}"
 
@@ -159,6 +153,57 @@ class WalletTransaction(models.Model):
         ordering = ['-created_at']
 
 
+class WalletLedgerEntry(models.Model):
+    """
+    One signed change to a wallet's balance (customer_data/ledger.py).
+
+    Append-only: every balance change is an atomic UPDATE of
+    UserWallet.balance plus one of these rows, written in the same
+    transaction. WalletTransaction stays the user-facing history (pending
+    requests, descriptions, references); the ledger is what balances are
+    reconciled against.
+    """
+    wallet = models.ForeignKey(UserWallet, on_delete=models.CASCADE, related_name='ledger_entries')
+    amount = models.DecimalField(max_digits=12, decimal_places=2, help_text="Signed change to the balance.")
+    entry_type = models.CharField(max_length=30, help_text="The WalletTransaction type that caused it.")
+    wallet_transaction = models.ForeignKey(WalletTransaction, on_delete=models.SET_NULL, null=True, blank=True,
+                                           related_name='ledger_entries')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Wallet ledger entries are append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.entry_type} {self.amount} on wallet {self.wallet_id}"
+
+    class Meta:
+        indexes = [models.Index(fields=['wallet', 'id'])]
+        verbose_name = "Wallet Ledger Entry"
+        verbose_name_plural = "Wallet Ledger Entries"
+
+
+class WalletBalanceSnapshot(models.Model):
+    """
+    A wallet's balance as of ledger entry `last_entry_id` (every entry up to
+    and including it, none after). Reconciliation checks
+    balance == snapshot balance + sum(entries after last_entry_id).
+    """
+    wallet = models.ForeignKey(UserWallet, on_delete=models.CASCADE, related_name='balance_snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Wallet {self.wallet_id}: {self.balance} at entry {self.last_entry_id}"
+
+    class Meta:
+        indexes = [models.Index(fields=['wallet', '-id'])]
+        verbose_name = "Wallet Balance Snapshot"
+        verbose_name_plural = "Wallet Balance Snapshots"
+
+
 class PendingWithdrawalManager(models.Manager):
     """
     Custom manager for WalletTransaction to filter for pending withdrawal requests.
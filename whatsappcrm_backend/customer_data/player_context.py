@@ -0,0 +1,143 @@
+# whatsappcrm_backend/customer_data/player_context.py
+"""
+Cached player context for ticket placement.
+
+Every placement (ticket_processing.process_bet_ticket_submission) used to
+start with a chain of lookups before it could even price the slip: the
+Contact by whatsapp_id, its CustomerProfile, the User, the wallet (under a
+row lock), and the ResponsibleGamblingControls for the age, KYC and
+self-exclusion gate. These change rarely; a player places many tickets.
+
+The context is everything placement needs to know about the player --
+user id and username, wallet id, date of birth, and the controls that gate
+betting -- read in one query and kept in Redis as JSON per whatsapp_id
+(PLAYER_CONTEXT_KEY) for PLAYER_CONTEXT_TTL seconds. Saving or deleting a
+Contact, CustomerProfile or ResponsibleGamblingControls through the ORM
+drops the contexts it could affect (signals.py), now and again when the
+transaction commits, so a self-exclusion or limit takes effect on the very
+next ticket.
+
+The wallet balance is deliberately not part of it: placement debits the
+wallet with a conditional UPDATE (ledger.post_to_ledger), which is the
+funds check. Lookups that find no linked user or wallet are not cached.
+
+If Redis is unavailable the context is read from the database for the
+request and not stored.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from whatsappcrm_backend.redis_client import database_key, delete_keys, get_redis
+from .models import CustomerProfile, ResponsibleGamblingControls, UserWallet
+
+logger = logging.getLogger(__name__)
+
+PLAYER_CONTEXT_KEY = 'customer:player_context:{}:{}'
+
+
+class NoLinkedUser(Exception):
+    """The contact's profile has no user account."""
+
+
+@dataclass(frozen=True)
+class PlayerContext:
+    whatsapp_id: str
+    user_id: int
+    username: str
+    wallet_id: int
+    date_of_birth: Optional[str] = None
+    self_excluded_until: Optional[str] = None
+    kyc_verified: bool = False
+    daily_stake_limit: Optional[str] = None
+
+    @property
+    def user(self) -> User:
+        """An unsaved stand-in carrying the user's id and username."""
+        return User(pk=self.user_id, username=self.username)
+
+    @property
+    def age(self) -> Optional[int]:
+        from .compliance import age_from_dob
+        return age_from_dob(date.fromisoformat(self.date_of_birth) if self.date_of_birth else None)
+
+    @property
+    def controls(self) -> ResponsibleGamblingControls:
+        """The user's controls as an unsaved instance (defaults if they have none)."""
+        return ResponsibleGamblingControls(
+            user_id=self.user_id,
+            self_excluded_until=datetime.fromisoformat(self.self_excluded_until) if self.self_excluded_until else None,
+            kyc_verified=self.kyc_verified,
+            daily_stake_limit=Decimal(self.daily_stake_limit) if self.daily_stake_limit is not None else None,
+        )
+
+
+def _key(whatsapp_id: str) -> str:
+    return database_key(PLAYER_CONTEXT_KEY, whatsapp_id)
+
+
+def _load(whatsapp_id: str) -> PlayerContext:
+    """
+    The context from the database. Raises Contact.DoesNotExist,
+    CustomerProfile.DoesNotExist, NoLinkedUser or UserWallet.DoesNotExist.
+    """
+    row = (CustomerProfile.objects.filter(contact__whatsapp_id=whatsapp_id)
+           .values('user_id', 'user__username', 'user__wallet__id', 'date_of_birth',
+                   'user__rg_controls__self_excluded_until', 'user__rg_controls__kyc_verified',
+                   'user__rg_controls__daily_stake_limit')
+           .first())
+    if row is None:
+        from conversations.models import Contact
+        if not Contact.objects.filter(whatsapp_id=whatsapp_id).exists():
+            raise Contact.DoesNotExist(f"No contact with whatsapp_id {whatsapp_id}.")
+        raise CustomerProfile.DoesNotExist(f"No customer profile for {whatsapp_id}.")
+    if row['user_id'] is None:
+        raise NoLinkedUser(whatsapp_id)
+    if row['user__wallet__id'] is None:
+        raise UserWallet.DoesNotExist(f"No wallet for user {row['user_id']}.")
+    excluded_until = row['user__rg_controls__self_excluded_until']
+    stake_limit = row['user__rg_controls__daily_stake_limit']
+    return PlayerContext(
+        whatsapp_id=whatsapp_id,
+        user_id=row['user_id'],
+        username=row['user__username'],
+        wallet_id=row['user__wallet__id'],
+        date_of_birth=row['date_of_birth'].isoformat() if row['date_of_birth'] else None,
+        self_excluded_until=excluded_until.isoformat() if excluded_until else None,
+        kyc_verified=bool(row['user__rg_controls__kyc_verified']),
+        daily_stake_limit=str(stake_limit) if stake_limit is not None else None,
+    )
+
+
+def get_player_context(whatsapp_id: str) -> PlayerContext:
+    """The player's placement context, from Redis when cached (see the
+    module docstring); raises as _load when there is none."""
+    key = _key(whatsapp_id)
+    try:
+        raw = get_redis().get(key)
+    except Exception:
+        logger.warning("Redis unavailable reading the player context; loading it from the database.", exc_info=True)
+        return _load(whatsapp_id)
+    if raw:
+        return PlayerContext(**json.loads(raw))
+
+    context = _load(whatsapp_id)
+    try:
+        get_redis().set(key, json.dumps(asdict(context), separators=(',', ':')),
+                        ex=int(getattr(settings, 'PLAYER_CONTEXT_TTL', 300)))
+    except Exception:
+        logger.warning("Redis unavailable storing the player context.", exc_info=True)
+    return context
+
+
+def invalidate_player_contexts(whatsapp_ids: Iterable[Optional[str]]):
+    """Drop the contexts of `whatsapp_ids` (redis_client.delete_keys)."""
+    delete_keys([_key(whatsapp_id) for whatsapp_id in whatsapp_ids if whatsapp_id], "player contexts")
@@ -0,0 +1,59 @@
+# whatsappcrm_backend/customer_data/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from conversations.models import Contact
+from . import compliance
+from .models import CustomerProfile, ResponsibleGamblingControls, WalletTransaction
+from .player_context import invalidate_player_contexts
+
+_WINDOW_KINDS = {'DEPOSIT': compliance.DEPOSITS, 'BET_PLACED': compliance.STAKES}
+
+
+def _counted(kind, status):
+    return kind == compliance.STAKES or status != 'FAILED'
+
+
+@receiver(post_save, sender=WalletTransaction)
+def limit_window_transaction_saved(sender, instance, created, **kwargs):
+    """Deposits and stakes update the rolling daily-limit counters
+    (compliance.py) once they commit: a new one is added, a deposit that
+    FAILS is zeroed."""
+    kind = _WINDOW_KINDS.get(instance.transaction_type)
+    if kind is None:
+        return
+    previous = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    if created:
+        was_counted = False
+    elif previous is None:
+        return
+    else:
+        was_counted = _counted(kind, previous)
+    is_counted = _counted(kind, instance.status)
+    if was_counted == is_counted:
+        return
+    user_id, transaction_id = instance.wallet.user_id, instance.pk
+    amount = instance.amount if is_counted else 0
+    created_at = instance.created_at
+    transaction.on_commit(lambda: compliance.record_window_amount(user_id, kind, transaction_id, amount, created_at))
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+@receiver(post_save, sender=CustomerProfile)
+@receiver(post_delete, sender=CustomerProfile)
+@receiver(post_save, sender=ResponsibleGamblingControls)
+@receiver(post_delete, sender=ResponsibleGamblingControls)
+def player_context_changed(sender, instance, **kwargs):
+    """Drop the cached placement contexts (player_context.py) a contact,
+    profile or controls write could affect."""
+    if sender is Contact:
+        whatsapp_ids = [instance.whatsapp_id]
+    elif sender is CustomerProfile:
+        whatsapp_ids = Contact.objects.filter(pk=instance.contact_id).values_list('whatsapp_id', flat=True)
+    else:
+        whatsapp_ids = Contact.objects.filter(customerprofile__user_id=instance.user_id).values_list('whatsapp_id', flat=True)
+    invalidate_player_contexts(whatsapp_ids)
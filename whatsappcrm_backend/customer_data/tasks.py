@@ -125,3 +125,33 @@ def send_withdrawal_confirmation_whatsapp(
         logger.info("="*80)
         logger.info(f"TASK END: send_withdrawal_confirmation_whatsapp - ERROR")
         logger.info("="*80)
+
+
+@shared_task(name="customer_data.reconcile_wallet_ledger", queue='cpu_heavy')
+def reconcile_wallet_ledger_task():
+    """Check every wallet against the ledger, then snapshot the ones that agree.
+    A mismatched wallet keeps its old snapshot, so it is reported again until
+    someone corrects it."""
+    from .ledger import reconcile_wallets, snapshot_wallets
+
+    mismatches = reconcile_wallets()
+    for mismatch in mismatches:
+        logger.error(
+            f"[Wallet Ledger] Wallet {mismatch.wallet_id} balance {mismatch.balance} does not match "
+            f"its snapshot plus ledger ({mismatch.expected})."
+        )
+    snapshots = snapshot_wallets(exclude=[mismatch.wallet_id for mismatch in mismatches])
+    logger.info(f"[Wallet Ledger] Reconciled wallets: {len(mismatches)} mismatch(es), {snapshots} snapshot(s) taken.")
+    return {'mismatches': len(mismatches), 'snapshots': snapshots}
+
+
+@shared_task(name="customer_data.check_limit_counters")
+def check_limit_counters_task():
+    """Check the rolling deposit/stake counters of users with a daily limit
+    against their transactions (compliance.py); disagreeing counters are
+    dropped and reseeded by the next limit check."""
+    from .compliance import check_window_counters
+
+    dropped = check_window_counters()
+    logger.info(f"[Limit Counters] Checked rolling limit counters: {dropped} dropped.")
+    return {'dropped': dropped}
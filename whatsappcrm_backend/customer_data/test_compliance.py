@@ -1,16 +1,21 @@
 # whatsappcrm_backend/customer_data/test_compliance.py
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
 from django.test import TestCase, override_settings
 from django.utils import timezone
 
 from conversations.models import Contact
+from whatsappcrm_backend.redis_client import get_redis
 from . import compliance
 from .models import CustomerProfile, UserWallet, WalletTransaction, ResponsibleGamblingControls
 
 
+WINDOW_KEY = 'test:rg:window:{}:{}:{}'
+
+
 def _make_user(username, dob=None):
     user = User.objects.create(username=username)
     contact = Contact.objects.create(whatsapp_id=f"wa_{username}")
@@ -18,8 +23,23 @@ def _make_user(username, dob=None):
     return user
 
 
+def _use_test_window_keys(test):
+    """Point the rolling limit counters at throwaway keys (user ids repeat
+    across test runs)."""
+    def clear():
+        redis_client = get_redis()
+        for key in redis_client.scan_iter(match='test:rg:window:*'):
+            redis_client.delete(key)
+    patcher = patch.object(compliance, 'WINDOW_KEY', WINDOW_KEY)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    clear()
+    test.addCleanup(clear)
+
+
 class ComplianceTests(TestCase):
     def setUp(self):
+        _use_test_window_keys(self)
         adult_dob = date.today().replace(year=date.today().year - 25)
         self.adult = _make_user('adult', dob=adult_dob)
 
@@ -83,3 +103,76 @@ class ComplianceTests(TestCase):
         compliance.set_daily_deposit_limit(self.adult, 100)
         compliance.set_daily_deposit_limit(self.adult, None)
         self.assertIsNone(compliance.get_controls(self.adult).daily_deposit_limit)
+
+
+class RollingLimitCounterTests(TestCase):
+    """The daily limits read per-transaction counters kept in Redis, not the
+    user's transaction history."""
+
+    def setUp(self):
+        _use_test_window_keys(self)
+        self.user = _make_user('counted', dob=date.today().replace(year=date.today().year - 30))
+        self.wallet = self.user.wallet
+        self.wallet.add_funds(Decimal('100.00'), 'Deposit')  # counted: no counter kept yet, so only in SQL
+
+    def test_stakes_are_counted_without_summing_transactions(self):
+        compliance.set_daily_stake_limit(self.user, 50)
+        self.assertEqual(compliance.stakes_today(self.user), Decimal('0.00'))  # seeds the counter
+        for stake in ('15.00', '20.50'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.wallet.deduct_funds(Decimal(stake), 'Bet ticket placed', 'BET_PLACED')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(compliance.stakes_today(self.user), Decimal('35.50'))
+        self.assertFalse(compliance.check_stake_within_limit(self.user, 15)[0])
+        self.assertTrue(compliance.check_stake_within_limit(self.user, '14.50')[0])
+
+    def test_deposit_counts_from_request_until_it_fails(self):
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('100.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            WalletTransaction.objects.create(wallet=self.wallet, amount=Decimal('40.00'), transaction_type='DEPOSIT',
+                                             status='PENDING', reference='DEP-counted-1', description='Deposit')
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('140.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = WalletTransaction.objects.get(reference='DEP-counted-1')
+            pending.status = 'FAILED'
+            pending.save()
+            pending.save()  # saving it again takes nothing more out
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('100.00'))
+
+    def test_a_deposit_committed_while_seeding_is_kept(self):
+        real_script = compliance._script
+
+        def commit_before_finishing(redis_client, source):
+            # A deposit the seed's SQL read did not see, recorded before the seed is written.
+            if source == compliance._FINISH_SEED:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.wallet.add_funds(Decimal('30.00'), 'Deposit')
+            return real_script(redis_client, source)
+
+        with patch.object(compliance, '_script', side_effect=commit_before_finishing):
+            self.assertEqual(compliance.deposits_today(self.user), Decimal('130.00'))
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('130.00'))
+
+    def test_transactions_outside_the_window_are_not_counted(self):
+        WalletTransaction.objects.filter(wallet=self.wallet).update(created_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('0.00'))
+        self.assertEqual(compliance.sql_window_totals(compliance.DEPOSITS, [self.user.pk]), {})
+
+    def test_falls_back_to_transactions_without_redis(self):
+        with patch.object(compliance, 'get_redis', side_effect=ConnectionError('down')), \
+                self.assertLogs('customer_data.compliance', 'WARNING'):
+            self.assertEqual(compliance.deposits_today(self.user), Decimal('100.00'))
+
+    def test_consistency_check_drops_drifted_counters(self):
+        compliance.set_daily_deposit_limit(self.user, 500)
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('100.00'))
+        self.assertEqual(compliance.check_window_counters(), 0)
+
+        # Recorded behind the counter's back (no commit callbacks run).
+        self.wallet.add_funds(Decimal('25.00'), 'Deposit')
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('100.00'))
+        with self.assertLogs('customer_data.compliance', 'WARNING'):
+            self.assertEqual(compliance.check_window_counters(), 1)
+        self.assertEqual(compliance.deposits_today(self.user), Decimal('125.00'))
@@ -0,0 +1,84 @@
+# whatsappcrm_backend/customer_data/test_ledger.py
+"""
+Coverage for the wallet ledger (ledger.py): balance changes are atomic
+UPDATEs with a ledger row each, stale wallet instances cannot lose updates,
+a batch credits many wallets in one statement, and reconciliation flags a
+balance changed outside the ledger.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .ledger import LedgerPosting, post_many, reconcile_wallets, snapshot_wallets
+from .models import UserWallet, WalletBalanceSnapshot, WalletLedgerEntry
+from .tasks import reconcile_wallet_ledger_task
+
+
+class WalletLedgerTests(TestCase):
+
+    def setUp(self):
+        self.wallets = [User.objects.create_user(f'ledger{i}', password='x').wallet for i in range(3)]
+
+    def _balance(self, wallet):
+        return UserWallet.objects.get(pk=wallet.pk).balance
+
+    def test_stale_instances_do_not_lose_updates(self):
+        first = UserWallet.objects.get(pk=self.wallets[0].pk)
+        second = UserWallet.objects.get(pk=self.wallets[0].pk)
+        first.add_funds(Decimal('50.00'), 'Deposit')
+        self.assertEqual(second.add_funds(Decimal('20.00'), 'Deposit'), Decimal('70.00'))
+        self.assertEqual(first.deduct_funds(Decimal('30.00'), 'Withdrawal'), Decimal('40.00'))
+
+        self.assertEqual(self._balance(first), Decimal('40.00'))
+        self.assertEqual(list(WalletLedgerEntry.objects.filter(wallet=first).order_by('id')
+                              .values_list('amount', 'entry_type', 'wallet_transaction__amount')),
+                         [(Decimal('50.00'), 'DEPOSIT', Decimal('50.00')),
+                          (Decimal('20.00'), 'DEPOSIT', Decimal('20.00')),
+                          (Decimal('-30.00'), 'WITHDRAWAL', Decimal('-30.00'))])
+
+    def test_insufficient_funds_writes_nothing(self):
+        wallet = self.wallets[0]
+        wallet.add_funds(Decimal('10.00'), 'Deposit')
+        with self.assertRaisesMessage(ValueError, 'Insufficient funds'):
+            wallet.deduct_funds(Decimal('10.01'), 'Withdrawal')
+        self.assertEqual(self._balance(wallet), Decimal('10.00'))
+        self.assertEqual(wallet.transactions.count(), 1)
+        self.assertEqual(wallet.deduct_funds_allow_negative(Decimal('15.00'), 'Deduction', 'AGENT_WIN_DEDUCTION'),
+                         Decimal('-5.00'))
+
+    def test_batch_credits_in_one_update(self):
+        postings = [LedgerPosting(wallet_id=w.pk, amount=Decimal('5.00'), entry_type='BET_WON') for w in self.wallets]
+        postings.append(LedgerPosting(wallet_id=self.wallets[0].pk, amount=Decimal('2.50'), entry_type='BET_REFUNDED'))
+        with CaptureQueriesContext(connection) as queries:
+            totals = post_many(postings)
+
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(totals[self.wallets[0].pk], Decimal('7.50'))
+        self.assertEqual([self._balance(w) for w in self.wallets], [Decimal('7.50'), Decimal('5.00'), Decimal('5.00')])
+        self.assertEqual(WalletLedgerEntry.objects.count(), 4)
+
+    @override_settings(LEDGER_SNAPSHOT_SETTLE_SECONDS=0)
+    def test_reconciliation_flags_balance_changed_outside_ledger(self):
+        self.wallets[0].add_funds(Decimal('100.00'), 'Deposit')
+        self.assertEqual(snapshot_wallets(), 3)
+        self.wallets[0].deduct_funds(Decimal('40.00'), 'Withdrawal')
+        self.wallets[1].add_funds(Decimal('5.00'), 'Deposit')
+        self.assertEqual(reconcile_wallets(), [])
+
+        UserWallet.objects.filter(pk=self.wallets[1].pk).update(balance=Decimal('999.00'))
+        with self.assertLogs('customer_data.tasks', 'ERROR'):
+            self.assertEqual(reconcile_wallet_ledger_task(), {'mismatches': 1, 'snapshots': 2})
+        # The mismatched wallet keeps its old snapshot and is reported again.
+        self.assertEqual(WalletBalanceSnapshot.objects.filter(wallet=self.wallets[1]).count(), 1)
+        self.assertEqual([m.wallet_id for m in reconcile_wallets()], [self.wallets[1].pk])
+
+    def test_snapshot_leaves_out_unsettled_entries(self):
+        self.wallets[0].add_funds(Decimal('25.00'), 'Deposit')
+        snapshot_wallets()
+        snapshot = WalletBalanceSnapshot.objects.get(wallet=self.wallets[0])
+        self.assertEqual((snapshot.balance, snapshot.last_entry_id), (Decimal('0.00'), 0))
+        self.assertEqual(reconcile_wallets(), [])
@@ -0,0 +1,137 @@
+# whatsappcrm_backend/customer_data/test_ticket_placement.py
+"""
+Coverage for ticket placement (ticket_processing.process_bet_ticket_submission):
+a player with a cached context places a ticket in a fixed handful of
+statements without locking the wallet, insufficient funds write nothing,
+controls changes reach the cached context immediately, and a daily stake
+limit still serialises the player's placements, reserving each stake in the
+rolling counter rather than summing the player's stakes under the lock.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from conversations.models import Contact
+from football_data_app.models import Bookmaker, FootballFixture, League, Market, MarketCategory, MarketOutcome, Team
+from whatsappcrm_backend.redis_client import get_redis
+from . import compliance, player_context
+from .models import Bet, BetTicket, CustomerProfile, UserWallet, WalletLedgerEntry
+from .ticket_processing import process_bet_ticket_submission
+
+WHATSAPP_ID = '263770001234'
+
+
+def _clear_test_keys():
+    redis_client = get_redis()
+    for key in redis_client.scan_iter(match='test:placement:*'):
+        redis_client.delete(key)
+
+
+@patch.object(player_context, 'PLAYER_CONTEXT_KEY', 'test:placement:context:{}:{}')
+@patch.object(compliance, 'WINDOW_KEY', 'test:placement:window:{}:{}:{}')
+class TicketPlacementTests(TestCase):
+
+    def setUp(self):
+        _clear_test_keys()
+        self.addCleanup(_clear_test_keys)
+        self.user = User.objects.create_user('placer', password='x')
+        UserWallet.objects.filter(user=self.user).update(balance=Decimal('100.00'))
+        CustomerProfile.objects.create(contact=Contact.objects.create(whatsapp_id=WHATSAPP_ID), user=self.user,
+                                       date_of_birth=date.today().replace(year=date.today().year - 30))
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        category = MarketCategory.objects.create(name='Match Winner')
+        bookmaker = Bookmaker.objects.create(name='Bet365', api_bookmaker_key='bet365')
+        self.outcomes = []
+        for i in range(2):
+            fixture = FootballFixture.objects.create(
+                league=league, home_team=Team.objects.create(name=f'Home {i}'),
+                away_team=Team.objects.create(name=f'Away {i}'), api_id=f'v3_{7000 + i}',
+                match_date=timezone.now() + timedelta(hours=2), status=FootballFixture.FixtureStatus.SCHEDULED,
+            )
+            market = Market.objects.create(fixture=fixture, category=category, api_market_key='h2h',
+                                           bookmaker=bookmaker, last_updated_odds_api=timezone.now())
+            self.outcomes.append(MarketOutcome.objects.create(market=market, outcome_name='Home', odds=Decimal('2.00')))
+
+    def _place(self, stake, outcomes=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return process_bet_ticket_submission(WHATSAPP_ID, [str(o.id) for o in (outcomes or self.outcomes)], stake)
+
+    def test_placement_is_a_fixed_handful_of_statements_without_locks(self):
+        self.assertTrue(self._place(1.0)['success'])  # caches the player context
+        with CaptureQueriesContext(connection) as queries:
+            result = self._place(10.0)
+
+        self.assertTrue(result['success'], result['message'])
+        sql = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # Selections; ticket, bets, transaction; balance UPDATE, ledger entry, new balance.
+        self.assertEqual(len(sql), 7, sql)
+        self.assertFalse([q for q in sql if 'FOR UPDATE' in q])
+        self.assertEqual(result['new_balance'], 89.0)
+        self.assertIn('Home 0 vs Away 0', result['message'])
+
+        ticket = BetTicket.objects.get(pk=result['ticket_id'])
+        self.assertEqual((ticket.status, ticket.bet_type, ticket.total_odds, ticket.potential_winnings),
+                         ('PLACED', 'MULTIPLE', Decimal('4.000'), Decimal('40.00')))
+        self.assertEqual(sorted(ticket.bets.values_list('potential_winnings', flat=True)),
+                         [Decimal('20.00'), Decimal('20.00')])
+        self.assertEqual(WalletLedgerEntry.objects.filter(wallet__user=self.user).count(), 2)
+
+    def test_insufficient_funds_writes_nothing(self):
+        result = self._place(150.0)
+        self.assertFalse(result['success'])
+        self.assertIn('100.00', result['message'])
+        self.assertEqual((BetTicket.objects.count(), Bet.objects.count()), (0, 0))
+        self.assertEqual(self.user.wallet.transactions.count(), 0)
+
+    def test_self_exclusion_reaches_a_cached_context(self):
+        self.assertTrue(self._place(1.0)['success'])
+        with self.captureOnCommitCallbacks(execute=True):
+            compliance.set_self_exclusion(self.user, days=7)
+        result = self._place(1.0)
+        self.assertFalse(result['success'])
+        self.assertIn('self-excluded', result['message'])
+
+    def test_stake_limit_is_checked_under_the_wallet_lock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            compliance.set_daily_stake_limit(self.user, 15)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self._place(10.0, self.outcomes[:1])['success'])
+        self.assertTrue([q for q in queries.captured_queries if 'FOR UPDATE' in q['sql']])
+        # The limit is checked against the counter, not a sum of the player's stakes.
+        self.assertFalse([q for q in queries.captured_queries if 'SUM(' in q['sql'].upper()])
+
+        result = self._place(10.0, self.outcomes[:1])
+        self.assertFalse(result['success'])
+        self.assertIn('daily stake limit', result['message'])
+        self.assertEqual(BetTicket.objects.count(), 1)
+
+    def test_stake_limit_counts_stakes_the_counter_has_not_heard_of(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            compliance.set_daily_stake_limit(self.user, 15)
+        # Placed, but its commit callbacks (the counter update) have not run yet.
+        self.assertTrue(process_bet_ticket_submission(WHATSAPP_ID, [str(self.outcomes[0].id)], 10.0)['success'])
+        self.assertEqual(compliance.stakes_today(self.user), Decimal('0.00'))
+
+        result = self._place(10.0, self.outcomes[:1])
+        self.assertFalse(result['success'])
+        self.assertIn('daily stake limit', result['message'])
+
+    def test_failed_placement_releases_its_reserved_stake(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            compliance.set_daily_stake_limit(self.user, 200)
+        self.assertFalse(self._place(150.0, self.outcomes[:1])['success'])  # insufficient funds
+        self.assertTrue(self._place(60.0, self.outcomes[:1])['success'])
+        self.assertEqual(compliance.stakes_today(self.user), Decimal('60.00'))
+
+    def test_profile_without_user_is_not_cached(self):
+        CustomerProfile.objects.create(contact=Contact.objects.create(whatsapp_id='263770009999'))
+        result = process_bet_ticket_submission('263770009999', [str(self.outcomes[0].id)], 1.0)
+        self.assertFalse(result['success'])
+        self.assertIn('No linked user', result['message'])
+        self.assertIsNone(get_redis().get(player_context._key('263770009999')))
@@ -19,6 +19,27 @@ Bet = apps.get_model('customer_data', 'Bet')
 FootballFixture = apps.get_model('football_data_app', 'FootballFixture') # Corrected: use FootballFixture
 MarketOutcome = apps.get_model('football_data_app', 'MarketOutcome')
 
+from customer_data import compliance
+from customer_data.ledger import post_to_ledger
+from customer_data.player_context import NoLinkedUser, get_player_context
+
+# Non-bettable fixture statuses
+NON_BETTABLE_STATUSES = [
+    FootballFixture.FixtureStatus.FINISHED,
+    FootballFixture.FixtureStatus.CANCELLED,
+    FootballFixture.FixtureStatus.POSTPONED
+]
+
+# Everything placement needs about a selection, in one query.
+SELECTION_FIELDS = (
+    'id', 'odds', 'outcome_name', 'market__category__name', 'market__fixture__status',
+    'market__fixture__home_team__name', 'market__fixture__away_team__name',
+)
+
+
+def _fixture_name(selection: dict) -> str:
+    return f"{selection['market__fixture__home_team__name']} vs {selection['market__fixture__away_team__name']}"
+
 
 def process_bet_ticket_submission(
     whatsapp_id: str,
@@ -60,148 +81,137 @@ def process_bet_ticket_submission(
         return {"success": False, "message": f"Maximum stake is ${MAX_STAKE:.2f}. Your stake is ${stake:.2f}."}
 
     logger.info(f"Processing bet ticket submission for WhatsApp ID: {whatsapp_id}, Stake: ${stake:.2f}, Selections: {len(market_outcome_ids)}")
-    
-    try:
-        with transaction.atomic():
-            contact = Contact.objects.get(whatsapp_id=whatsapp_id)
-            customer_profile = CustomerProfile.objects.get(contact=contact)
-            if not customer_profile.user:
-                logger.warning(f"No linked user account for WhatsApp ID: {whatsapp_id}")
-                return {"success": False, "message": "No linked user account found for this contact. Cannot place bet."}
-
-            # Lock the wallet row for the duration of the transaction to prevent race conditions.
-            # This ensures the balance check and deduction are atomic.
-            user_wallet = UserWallet.objects.select_for_update().get(user=customer_profile.user)
-
-            # Responsible-gambling gating: self-exclusion, age, KYC, daily stake limit.
-            from customer_data import compliance
-            allowed, message = compliance.check_can_bet(customer_profile.user)
-            if not allowed:
-                return {"success": False, "message": message}
-            within, message = compliance.check_stake_within_limit(customer_profile.user, stake)
-            if not within:
-                return {"success": False, "message": message}
 
-            # Check for sufficient funds
-            if user_wallet.balance < Decimal(str(stake)):
+    # Read phase: nothing here is locked or written. The player comes from the
+    # cached placement context (player_context.py) and the selections from
+    # one flat query, priced at the odds stored now.
+    try:
+        player = get_player_context(whatsapp_id)
+        user, controls = player.user, player.controls
+
+        # Responsible-gambling gating: self-exclusion, age, KYC.
+        allowed, message = compliance.check_bet_gate(controls, player.age)
+        if not allowed:
+            return {"success": False, "message": message}
+
+        int_market_outcome_ids = [int(i) for i in market_outcome_ids]
+        rows = {
+            row['id']: row for row in MarketOutcome.objects.filter(
+                id__in=int_market_outcome_ids, is_active=True,
+            ).values(*SELECTION_FIELDS)
+        }
+        if len(rows) != len(int_market_outcome_ids):
+            found_ids = {str(i) for i in rows}
+            missing_ids = [i for i in market_outcome_ids if i not in found_ids]
+            return {"success": False, "message": f"Invalid or unavailable market outcome IDs found: {', '.join(missing_ids)}"}
+        selections = [rows[i] for i in int_market_outcome_ids]
+
+        # Check that all fixtures are in a bettable state
+        for selection in selections:
+            if selection['market__fixture__status'] in NON_BETTABLE_STATUSES:
                 return {
                     "success": False,
-                    "message": f"Insufficient funds. Your current balance is {float(user_wallet.balance):.2f}.",
-                    "new_balance": float(user_wallet.balance)
+                    "message": f"Cannot bet on match '{_fixture_name(selection)}' - match status is {selection['market__fixture__status']}."
                 }
 
-            # Fetch and validate MarketOutcomes
-            int_market_outcome_ids = [int(i) for i in market_outcome_ids]
-            valid_outcomes = list(MarketOutcome.objects.filter(
-                id__in=int_market_outcome_ids,
-                is_active=True
-            ).select_related(
-                'market__fixture__home_team',
-                'market__fixture__away_team',
-                'market__category',
-                'market__fixture'
-            ))
-
-            if len(valid_outcomes) != len(int_market_outcome_ids):
-                found_ids = {str(o.id) for o in valid_outcomes}
-                missing_ids = [i for i in market_outcome_ids if i not in found_ids]
-                return {"success": False, "message": f"Invalid or unavailable market outcome IDs found: {', '.join(missing_ids)}"}
-
-            if not valid_outcomes:
-                return {"success": False, "message": "No valid market outcomes to place a bet."}
-
-            # Define non-bettable fixture statuses
-            NON_BETTABLE_STATUSES = [
-                FootballFixture.FixtureStatus.FINISHED,
-                FootballFixture.FixtureStatus.CANCELLED,
-                FootballFixture.FixtureStatus.POSTPONED
-            ]
-            
-            # Check that all fixtures are in a bettable state
-            for outcome in valid_outcomes:
-                fixture = outcome.market.fixture
-                if fixture.status in NON_BETTABLE_STATUSES:
-                    return {
-                        "success": False, 
-                        "message": f"Cannot bet on match '{fixture.home_team.name} vs {fixture.away_team.name}' - match status is {fixture.status}."
-                    }
-            
-            # Calculate total odds
-            total_odds = Decimal('1.0')
-            for outcome in valid_outcomes:
-                if outcome.odds <= Decimal('1.0'):
-                    return {
-                        "success": False,
-                        "message": f"Invalid odds ({outcome.odds}) for selection '{outcome.outcome_name}'. Odds must be greater than 1.0."
-                    }
-                total_odds *= outcome.odds
-
-            # Determine bet type
-            bet_type = 'SINGLE' if len(valid_outcomes) == 1 else 'MULTIPLE'
-
-            # Calculate potential winnings
-            potential_winnings = Decimal(str(stake)) * total_odds
-
-            # Create BetTicket
-            bet_ticket = BetTicket.objects.create(
-                user=customer_profile.user,
-                total_stake=Decimal(str(stake)),
-                potential_winnings=potential_winnings,
-                status='PENDING',
-                bet_type=bet_type,
-                total_odds=total_odds
-            )
-
-            # Create individual Bets for the ticket
-            for outcome in valid_outcomes:
-                # For both SINGLE and MULTIPLE, the amount on the bet leg can be considered the full stake.
-                # The potential winnings of the leg is based on its own odds. The ticket's potential
-                # winnings will be based on the combined odds.
-                bet_amount = Decimal(str(stake))
-                potential_winnings_for_bet = bet_amount * outcome.odds
-
-                Bet.objects.create(
-                    ticket=bet_ticket,
-                    market_outcome=outcome,
-                    amount=bet_amount, # Use the full stake
-                    potential_winnings=potential_winnings_for_bet, # Provide the value here
-                    status='PENDING'
+        # Calculate total odds
+        total_odds = Decimal('1.0')
+        for selection in selections:
+            if selection['odds'] <= Decimal('1.0'):
+                return {
+                    "success": False,
+                    "message": f"Invalid odds ({selection['odds']}) for selection '{selection['outcome_name']}'. Odds must be greater than 1.0."
+                }
+            total_odds *= selection['odds']
+
+        stake_amount = Decimal(str(stake))
+        bet_type = 'SINGLE' if len(selections) == 1 else 'MULTIPLE'
+        potential_winnings = stake_amount * total_odds
+
+        # Write phase: one short transaction. The conditional balance UPDATE in
+        # post_to_ledger is the funds check; if it refuses, the ticket and bets
+        # written before it roll back with it.
+        if controls.daily_stake_limit is not None:
+            # Early rejection from the rolling counter, without the lock.
+            within, message = compliance.check_stake_within_limit(user, stake_amount, controls)
+            if not within:
+                return {"success": False, "message": message}
+        reservation = None
+        try:
+            with transaction.atomic():
+                if controls.daily_stake_limit is not None:
+                    # Hold the wallet row so two tickets from this player cannot
+                    # both fit under the limit, and reserve the stake in the
+                    # counter: it only hears of a ticket after its commit.
+                    UserWallet.objects.select_for_update().filter(pk=player.wallet_id).values_list('pk').first()
+                    within, message, reservation = compliance.reserve_stake(
+                        user, stake_amount, controls.daily_stake_limit)
+                    if not within:
+                        return {"success": False, "message": message}
+
+                bet_ticket = BetTicket.objects.create(
+                    user_id=player.user_id,
+                    total_stake=stake_amount,
+                    potential_winnings=potential_winnings,
+                    status=BetTicket.TicketStatus.PLACED,
+                    bet_type=bet_type,
+                    total_odds=total_odds
                 )
-
-            # Now, place the ticket (this will update its status to PLACED)
-            logger.info(f"Placing ticket #{bet_ticket.id} for user {customer_profile.user.username}")
-            bet_ticket.place_ticket()
-
-            # Refresh the wallet object from the database to get the updated balance
-            # after the deduction made inside place_ticket().
-            user_wallet.refresh_from_db()
-            
-            logger.info(f"Ticket #{bet_ticket.id} placed successfully. New wallet balance: ${user_wallet.balance:.2f}")
-
-            # Build the detailed success message, not truncated
-            success_message = f"✅ Ticket #{bet_ticket.id} placed successfully!\n\n"
-            success_message += f"Stake: ${float(bet_ticket.total_stake):.2f}\n"
-            success_message += f"Potential Winnings: ${float(bet_ticket.potential_winnings):.2f}\n"
-            success_message += "-------------------\n\n"
-            success_message += "*Your Selections:*\n"
-
-            # The `valid_outcomes` list already has the prefetched data
-            for outcome in valid_outcomes:
-                fixture = outcome.market.fixture
-                fixture_name = f"{fixture.home_team.name} vs {fixture.away_team.name}"
-                success_message += f"  - Match: {fixture_name}\n"
-                success_message += f"    Selection: {outcome.outcome_name} ({outcome.market.category.name})\n"
-                success_message += f"    Odds: {float(outcome.odds):.2f}\n\n"
-
-            success_message += f"Your new balance is: ${float(user_wallet.balance):.2f}"
-
+                # For both SINGLE and MULTIPLE, the amount on each leg is the full
+                # stake; a leg's potential winnings use its own odds.
+                Bet.objects.bulk_create([
+                    Bet(ticket=bet_ticket, market_outcome_id=selection['id'], amount=stake_amount,
+                        potential_winnings=stake_amount * selection['odds'], status=Bet.BetStatus.PENDING)
+                    for selection in selections
+                ])
+                wallet_transaction = WalletTransaction.objects.create(
+                    wallet=UserWallet(pk=player.wallet_id, user_id=player.user_id),
+                    amount=-stake_amount,
+                    transaction_type='BET_PLACED',
+                    status='COMPLETED',
+                    description=f"Bet ticket #{bet_ticket.id} placed",
+                    payment_method='manual',
+                )
+                new_balance = post_to_ledger(player.wallet_id, -stake_amount, 'BET_PLACED',
+                                             wallet_transaction=wallet_transaction, floor=Decimal('0.00'))
+                if reservation:
+                    # After the BET_PLACED transaction's own counter update.
+                    transaction.on_commit(lambda: compliance.release_stake(player.user_id, reservation))
+        except ValueError:
+            compliance.release_stake(player.user_id, reservation)
+            balance = UserWallet.objects.filter(pk=player.wallet_id).values_list('balance', flat=True).first()
             return {
-                "success": True,
-                "message": success_message,
-                "ticket_id": str(bet_ticket.id),
-                "potential_winnings": float(potential_winnings),
-                "new_balance": float(user_wallet.balance)
+                "success": False,
+                "message": f"Insufficient funds. Your current balance is {float(balance or 0):.2f}.",
+                "new_balance": float(balance or 0)
             }
+        except Exception:
+            compliance.release_stake(player.user_id, reservation)
+            raise
+
+        logger.info(f"Ticket #{bet_ticket.id} placed for user {player.username}. New wallet balance: ${new_balance:.2f}")
+
+        # Build the detailed success message, not truncated
+        success_message = f"✅ Ticket #{bet_ticket.id} placed successfully!\n\n"
+        success_message += f"Stake: ${float(stake_amount):.2f}\n"
+        success_message += f"Potential Winnings: ${float(potential_winnings):.2f}\n"
+        success_message += "-------------------\n\n"
+        success_message += "*Your Selections:*\n"
+
+        for selection in selections:
+            success_message += f"  - Match: {_fixture_name(selection)}\n"
+            success_message += f"    Selection: {selection['outcome_name']} ({selection['market__category__name']})\n"
+            success_message += f"    Odds: {float(selection['odds']):.2f}\n\n"
+
+        success_message += f"Your new balance is: ${float(new_balance):.2f}"
+
+        return {
+            "success": True,
+            "message": success_message,
+            "ticket_id": str(bet_ticket.id),
+            "potential_winnings": float(potential_winnings),
+            "new_balance": float(new_balance)
+        }
 
     except Contact.DoesNotExist:
         logger.error(f"Contact not found for WhatsApp ID: {whatsapp_id}")
@@ -209,6 +219,9 @@ def process_bet_ticket_submission(
     except CustomerProfile.DoesNotExist:
         logger.error(f"Customer profile not found for WhatsApp ID: {whatsapp_id}")
         return {"success": False, "message": "Customer profile not found for this contact."}
+    except NoLinkedUser:
+        logger.warning(f"No linked user account for WhatsApp ID: {whatsapp_id}")
+        return {"success": False, "message": "No linked user account found for this contact. Cannot place bet."}
     except UserWallet.DoesNotExist:
         logger.error(f"Wallet not found for WhatsApp ID: {whatsapp_id}")
         return {"success": False, "message": "Wallet not found for the linked user."}
@@ -217,4 +230,4 @@ def process_bet_ticket_submission(
         return {"success": False, "message": str(e)}
     except Exception as e:
         logger.exception(f"Unexpected error during ticket processing for WhatsApp ID {whatsapp_id}: {str(e)}")
-        return {"success": False, "message": f"An unexpected error occurred during ticket processing: {str(e)}"}
\ No newline at end of file
+        return {"success": False, "message": f"An unexpected error occurred during ticket processing: {str(e)}"}
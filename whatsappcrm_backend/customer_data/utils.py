@@ -10,6 +10,7 @@ from django.utils import timezone
 from django.contrib.auth import get_user_model
 from conversations.models import Contact
 from .models import CustomerProfile, UserWallet, WalletTransaction
+from .ledger import post_to_ledger
 import json # Added import for json module
 import logging
 from typing import Optional, Dict, Any
@@ -372,8 +373,16 @@ def process_withdrawal_approval(transaction_reference: str, approved: bool, reas
             whatsapp_id = wallet.user.customer_profile.contact.whatsapp_id
 
             if approved:
-                # Check for sufficient funds again at the time of approval
-                if wallet.balance < amount_to_deduct:
+                # Deduct funds, re-checking for sufficient funds at the time of
+                # approval in the same atomic UPDATE (customer_data/ledger.py).
+                try:
+                    wallet.balance = post_to_ledger(wallet.pk, -amount_to_deduct, 'WITHDRAWAL',
+                                                    wallet_transaction=withdrawal_tx, floor=Decimal('0.00'))
+                    insufficient = False
+                except ValueError:
+                    wallet.refresh_from_db(fields=['balance'])
+                    insufficient = True
+                if insufficient:
                     withdrawal_tx.status = 'FAILED'
                     withdrawal_tx.description = f"Withdrawal failed: Insufficient funds ({wallet.balance}) at time of approval for {amount_to_deduct}."
                     withdrawal_tx.save(update_fields=['status', 'description'])
@@ -389,10 +398,6 @@ def process_withdrawal_approval(transaction_reference: str, approved: bool, reas
                     )
                     return {"success": False, "message": "Insufficient funds at time of approval."}
 
-                # Deduct funds
-                wallet.balance -= amount_to_deduct
-                wallet.save(update_fields=['balance'])
-
                 # Update transaction status to COMPLETED
                 withdrawal_tx.status = 'COMPLETED'
                 withdrawal_tx.description = f"Withdrawal approved and disbursed to {withdrawal_tx.payment_details.get('phone_number')}."
@@ -480,8 +485,7 @@ def process_paynow_ipn(ipn_data: Dict[str, Any]) -> dict:
                 return {"success": False, "message": "Amount mismatch."}
 
             if status.lower() in ['paid', 'delivered']:
-                wallet.balance += amount_paid
-                wallet.save(update_fields=['balance'])
+                wallet.balance = post_to_ledger(wallet.pk, amount_paid, 'DEPOSIT', wallet_transaction=pending_tx)
                 pending_tx.status = 'COMPLETED'
                 pending_tx.description = f"Paynow deposit successful. Paynow Ref: {paynow_ref}"
                 pending_tx.save()
@@ -533,8 +537,7 @@ def process_manual_deposit_approval(transaction_reference: str) -> dict:
             amount_to_add = manual_tx.amount
 
             # Increment wallet balance
-            wallet.balance += amount_to_add
-            wallet.save(update_fields=['balance'])
+            wallet.balance = post_to_ledger(wallet.pk, amount_to_add, 'DEPOSIT', wallet_transaction=manual_tx)
 
             # Update transaction status to COMPLETED
             manual_tx.status = 'COMPLETED'
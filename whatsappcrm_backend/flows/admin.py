@@ -1,7 +1,8 @@
 # whatsappcrm_backend/flows/admin.py
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import Flow, FlowStep, FlowTransition, ContactFlowState, WhatsAppFlow, WhatsAppFlowResponse
+from .flow_graph import get_flow_graph, invalidate_flow_graph
 
 # @admin.register(MessageTemplate)
 # class MessageTemplateAdmin(admin.ModelAdmin):
@@ -23,16 +24,30 @@ class FlowAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     list_filter = ('is_active', 'requires_login', 'created_at') # 'app_config',
     inlines = [FlowStepInline]
-    actions = ['activate_flows', 'deactivate_flows']
+    actions = ['activate_flows', 'deactivate_flows', 'check_trigger_conflicts']
 
     def activate_flows(self, request, queryset):
         queryset.update(is_active=True)
+        invalidate_flow_graph()  # update() skips the post_save signal
     activate_flows.short_description = "Activate selected flows"
 
     def deactivate_flows(self, request, queryset):
         queryset.update(is_active=False)
+        invalidate_flow_graph()  # update() skips the post_save signal
     deactivate_flows.short_description = "Deactivate selected flows"
 
+    def check_trigger_conflicts(self, request, queryset):
+        conflicts = get_flow_graph().trigger_index.conflicts(queryset)
+        for c in conflicts:
+            self.message_user(
+                request,
+                f"'{c.keyword}' in flow '{c.flow.name}' triggers '{c.winner.name}' instead (matches its keyword '{c.winning_keyword}').",
+                level=messages.WARNING,
+            )
+        if not conflicts:
+            self.message_user(request, "No trigger keyword conflicts among the selected active flows.", level=messages.SUCCESS)
+    check_trigger_conflicts.short_description = "Check trigger keyword conflicts"
+
 
 class FlowTransitionInline(admin.TabularInline):
     model = FlowTransition
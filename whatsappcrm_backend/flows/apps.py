@@ -8,5 +8,4 @@ class FlowsConfig(AppConfig):
     verbose_name = "Conversational Flows Management"
 
     def ready(self):
-        # Import signals if any
-        pass
+        from . import signals  # noqa: F401
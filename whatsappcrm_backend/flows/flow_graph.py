@@ -0,0 +1,275 @@
+# whatsappcrm_backend/flows/flow_graph.py
+"""
+Process-local, versioned cache of compiled flow definitions.
+
+Flow definitions (Flow / FlowStep / FlowTransition rows) change rarely — an
+admin edit or a `load_flow_definitions` run — but every inbound message used to
+re-read them and re-validate each step's JSON config with the Pydantic models
+in flows/services.py. Instead, each worker process compiles every definition
+once into a FlowGraph:
+
+  * steps carry their pre-validated config model (StepConfigSendMessage,
+    StepConfigQuestion, StepConfigAction, ...), including the nested prompt /
+    final message of question and end_flow steps, and every `{{ ... }}`
+    template in their configs is tokenized up front (flows/templating.py);
+  * transitions are pre-sorted by priority and their condition configs are
+    pre-parsed (regexes compiled once);
+  * active flows are kept in trigger precedence order (by name) with their
+    trigger keywords already stripped and lowercased, and indexed for
+    single-pass matching (flows/trigger_index.py).
+
+Every FlowStep/FlowTransition/Flow instance held by the graph has its foreign
+key caches populated from the graph itself, so walking step -> flow or
+transition -> next_step never hits the database. They are shared between
+messages and must be treated as read-only.
+
+Invalidation is a version counter. Saving or deleting a definition row (see
+flows/signals.py) drops this process's graph immediately and, once the write
+commits, bumps a shared counter in Redis so every other web/Celery process
+rebuilds on its next check. Processes re-check that counter at most every
+VERSION_CHECK_INTERVAL_SECONDS; if Redis is unreachable a graph is trusted for
+FALLBACK_TTL_SECONDS and then rebuilt from the database.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from whatsappcrm_backend.redis_client import after_commit, commit_pending, database_key
+from . import templating
+from .models import Flow, FlowStep, FlowTransition
+from .trigger_index import TriggerIndex
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'flows:graph_version:{}'  # database
+VERSION_CHECK_INTERVAL_SECONDS = 2
+FALLBACK_TTL_SECONDS = 30
+
+
+@dataclass
+class CompiledTransition:
+    transition: FlowTransition
+    condition_type: Optional[str]
+    regex: Optional[re.Pattern] = None
+
+    @property
+    def next_step(self) -> FlowStep:
+        return self.transition.next_step
+
+
+@dataclass
+class CompiledStep:
+    step: FlowStep
+    # Validated Pydantic config for the step's type, or None for structural
+    # steps / configs that failed validation (config_error holds the reason and
+    # services.py re-validates so the original error logging still happens).
+    config_model: Any = None
+    config_error: Optional[Exception] = None
+    # Validated StepConfigSendMessage for a question's prompt or an end_flow's
+    # final message_config.
+    message_model: Any = None
+    transitions: list[CompiledTransition] = field(default_factory=list)
+
+
+@dataclass
+class CompiledFlow:
+    flow: Flow
+    entry_step: Optional[FlowStep]
+    trigger_keywords: tuple[str, ...]
+
+
+class FlowGraph:
+    """A compiled snapshot of every flow definition at a given version."""
+
+    def __init__(self, version, flows: dict, steps: dict):
+        self.version = version
+        self.flows = flows          # flow id -> CompiledFlow, in name order (database collation)
+        self.steps = steps          # step id -> CompiledStep
+        self.active_flows = [cf for cf in flows.values() if cf.flow.is_active]
+        self.trigger_index = TriggerIndex(self.active_flows)
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+
+    def step(self, step_id) -> Optional[FlowStep]:
+        compiled = self.steps.get(step_id)
+        return compiled.step if compiled else None
+
+    def flow(self, flow_id) -> Optional[Flow]:
+        compiled = self.flows.get(flow_id)
+        return compiled.flow if compiled else None
+
+    def transitions_for(self, step_id) -> list[CompiledTransition]:
+        compiled = self.steps.get(step_id)
+        return compiled.transitions if compiled else []
+
+    def entry_step(self, flow_id) -> Optional[FlowStep]:
+        compiled = self.flows.get(flow_id)
+        return compiled.entry_step if compiled else None
+
+    def bind_state(self, state):
+        """Point a ContactFlowState's current_flow/current_step at the graph's
+        instances so reading them doesn't lazy-load from the database."""
+        if state is None:
+            return state
+        step = self.step(state.current_step_id)
+        if step is not None:
+            state.current_step = step
+        flow = self.flow(state.current_flow_id)
+        if flow is not None:
+            state.current_flow = flow
+        return state
+
+
+def _config_models():
+    # Imported lazily: services.py imports this module.
+    from . import services
+    return {
+        'send_message': services.StepConfigSendMessage,
+        'question': services.StepConfigQuestion,
+        'action': services.StepConfigAction,
+        'end_flow': services.StepConfigEndFlow,
+        'human_handover': services.StepConfigHumanHandover,
+    }, services.StepConfigSendMessage
+
+
+def _compile_step(step: FlowStep, models: dict, send_message_model) -> CompiledStep:
+    compiled = CompiledStep(step=step)
+    model_cls = models.get(step.step_type)
+    if model_cls is None:
+        return compiled
+    try:
+        compiled.config_model = model_cls.model_validate(step.config or {})
+    except Exception as e:
+        compiled.config_error = e
+        logger.warning(f"Flow graph: step '{step.name}' (ID: {step.id}) has an invalid {step.step_type} config: {e}")
+        return compiled
+    message_config = getattr(compiled.config_model, 'message_config', None)
+    if message_config:
+        try:
+            compiled.message_model = send_message_model.model_validate(message_config)
+        except Exception:
+            # Already validated by the step model's own field validator; keep
+            # the failure path in services.py as the single place it is logged.
+            pass
+    return compiled
+
+
+def _compile_transition(transition: FlowTransition) -> CompiledTransition:
+    config = transition.condition_config if isinstance(transition.condition_config, dict) else {}
+    condition_type = config.get('type')
+    regex = None
+    if condition_type == 'user_reply_matches_regex' and config.get('regex'):
+        try:
+            regex = re.compile(config['regex'])
+        except re.error as e:
+            logger.warning(f"Flow graph: transition {transition.id} has an invalid regex '{config['regex']}': {e}")
+    return CompiledTransition(transition=transition, condition_type=condition_type, regex=regex)
+
+
+def build_flow_graph(version=None) -> FlowGraph:
+    """Load and compile every flow definition (three queries in total)."""
+    models, send_message_model = _config_models()
+
+    flows = {flow.id: flow for flow in Flow.objects.order_by('name')}
+    steps = {}
+    entry_steps = {}
+    templates = {}
+    for step in FlowStep.objects.all():
+        flow = flows.get(step.flow_id)
+        if flow is None:
+            continue
+        step.flow = flow
+        steps[step.id] = _compile_step(step, models, send_message_model)
+        templating.precompile(step.config, templates)
+        if step.is_entry_point and step.flow_id not in entry_steps:
+            entry_steps[step.flow_id] = step
+
+    templating.install_precompiled(templates)
+
+    for transition in FlowTransition.objects.order_by('current_step_id', 'priority', 'id'):
+        current = steps.get(transition.current_step_id)
+        target = steps.get(transition.next_step_id)
+        if current is None or target is None:
+            continue
+        transition.current_step = current.step
+        transition.next_step = target.step
+        current.transitions.append(_compile_transition(transition))
+
+    compiled_flows = {}
+    for flow_id, flow in flows.items():
+        keywords = flow.trigger_keywords if isinstance(flow.trigger_keywords, list) else []
+        compiled_flows[flow_id] = CompiledFlow(
+            flow=flow,
+            entry_step=entry_steps.get(flow_id),
+            trigger_keywords=tuple(
+                kw.strip().lower() for kw in keywords if isinstance(kw, str) and kw.strip()
+            ),
+        )
+
+    logger.info(f"Flow graph compiled (version {version}): {len(compiled_flows)} flows, {len(steps)} steps.")
+    return FlowGraph(version, compiled_flows, steps)
+
+
+# --------------------------------------------------------------------------- #
+#  Process-local cache + shared version counter                                #
+# --------------------------------------------------------------------------- #
+
+_graph: Optional[FlowGraph] = None
+
+
+def _shared_version():
+    """The current definition version from Redis, or None if unreachable."""
+    from whatsappcrm_backend.redis_client import get_redis
+    try:
+        return int(get_redis().get(database_key(VERSION_KEY)) or 0)
+    except Exception:
+        logger.warning("Flow graph: Redis unavailable for version check; falling back to TTL rebuilds.", exc_info=True)
+        return None
+
+
+def get_flow_graph() -> FlowGraph:
+    global _graph
+    graph = _graph
+    now = time.monotonic()
+    if graph is not None and now - graph.checked_at < VERSION_CHECK_INTERVAL_SECONDS:
+        return graph
+
+    if commit_pending(_bump_shared_version):
+        # Our own uncommitted edits must be visible to us, but a graph built
+        # from them can't be cached: if the transaction rolls back nothing
+        # would ever invalidate it.
+        return build_flow_graph(None)
+
+    version = _shared_version()
+    if graph is not None:
+        if version is not None and version == graph.version:
+            graph.checked_at = now
+            return graph
+        if version is None and now - graph.built_at < FALLBACK_TTL_SECONDS:
+            graph.checked_at = now
+            return graph
+
+    graph = build_flow_graph(version)
+    _graph = graph
+    return graph
+
+
+def _bump_shared_version():
+    from whatsappcrm_backend.redis_client import get_redis
+    try:
+        get_redis().incr(database_key(VERSION_KEY))
+    except Exception:
+        logger.warning("Flow graph: Redis unavailable; other processes will pick up the change after their fallback TTL.", exc_info=True)
+
+
+def invalidate_flow_graph():
+    """Drop this process's graph now and bump the shared version once the
+    current transaction (if any) commits, so other processes never rebuild
+    from uncommitted rows."""
+    global _graph
+    _graph = None
+    after_commit(_bump_shared_version)
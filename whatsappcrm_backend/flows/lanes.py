@@ -0,0 +1,178 @@
+# whatsappcrm_backend/flows/lanes.py
+"""
+Per-contact ordered processing lanes for incoming messages.
+
+process_flow_for_message_task is one shared task, so two quick taps from the
+same contact can run out of order or at the same time on different workers;
+the second then blocks a worker slot on ContactFlowState's select_for_update
+until the first finishes. With settings.FLOW_PROCESSING_LANES > 0, incoming
+messages are instead routed through a fixed number of lanes:
+
+  * each contact's whatsapp_id maps to one lane by jump consistent hashing,
+    so changing the lane count only moves ~1/N of contacts to another lane;
+  * a lane is a Redis list of message ids plus an owner key. Whoever pushes
+    into an unowned lane claims it and starts process_flow_lane_task, which
+    processes the lane's messages one at a time, in arrival order;
+  * lanes drain in parallel, so throughput scales with flow workers while a
+    contact's messages are never processed concurrently or reordered.
+
+Pushing/claiming and popping/releasing are each a single Lua script, so a
+message pushed while the owner is finishing up is never stranded. The owner
+key expires (LANE_OWNER_TTL_MS) if a worker dies mid-lane, and
+sweep_flow_lanes_task (Celery Beat) restarts any non-empty lane left without
+an owner. A message popped by a worker that then dies is lost, as a Celery
+task acknowledged on receipt would be today.
+
+If Redis is unavailable, dispatch falls back to the plain shared task.
+"""
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+
+logger = logging.getLogger(__name__)
+
+LANE_KEY = 'flows:lane:{}:{}'  # database, lane
+LANE_OWNER_KEY = 'flows:lane:{}:{}:owner'
+LANE_OWNER_TTL_MS = 5 * 60 * 1000
+# Messages one process_flow_lane_task run handles before handing the lane to a
+# fresh task, so a busy lane can't monopolise a worker.
+MESSAGES_PER_RUN = 50
+
+# RPUSH the message id and claim the lane if nobody owns it. Returns 1 if the
+# caller now owns the lane and must start a drain.
+_PUSH_AND_CLAIM = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+if redis.call('SET', KEYS[2], ARGV[2], 'NX', 'PX', ARGV[3]) then
+    return 1
+end
+return 0
+"""
+
+# Pop the next message id while keeping ownership alive, or give the lane up
+# when it is empty. Atomic with _PUSH_AND_CLAIM, so an empty lane is released
+# and a new push claims it -- never both missed.
+_POP_OR_RELEASE = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return false
+end
+local message_id = redis.call('LPOP', KEYS[1])
+if message_id then
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+else
+    redis.call('DEL', KEYS[2])
+end
+return message_id
+"""
+
+_scripts = {}
+
+
+def _script(redis_client, source):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis_client.register_script(source)
+    return script
+
+
+def lane_count() -> int:
+    return int(getattr(settings, 'FLOW_PROCESSING_LANES', 0) or 0)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Lamping & Veach jump consistent hash of a 64-bit key into `buckets`."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def lane_for(whatsapp_id: str, lanes: int = None) -> int:
+    lanes = lanes or lane_count()
+    digest = hashlib.blake2b(str(whatsapp_id).encode('utf-8'), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, 'big'), lanes)
+
+
+def _keys(lane: int):
+    return database_key(LANE_KEY, lane), database_key(LANE_OWNER_KEY, lane)
+
+
+def dispatch_flow_processing(message_id: int, whatsapp_id: str):
+    """Queue flow processing for an incoming message, on the contact's lane
+    when lanes are enabled."""
+    from .tasks import process_flow_for_message_task
+
+    lanes = lane_count()
+    if lanes <= 0 or not whatsapp_id:
+        process_flow_for_message_task.delay(message_id)
+        return
+
+    lane = lane_for(whatsapp_id, lanes)
+    token = uuid.uuid4().hex
+    try:
+        redis_client = get_redis()
+        claimed = _script(redis_client, _PUSH_AND_CLAIM)(
+            keys=list(_keys(lane)),
+            args=[message_id, token, LANE_OWNER_TTL_MS],
+        )
+    except Exception:
+        logger.warning(f"Redis unavailable for flow lanes; processing message {message_id} on the shared queue.", exc_info=True)
+        process_flow_for_message_task.delay(message_id)
+        return
+
+    if claimed:
+        _start_lane(lane, token)
+
+
+def _start_lane(lane: int, token: str):
+    from .tasks import process_flow_lane_task
+    try:
+        process_flow_lane_task.delay(lane, token)
+    except Exception:
+        # The owner key expires and the sweeper restarts the lane.
+        logger.error(f"Could not start flow lane {lane}; it will be restarted by the lane sweeper.", exc_info=True)
+
+
+def drain_lane(lane: int, token: str, process_message):
+    """Process up to MESSAGES_PER_RUN messages from `lane` while holding its
+    ownership `token`. Returns True if the lane still has work and is still
+    owned by `token`, i.e. the caller should continue it in a new task."""
+    redis_client = get_redis()
+    pop = _script(redis_client, _POP_OR_RELEASE)
+    keys = list(_keys(lane))
+    for _ in range(MESSAGES_PER_RUN):
+        message_id = pop(keys=keys, args=[token, LANE_OWNER_TTL_MS])
+        if message_id is None:
+            return False
+        process_message(int(message_id))
+    return True
+
+
+def sweep_lanes() -> int:
+    """Restart non-empty lanes that have no owner. Returns how many."""
+    lanes = lane_count()
+    if lanes <= 0:
+        return 0
+    redis_client = get_redis()
+    pipe = redis_client.pipeline(transaction=False)
+    keys = [_keys(lane) for lane in range(lanes)]
+    for lane_key, owner_key in keys:
+        pipe.llen(lane_key)
+        pipe.exists(owner_key)
+    results = pipe.execute()
+
+    restarted = 0
+    for lane in range(lanes):
+        length, owned = results[2 * lane], results[2 * lane + 1]
+        if length and not owned:
+            token = uuid.uuid4().hex
+            if redis_client.set(keys[lane][1], token, nx=True, px=LANE_OWNER_TTL_MS):
+                logger.warning(f"Flow lane {lane} had {length} queued message(s) and no owner; restarting it.")
+                _start_lane(lane, token)
+                restarted += 1
+    return restarted
@@ -23,9 +23,12 @@ from conversations.models import Contact # Direct import as originally specified
 from conversations.models import Message # Direct import as originally specified
 from football_data_app.models import FootballFixture # Direct import as originally specified (renamed from Match)
 from customer_data.models import CustomerProfile # Direct import as originally specified
+from stats.rollups import FLOW_COMPLETIONS, record_event
 
 # Flow related models (relative import as originally specified)
-from .models import Flow, FlowStep, FlowTransition, ContactFlowState
+from .models import FlowStep, FlowTransition, ContactFlowState
+from .flow_graph import get_flow_graph
+from . import templating
 
 # Conditional imports as per your original structure
 try:
@@ -87,7 +90,8 @@ FOOTBALL_APP_ENABLED = False
 try:
     # These imports assume 'football_data_app' is directly on Python path or known to Django
     from football_data_app.flow_actions import handle_football_betting_action # Assuming renamed to handle_football_betting_action
-    from football_data_app.utils import get_formatted_football_data, generate_fixtures_pdf # Assuming this is in utils.py
+    from football_data_app.utils import get_formatted_football_data # Assuming this is in utils.py
+    from football_data_app.fixtures_pdf import get_fixtures_pdf
     FOOTBALL_APP_ENABLED = True
 except ImportError as e:
     logger.warning(f"football_data_app.flow_actions or utils could not be imported. Football-related actions will not work. Error: {e}")
@@ -543,153 +547,65 @@ class StepConfigEndFlow(BasePydanticConfig):
 InteractiveMessagePayload.model_rebuild()
 
 
+def _compiled_step(step: FlowStep):
+    """The compiled-graph entry for `step`, or None for unsaved (ad-hoc) steps
+    and steps whose config no longer matches the compiled copy."""
+    if not step.pk:
+        return None
+    compiled = get_flow_graph().steps.get(step.pk)
+    if compiled is None or (compiled.step is not step and compiled.step.config != step.config):
+        return None
+    return compiled
+
+
+def _validated_step_config(step: FlowStep, model_cls):
+    """
+    Return the step's config validated as `model_cls`, reusing the model the flow
+    graph validated at compile time when there is one. Otherwise validates here,
+    raising ValidationError exactly as a direct `model_validate` would.
+    """
+    prevalidated = getattr(step, '_prevalidated_config', None)
+    if isinstance(prevalidated, model_cls):
+        return prevalidated
+    compiled = _compiled_step(step)
+    if compiled is not None and isinstance(compiled.config_model, model_cls):
+        return compiled.config_model
+    return model_cls.model_validate(step.config or {})
+
+
+def _message_step(step: FlowStep, suffix: str, message_config: dict) -> FlowStep:
+    """An unsaved send_message step for a question prompt / end_flow message,
+    carrying the graph's pre-validated message model when available."""
+    message_step = FlowStep(name=f"{step.name}_{suffix}", step_type="send_message", config=message_config)
+    compiled = _compiled_step(step)
+    if compiled is not None and compiled.message_model is not None:
+        message_step._prevalidated_config = compiled.message_model
+    return message_step
+
+
 # --- Helper Functions ---
 # _execute_step_actions calls other helpers like _get_value_from_context_or_contact, _resolve_value etc.
 # These helper functions have been updated to match the new Pydantic structure and action types.
 
-def _get_value_from_context_or_contact(variable_path: str, flow_context: dict, contact: Contact) -> Any:
+def _get_value_from_context_or_contact(variable_path: str, flow_context: dict, contact: Contact, scope: Optional[templating.RenderScope] = None) -> Any:
     """
     Safely retrieves a value from flow_context or contact/customer_profile object using dot notation.
     Handles nested dictionaries and model attributes, including callable attributes.
+    Paths are parsed once into cached accessor chains (see flows/templating.py).
+    Pass the step's `scope` so the customer profile is loaded once per step, not per lookup.
     """
-    logger.debug(f"Resolving variable path: '{variable_path}' for contact {contact.whatsapp_id} (ID: {contact.id})")
     if not variable_path:
-        logger.debug("Empty variable_path received.")
         return None
+    return templating.compile_path(variable_path).resolve(flow_context, scope or templating.RenderScope(contact))
 
-    parts = variable_path.split('.')
-    source_object_name = parts[0]
-    current_value = None
-
-    if source_object_name == 'flow_context':
-        current_value = flow_context
-        path_to_traverse = parts[1:]
-        logger.debug(f"Accessing flow_context. Path to traverse: {path_to_traverse}. Current context keys: {list(flow_context.keys())}")
-    elif source_object_name == 'contact':
-        current_value = contact
-        path_to_traverse = parts[1:]
-        logger.debug(f"Accessing contact attributes. Path to traverse: {path_to_traverse}")
-    elif source_object_name == 'customer_profile':
-        try:
-            current_value = contact.customerprofile # Note: Use .customerprofile for OneToOne related_name
-            path_to_traverse = parts[1:]
-            logger.debug(f"Accessing customer_profile attributes for contact {contact.id}. Path to traverse: {path_to_traverse}")
-        except CustomerProfile.DoesNotExist:
-            logger.debug(f"CustomerProfile does not exist for contact {contact.id} when trying to access '{variable_path}'")
-            return None
-        except AttributeError: # If related object is None (e.g., customerprofile not yet created)
-            logger.warning(f"Contact {contact.id} has no 'customerprofile' related object (or it's None) for path '{variable_path}'")
-            return None
-    else:
-        # If the path doesn't start with a known source, assume it's a top-level flow_context variable
-        current_value = flow_context
-        path_to_traverse = parts
-        logger.debug(f"Defaulting to flow_context for path '{variable_path}'. Path to traverse: {path_to_traverse}. Current context keys: {list(flow_context.keys())}")
-
-    for i, part in enumerate(path_to_traverse):
-        if current_value is None:
-            logger.debug(f"Intermediate value became None at part '{part}' (index {i}) for path '{variable_path}'.")
-            return None
-        try:
-            if isinstance(current_value, dict):
-                current_value = current_value.get(part)
-            elif hasattr(current_value, part):
-                attr_or_method = getattr(current_value, part)
-                if callable(attr_or_method):
-                    # Handle callable attributes (methods, properties)
-                    try:
-                        num_args = -1
-                        # For methods on instances (including properties)
-                        if hasattr(attr_or_method, '__func__'):
-                            # inspect.signature might be more robust, but this checks for 'self' arg
-                            num_args = attr_or_method.__func__.__code__.co_argcount - (1 if not isinstance(attr_or_method.__self__, type) else 0) 
-                            if num_args == 0:
-                                current_value = attr_or_method()
-                                logger.debug(f"Called method '{part}' from path '{variable_path}'.")
-                            else:
-                                logger.debug(f"Method '{part}' requires {num_args} args, returning method itself for path '{variable_path}'.")
-                                current_value = attr_or_method # Return the callable if it needs args
-                        # For plain functions or staticmethods (no 'self' arg)
-                        elif hasattr(attr_or_method, '__code__'):
-                            num_args = attr_or_method.__code__.co_argcount
-                            if num_args == 0:
-                                current_value = attr_or_method()
-                                logger.debug(f"Called function/static method '{part}' from path '{variable_path}'.")
-                            else:
-                                logger.debug(f"Function '{part}' requires {num_args} args, returning function itself for path '{variable_path}'.")
-                                current_value = attr_or_method
-                        else: # Fallback for other callable types
-                            logger.debug(f"Unknown callable type for '{part}', returning as is for path '{variable_path}'.")
-                            current_value = attr_or_method
-                    except TypeError as te_callable:
-                        logger.warning(f"TypeError calling method/function '{part}' for path '{variable_path}': {te_callable}. Returning callable as is.")
-                        current_value = attr_or_method
-                    except Exception as e_callable:
-                        logger.warning(f"Error calling method/function '{part}' for path '{variable_path}': {e_callable}. Returning callable as is.")
-                        current_value = attr_or_method
-                else:
-                    current_value = attr_or_method # It's a non-callable attribute
-            else:
-                logger.debug(f"Part '{part}' not found in current object for path '{variable_path}'. Current object type: {type(current_value).__name__}, value: {str(current_value)[:100]}")
-                return None
-        except Exception as e:
-            logger.warning(f"Unexpected error accessing part '{part}' of path '{variable_path}': {e}", exc_info=True)
-            return None
-            
-    resolved_val_str = str(current_value)
-    logger.debug(f"Resolved path '{variable_path}' to value: '{resolved_val_str[:100]}{'...' if len(resolved_val_str) > 100 else ''}' (Type: {type(current_value).__name__})")
-
-    # Ensure that 'type' objects are converted to their string representation
-    # This prevents TypeError: Object of type type is not JSON serializable when saving to JSONField.
-    if isinstance(current_value, type):
-        return str(current_value)
-    return current_value
-
-def _resolve_value(template_value: Any, flow_context: dict, contact: Contact) -> Any:
+def _resolve_value(template_value: Any, flow_context: dict, contact: Contact, scope: Optional[templating.RenderScope] = None) -> Any:
     """
-    Recursively resolves template strings within a value using _get_value_from_context_or_contact.
-    Handles nested dictionaries and lists.
+    Recursively resolves template strings within a value using precompiled templates.
+    Handles nested dictionaries and lists; the customer profile is loaded at most once per `scope`.
     """
-    if isinstance(template_value, str):
-        # Find all {{ variable_path }} occurrences
-        variable_pattern = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
-        resolved_string = template_value
-        
-        # Iteratively resolve templates to handle nested or chained templates (up to 10 levels)
-        for i in range(10): 
-            original_string_for_iteration = resolved_string
-            matches = list(variable_pattern.finditer(resolved_string))
-            if not matches:
-                break # No more templates to resolve
-
-            new_parts = []
-            last_end = 0
-            for match in matches:
-                new_parts.append(resolved_string[last_end:match.start()]) # Add text before match
-                var_path = match.group(1).strip() # Extract variable path
-                val = _get_value_from_context_or_contact(var_path, flow_context, contact) # Resolve variable
-                new_parts.append(str(val) if val is not None else '') # Add resolved value
-                last_end = match.end() # Move cursor past the match
-            
-            new_parts.append(resolved_string[last_end:]) # Add remaining text after last match
-            resolved_string = "".join(new_parts)
+    return templating.render_value(template_value, flow_context, scope or templating.RenderScope(contact))
 
-            # Break if no change occurred (all templates resolved or unresolved)
-            if resolved_string == original_string_for_iteration:
-                break
-            # Also break if no more templates are found, faster than waiting for no change
-            if not variable_pattern.search(resolved_string):
-                break
-            if i == 9: # Warn if max iterations reached
-                logger.warning(f"Template string resolution reached max iterations (10) for input: '{template_value}'. Result: '{resolved_string}'")
-        return resolved_string
-    elif isinstance(template_value, dict):
-        return {k: _resolve_value(v, flow_context, contact) for k, v in template_value.items()}
-    elif isinstance(template_value, list):
-        return [_resolve_value(item, flow_context, contact) for item in template_value]
-    return template_value # Return non-string, non-dict, non-list values as is
-
-def _inject_dynamic_interactive_content(interactive_dict: dict, flow_context: dict, contact: Contact, step=None) -> dict:
+def _inject_dynamic_interactive_content(interactive_dict: dict, flow_context: dict, contact: Contact, step=None, scope: Optional[templating.RenderScope] = None) -> dict:
     """
     Splice dynamically-generated list sections or reply buttons into an interactive
     payload. When a list action carries `sections_from` (or a button action carries
@@ -708,7 +624,7 @@ def _inject_dynamic_interactive_content(interactive_dict: dict, flow_context: di
 
         if 'sections_from' in action:
             var_path = action.pop('sections_from')
-            sections = _get_value_from_context_or_contact(var_path, flow_context, contact)
+            sections = _get_value_from_context_or_contact(var_path, flow_context, contact, scope=scope)
             if not isinstance(sections, list) or not sections:
                 logger.warning(f"Step '{step_name}': sections_from '{var_path}' resolved to empty/invalid; sending a placeholder row.")
                 sections = [{"rows": [{"id": "none_available", "title": "None available"}]}]
@@ -720,7 +636,7 @@ def _inject_dynamic_interactive_content(interactive_dict: dict, flow_context: di
 
         if 'buttons_from' in action:
             var_path = action.pop('buttons_from')
-            buttons = _get_value_from_context_or_contact(var_path, flow_context, contact)
+            buttons = _get_value_from_context_or_contact(var_path, flow_context, contact, scope=scope)
             if not isinstance(buttons, list) or not buttons:
                 logger.warning(f"Step '{step_name}': buttons_from '{var_path}' resolved to empty/invalid; sending a placeholder button.")
                 buttons = [{"type": "reply", "reply": {"id": "none_available", "title": "None available"}}]
@@ -730,7 +646,7 @@ def _inject_dynamic_interactive_content(interactive_dict: dict, flow_context: di
     return interactive_dict
 
 
-def _resolve_template_components(components_config: list, flow_context: dict, contact: Contact) -> list:
+def _resolve_template_components(components_config: list, flow_context: dict, contact: Contact, scope: Optional[templating.RenderScope] = None) -> list:
     """
     Resolves template parameters within WhatsApp template message components.
     """
@@ -761,7 +677,7 @@ def _resolve_template_components(components_config: list, flow_context: dict, co
                     # Resolve 'text' parameters
                     if 'text' in param and isinstance(param['text'], str):
                         original_text = param['text']
-                        param['text'] = _resolve_value(param['text'], flow_context, contact)
+                        param['text'] = _resolve_value(param['text'], flow_context, contact, scope=scope)
                         if original_text != param['text']: logger.debug(f"Resolved param text from '{original_text}' to: '{param['text']}'")
                     
                     # Resolve media (image, video, document) links
@@ -769,25 +685,25 @@ def _resolve_template_components(components_config: list, flow_context: dict, co
                         media_obj = param[param_type]
                         if 'link' in media_obj and isinstance(media_obj['link'], str):
                             original_link = media_obj['link']
-                            media_obj['link'] = _resolve_value(media_obj['link'], flow_context, contact)
+                            media_obj['link'] = _resolve_value(media_obj['link'], flow_context, contact, scope=scope)
                             if original_link != media_obj['link']: logger.debug(f"Resolved media link from '{original_link}' to: {media_obj['link']}")
                     
                     # Resolve button 'payload'
                     if component.get('type') == 'button' and param.get('type') == 'payload' and 'payload' in param and isinstance(param['payload'], str):
                         original_payload = param['payload']
-                        param['payload'] = _resolve_value(param['payload'], flow_context, contact)
+                        param['payload'] = _resolve_value(param['payload'], flow_context, contact, scope=scope)
                         if original_payload != param['payload']: logger.debug(f"Resolved button payload from '{original_payload}' to: {param['payload']}")
 
                     # Resolve currency fallback value
                     if param_type == 'currency' and isinstance(param.get('currency'), dict) and 'fallback_value' in param['currency'] and isinstance(param['currency']['fallback_value'], str) :
                         original_fb_val = param['currency']['fallback_value']
-                        param['currency']['fallback_value'] = _resolve_value(param['currency']['fallback_value'], flow_context, contact)
+                        param['currency']['fallback_value'] = _resolve_value(param['currency']['fallback_value'], flow_context, contact, scope=scope)
                         if original_fb_val != param['currency']['fallback_value']: logger.debug(f"Resolved currency fallback from '{original_fb_val}' to: {param['currency']['fallback_value']}")
 
                     # Resolve date_time fallback value
                     if param_type == 'date_time' and isinstance(param.get('date_time'), dict) and 'fallback_value' in param['date_time'] and isinstance(param['date_time']['fallback_value'], str):
                         original_fb_val = param['date_time']['fallback_value']
-                        param['date_time']['fallback_value'] = _resolve_value(param['date_time']['fallback_value'], flow_context, contact)
+                        param['date_time']['fallback_value'] = _resolve_value(param['date_time']['fallback_value'], flow_context, contact, scope=scope)
                         if original_fb_val != param['date_time']['fallback_value']: logger.debug(f"Resolved date_time fallback from '{original_fb_val}' to: {param['date_time']['fallback_value']}")
             
         logger.debug(f"Finished resolving template components. Final data (sample): {str(resolved_components_list)[:200]}")
@@ -883,7 +799,7 @@ def _update_contact_data(contact: Contact, field_path: str, value_to_set: Any):
         logger.warning(f"Unsupported field path structure '{field_path}' for updating Contact model for contact {contact.whatsapp_id}.")
 
 
-def _update_customer_profile_data(contact: Contact, fields_to_update_config: Dict[str, Any], flow_context: dict):
+def _update_customer_profile_data(contact: Contact, fields_to_update_config: Dict[str, Any], flow_context: dict, scope: Optional[templating.RenderScope] = None):
     """
     Updates fields on the CustomerProfile model. Handles special mappings (e.g., gender, date_of_birth)
     and assumes CustomerProfile has JSONFields named 'preferences' and 'custom_attributes' if used.
@@ -903,7 +819,7 @@ def _update_customer_profile_data(contact: Contact, fields_to_update_config: Dic
     changed_fields = []
     for field_name, value_template in fields_to_update_config.items():
         # Resolve value from template
-        resolved_value = _resolve_value(value_template, flow_context, contact)
+        resolved_value = _resolve_value(value_template, flow_context, contact, scope=scope)
         
         logger.debug(f"For CustomerProfile of {contact.whatsapp_id}, field '{field_name}', resolved value from template '{value_template}': '{str(resolved_value)[:100]}'.")
 
@@ -1006,9 +922,13 @@ def _update_customer_profile_data(contact: Contact, fields_to_update_config: Dic
     else:
         logger.debug(f"No fields changed in CustomerProfile for {contact.whatsapp_id}. No save needed.")
 
+    if scope is not None:
+        # Later templates in this step must see the profile as just written.
+        scope.use_customer_profile(profile)
+
 
 @transaction.atomic
-def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict, is_re_execution: bool = False) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict, is_re_execution: bool = False, scope: Optional[templating.RenderScope] = None) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """
     Executes actions defined for a given flow step. This includes sending messages,
     updating contact/customer profile data, switching flows, and triggering integrations.
@@ -1016,6 +936,8 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
     actions_to_perform = []
     # Make a copy of context to ensure changes are reflected in this execution scope
     current_step_context = flow_context.copy()
+    # One render scope for the whole step, so every template shares a single profile load.
+    scope = scope or templating.RenderScope(contact)
 
     logger.debug(
         f"Executing actions for step '{step.name}' (ID: {step.id}, Type: {step.step_type}) "
@@ -1027,7 +949,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
     if step.step_type == 'send_message':
         try:
-            send_message_config = StepConfigSendMessage.model_validate(raw_step_config)
+            send_message_config = _validated_step_config(step, StepConfigSendMessage)
             actual_message_type = send_message_config.message_type
             final_api_data_structure = {}
             logger.debug(f"Step '{step.name}': Validated send_message config. Type: '{actual_message_type}'.")
@@ -1062,7 +984,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                 if single_var_match:
                     variable_path = single_var_match.group(1).strip()
                     # Directly get the value of the variable from context/contact
-                    potential_list_value = _get_value_from_context_or_contact(variable_path, current_step_context, contact)
+                    potential_list_value = _get_value_from_context_or_contact(variable_path, current_step_context, contact, scope=scope)
                     logger.debug(f"Step '{step.name}': Single variable template detected: '{variable_path}'. Value type: {type(potential_list_value).__name__}, Is list: {isinstance(potential_list_value, list)}")
                     if potential_list_value is not None and isinstance(potential_list_value, list):
                         logger.debug(f"Step '{step.name}': List has {len(potential_list_value)} items. First item preview: {str(potential_list_value[0])[:200] if potential_list_value else 'N/A'}")
@@ -1129,11 +1051,11 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
                 if not valid_source_found:
                     if media_conf.id:
-                        media_data_to_send['id'] = _resolve_value(media_conf.id, current_step_context, contact)
+                        media_data_to_send['id'] = _resolve_value(media_conf.id, current_step_context, contact, scope=scope)
                         valid_source_found = True
                         logger.debug(f"Step '{step.name}': Using direct media ID '{media_data_to_send['id']}'.")
                     elif media_conf.link:
-                        media_data_to_send['link'] = _resolve_value(media_conf.link, current_step_context, contact)
+                        media_data_to_send['link'] = _resolve_value(media_conf.link, current_step_context, contact, scope=scope)
                         valid_source_found = True
                         logger.debug(f"Step '{step.name}': Using direct media link '{media_data_to_send['link']}'.")
                 
@@ -1141,22 +1063,22 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                     logger.error(f"Step '{step.name}': No valid media source (asset_pk, id, or link) for '{actual_message_type}'. Message part will be missing.")
                 else:
                     if media_conf.caption:
-                        media_data_to_send['caption'] = _resolve_value(media_conf.caption, current_step_context, contact)
+                        media_data_to_send['caption'] = _resolve_value(media_conf.caption, current_step_context, contact, scope=scope)
                     if actual_message_type == 'document' and media_conf.filename:
-                        media_data_to_send['filename'] = _resolve_value(media_conf.filename, current_step_context, contact)
+                        media_data_to_send['filename'] = _resolve_value(media_conf.filename, current_step_context, contact, scope=scope)
                     final_api_data_structure = media_data_to_send
 
             elif actual_message_type == "interactive":
                 interactive_payload_obj: InteractiveMessagePayload = payload_field_value
                 # Access interactive payload dictionary to allow resolution
                 interactive_payload_dict = interactive_payload_obj.model_dump(exclude_none=True, by_alias=True)
-                resolved_interactive_dict = _resolve_value(interactive_payload_dict, current_step_context, contact)
+                resolved_interactive_dict = _resolve_value(interactive_payload_dict, current_step_context, contact, scope=scope)
                 # Support dynamically-generated list sections / buttons sourced from a
                 # flow-context variable. A preceding action step builds the rows/buttons
                 # (e.g. the fixture browser or bet-slip) and stores them in context; here
                 # we splice them into the payload in place of the static structure.
                 resolved_interactive_dict = _inject_dynamic_interactive_content(
-                    resolved_interactive_dict, current_step_context, contact, step
+                    resolved_interactive_dict, current_step_context, contact, step, scope=scope
                 )
                 logger.debug(f"Step '{step.name}': Resolved interactive payload: {json.dumps(resolved_interactive_dict, indent=2)}")
                 final_api_data_structure = resolved_interactive_dict
@@ -1166,7 +1088,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                 template_payload_dict = template_payload_obj.model_dump(exclude_none=True, by_alias=True)
                 if 'components' in template_payload_dict and template_payload_dict['components']:
                     template_payload_dict['components'] = _resolve_template_components(
-                        template_payload_dict['components'], current_step_context, contact
+                        template_payload_dict['components'], current_step_context, contact, scope=scope
                     )
                 logger.debug(f"Step '{step.name}': Resolved template payload: {json.dumps(template_payload_dict, indent=2)}")
                 final_api_data_structure = template_payload_dict
@@ -1174,7 +1096,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
             elif actual_message_type == "contacts":
                 contacts_list_of_objects: List[ContactObject] = payload_field_value
                 contacts_list_of_dicts = [c.model_dump(exclude_none=True, by_alias=True) for c in contacts_list_of_objects]
-                resolved_contacts_list = _resolve_value(contacts_list_of_dicts, current_step_context, contact)
+                resolved_contacts_list = _resolve_value(contacts_list_of_dicts, current_step_context, contact, scope=scope)
                 logger.debug(f"Step '{step.name}': Resolved contacts payload: {json.dumps(resolved_contacts_list, indent=2)}")
                 final_api_data_structure = {"contacts": resolved_contacts_list}
 
@@ -1182,7 +1104,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                 location_obj: LocationMessageContent = payload_field_value
                 location_dict = location_obj.model_dump(exclude_none=True, by_alias=True)
                 # Location data is typically fixed, but resolving allows for templates in name/address
-                resolved_location_dict = _resolve_value(location_dict, current_step_context, contact) 
+                resolved_location_dict = _resolve_value(location_dict, current_step_context, contact, scope=scope) 
                 logger.debug(f"Step '{step.name}': Resolved location payload: {json.dumps(resolved_location_dict, indent=2)}")
                 final_api_data_structure = resolved_location_dict
 
@@ -1207,18 +1129,14 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
     elif step.step_type == 'question':
         try:
-            question_config = StepConfigQuestion.model_validate(raw_step_config)
+            question_config = _validated_step_config(step, StepConfigQuestion)
             logger.debug(f"Validated 'question' step '{step.name}' (ID: {step.id}) config.")
             if question_config.message_config and not is_re_execution:
                 logger.info(f"Processing message_config for question step '{step.name}'.")
                 try:
-                    dummy_send_step = FlowStep(
-                        name=f"{step.name}_prompt_message",
-                        step_type="send_message",
-                        config=question_config.message_config
-                    )
+                    dummy_send_step = _message_step(step, "prompt_message", question_config.message_config)
                     # Recursively call _execute_step_actions to handle sending the question prompt
-                    send_actions, _ = _execute_step_actions(dummy_send_step, contact, current_step_context.copy())
+                    send_actions, _ = _execute_step_actions(dummy_send_step, contact, current_step_context.copy(), scope=scope)
                     actions_to_perform.extend(send_actions)
                     logger.debug(f"Generated {len(send_actions)} send actions for question prompt of step '{step.name}'.")
                 except ValidationError as ve:
@@ -1241,7 +1159,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
     elif step.step_type == 'action':
         try:
-            action_step_config = StepConfigAction.model_validate(raw_step_config)
+            action_step_config = _validated_step_config(step, StepConfigAction)
             logger.debug(f"Validated 'action' step '{step.name}' (ID: {step.id}) config with {len(action_step_config.actions_to_run)} actions.")
             
             for i, action_item_conf in enumerate(action_step_config.actions_to_run):
@@ -1299,16 +1217,16 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                     logger.info(f"Step '{step.name}': Context variable '{action_item_root.variable_name}' set to: '{str(resolved_value)[:100]}'.")
                 
                 elif action_type == ActionType.UPDATE_CONTACT_FIELD:
-                    resolved_value = _resolve_value(action_item_root.value_template, current_step_context, contact)
+                    resolved_value = _resolve_value(action_item_root.value_template, current_step_context, contact, scope=scope)
                     _update_contact_data(contact, action_item_root.field_path, resolved_value)
                 
                 elif action_type == ActionType.UPDATE_CUSTOMER_PROFILE:
-                    resolved_fields_to_update = _resolve_value(action_item_root.fields_to_update, current_step_context, contact)
-                    _update_customer_profile_data(contact, resolved_fields_to_update, current_step_context)
+                    resolved_fields_to_update = _resolve_value(action_item_root.fields_to_update, current_step_context, contact, scope=scope)
+                    _update_customer_profile_data(contact, resolved_fields_to_update, current_step_context, scope=scope)
                 
                 elif action_type == ActionType.SWITCH_FLOW:
-                    resolved_initial_context = _resolve_value(action_item_root.initial_context_template or {}, current_step_context, contact)
-                    resolved_trigger_keyword = _resolve_value(action_item_root.trigger_keyword_template, current_step_context, contact)
+                    resolved_initial_context = _resolve_value(action_item_root.initial_context_template or {}, current_step_context, contact, scope=scope)
+                    resolved_trigger_keyword = _resolve_value(action_item_root.trigger_keyword_template, current_step_context, contact, scope=scope)
                     logger.info(f"Step '{step.name}': Queuing switch to flow via keyword '{resolved_trigger_keyword}'. Initial context: {resolved_initial_context}")
                     actions_to_perform.append({
                         'type': '_internal_command_switch_flow',
@@ -1326,7 +1244,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
                     selected_league_code = None
                     if hasattr(action_item_root, 'league_code_variable') and action_item_root.league_code_variable:
-                        selected_league_code = _get_value_from_context_or_contact(action_item_root.league_code_variable, current_step_context, contact)
+                        selected_league_code = _get_value_from_context_or_contact(action_item_root.league_code_variable, current_step_context, contact, scope=scope)
 
                     days_past = action_item_root.days_past_for_results
                     days_ahead = action_item_root.days_ahead_for_fixtures
@@ -1335,7 +1253,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                     if action_item_root.data_type == "scheduled_fixtures":
                         logger.info(f"Step '{step.name}': Generating PDF for scheduled fixtures. League code: '{selected_league_code}'.")
                         
-                        pdf_path = generate_fixtures_pdf(
+                        pdf_path = get_fixtures_pdf(
                             data_type="scheduled_fixtures",
                             league_code=selected_league_code,
                             days_ahead=days_ahead
@@ -1386,11 +1304,11 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         continue
 
                     # Resolve all templates for parameters
-                    email = _resolve_value(action_item_root.email_template, current_step_context, contact) if hasattr(action_item_root, 'email_template') else None
-                    first_name = _resolve_value(action_item_root.first_name_template, current_step_context, contact) if hasattr(action_item_root, 'first_name_template') else None
-                    last_name = _resolve_value(action_item_root.last_name_template, current_step_context, contact) if hasattr(action_item_root, 'last_name_template') else None
-                    acquisition_source = _resolve_value(action_item_root.acquisition_source_template, current_step_context, contact) if hasattr(action_item_root, 'acquisition_source_template') else None
-                    referral_code = _resolve_value(action_item_root.referral_code_template, current_step_context, contact) if hasattr(action_item_root, 'referral_code_template') else None
+                    email = _resolve_value(action_item_root.email_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'email_template') else None
+                    first_name = _resolve_value(action_item_root.first_name_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'first_name_template') else None
+                    last_name = _resolve_value(action_item_root.last_name_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'last_name_template') else None
+                    acquisition_source = _resolve_value(action_item_root.acquisition_source_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'acquisition_source_template') else None
+                    referral_code = _resolve_value(action_item_root.referral_code_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'referral_code_template') else None
                     initial_balance = action_item_root.initial_balance if hasattr(action_item_root, 'initial_balance') else 0.0
 
                     result = customer_data_utils.create_or_get_customer_account(
@@ -1422,7 +1340,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         continue
                     
                     # Resolve amount and validate it's a float
-                    resolved_amount = _resolve_value(action_item_root.amount_template, current_step_context, contact)
+                    resolved_amount = _resolve_value(action_item_root.amount_template, current_step_context, contact, scope=scope)
                     try:
                         resolved_amount = float(resolved_amount)
                     except (ValueError, TypeError):
@@ -1432,9 +1350,9 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         continue
 
                     # Resolve all other templates from the action config
-                    resolved_description = _resolve_value(action_item_root.description_template, current_step_context, contact)
-                    resolved_phone_number = _resolve_value(action_item_root.phone_number_template, current_step_context, contact) if hasattr(action_item_root, 'phone_number_template') and action_item_root.phone_number_template else None
-                    resolved_paynow_method_type = _resolve_value(action_item_root.paynow_method_type_template, current_step_context, contact) if hasattr(action_item_root, 'paynow_method_type_template') and action_item_root.paynow_method_type_template else None
+                    resolved_description = _resolve_value(action_item_root.description_template, current_step_context, contact, scope=scope)
+                    resolved_phone_number = _resolve_value(action_item_root.phone_number_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'phone_number_template') and action_item_root.phone_number_template else None
+                    resolved_paynow_method_type = _resolve_value(action_item_root.paynow_method_type_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'paynow_method_type_template') and action_item_root.paynow_method_type_template else None
                     
                     # Call the updated perform_deposit function with all necessary parameters
                     result = customer_data_utils.perform_deposit(
@@ -1475,7 +1393,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         current_step_context['withdrawal_message'] = "Error: Withdrawal feature is unavailable."
                         continue
                     
-                    resolved_amount = _resolve_value(action_item_root.amount_template, current_step_context, contact)
+                    resolved_amount = _resolve_value(action_item_root.amount_template, current_step_context, contact, scope=scope)
                     # Ensure amount is float
                     try:
                         resolved_amount = float(resolved_amount)
@@ -1490,10 +1408,10 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                     if action_item_root.payment_method:
                         resolved_payment_method = action_item_root.payment_method
                     elif action_item_root.payment_method_template:
-                        resolved_payment_method = _resolve_value(action_item_root.payment_method_template, current_step_context, contact)
+                        resolved_payment_method = _resolve_value(action_item_root.payment_method_template, current_step_context, contact, scope=scope)
 
-                    resolved_phone_number = _resolve_value(action_item_root.phone_number_template, current_step_context, contact)
-                    resolved_description = _resolve_value(action_item_root.description_template, current_step_context, contact)
+                    resolved_phone_number = _resolve_value(action_item_root.phone_number_template, current_step_context, contact, scope=scope)
+                    resolved_description = _resolve_value(action_item_root.description_template, current_step_context, contact, scope=scope)
                     
                     result = customer_data_utils.perform_withdrawal(
                         whatsapp_id=contact.whatsapp_id,
@@ -1520,7 +1438,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         continue
                     
                     # Resolve all relevant parameters for betting action
-                    resolved_stake = _resolve_value(action_item_root.stake_template, current_step_context, contact) if hasattr(action_item_root, 'stake_template') else None
+                    resolved_stake = _resolve_value(action_item_root.stake_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'stake_template') else None
                     try:
                         if resolved_stake is not None:
                             resolved_stake = float(resolved_stake)
@@ -1528,13 +1446,13 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         logger.error(f"Step '{step.name}': Betting stake '{resolved_stake}' could not be converted to float.")
                         resolved_stake = None # Ensure it's None if invalid
 
-                    resolved_market_outcome_id = _resolve_value(action_item_root.market_outcome_id_template, current_step_context, contact) if hasattr(action_item_root, 'market_outcome_id_template') else None
-                    resolved_selection = _resolve_value(action_item_root.selection_template, current_step_context, contact) if getattr(action_item_root, 'selection_template', None) else None
-                    resolved_ticket_id = _resolve_value(action_item_root.ticket_id_template, current_step_context, contact) if hasattr(action_item_root, 'ticket_id_template') else None
-                    resolved_raw_bet_string = _resolve_value(action_item_root.raw_bet_string_template, current_step_context, contact) if hasattr(action_item_root, 'raw_bet_string_template') else None
+                    resolved_market_outcome_id = _resolve_value(action_item_root.market_outcome_id_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'market_outcome_id_template') else None
+                    resolved_selection = _resolve_value(action_item_root.selection_template, current_step_context, contact, scope=scope) if getattr(action_item_root, 'selection_template', None) else None
+                    resolved_ticket_id = _resolve_value(action_item_root.ticket_id_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'ticket_id_template') else None
+                    resolved_raw_bet_string = _resolve_value(action_item_root.raw_bet_string_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'raw_bet_string_template') else None
                     
                     # Parameters for view_matches/view_results (if the betting_action itself involves fetching data)
-                    resolved_league_code = _resolve_value(action_item_root.league_code_template, current_step_context, contact) if hasattr(action_item_root, 'league_code_template') else None
+                    resolved_league_code = _resolve_value(action_item_root.league_code_template, current_step_context, contact, scope=scope) if hasattr(action_item_root, 'league_code_template') else None
                     days_past = action_item_root.days_past if hasattr(action_item_root, 'days_past') else 2
                     days_ahead = action_item_root.days_ahead if hasattr(action_item_root, 'days_ahead') else 10
 
@@ -1646,7 +1564,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                         current_step_context[action_item_root.output_variable_name] = {"success": False, "message": "Agent system unavailable."}
                         continue
                     
-                    input_string = _get_value_from_context_or_contact(action_item_root.input_variable_name, current_step_context, contact)
+                    input_string = _get_value_from_context_or_contact(action_item_root.input_variable_name, current_step_context, contact, scope=scope)
                     
                     if not input_string or not isinstance(input_string, str):
                         logger.warning(f"Step '{step.name}': Input variable '{action_item_root.input_variable_name}' for get_referrer_details is missing or not a string. Value: {input_string}")
@@ -1722,14 +1640,14 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
                     from django.contrib.auth import authenticate
                     output_var = action_item_root.output_variable_name
                     pin_variable = action_item_root.pin_variable
-                    pin_value = _get_value_from_context_or_contact(pin_variable, current_step_context, contact)
+                    pin_value = _get_value_from_context_or_contact(pin_variable, current_step_context, contact, scope=scope)
                     pin_value = str(pin_value).strip() if pin_value else ""
 
                     # Optionally resolve a username from context (allows any contact to login as any user)
                     username_variable = getattr(action_item_root, 'username_variable', None)
                     provided_username = None
                     if username_variable:
-                        provided_username = _get_value_from_context_or_contact(username_variable, current_step_context, contact)
+                        provided_username = _get_value_from_context_or_contact(username_variable, current_step_context, contact, scope=scope)
                         provided_username = str(provided_username).strip() if provided_username else None
 
                     verified = False
@@ -1777,18 +1695,14 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
     elif step.step_type == 'end_flow':
         try:
-            end_flow_config = StepConfigEndFlow.model_validate(raw_step_config)
+            end_flow_config = _validated_step_config(step, StepConfigEndFlow)
             logger.info(f"Executing 'end_flow' step '{step.name}' (ID: {step.id}) for contact {contact.whatsapp_id} (ID: {contact.id}).")
             
             if end_flow_config.message_config:
                 logger.debug(f"Step '{step.name}': End_flow step has a final message to send. Config: {end_flow_config.message_config}")
                 try:
-                    dummy_end_msg_step = FlowStep(
-                        name=f"{step.name}_final_message",
-                        step_type="send_message",
-                        config=end_flow_config.message_config
-                    )
-                    send_actions, _ = _execute_step_actions(dummy_end_msg_step, contact, current_step_context.copy())
+                    dummy_end_msg_step = _message_step(step, "final_message", end_flow_config.message_config)
+                    send_actions, _ = _execute_step_actions(dummy_end_msg_step, contact, current_step_context.copy(), scope=scope)
                     actions_to_perform.extend(send_actions)
                     logger.debug(f"Generated {len(send_actions)} send actions for the final message of end_flow step '{step.name}'.")
                 except ValidationError as ve_msg_conf:
@@ -1800,6 +1714,7 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
             
             clear_reason = f'Flow ended at step {step.name} (ID: {step.id})'
             logger.info(f"Step '{step.name}': {clear_reason}. Clearing flow state directly for contact {contact.whatsapp_id}.")
+            record_event(FLOW_COMPLETIONS)
             actions_to_perform.append({'type': '_internal_command_clear_flow_state', 'reason': clear_reason}) # Defer actual clearing
             
         except ValidationError as e_conf:
@@ -1811,10 +1726,10 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
 
     elif step.step_type == 'human_handover':
         try:
-            handover_config = StepConfigHumanHandover.model_validate(raw_step_config)
+            handover_config = _validated_step_config(step, StepConfigHumanHandover)
             logger.info(f"Executing 'human_handover' step '{step.name}' (ID: {step.id}) for contact {contact.whatsapp_id}.")
             if handover_config.pre_handover_message_text and not is_re_execution:
-                resolved_msg = _resolve_value(handover_config.pre_handover_message_text, current_step_context, contact)
+                resolved_msg = _resolve_value(handover_config.pre_handover_message_text, current_step_context, contact, scope=scope)
                 logger.debug(f"Step '{step.name}': Sending pre-handover message: '{resolved_msg}'")
                 actions_to_perform.append({
                     'type': 'send_whatsapp_message',
@@ -1831,7 +1746,8 @@ def _execute_step_actions(step: FlowStep, contact: Contact, flow_context: dict,
             notification_info = _resolve_value(
                 handover_config.notification_details,
                 current_step_context,
-                contact
+                contact,
+                scope=scope,
             )
             # This action might be sent to an internal notification system, not WhatsApp directly
             logger.info(f"HUMAN_INTERVENTION_ALERT: Contact: {contact.whatsapp_id} (ID: {contact.id}), Name: {contact.name or 'N/A'}, Details: {notification_info}, Context: {json.dumps(current_step_context)}")
@@ -2008,19 +1924,14 @@ def _trigger_new_flow(contact: Contact, message_data: dict, incoming_message_obj
         message_text_body = 'register'
 
     triggered_flow = None
-    # Assuming Flow model has is_active and trigger_keywords fields
-    active_flows = Flow.objects.filter(is_active=True).order_by('name')
+    flow_graph = get_flow_graph()
 
     if message_text_body:
-        for flow_candidate in active_flows:
-            if isinstance(flow_candidate.trigger_keywords, list): # Assumes trigger_keywords is a JSONField or similar list
-                for keyword in flow_candidate.trigger_keywords:
-                    if isinstance(keyword, str) and keyword.strip() and keyword.strip().lower() in message_text_body:
-                        triggered_flow = flow_candidate
-                        logger.info(f"Keyword '{keyword}' triggered flow '{flow_candidate.name}' for contact {contact.whatsapp_id}.")
-                        break
-            if triggered_flow:
-                break # A flow was triggered, stop checking others
+        # First active flow by name with a keyword in the text, found in one pass.
+        trigger_match = flow_graph.trigger_index.match(message_text_body)
+        if trigger_match:
+            triggered_flow = trigger_match.flow
+            logger.info(f"Keyword '{trigger_match.keyword}' triggered flow '{triggered_flow.name}' for contact {contact.whatsapp_id}.")
     
     if triggered_flow:
         # --- Session security check ---
@@ -2069,7 +1980,7 @@ def _trigger_new_flow(contact: Contact, message_data: dict, incoming_message_obj
         # --- End populate WhatsApp UI Flow IDs ---
 
         # Assuming FlowStep has is_entry_point field and a related manager for steps
-        entry_point_step = FlowStep.objects.filter(flow=triggered_flow, is_entry_point=True).first()
+        entry_point_step = flow_graph.entry_step(triggered_flow.id)
         if entry_point_step:
             logger.info(f"Starting flow '{triggered_flow.name}' for contact {contact.whatsapp_id} at entry step '{entry_point_step.name}'.")
             _clear_contact_flow_state(contact) # Clear any existing state
@@ -2133,6 +2044,7 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
     current_step = contact_flow_state.current_step
     flow_context = contact_flow_state.flow_context_data if isinstance(contact_flow_state.flow_context_data, dict) else {}
     actions_to_perform = []
+    scope = templating.RenderScope(contact)
 
     logger.info(
         f"Handling active flow for contact {contact.whatsapp_id} (ID: {contact.id}). Current Flow: '{contact_flow_state.current_flow.name}', "
@@ -2289,12 +2201,12 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
                 flow_context['_fallback_count'] = current_fallback_count + 1
                 re_prompt_message_text = fallback_config.get('re_prompt_message_text')
                 if re_prompt_message_text:
-                    resolved_re_prompt_text = _resolve_value(re_prompt_message_text, flow_context, contact)
+                    resolved_re_prompt_text = _resolve_value(re_prompt_message_text, flow_context, contact, scope=scope)
                     actions_to_perform.append({'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id, 'message_type': 'text', 'data': {'body': resolved_re_prompt_text}})
                 else:
                     logger.debug(f"No custom re-prompt message for Q '{current_step.name}'. Re-sending original question message.")
                     # Re-execute original question step to send its message again
-                    step_actions, updated_context_from_re_execution = _execute_step_actions(current_step, contact, flow_context.copy(), is_re_execution=True)
+                    step_actions, updated_context_from_re_execution = _execute_step_actions(current_step, contact, flow_context.copy(), is_re_execution=True, scope=scope)
                     actions_to_perform.extend(step_actions)
                     flow_context = updated_context_from_re_execution # Ensure context reflects any changes from re-execution
                 contact_flow_state.flow_context_data = flow_context
@@ -2309,7 +2221,7 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
                 if action_after_max_retries == 'human_handover':
                     logger.info(f"Max retries for Q '{current_step.name}'. Fallback: Initiating human handover for {contact.whatsapp_id}.")
                     handover_message_text = fallback_config.get('handover_message_text', "Sorry, I'm having trouble understanding. Let me connect you to an agent.")
-                    resolved_handover_msg = _resolve_value(handover_message_text, flow_context, contact)
+                    resolved_handover_msg = _resolve_value(handover_message_text, flow_context, contact, scope=scope)
                     actions_to_perform.append({'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id, 'message_type': 'text', 'data': {'body': resolved_handover_msg}})
                     # Flag for human intervention and clear flow state
                     actions_to_perform.append({'type': '_internal_command_clear_flow_state', 'reason': f'Max retries for Q {current_step.name}'})
@@ -2320,7 +2232,7 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
                     logger.info(f"Max retries for Q '{current_step.name}'. Fallback: Ending flow for {contact.whatsapp_id}.")
                     actions_to_perform.append({'type': '_internal_command_clear_flow_state', 'reason': f'Max retries for Q {current_step.name}, ending flow.'})
                     if fallback_config.get('end_flow_message_text'):
-                            actions_to_perform.append({'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id, 'message_type': 'text', 'data': {'body': _resolve_value(fallback_config['end_flow_message_text'], flow_context, contact)}})
+                            actions_to_perform.append({'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id, 'message_type': 'text', 'data': {'body': _resolve_value(fallback_config['end_flow_message_text'], flow_context, contact, scope=scope)}})
                     return actions_to_perform # Stop flow
                 else:
                     logger.info(f"Max retries for Q '{current_step.name}'. Action_after_max_retries is '{action_after_max_retries}' (not direct handover/end). Proceeding to general transitions.")
@@ -2328,13 +2240,14 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
     # If not actively processing a question reply (or if reply was valid and handled), proceed to evaluate general transitions
     if not (is_processing_reply_for_current_question and not reply_was_valid_for_question):
         # Fetch transitions related to the current step
-        transitions = FlowTransition.objects.filter(current_step=current_step).select_related('next_step').order_by('priority')
+        transitions = get_flow_graph().transitions_for(current_step.id)
         next_step_to_transition_to = None
         chosen_transition_info = "None"
 
-        logger.debug(f"Evaluating {transitions.count()} general transitions for step '{current_step.name}'.")
-        for transition in transitions:
-            if _evaluate_transition_condition(transition, contact, message_data, flow_context.copy(), incoming_message_obj):
+        logger.debug(f"Evaluating {len(transitions)} general transitions for step '{current_step.name}'.")
+        for compiled_transition in transitions:
+            transition = compiled_transition.transition
+            if _evaluate_transition_condition(transition, contact, message_data, flow_context.copy(), incoming_message_obj, compiled_regex=compiled_transition.regex, scope=scope):
                 next_step_to_transition_to = transition.next_step
                 chosen_transition_info = f"ID {transition.id} (Priority {transition.priority})"
                 logger.info(f"Transition {chosen_transition_info} condition met: From '{current_step.name}' to '{next_step_to_transition_to.name}'.")
@@ -2352,7 +2265,7 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
             fallback_config = current_step.config.get('fallback_config', {}) if isinstance(current_step.config, dict) else {}
             
             if fallback_config.get('fallback_message_text'):
-                resolved_fallback_text = _resolve_value(fallback_config['fallback_message_text'], flow_context, contact)
+                resolved_fallback_text = _resolve_value(fallback_config['fallback_message_text'], flow_context, contact, scope=scope)
                 logger.debug(f"Step '{current_step.name}': Sending general fallback message: {resolved_fallback_text}")
                 actions_to_perform.append({
                     'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id,
@@ -2367,7 +2280,7 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
             elif fallback_config.get('action') == 'human_handover':
                 logger.info(f"Step '{current_step.name}': General fallback initiating human handover directly for {contact.whatsapp_id}.")
                 pre_handover_msg = fallback_config.get('pre_handover_message_text', "Let me connect you to an agent for further assistance.")
-                resolved_msg = _resolve_value(pre_handover_msg, flow_context, contact)
+                resolved_msg = _resolve_value(pre_handover_msg, flow_context, contact, scope=scope)
                 actions_to_perform.append({'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id, 'message_type': 'text', 'data': {'body': resolved_msg}})
                 actions_to_perform.append({'type': '_internal_command_clear_flow_state', 'reason': f'General fallback direct handover at {current_step.name}'})
                 contact.needs_human_intervention = True; contact.intervention_requested_at = timezone.now()
@@ -2376,7 +2289,7 @@ def _handle_active_flow_step(contact_flow_state: ContactFlowState, contact: Cont
                 logger.info(f"Step '{current_step.name}': General fallback ending flow directly for {contact.whatsapp_id}.")
                 actions_to_perform.append({'type': '_internal_command_clear_flow_state', 'reason': f'General fallback ending flow at {current_step.name}'})
                 if fallback_config.get('end_flow_message_text'):
-                    resolved_end_msg = _resolve_value(fallback_config['end_flow_message_text'], flow_context, contact)
+                    resolved_end_msg = _resolve_value(fallback_config['end_flow_message_text'], flow_context, contact, scope=scope)
                     actions_to_perform.append({'type': 'send_whatsapp_message', 'recipient_wa_id': contact.whatsapp_id, 'message_type': 'text', 'data': {'body': resolved_end_msg}})
             else:
                 if not actions_to_perform: # If no explicit fallback message/action and nothing else generated
@@ -2413,10 +2326,13 @@ def _evaluate_transition_condition(
     contact: Contact,    
     message_data: dict,    
     flow_context: dict,    
-    incoming_message_obj: Optional[Message]    
+    incoming_message_obj: Optional[Message],
+    compiled_regex: Optional[re.Pattern] = None,
+    scope: Optional[templating.RenderScope] = None
 ) -> bool:
     """
-    Evaluates the condition for a given flow transition.
+    Evaluates the condition for a given flow transition. `compiled_regex` is the
+    flow graph's pre-compiled pattern for 'user_reply_matches_regex' conditions.
     """
     config = transition.condition_config
     if not isinstance(config, dict):
@@ -2515,7 +2431,7 @@ def _evaluate_transition_condition(
         regex = config.get('regex')
         if not regex: logger.warning(f"T_ID {transition.id}: 'user_reply_matches_regex' missing regex pattern."); return False
         try:
-            is_match = bool(re.match(regex, user_text))
+            is_match = bool((compiled_regex or re.compile(regex)).match(user_text))
             logger.debug(f"T_ID {transition.id} ('user_reply_matches_regex'): Text '{user_text}' vs Regex '{regex}'. Match: {is_match}")
             return is_match
         except re.error as e:
@@ -2528,7 +2444,7 @@ def _evaluate_transition_condition(
         if value_for_condition_comparison is None:
             logger.warning(f"T_ID {transition.id}: 'variable_equals' missing 'value' in condition_config. Cannot compare.")
             return False
-        actual_value = _get_value_from_context_or_contact(variable_name, flow_context, contact)
+        actual_value = _get_value_from_context_or_contact(variable_name, flow_context, contact, scope=scope)
         expected_value_str = str(value_for_condition_comparison)
         actual_value_str = str(actual_value)
         is_match = actual_value_str == expected_value_str
@@ -2540,7 +2456,7 @@ def _evaluate_transition_condition(
         if variable_name is None: logger.warning(f"T_ID {transition.id}: 'variable_exists' missing variable_name."); return False
         # Check for truthiness (e.g., non-empty string, non-zero number, not None)
         # instead of just `is not None`. This correctly handles empty strings for fields like 'email'.
-        value = _get_value_from_context_or_contact(variable_name, flow_context, contact)
+        value = _get_value_from_context_or_contact(variable_name, flow_context, contact, scope=scope)
         exists = bool(value)
         logger.debug(f"T_ID {transition.id} ('variable_exists'): Var '{variable_name}' (Value: '{value}'). Exists (is truthy): {exists}")
         return exists
@@ -2551,7 +2467,7 @@ def _evaluate_transition_condition(
         if value_for_condition_comparison is None:
             logger.warning(f"T_ID {transition.id}: 'variable_contains' missing 'value' in condition_config.")
             return False
-        actual_value = _get_value_from_context_or_contact(variable_name, flow_context, contact)
+        actual_value = _get_value_from_context_or_contact(variable_name, flow_context, contact, scope=scope)
         expected_item_to_contain = value_for_condition_comparison
         contains = False
         if isinstance(actual_value, str) and isinstance(expected_item_to_contain, str):
@@ -2649,8 +2565,8 @@ def _process_automatic_transitions(contact_flow_state: ContactFlowState, contact
                 break
         
         # Get all transitions from the current step
-        transitions = FlowTransition.objects.filter(current_step=current_step).select_related('next_step').order_by('priority')
-        if not transitions.exists():
+        transitions = get_flow_graph().transitions_for(current_step.id)
+        if not transitions:
             logger.debug(f"No outgoing transitions defined for step '{current_step.name}'. Stopping automatic transitions.")
             break # No more transitions from this step
             
@@ -2658,8 +2574,10 @@ def _process_automatic_transitions(contact_flow_state: ContactFlowState, contact
         chosen_transition_info = "None"
 
         # Evaluate transitions for an automatic check (i.e., no new user message data)
-        for transition in transitions:
-            if _evaluate_transition_condition(transition, contact, message_data={}, flow_context=flow_context.copy(), incoming_message_obj=None):
+        scope = templating.RenderScope(contact)
+        for compiled_transition in transitions:
+            transition = compiled_transition.transition
+            if _evaluate_transition_condition(transition, contact, message_data={}, flow_context=flow_context.copy(), incoming_message_obj=None, compiled_regex=compiled_transition.regex, scope=scope):
                 next_step_to_transition_to = transition.next_step
                 chosen_transition_info = f"ID {transition.id} (Priority {transition.priority})"
                 logger.info(f"Automatic transition condition met: {chosen_transition_info}. From '{current_step.name}' to '{next_step_to_transition_to.name}'.")
@@ -2684,7 +2602,7 @@ def _process_automatic_transitions(contact_flow_state: ContactFlowState, contact
                 break
             
             # Refresh the contact_flow_state object from DB, as it might have been modified by actions
-            refreshed_state = ContactFlowState.objects.filter(pk=contact_flow_state.pk).first()
+            refreshed_state = get_flow_graph().bind_state(ContactFlowState.objects.filter(pk=contact_flow_state.pk).first())
             if not refreshed_state:
                 logger.info(f"ContactFlowState (pk={contact_flow_state.pk}) was cleared from DB during auto-transition. Stopping.")
                 break # State was cleared (e.g., end flow, human handover)
@@ -2736,7 +2654,7 @@ def _transition_to_step(
     
     # After executing actions, check if the contact_flow_state object still exists
     # (it might have been deleted by an 'end_flow' or 'human_handover' action)
-    current_db_state_for_contact = ContactFlowState.objects.filter(contact=contact).first()
+    current_db_state_for_contact = get_flow_graph().bind_state(ContactFlowState.objects.filter(contact=contact).first())
 
     if current_db_state_for_contact:
         # If the state exists and is the same one we started with for this processing cycle
@@ -2784,11 +2702,12 @@ def process_message_for_flow(contact: Contact, message_data: dict, incoming_mess
     )
 
     try:
-        # Acquire a lock on the ContactFlowState to prevent race conditions
-        contact_flow_state_qs = ContactFlowState.objects.select_for_update().select_related(
-            'current_flow', 'current_step'
+        # Acquire a lock on the ContactFlowState to prevent race conditions. The
+        # flow/step come from the compiled flow graph rather than a join, which
+        # also keeps FOR UPDATE from locking the shared Flow/FlowStep rows.
+        contact_flow_state = get_flow_graph().bind_state(
+            ContactFlowState.objects.select_for_update().get(contact=contact)
         )
-        contact_flow_state = contact_flow_state_qs.get(contact=contact)
         
         flow_name = contact_flow_state.current_flow.name if contact_flow_state.current_flow else "N/A"
         step_name = contact_flow_state.current_step.name if contact_flow_state.current_step else "N/A"
@@ -2847,7 +2766,7 @@ def process_message_for_flow(contact: Contact, message_data: dict, incoming_mess
     # After initial handling of the message (or new flow trigger),
     # check for any pending auto-transitions or internal commands like flow clearing/switching.
     
-    current_contact_flow_state_after_initial_handling = ContactFlowState.objects.filter(contact=contact).first()
+    current_contact_flow_state_after_initial_handling = get_flow_graph().bind_state(ContactFlowState.objects.filter(contact=contact).first())
     
     if current_contact_flow_state_after_initial_handling:
         is_waiting_for_reply_from_current_step = False
@@ -2925,7 +2844,7 @@ def process_message_for_flow(contact: Contact, message_data: dict, incoming_mess
             switched_flow_actions = _trigger_new_flow(contact, synthetic_message_data, incoming_message_obj)
             
             # After _trigger_new_flow, if a new state was created, update its context
-            newly_created_state_after_switch = ContactFlowState.objects.filter(contact=contact).first()
+            newly_created_state_after_switch = get_flow_graph().bind_state(ContactFlowState.objects.filter(contact=contact).first())
             if newly_created_state_after_switch:
                 if initial_context_for_new_flow and isinstance(initial_context_for_new_flow, dict):
                     logger.debug(f"Applying initial context to newly switched flow state (pk={newly_created_state_after_switch.pk}). Current context: {newly_created_state_after_switch.flow_context_data}, Initial to apply: {initial_context_for_new_flow}")
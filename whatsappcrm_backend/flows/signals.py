@@ -0,0 +1,18 @@
+# whatsappcrm_backend/flows/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .flow_graph import invalidate_flow_graph
+from .models import Flow, FlowStep, FlowTransition
+
+
+@receiver(post_save, sender=Flow)
+@receiver(post_delete, sender=Flow)
+@receiver(post_save, sender=FlowStep)
+@receiver(post_delete, sender=FlowStep)
+@receiver(post_save, sender=FlowTransition)
+@receiver(post_delete, sender=FlowTransition)
+def flow_definition_changed(sender, **kwargs):
+    """Any definition write invalidates the compiled flow graph (see flows/flow_graph.py)."""
+    invalidate_flow_graph()
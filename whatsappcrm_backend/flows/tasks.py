@@ -10,6 +10,7 @@ from django.conf import settings
 from conversations.models import Message, Contact
 from meta_integration.models import MetaAppConfig
 from meta_integration.tasks import send_whatsapp_message_task
+from meta_integration.sender import queue_outgoing_messages
 from .services import process_message_for_flow, _clear_contact_flow_state
 from .models import ContactFlowState
 
@@ -24,6 +25,42 @@ def process_flow_for_message_task(message_id: int):
     Args:
         message_id: ID of the incoming Message object to process
     """
+    _process_flow_for_message(message_id)
+
+
+@shared_task(queue='celery', priority=9)
+def process_flow_lane_task(lane: int, token: str):
+    """
+    Processes one per-contact lane's queued messages in order (see flows/lanes.py).
+    A lane with more work than one run handles is continued by a fresh task so
+    other lanes get worker time too.
+    """
+    from .lanes import drain_lane
+    try:
+        more = drain_lane(lane, token, _process_flow_for_message)
+    except Exception as e:
+        # Ownership lapses after its TTL and the sweeper restarts the lane.
+        logger.error(f"process_flow_lane_task: error draining lane {lane}: {e}", exc_info=True)
+        return
+    if more:
+        process_flow_lane_task.delay(lane, token)
+
+
+@shared_task(name="flows.sweep_flow_lanes_task")
+def sweep_flow_lanes_task():
+    """Restarts per-contact lanes left with queued messages but no owner."""
+    from .lanes import sweep_lanes
+    try:
+        restarted = sweep_lanes()
+    except Exception as e:
+        logger.warning(f"sweep_flow_lanes_task: Redis unavailable, skipping sweep: {e}")
+        return
+    if restarted:
+        logger.info(f"sweep_flow_lanes_task: restarted {restarted} lane(s).")
+
+
+def _process_flow_for_message(message_id: int):
+    """Runs the flow engine for one incoming message and queues its replies."""
     # List to collect messages that need to be sent after transaction commits
     messages_to_send = []
     
@@ -261,7 +298,8 @@ def cleanup_idle_conversations_task():
     if timed_out_contacts:
         logger.info(f"{log_prefix} Sending timeout notifications to {len(timed_out_contacts)} contacts.")
         notification_text = "Your session has expired due to inactivity. Please send 'menu' to start over."
-        
+        message_ids_by_config = {}
+
         for contact in timed_out_contacts:
             try:
                 # Use the contact's associated config so the reply comes
@@ -281,11 +319,16 @@ def cleanup_idle_conversations_task():
                     content_payload={'body': notification_text},
                     status='pending_dispatch'
                 )
-                send_whatsapp_message_task.delay(outgoing_msg.id, config_to_use.id)
+                message_ids_by_config.setdefault(config_to_use.id, []).append(outgoing_msg.id)
             except MetaAppConfig.DoesNotExist:
                 logger.error(f"{log_prefix} No active MetaAppConfig found for contact {contact.whatsapp_id}. Cannot send timeout notification.")
             except Exception as e:
                 logger.error(f"{log_prefix} Error sending timeout notification to {contact.whatsapp_id}: {e}", exc_info=True)
 
+        # One batch task per config (and per META_SEND_BATCH_SIZE messages)
+        # instead of one send task per contact.
+        for config_id, message_ids in message_ids_by_config.items():
+            queue_outgoing_messages(message_ids, config_id)
+
     logger.info(f"{log_prefix} Cleanup complete. Timed out {len(timed_out_contacts)} contacts.")
 
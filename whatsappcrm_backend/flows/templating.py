@@ -0,0 +1,252 @@
+# whatsappcrm_backend/flows/templating.py
+"""
+Compiled `{{ variable.path }}` templates for flow step configs.
+
+Step configs (message bodies, interactive list rows, action templates) embed
+`{{ flow_context.x }}`, `{{ contact.name }}` or `{{ customer_profile.y }}`
+placeholders that flows/services.py resolves for every message it sends. This
+module does the expensive parts once instead of on every render:
+
+  * Templates are tokenized into literal / variable parts once. The flow graph
+    (flows/flow_graph.py) precompiles every string in every step config when it
+    is built; other strings are compiled on first use and kept in an LRU cache.
+    Strings without `{{` are returned untouched without any regex work.
+  * Variable paths are parsed into accessor chains once, and the "call it if it
+    takes no arguments" decision for callable attributes is cached per function
+    rather than re-derived from `__code__` for every path segment.
+  * A render of a whole config (dict/list) shares one RenderScope, so
+    `contact.customerprofile` is looked up at most once per render even when
+    the profile is missing (a miss isn't cached by Django's reverse accessor).
+
+Resolution rules are unchanged from the original services.py helpers: values
+are substituted with `str()` (None becomes ''), and substituted values that
+themselves contain templates are resolved again, up to 10 passes.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Optional
+
+from django.core.exceptions import ObjectDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+VARIABLE_PATTERN = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+MAX_PASSES = 10
+
+_MISSING = object()
+
+
+class RenderScope:
+    """Per-render state: the contact's customer profile, loaded on first use."""
+
+    __slots__ = ('contact', '_profile', '_profile_loaded')
+
+    def __init__(self, contact):
+        self.contact = contact
+        self._profile = None
+        self._profile_loaded = False
+
+    def customer_profile(self):
+        if not self._profile_loaded:
+            self._profile_loaded = True
+            try:
+                self._profile = self.contact.customerprofile
+            except ObjectDoesNotExist:
+                logger.debug("CustomerProfile does not exist for contact %s.", self.contact.id)
+            except AttributeError:  # related object is None
+                logger.warning("Contact %s has no 'customerprofile' related object.", self.contact.id)
+        return self._profile
+
+    def use_customer_profile(self, profile):
+        """Replace the cached profile, e.g. after a step has just updated it."""
+        self._profile = profile
+        self._profile_loaded = True
+
+
+# --------------------------------------------------------------------------- #
+#  Accessor chains                                                            #
+# --------------------------------------------------------------------------- #
+
+_zero_arg_cache: dict = {}
+
+
+def _takes_no_args(attr) -> bool:
+    """Whether a callable attribute should be called (it takes no arguments
+    beyond self) or returned as is. Cached per underlying function."""
+    func = getattr(attr, '__func__', None)
+    if func is not None:
+        bound_to_class = isinstance(attr.__self__, type)
+        key = (func, bound_to_class)
+        cached = _zero_arg_cache.get(key)
+        if cached is None:
+            code = getattr(func, '__code__', None)
+            cached = code is not None and code.co_argcount - (0 if bound_to_class else 1) == 0
+            _zero_arg_cache[key] = cached
+        return cached
+    code = getattr(attr, '__code__', None)
+    return code is not None and code.co_argcount == 0
+
+
+class Accessor:
+    """A parsed `source.part.part` variable path."""
+
+    __slots__ = ('path', 'source', 'parts')
+
+    def __init__(self, path: str):
+        self.path = path
+        parts = path.split('.')
+        if parts[0] in ('flow_context', 'contact', 'customer_profile'):
+            self.source = parts[0]
+            self.parts = tuple(parts[1:])
+        else:
+            # Bare names are top-level flow_context variables.
+            self.source = 'flow_context'
+            self.parts = tuple(parts)
+
+    def resolve(self, flow_context: dict, scope: RenderScope) -> Any:
+        if self.source == 'flow_context':
+            value = flow_context
+        elif self.source == 'contact':
+            value = scope.contact
+        else:
+            value = scope.customer_profile()
+            if value is None:
+                return None
+
+        for part in self.parts:
+            if value is None:
+                return None
+            try:
+                if isinstance(value, dict):
+                    value = value.get(part)
+                    continue
+                attr = getattr(value, part, _MISSING)
+                if attr is _MISSING:
+                    return None
+                if callable(attr) and _takes_no_args(attr):
+                    try:
+                        attr = attr()
+                    except Exception as e:
+                        logger.warning(f"Error calling method/function '{part}' for path '{self.path}': {e}. Returning callable as is.")
+                value = attr
+            except Exception as e:
+                logger.warning(f"Unexpected error accessing part '{part}' of path '{self.path}': {e}", exc_info=True)
+                return None
+
+        # 'type' objects aren't JSON serializable when saved to a JSONField.
+        if isinstance(value, type):
+            return str(value)
+        return value
+
+
+@lru_cache(maxsize=2048)
+def compile_path(path: str) -> Accessor:
+    return Accessor(path)
+
+
+# --------------------------------------------------------------------------- #
+#  Templates                                                                  #
+# --------------------------------------------------------------------------- #
+
+class CompiledTemplate:
+    """A template string split into literal text and variable accessors."""
+
+    __slots__ = ('source', 'parts')
+
+    def __init__(self, source: str, parts: tuple):
+        self.source = source
+        self.parts = parts  # str literals and Accessor instances, in order
+
+    def render_once(self, flow_context: dict, scope: RenderScope) -> str:
+        out = []
+        for part in self.parts:
+            if part.__class__ is str:
+                out.append(part)
+            else:
+                value = part.resolve(flow_context, scope)
+                out.append(str(value) if value is not None else '')
+        return ''.join(out)
+
+
+def _tokenize(source: str) -> Optional[CompiledTemplate]:
+    parts = []
+    last_end = 0
+    for match in VARIABLE_PATTERN.finditer(source):
+        if match.start() > last_end:
+            parts.append(source[last_end:match.start()])
+        parts.append(compile_path(match.group(1).strip()))
+        last_end = match.end()
+    if not parts:
+        return None
+    if last_end < len(source):
+        parts.append(source[last_end:])
+    return CompiledTemplate(source, tuple(parts))
+
+
+_tokenize_cached = lru_cache(maxsize=4096)(_tokenize)
+
+# Templates from the current flow definitions, installed by the flow graph.
+_precompiled: dict[str, Optional[CompiledTemplate]] = {}
+
+
+def compile_template(source: str) -> Optional[CompiledTemplate]:
+    """The compiled form of `source`, or None if it has no variables."""
+    if '{{' not in source:
+        return None
+    try:
+        return _precompiled[source]
+    except KeyError:
+        return _tokenize_cached(source)
+
+
+def precompile(value: Any, table: dict):
+    """Tokenize every template string inside a (nested) config into `table`."""
+    if isinstance(value, str):
+        if '{{' in value and value not in table:
+            table[value] = _tokenize(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            precompile(item, table)
+    elif isinstance(value, list):
+        for item in value:
+            precompile(item, table)
+
+
+def install_precompiled(table: dict):
+    global _precompiled
+    _precompiled = table
+
+
+def render_string(source: str, flow_context: dict, scope: RenderScope) -> str:
+    compiled = compile_template(source)
+    if compiled is None:
+        return source
+    result = source
+    for i in range(MAX_PASSES):
+        rendered = compiled.render_once(flow_context, scope)
+        if rendered == result:
+            break
+        result = rendered
+        # Substituted values may themselves contain templates.
+        if '{{' not in result:
+            break
+        compiled = _tokenize(result)
+        if compiled is None:
+            break
+        if i == MAX_PASSES - 1:
+            logger.warning(f"Template string resolution reached max iterations ({MAX_PASSES}) for input: '{source}'. Result: '{result}'")
+    return result
+
+
+def render_value(value: Any, flow_context: dict, scope: RenderScope) -> Any:
+    """Resolve templates in a string, or recursively in a dict/list."""
+    if isinstance(value, str):
+        return render_string(value, flow_context, scope)
+    if isinstance(value, dict):
+        return {k: render_value(v, flow_context, scope) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render_value(item, flow_context, scope) for item in value]
+    return value
@@ -0,0 +1,135 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from flows import flow_graph
+from flows.flow_graph import build_flow_graph, get_flow_graph, invalidate_flow_graph
+from flows.models import Flow, FlowStep, FlowTransition
+from flows.services import StepConfigQuestion, StepConfigSendMessage, _validated_step_config
+
+
+class FlowGraphCompileTests(TestCase):
+    """The compiled graph replaces the per-message Flow/FlowStep/FlowTransition
+    queries and Pydantic re-validation in flows/services.py, so it must keep
+    the exact semantics those queries had: trigger precedence by flow name,
+    transitions by priority, and a step -> transition -> next_step walk that
+    never goes back to the database."""
+
+    def setUp(self):
+        self.zeta = Flow.objects.create(name="Zeta", is_active=True, trigger_keywords=["  Hello "])
+        self.alpha = Flow.objects.create(name="Alpha", is_active=True, trigger_keywords=["hello"])
+        Flow.objects.create(name="Inactive", is_active=False, trigger_keywords=["hello"])
+        self.question = FlowStep.objects.create(
+            flow=self.alpha, name="ask", step_type="question", is_entry_point=True,
+            config={
+                "message_config": {"message_type": "text", "text": {"body": "Name?"}},
+                "reply_config": {"save_to_variable": "name", "expected_type": "text"},
+            },
+        )
+        self.low = FlowStep.objects.create(
+            flow=self.alpha, name="low", step_type="end_flow", config={},
+        )
+        self.high = FlowStep.objects.create(
+            flow=self.alpha, name="high", step_type="end_flow", config={},
+        )
+        FlowTransition.objects.create(
+            current_step=self.question, next_step=self.low, priority=5,
+            condition_config={"type": "always_true"},
+        )
+        FlowTransition.objects.create(
+            current_step=self.question, next_step=self.high, priority=1,
+            condition_config={"type": "user_reply_matches_regex", "regex": r"^\d+$"},
+        )
+
+    def test_active_flows_in_name_order_with_normalised_keywords(self):
+        graph = build_flow_graph()
+        self.assertEqual([cf.flow.name for cf in graph.active_flows], ["Alpha", "Zeta"])
+        self.assertEqual(graph.flows[self.zeta.id].trigger_keywords, ("hello",))
+        self.assertEqual(graph.entry_step(self.alpha.id).id, self.question.id)
+        self.assertIsNone(graph.entry_step(self.zeta.id))
+
+    def test_transitions_sorted_by_priority_with_compiled_regex(self):
+        graph = build_flow_graph()
+        transitions = graph.transitions_for(self.question.id)
+        self.assertEqual([t.next_step.name for t in transitions], ["high", "low"])
+        self.assertTrue(transitions[0].regex.match("42"))
+        self.assertIsNone(transitions[1].regex)
+
+    def test_walking_the_graph_needs_no_queries(self):
+        graph = build_flow_graph()
+        with self.assertNumQueries(0):
+            for compiled in graph.transitions_for(self.question.id):
+                self.assertEqual(compiled.transition.current_step.flow.name, "Alpha")
+                self.assertEqual(compiled.next_step.flow.name, "Alpha")
+
+    def test_step_configs_are_prevalidated(self):
+        graph = build_flow_graph()
+        compiled = graph.steps[self.question.id]
+        self.assertIsInstance(compiled.config_model, StepConfigQuestion)
+        self.assertIsInstance(compiled.message_model, StepConfigSendMessage)
+
+
+class FlowGraphCacheTests(TestCase):
+    """Each process keeps one graph and only rebuilds when the shared version
+    moves (or this process invalidates it); a rebuild on every message would
+    bring back exactly the queries the graph exists to remove."""
+
+    def setUp(self):
+        flow_graph._graph = None
+        self.addCleanup(setattr, flow_graph, '_graph', None)
+
+    def _patched(self, version):
+        return mock.patch.multiple(
+            flow_graph,
+            _shared_version=mock.Mock(return_value=version),
+            commit_pending=mock.Mock(return_value=False),
+        )
+
+    def test_graph_reused_until_version_changes(self):
+        with self._patched(1):
+            first = get_flow_graph()
+            first.checked_at -= flow_graph.VERSION_CHECK_INTERVAL_SECONDS
+            with self.assertNumQueries(0):
+                self.assertIs(get_flow_graph(), first)
+        with self._patched(2):
+            first.checked_at -= flow_graph.VERSION_CHECK_INTERVAL_SECONDS
+            self.assertIsNot(get_flow_graph(), first)
+
+    def test_invalidate_forces_rebuild(self):
+        with self._patched(1):
+            first = get_flow_graph()
+            invalidate_flow_graph()
+            self.assertIsNot(get_flow_graph(), first)
+
+    def test_uncommitted_definition_changes_are_visible_but_not_cached(self):
+        flow = Flow.objects.create(name="Fresh", is_active=True, trigger_keywords=["fresh"])
+        graph = get_flow_graph()
+        self.assertIn(flow.id, graph.flows)
+        self.assertIsNone(flow_graph._graph)
+
+    def test_version_bumped_once_per_commit_then_graph_cached(self):
+        with mock.patch.object(flow_graph, '_bump_shared_version') as bump, \
+                mock.patch.object(flow_graph, '_shared_version', return_value=1):
+            with self.captureOnCommitCallbacks(execute=True):
+                Flow.objects.create(name="One", is_active=True)
+                Flow.objects.create(name="Two", is_active=True)
+                self.assertTrue(flow_graph.commit_pending(bump))
+            bump.assert_called_once()
+            self.assertFalse(flow_graph.commit_pending(bump))
+            self.assertIs(get_flow_graph(), flow_graph._graph)
+
+    def test_validated_step_config_prefers_compiled_model(self):
+        flow = Flow.objects.create(name="Cfg", is_active=True)
+        step = FlowStep.objects.create(
+            flow=flow, name="send", step_type="send_message",
+            config={"message_type": "text", "text": {"body": "hi"}},
+        )
+        graph = build_flow_graph()
+        with mock.patch('flows.services.get_flow_graph', return_value=graph):
+            self.assertIs(
+                _validated_step_config(step, StepConfigSendMessage),
+                graph.steps[step.id].config_model,
+            )
+            # A step whose config was edited in memory is re-validated.
+            step.config = {"message_type": "text", "text": {"body": "changed"}}
+            self.assertEqual(_validated_step_config(step, StepConfigSendMessage).text.body, "changed")
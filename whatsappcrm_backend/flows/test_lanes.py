@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from whatsappcrm_backend.redis_client import get_redis
+from flows import lanes
+
+
+class JumpHashTests(SimpleTestCase):
+    """Lane assignment must be stable per contact, and growing the lane count
+    should only move the contacts that land on the new lane."""
+
+    def test_stable_and_in_range(self):
+        for wa_id in ("263771234567", "263780000000", "27821112222"):
+            lane = lanes.lane_for(wa_id, 16)
+            self.assertEqual(lane, lanes.lane_for(wa_id, 16))
+            self.assertTrue(0 <= lane < 16)
+
+    def test_growing_lane_count_moves_few_contacts(self):
+        ids = [f"2637{i:08d}" for i in range(2000)]
+        moved = [wa_id for wa_id in ids if lanes.lane_for(wa_id, 10) != lanes.lane_for(wa_id, 11)]
+        self.assertTrue(all(lanes.lane_for(wa_id, 11) == 10 for wa_id in moved))
+        self.assertLess(len(moved), 2000 * 0.15)
+
+
+@patch.object(lanes, 'LANE_KEY', 'test:flows:lane:{}:{}')
+@patch.object(lanes, 'LANE_OWNER_KEY', 'test:flows:lane:{}:{}:owner')
+@override_settings(FLOW_PROCESSING_LANES=4)
+class FlowLaneTests(SimpleTestCase):
+    """A contact's messages go through one lane: one drain task per busy lane,
+    messages processed in arrival order, and a push after the lane empties
+    starts a new drain rather than getting stranded."""
+
+    def setUp(self):
+        self.redis = get_redis()
+        self._clear()
+        self.addCleanup(self._clear)
+
+    def _clear(self):
+        for lane in range(4):
+            self.redis.delete(*lanes._keys(lane))
+
+    def test_disabled_lanes_use_shared_task(self):
+        with override_settings(FLOW_PROCESSING_LANES=0), \
+                patch('flows.tasks.process_flow_for_message_task.delay') as delay:
+            lanes.dispatch_flow_processing(7, "263771234567")
+        delay.assert_called_once_with(7)
+
+    def test_messages_drain_in_order_with_one_owner(self):
+        with patch('flows.tasks.process_flow_lane_task.delay') as lane_delay:
+            for message_id in (11, 12, 13):
+                lanes.dispatch_flow_processing(message_id, "263771234567")
+        lane_delay.assert_called_once()
+        lane, token = lane_delay.call_args.args
+
+        processed = []
+        self.assertFalse(lanes.drain_lane(lane, token, processed.append))
+        self.assertEqual(processed, [11, 12, 13])
+        self.assertFalse(self.redis.exists(lanes._keys(lane)[1]))
+
+        with patch('flows.tasks.process_flow_lane_task.delay') as lane_delay:
+            lanes.dispatch_flow_processing(14, "263771234567")
+        lane_delay.assert_called_once()
+
+    def test_stale_token_cannot_drain(self):
+        with patch('flows.tasks.process_flow_lane_task.delay') as lane_delay:
+            lanes.dispatch_flow_processing(21, "263771234567")
+        lane, _ = lane_delay.call_args.args
+        processed = []
+        self.assertFalse(lanes.drain_lane(lane, "not-the-owner", processed.append))
+        self.assertEqual(processed, [])
+
+    def test_sweeper_restarts_orphaned_lane(self):
+        self.redis.rpush(lanes._keys(2)[0], 31)
+        with patch('flows.tasks.process_flow_lane_task.delay') as lane_delay:
+            self.assertEqual(lanes.sweep_lanes(), 1)
+        self.assertEqual(lane_delay.call_args.args[0], 2)
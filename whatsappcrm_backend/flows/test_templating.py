@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from conversations.models import Contact
+from customer_data.models import CustomerProfile
+from flows import templating
+from flows.services import _get_value_from_context_or_contact, _resolve_value, _update_customer_profile_data
+
+
+class _Thing:
+    label = "thing"
+
+    def greeting(self):
+        return "hello"
+
+    def needs_arg(self, x):
+        return x
+
+
+class TemplateResolutionTests(TestCase):
+    """_resolve_value/_get_value_from_context_or_contact now run on compiled
+    templates and cached accessor chains; the resolution rules flows rely on
+    (None -> '', zero-arg methods called, nested templates re-resolved, bare
+    names read from flow_context) must not change."""
+
+    def setUp(self):
+        self.contact = Contact.objects.create(whatsapp_id="263770000001", name="Tariro")
+
+    def test_mixed_sources_and_missing_values(self):
+        context = {"stake": 5, "slip": {"count": 2}, "thing": _Thing()}
+        rendered = _resolve_value(
+            "Hi {{ contact.name }}, {{stake}} on {{ flow_context.slip.count }} picks{{ missing.path }}. {{ thing.greeting }}",
+            context, self.contact,
+        )
+        self.assertEqual(rendered, "Hi Tariro, 5 on 2 picks. hello")
+
+    def test_callables_needing_args_are_returned_not_called(self):
+        thing = _Thing()
+        value = _get_value_from_context_or_contact("thing.needs_arg", {"thing": thing}, self.contact)
+        self.assertEqual(value, thing.needs_arg)
+        self.assertEqual(_get_value_from_context_or_contact("thing.label", {"thing": thing}, self.contact), "thing")
+
+    def test_nested_templates_are_resolved_again(self):
+        context = {"outer": "{{ inner }}!", "inner": "done"}
+        self.assertEqual(_resolve_value("{{ outer }}", context, self.contact), "done!")
+
+    def test_structures_and_non_strings_pass_through(self):
+        value = {"rows": [{"title": "{{ name }}", "n": 3}], "plain": "no vars"}
+        self.assertEqual(
+            _resolve_value(value, {"name": "Arsenal"}, self.contact),
+            {"rows": [{"title": "Arsenal", "n": 3}], "plain": "no vars"},
+        )
+
+    def test_missing_customer_profile_is_looked_up_once_per_render(self):
+        template = {"a": "{{ customer_profile.first_name }}", "b": ["{{ customer_profile.last_name }}"] * 5}
+        with self.assertNumQueries(1):
+            rendered = _resolve_value(template, {}, self.contact)
+        self.assertEqual(rendered, {"a": "", "b": [""] * 5})
+
+    def test_shared_scope_loads_profile_once_across_calls(self):
+        scope = templating.RenderScope(self.contact)
+        with self.assertNumQueries(1):
+            for field in ("first_name", "last_name", "email"):
+                _resolve_value(f"{{{{ customer_profile.{field} }}}}", {}, self.contact, scope)
+            _get_value_from_context_or_contact("customer_profile.first_name", {}, self.contact, scope)
+
+    def test_profile_update_is_visible_to_the_same_scope(self):
+        scope = templating.RenderScope(self.contact)
+        self.assertEqual(_resolve_value("{{ customer_profile.first_name }}", {}, self.contact, scope), "")
+        _update_customer_profile_data(self.contact, {"first_name": "Tariro"}, {}, scope=scope)
+        with self.assertNumQueries(0):
+            self.assertEqual(_resolve_value("{{ customer_profile.first_name }}", {}, self.contact, scope), "Tariro")
+
+    def test_customer_profile_values(self):
+        CustomerProfile.objects.create(contact=self.contact, first_name="Rudo")
+        contact = Contact.objects.get(pk=self.contact.pk)
+        self.assertEqual(_resolve_value("{{ customer_profile.first_name }}", {}, contact), "Rudo")
+
+    def test_precompiled_templates_skip_tokenizing(self):
+        table = {}
+        templating.precompile({"body": "Hi {{ name }}", "rows": ["{{ a }}", "plain"]}, table)
+        self.assertEqual(set(table), {"Hi {{ name }}", "{{ a }}"})
+        templating.install_precompiled(table)
+        self.addCleanup(templating.install_precompiled, {})
+        with mock.patch.object(templating, '_tokenize_cached') as tokenize:
+            self.assertEqual(_resolve_value("Hi {{ name }}", {"name": "Chipo"}, self.contact), "Hi Chipo")
+        tokenize.assert_not_called()
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from flows.models import Flow
+from flows.trigger_index import TriggerIndex
+
+
+def _compiled(pk, name, keywords):
+    return SimpleNamespace(flow=Flow(pk=pk, name=name), trigger_keywords=tuple(keywords))
+
+
+def _naive(compiled_flows, text):
+    """The loop _trigger_new_flow used before the index."""
+    for compiled in compiled_flows:
+        for keyword in compiled.trigger_keywords:
+            if keyword in text:
+                return compiled.flow.name, keyword
+    return None
+
+
+class TriggerIndexTests(SimpleTestCase):
+    """The index must pick exactly the flow and keyword the old nested
+    `keyword in text` loop picked -- first flow by name, then first keyword in
+    that flow's list -- even when keywords overlap or nest inside each other
+    (e.g. "bet" inside "alphabet", "my bets" vs "bet slip")."""
+
+    def setUp(self):
+        self.flows = [
+            _compiled(1, "Betting Flow", ["bet", "my bets", "bet slip", "odds"]),
+            _compiled(2, "Referral Flow", ["refer", "referral", "agent"]),
+            _compiled(3, "Withdrawal Flow", ["withdraw", "cash out", "hers"]),
+            _compiled(4, "Zeta Flow", ["he", "she", "his", "betting"]),
+        ]
+        self.index = TriggerIndex(self.flows)
+
+    def test_matches_agree_with_naive_scan(self):
+        texts = [
+            "", "hello", "ushers", "i want to withdraw", "show my bets please",
+            "alphabet soup", "agent program", "she sells", "cash outs", "referral",
+            "nothing here", "hishers", "ods odds",
+        ]
+        for text in texts:
+            hit = self.index.match(text)
+            got = (hit.flow.name, hit.keyword) if hit else None
+            self.assertEqual(got, _naive(self.flows, text), text)
+
+    def test_earlier_flow_wins_even_if_its_keyword_occurs_later(self):
+        hit = self.index.match("agent, i want to bet")
+        self.assertEqual((hit.flow.name, hit.keyword), ("Betting Flow", "bet"))
+
+    def test_match_many_normalises_like_trigger(self):
+        results = self.index.match_many(["  WITHDRAW now ", "hi"])
+        self.assertEqual(results["  WITHDRAW now "].flow.name, "Withdrawal Flow")
+        self.assertIsNone(results["hi"])
+
+    def test_conflicts_report_shadowed_keywords(self):
+        conflicts = self.index.conflicts()
+        self.assertEqual(
+            {(c.flow.name, c.keyword, c.winner.name) for c in conflicts},
+            {("Zeta Flow", "betting", "Betting Flow")},
+        )
+        self.assertEqual(self.index.conflicts([self.flows[0].flow]), [])
+
+    def test_empty_index(self):
+        self.assertIsNone(TriggerIndex([]).match("anything"))
@@ -0,0 +1,133 @@
+# whatsappcrm_backend/flows/trigger_index.py
+"""
+Keyword trigger index for starting conversational flows.
+
+`_trigger_new_flow` starts the first active flow (ordered by name) that has a
+trigger keyword contained anywhere in the lowercased message. Checking every
+keyword of every flow with `keyword in text` costs one scan of the message per
+keyword; this index is an Aho-Corasick automaton over all active keywords that
+finds every keyword occurrence in a single pass over the text, then applies the
+same precedence rule:
+
+  * the winning flow is the matching flow that sorts first by name;
+  * the keyword reported for it is the first of that flow's keywords (in its
+    `trigger_keywords` order) that occurs in the text.
+
+The index is built by FlowGraph (flows/flow_graph.py) from its name-ordered
+active flows, so it is rebuilt exactly when the flow definitions change.
+
+It also answers "which flow would this text trigger" for many texts at once and
+reports shadowed keywords -- a flow's keyword that actually starts an earlier
+flow -- for the flow admin's conflict checks.
+"""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .models import Flow
+
+
+@dataclass(frozen=True)
+class TriggerMatch:
+    flow: Flow
+    keyword: str
+
+
+@dataclass(frozen=True)
+class TriggerConflict:
+    """`keyword` belongs to `flow`, but a message containing it starts `winner`."""
+    flow: Flow
+    keyword: str
+    winner: Flow
+    winning_keyword: str
+
+
+class TriggerIndex:
+    """Aho-Corasick automaton over the trigger keywords of `compiled_flows`,
+    which must already be in trigger precedence order (FlowGraph.active_flows)."""
+
+    def __init__(self, compiled_flows: Iterable):
+        self._flows: list[Flow] = []
+        self._keywords: list[tuple[str, ...]] = []
+        # Trie as parallel arrays: goto transitions, failure links and the
+        # (flow rank, keyword position) pairs that end at each node.
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[int, int]]] = [[]]
+
+        for rank, compiled in enumerate(compiled_flows):
+            self._flows.append(compiled.flow)
+            self._keywords.append(compiled.trigger_keywords)
+            for position, keyword in enumerate(compiled.trigger_keywords):
+                self._add(keyword, (rank, position))
+        self._link()
+
+    def _add(self, keyword: str, entry: tuple[int, int]):
+        node = 0
+        for char in keyword:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(entry)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                # Fold the suffix's matches in so search never walks fail links
+                # just to collect output.
+                self._out[child].extend(self._out[self._fail[child]])
+
+    def match(self, text: Optional[str]) -> Optional[TriggerMatch]:
+        """The flow `text` (already lowercased/stripped) would trigger, or None."""
+        if not text or not self._flows:
+            return None
+        goto, fail, out = self._goto, self._fail, self._out
+        best = None
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for entry in out[node]:
+                if best is None or entry < best:
+                    best = entry
+            if best == (0, 0):
+                break  # first keyword of the first flow; nothing can beat it
+        if best is None:
+            return None
+        rank, position = best
+        return TriggerMatch(flow=self._flows[rank], keyword=self._keywords[rank][position])
+
+    def match_many(self, texts: Iterable[str]) -> dict[str, Optional[TriggerMatch]]:
+        """Bulk form of `match`, keyed by the original text. Texts are
+        normalised the way `_trigger_new_flow` normalises message bodies."""
+        return {text: self.match((text or '').lower().strip()) for text in texts}
+
+    def conflicts(self, flows: Optional[Iterable[Flow]] = None) -> list[TriggerConflict]:
+        """Keywords (of `flows`, default all indexed flows) that would start a
+        different flow than the one they belong to."""
+        wanted = None if flows is None else {flow.pk for flow in flows}
+        found = []
+        for flow, keywords in zip(self._flows, self._keywords):
+            if wanted is not None and flow.pk not in wanted:
+                continue
+            for keyword in keywords:
+                hit = self.match(keyword)
+                if hit is not None and hit.flow.pk != flow.pk:
+                    found.append(TriggerConflict(flow=flow, keyword=keyword, winner=hit.flow, winning_keyword=hit.keyword))
+        return found
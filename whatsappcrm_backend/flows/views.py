@@ -6,6 +6,7 @@ from django.db import transaction
 from django.core.exceptions import ValidationError as DjangoValidationError # For model's full_clean
 from . import serializers
 from .models import Flow, FlowStep, FlowTransition, WhatsAppFlow, WhatsAppFlowResponse
+from .flow_graph import get_flow_graph
 from .serializers import (
     FlowSerializer, FlowStepSerializer, FlowTransitionSerializer,
     WhatsAppFlowSerializer, WhatsAppFlowResponseSerializer,
@@ -61,6 +62,40 @@ class FlowViewSet(viewsets.ModelViewSet):
             logger.error(f"Unexpected error during Flow update (PK: {serializer.instance.pk}): {e}", exc_info=True)
             raise
 
+    @action(detail=False, methods=['post'], url_path='trigger-check')
+    def trigger_check(self, request):
+        """
+        Report which active flow each of the given texts would trigger, plus any
+        trigger keywords shadowed by an earlier (by name) flow.
+        Body: {"texts": ["hi", "bet now", ...]} (optional).
+        """
+        texts = request.data.get('texts', [])
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return Response({"detail": "'texts' must be a list of strings."}, status=status.HTTP_400_BAD_REQUEST)
+
+        index = get_flow_graph().trigger_index
+        matches = [
+            {
+                "text": text,
+                "flow_id": hit.flow.pk if hit else None,
+                "flow_name": hit.flow.name if hit else None,
+                "keyword": hit.keyword if hit else None,
+            }
+            for text, hit in index.match_many(texts).items()
+        ]
+        conflicts = [
+            {
+                "flow_id": c.flow.pk,
+                "flow_name": c.flow.name,
+                "keyword": c.keyword,
+                "triggers_flow_id": c.winner.pk,
+                "triggers_flow_name": c.winner.name,
+                "matched_keyword": c.winning_keyword,
+            }
+            for c in index.conflicts()
+        ]
+        return Response({"matches": matches, "conflicts": conflicts}, status=status.HTTP_200_OK)
+
 
 class FlowStepViewSet(viewsets.ModelViewSet):
     """
@@ -2,32 +2,46 @@
 """
 Client for API-Football v3 (api-football.com / api-sports.io)
 Documentation: https://www.api-football.com/documentation-v3
+
+Requests go through one pooled keep-alive requests.Session per worker
+process instead of a fresh connection per call. Successful responses are
+cached in Redis, keyed by endpoint + params, with a TTL per kind of data
+(API_FOOTBALL_CACHE_TTLS: leagues/reference data, fixtures, odds, live), so
+the same league/date query repeated within a refresh cycle -- e.g. every
+league's score task asking for live=all -- costs one API credit, not one per
+caller. A cache hit does not take a rate limiter slot.
+
+Paginated endpoints fetch page 1, then pages 2..N concurrently
+(API_FOOTBALL_PAGE_CONCURRENCY threads). Every page still takes its own rate
+limiter slot, so concurrency never exceeds the request budget; pages already
+fetched are cached, so a task rescheduled by the limiter mid-way does not pay
+for them again.
 """
 import os
+import json
+import hashlib
+import threading
 import requests
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Union, Any
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+from requests.adapters import HTTPAdapter
+
 logger = logging.getLogger(__name__)
 
 # Import rate limiter
 try:
-    from .rate_limiter import rate_limit, check_rate_limit_status
+    from .rate_limiter import get_rate_limiter, LANE_LIVE_ODDS, LANE_PREMATCH_ODDS
     RATE_LIMITER_AVAILABLE = True
     logger.debug("Rate limiter imported successfully")
 except ImportError as e:
     logger.warning(f"Rate limiter not available: {e}. API calls will not be rate limited.")
     RATE_LIMITER_AVAILABLE = False
-    # Create a no-op decorator if rate limiter is not available
-    def rate_limit(wait=True):
-        def decorator(func):
-            return func
-        return decorator
-    def check_rate_limit_status():
-        return {"status": "Rate limiter not available"}
+    LANE_LIVE_ODDS, LANE_PREMATCH_ODDS = 'live_odds', 'prematch_odds'
 
 # API-Football v3 base URL
 API_FOOTBALL_V3_BASE_URL = "https://v3.football.api-sports.io"
@@ -36,6 +50,87 @@ MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
 RETRY_BACKOFF_MULTIPLIER = 2  # Multiplier for exponential backoff on rate limit (429) errors
 
+RESPONSE_CACHE_KEY = 'api_football:resp:{}'
+DEFAULT_CACHE_TTLS = {'leagues': 6 * 3600, 'fixtures': 120, 'odds': 300, 'live': 15}
+# Endpoints whose data barely changes within a day.
+_REFERENCE_ENDPOINTS = {'leagues', 'teams', 'standings', 'odds/bookmakers', 'odds/bets', 'players', 'fixtures/headtohead'}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _setting(name: str, default):
+    # Local import, as for Configuration below: the client is usable without Django configured.
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def _page_concurrency() -> int:
+    return max(1, int(_setting('API_FOOTBALL_PAGE_CONCURRENCY', 4)))
+
+
+def get_session() -> requests.Session:
+    """The pooled API-Football session for this process."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, _page_concurrency()))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _cache_kind(endpoint: str, params: Dict) -> str:
+    if endpoint == 'odds/live' or (endpoint == 'fixtures' and 'live' in params):
+        return 'live'
+    if endpoint in _REFERENCE_ENDPOINTS:
+        return 'leagues'
+    if endpoint.startswith('odds'):
+        return 'odds'
+    return 'fixtures'
+
+
+def _cache_ttl(endpoint: str, params: Dict) -> int:
+    ttls = {**DEFAULT_CACHE_TTLS, **_setting('API_FOOTBALL_CACHE_TTLS', {})}
+    return int(ttls.get(_cache_kind(endpoint, params), 0) or 0)
+
+
+def _cache_key(endpoint: str, params: Dict) -> str:
+    canonical = json.dumps([endpoint, sorted((str(k), str(v)) for k, v in params.items())], separators=(',', ':'))
+    return RESPONSE_CACHE_KEY.format(hashlib.sha1(canonical.encode('utf-8')).hexdigest())
+
+
+def _cache_get(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        from whatsappcrm_backend.redis_client import get_redis
+        raw = get_redis().get(key)
+    except Exception:
+        logger.warning("Redis unavailable reading the API-Football response cache.", exc_info=True)
+        return None
+    return json.loads(raw) if raw else None
+
+
+def _cache_set(key: str, data: Dict[str, Any], ttl: int):
+    try:
+        from whatsappcrm_backend.redis_client import get_redis
+        get_redis().set(key, json.dumps(data, separators=(',', ':')), ex=ttl)
+    except Exception:
+        logger.warning("Redis unavailable writing the API-Football response cache.", exc_info=True)
+
 
 class APIFootballV3Exception(Exception):
     """Custom exception for API-Football v3 client errors."""
@@ -52,9 +147,20 @@ class APIFootballV3Client:
     
     This client uses the api-sports.io infrastructure with x-apisports-key authentication.
     Documentation: https://www.api-football.com/documentation-v3
+
+    `lane` is the rate limiter priority lane its requests draw from (see
+    rate_limiter.py); /odds/live requests always use the live-odds lane. A
+    request whose lane has no slot soon raises RateLimitExceeded, which
+    callers turn into a Celery countdown.
+
+    With `read_cache=False` responses are always fetched from the provider
+    (and still written to the response cache) -- for the live-odds poller,
+    which polls faster than the live cache TTL.
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, lane: str = LANE_PREMATCH_ODDS, read_cache: bool = True):
+        self.lane = lane
+        self.read_cache = read_cache
         _api_key_to_use = api_key
         _api_key_source = None
 
@@ -113,29 +219,31 @@ class APIFootballV3Client:
         }
     
     def _request(self, endpoint: str, params: Optional[Dict] = None) -> Dict[str, Any]:
-        """Internal method to handle all API requests with retry logic and rate limiting."""
+        """Internal method to handle all API requests with retry logic, rate limiting and response caching."""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        endpoint_key = endpoint.strip('/')
+        
+        ttl = _cache_ttl(endpoint_key, params or {})
+        cache_key = _cache_key(endpoint_key, params or {}) if ttl else None
+        if cache_key and self.read_cache:
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                logger.debug(f"API-Football v3 cache hit: URL='{url}', Params={params}")
+                return cached
         
         # Log the request without the API key
         logger.info(f"API-Football v3 Request: URL='{url}', Params={params}")
         
-        # Log rate limit status before making request
-        if RATE_LIMITER_AVAILABLE:
-            rate_status = check_rate_limit_status()
-            logger.debug(
-                f"Rate limit status: {rate_status['requests_made']}/{rate_status['max_requests']} "
-                f"({rate_status['percentage_used']:.1f}% used)"
-            )
+        lane = LANE_LIVE_ODDS if endpoint_key == 'odds/live' else self.lane
         
         for attempt in range(MAX_RETRIES):
             try:
-                # Apply rate limiting before making the request
+                # Take a slot in this request's lane; raises RateLimitExceeded
+                # (not caught here) when the caller should reschedule instead.
                 if RATE_LIMITER_AVAILABLE:
-                    from .rate_limiter import get_rate_limiter
-                    limiter = get_rate_limiter()
-                    limiter.acquire(wait=True)  # Wait if rate limit is reached
+                    get_rate_limiter().acquire(lane=lane)
                 
-                response = requests.get(
+                response = get_session().get(
                     url,
                     params=params,
                     headers=self._get_headers(),
@@ -168,6 +276,8 @@ class APIFootballV3Client:
                     )
                 
                 logger.debug(f"API-Football v3 Response: Status={response.status_code}, Results={data.get('results', 0)}")
+                if cache_key:
+                    _cache_set(cache_key, data, ttl)
                 return data
 
             except requests.exceptions.HTTPError as e:
@@ -330,18 +440,17 @@ class APIFootballV3Client:
         `max_pages` is a safety cap against runaway pagination.
         """
         params = dict(params or {})
-        aggregated: List[dict] = []
-        page = 1
-        while page <= max_pages:
-            params['page'] = page
-            data = self._request(endpoint, params)
-            aggregated.extend(data.get('response', []))
-            paging = data.get('paging', {}) or {}
-            total_pages = paging.get('total', 1) or 1
-            if page >= total_pages:
-                break
-            page += 1
-        else:
+        first = self._request(endpoint, {**params, 'page': 1})
+        aggregated: List[dict] = list(first.get('response', []))
+        total_pages = (first.get('paging', {}) or {}).get('total', 1) or 1
+        last_page = min(total_pages, max_pages)
+        if last_page > 1:
+            # Pages 2..N concurrently; results are concatenated in page order.
+            pages = range(2, last_page + 1)
+            with ThreadPoolExecutor(max_workers=min(_page_concurrency(), len(pages))) as pool:
+                for data in pool.map(lambda page: self._request(endpoint, {**params, 'page': page}), pages):
+                    aggregated.extend(data.get('response', []))
+        if total_pages > max_pages:
             logger.warning(f"Reached max_pages={max_pages} for '{endpoint}' with params {params}; results may be truncated.")
         return aggregated
 
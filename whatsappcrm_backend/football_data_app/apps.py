@@ -27,3 +27,5 @@ class FootballDataAppConfig(AppConfig):
             from . import tasks_api_football_v3  # noqa: F401
         except ImportError:
             pass
+
+        from . import signals  # noqa: F401
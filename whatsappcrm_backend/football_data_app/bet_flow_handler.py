@@ -115,6 +115,13 @@ def is_bet_screen(screen: str) -> bool:
     return bool(screen) and screen.startswith('BET_')
 
 
+def is_placement(screen: str, data: dict) -> bool:
+    """True for a submission that places a ticket (and so must not be abandoned midway)."""
+    if screen == 'BET_CONFIRM':
+        return True
+    return screen == 'BET_SLIP' and (data or {}).get('slip_action', 'place') != 'clear'
+
+
 def _label(text, limit=30):
     text = (text or '').strip()
     return text if len(text) <= limit else text[: limit - 1] + '…'
@@ -131,6 +138,20 @@ def _err(screen, message, extra=None):
     return {"screen": screen, "data": data}
 
 
+BUSY_MESSAGE = "This is taking longer than usual. Please try again."
+
+
+def busy_screen(screen: str, data: dict, message: str = BUSY_MESSAGE) -> dict:
+    """
+    Stay on `screen` with an error, for a submission the Flow endpoint could
+    not answer (over its response budget, or an unhandled error). Placement
+    submissions are never cut off by the budget (see is_placement), so a
+    retry from here cannot place the same ticket twice.
+    """
+    data = data if isinstance(data, dict) else {}
+    return _err(screen, message, {"slip": data.get('slip', '')})
+
+
 # --------------------------------------------------------------------------- #
 #  Player / wallet helpers                                                     #
 # --------------------------------------------------------------------------- #
@@ -285,12 +306,12 @@ FIXTURES_PAGE_SIZE = MAX_FLOW_OPTIONS - 2
 
 
 def _fixtures_options(page=0):
-    from .betting_ux import _bettable_fixtures_qs, _kickoff_label
+    from .betting_ux import _snapshot_kickoff_label
+    from .fixture_snapshot import bettable_page
     page = max(0, int(page or 0))
-    qs = list(_bettable_fixtures_qs())
     start = page * FIXTURES_PAGE_SIZE
-    page_fixtures = qs[start:start + FIXTURES_PAGE_SIZE]
-    has_more = len(qs) > start + FIXTURES_PAGE_SIZE
+    page_fixtures, total = bettable_page(start, FIXTURES_PAGE_SIZE)
+    has_more = total > start + FIXTURES_PAGE_SIZE
 
     opts = []
     if page > 0:
@@ -298,9 +319,9 @@ def _fixtures_options(page=0):
                      "description": "See the previous page of fixtures"})
     for fx in page_fixtures:
         opts.append({
-            "id": str(fx.id),
-            "title": _label(f"{fx.home_team.name} v {fx.away_team.name}", 30),
-            "description": _label(_kickoff_label(fx), 30),
+            "id": str(fx['id']),
+            "title": _label(f"{fx['home']} v {fx['away']}", 30),
+            "description": _label(_snapshot_kickoff_label(fx), 30),
         })
     if has_more:
         opts.append({"id": f"more:{page + 1}", "title": "➡️ More matches",
@@ -335,7 +356,6 @@ def _markets_screen(fixture_id, flow_token, slip_str=''):
     scr = build_markets_screen(int(fixture_id))
     if not scr or not scr.get('has_markets'):
         return None
-    fixture = scr['fixture']
     markets = [{"id": r['id'].split(':', 1)[1], "title": _label(r['title'], 30)}
                for r in scr['sections'][0]['rows']][:MAX_FLOW_OPTIONS]
     return {
@@ -343,7 +363,7 @@ def _markets_screen(fixture_id, flow_token, slip_str=''):
         "data": {
             "slip": _slip_str(_current_slip_ids(flow_token, slip_str)),
             "fixture_id": str(fixture_id),
-            "fixture_label": _label(f"{fixture.home_team.name} v {fixture.away_team.name}", 40),
+            "fixture_label": _label(f"{scr['home']} v {scr['away']}", 40),
             "markets": markets,
             "is_error": False, "error_message": " ",
         },
@@ -363,7 +383,7 @@ def _outcomes_screen(market_id, flow_token, slip_str=''):
         "screen": "BET_OUTCOMES",
         "data": {
             "slip": _slip_str(_current_slip_ids(flow_token, slip_str)),
-            "market_label": _label(scr['market'].category.name, 40),
+            "market_label": _label(scr['market_name'], 40),
             "outcomes": outcomes,
             "is_error": False, "error_message": " ",
         },
@@ -30,6 +30,7 @@ from typing import Optional
 from django.db.models import Case, IntegerField, Prefetch, Q, When
 from django.utils import timezone
 
+from . import fixture_snapshot, market_screens
 from .models import FootballFixture, Market, MarketOutcome
 
 # WhatsApp interactive-list hard limit: total rows across all sections.
@@ -58,14 +59,23 @@ def _fixture_label(fixture: FootballFixture) -> str:
     return _truncate(f"{fixture.home_team.name} v {fixture.away_team.name}", 24)
 
 
-def _kickoff_label(fixture: FootballFixture) -> str:
-    if fixture.status == FootballFixture.FixtureStatus.LIVE:
-        if fixture.home_team_score is not None and fixture.away_team_score is not None:
-            return f"🔴 LIVE · {fixture.home_team_score}-{fixture.away_team_score}"
+def _kickoff_text(status: str, home_score, away_score, match_date) -> str:
+    if status == FootballFixture.FixtureStatus.LIVE:
+        if home_score is not None and away_score is not None:
+            return f"🔴 LIVE · {home_score}-{away_score}"
         return "🔴 LIVE"
-    if not fixture.match_date:
+    if not match_date:
         return 'TBD'
-    return timezone.localtime(fixture.match_date).strftime('%a %d %b, %H:%M')
+    return timezone.localtime(match_date).strftime('%a %d %b, %H:%M')
+
+
+def _kickoff_label(fixture: FootballFixture) -> str:
+    return _kickoff_text(fixture.status, fixture.home_team_score, fixture.away_team_score, fixture.match_date)
+
+
+def _snapshot_kickoff_label(entry: dict) -> str:
+    """_kickoff_label for a bettable-fixture snapshot entry (fixture_snapshot.py)."""
+    return _kickoff_text(entry['status'], entry['home_score'], entry['away_score'], fixture_snapshot.entry_kickoff(entry))
 
 
 def _day_bucket(fixture_dt) -> tuple[int, str]:
@@ -90,11 +100,7 @@ def _one_x_two_summary(fixture: FootballFixture) -> Optional[str]:
     )
     if not market:
         return None
-    odds = {o.outcome_name.lower(): o.odds for o in market.outcomes.all() if o.is_active}
-    home, draw, away = odds.get('home'), odds.get('draw'), odds.get('away')
-    if home and draw and away:
-        return f"1X2 {home:.2f}/{draw:.2f}/{away:.2f}"
-    return None
+    return fixture_snapshot.format_one_x_two(market.outcomes.all())
 
 
 def _bettable_fixtures_qs():
@@ -137,36 +143,35 @@ def build_fixtures_screen(page: int = 0, preferred_league_ids: Optional[list[int
     (used by personalization later); ordering otherwise is by kickoff.
     """
     page = max(0, int(page or 0))
-    qs = list(_bettable_fixtures_qs())
-
+    start = page * FIXTURES_PER_PAGE
     if preferred_league_ids:
         pref = set(preferred_league_ids)
-        qs.sort(key=lambda f: (0 if f.league_id in pref else 1,))  # stable: keeps kickoff order within groups
-
-    start = page * FIXTURES_PER_PAGE
-    page_fixtures = qs[start:start + FIXTURES_PER_PAGE]
-    has_more = len(qs) > start + FIXTURES_PER_PAGE
+        entries, total = fixture_snapshot.bettable_page(0, None)
+        entries.sort(key=lambda e: (0 if e['league_id'] in pref else 1,))  # stable: keeps kickoff order within groups
+        page_fixtures = entries[start:start + FIXTURES_PER_PAGE]
+    else:
+        page_fixtures, total = fixture_snapshot.bettable_page(start, FIXTURES_PER_PAGE)
+    has_more = total > start + FIXTURES_PER_PAGE
 
     # Group this page's fixtures into day sections (each section <= 10 rows; a
     # page is <= 9 fixtures so we never exceed the whole-list cap of 10).
     buckets: dict[tuple, dict] = {}
     for fx in page_fixtures:
-        if fx.status == FootballFixture.FixtureStatus.LIVE:
+        if fx['status'] == FootballFixture.FixtureStatus.LIVE:
             # Its own section ahead of "Today" -- a live fixture's match_date
             # is now in the past and no longer means anything as a grouping
             # key, and it shouldn't be mixed in with today's not-yet-started
             # matches.
             sort_key, label = (-1, '🔴 Live Now')
         else:
-            sort_key, label = _day_bucket(fx.match_date)
+            sort_key, label = _day_bucket(fixture_snapshot.entry_kickoff(fx))
         section = buckets.setdefault((sort_key, label), {'title': _truncate(label, 24), 'rows': []})
-        desc_bits = [_kickoff_label(fx)]
-        summary = _one_x_two_summary(fx)
-        if summary:
-            desc_bits.append(summary)
+        desc_bits = [_snapshot_kickoff_label(fx)]
+        if fx['summary']:
+            desc_bits.append(fx['summary'])
         section['rows'].append({
-            'id': f"fx:{fx.id}",
-            'title': _fixture_label(fx),
+            'id': f"fx:{fx['id']}",
+            'title': _truncate(f"{fx['home']} v {fx['away']}", 24),
             'description': _truncate(' · '.join(desc_bits), 72),
         })
 
@@ -185,7 +190,7 @@ def build_fixtures_screen(page: int = 0, preferred_league_ids: Optional[list[int
     if not page_fixtures:
         body = "No upcoming matches are open for betting right now. Please check back later."
     elif page > 0:
-        total_pages = -(-len(qs) // FIXTURES_PER_PAGE)  # ceil division
+        total_pages = -(-total // FIXTURES_PER_PAGE)  # ceil division
         body = f"Page {page + 1} of {total_pages}. Tap a match to see its markets and place a bet. 👇"
     else:
         body = "Tap a match to see its markets and place a bet. 👇"
@@ -213,8 +218,7 @@ def _ordered_markets(fixture: FootballFixture) -> list[Market]:
     return sorted(by_category.values(), key=lambda m: (order.get(m.category.name, 99), m.category.name))
 
 
-def build_markets_screen(fixture_id: int) -> Optional[dict]:
-    """Build the market list for one fixture. Returns None if fixture missing."""
+def _markets_screen_data(fixture_id: int) -> Optional[dict]:
     fixture = (
         FootballFixture.objects.filter(id=fixture_id)
         .select_related('home_team', 'away_team', 'league')
@@ -239,15 +243,25 @@ def build_markets_screen(fixture_id: int) -> Optional[dict]:
     body = f"*{_truncate(header, 60)}*\n{_kickoff_label(fixture)}\n\nChoose a market:"
     sections = [{'title': 'Markets', 'rows': rows}] if rows else []
     return {
-        'fixture': fixture,
+        'fixture_id': fixture.id,
+        'home': fixture.home_team.name,
+        'away': fixture.away_team.name,
         'sections': sections,
         'body': _truncate(body, 1024),
         'has_markets': bool(rows),
     }
 
 
-def build_outcomes_screen(market_id: int) -> Optional[dict]:
-    """Build the outcome list for one market. Returns None if market missing."""
+def build_markets_screen(fixture_id: int) -> Optional[dict]:
+    """Build the market list for one fixture. Returns None if fixture missing.
+
+    Served from the per-fixture screen cache (market_screens.py) while the
+    fixture's odds version is unchanged.
+    """
+    return market_screens.cached_screen(fixture_id, 'markets', lambda: _markets_screen_data(fixture_id))
+
+
+def _outcomes_screen_data(market_id: int) -> Optional[dict]:
     market = (
         Market.objects.filter(id=market_id, is_active=True)
         .select_related('category', 'fixture__home_team', 'fixture__away_team')
@@ -285,7 +299,27 @@ def build_outcomes_screen(market_id: int) -> Optional[dict]:
         f"{market.category.name}\n\nTap your pick:"
     )
     sections = [{'title': _truncate(market.category.name, 24), 'rows': rows[:MAX_LIST_ROWS]}] if rows else []
-    return {'market': market, 'sections': sections, 'body': _truncate(body, 1024), 'has_outcomes': bool(rows)}
+    return {
+        'market_id': market.id,
+        'fixture_id': fixture.id,
+        'market_name': market.category.name,
+        'sections': sections,
+        'body': _truncate(body, 1024),
+        'has_outcomes': bool(rows),
+    }
+
+
+def build_outcomes_screen(market_id: int) -> Optional[dict]:
+    """Build the outcome list for one market. Returns None if market missing.
+
+    Served from its fixture's screen cache (market_screens.py) while the
+    fixture's odds version is unchanged.
+    """
+    fixture_id = market_screens.market_fixture_id(market_id)
+    if fixture_id is None:
+        return None
+    return market_screens.cached_screen(fixture_id, f'outcomes:{market_id}',
+                                        lambda: _outcomes_screen_data(market_id))
 
 
 # --------------------------------------------------------------------------- #
@@ -0,0 +1,161 @@
+# whatsappcrm_backend/football_data_app/fixture_snapshot.py
+"""
+Redis snapshot of the fixtures open for betting, for the browse screens.
+
+Browsing is the most frequent action in both betting surfaces -- the
+conversational flow (betting_ux.build_fixtures_screen) and the native
+WhatsApp Flow (bet_flow_handler._fixtures_options), whose data_exchange
+endpoint has a hard response-time budget. Every page view used to list the
+whole browse window with a DISTINCT join over markets and then run one more
+market query per fixture on the page for its 1X2 summary.
+
+The snapshot holds, in browse order, one compact JSON entry per bettable
+fixture: id, league id, team names, status, kickoff, live score and the 1X2
+summary string. It is built in three queries for all fixtures at once and
+stored as a Redis list, so a page is one LRANGE (plus LLEN for the total) in
+a single round trip. Labels that depend on the current time ("Today",
+"Tomorrow", the local kickoff time) are derived from the entry when the page
+is rendered.
+
+A snapshot is dropped, and rebuilt by the next reader, when:
+
+  * odds change -- odds_deltas publishes a delta for the fixture;
+  * a fixture's score or status changes in the score sweep;
+  * a FootballFixture, Market or MarketOutcome row is saved or deleted
+    through the ORM (signals.py);
+  * its TTL runs out: BETTABLE_SNAPSHOT_TTL seconds, or sooner when a listed
+    fixture kicks off, so a fixture never stays listed as upcoming past its
+    kickoff.
+
+If Redis is unavailable the snapshot is built from the database for the
+request and not stored.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, delete_keys, get_redis
+from .models import FootballFixture, Market
+
+logger = logging.getLogger(__name__)
+
+BETTABLE_SNAPSHOT_KEY = 'football:bettable:snapshot:{}'
+BETTABLE_SNAPSHOT_BUILT_KEY = 'football:bettable:snapshot_built:{}'
+
+
+def _keys() -> tuple[str, str]:
+    return database_key(BETTABLE_SNAPSHOT_KEY), database_key(BETTABLE_SNAPSHOT_BUILT_KEY)
+
+
+def format_one_x_two(outcomes) -> Optional[str]:
+    """Short '1X2 2.10/3.40/2.80' summary from a Match Winner market's outcomes."""
+    odds = {o.outcome_name.lower(): o.odds for o in outcomes if o.is_active}
+    home, draw, away = odds.get('home'), odds.get('draw'), odds.get('away')
+    if home and draw and away:
+        return f"1X2 {home:.2f}/{draw:.2f}/{away:.2f}"
+    return None
+
+
+def one_x_two_summaries(fixture_ids) -> dict[int, str]:
+    """1X2 summaries for many fixtures in two queries, from each fixture's most
+    recently updated active Match Winner market."""
+    latest: dict[int, Market] = {}
+    for market in (Market.objects.filter(fixture_id__in=list(fixture_ids), category__name='Match Winner', is_active=True)
+                   .prefetch_related('outcomes')
+                   .order_by('fixture_id', '-last_updated_odds_api')):
+        latest.setdefault(market.fixture_id, market)
+    summaries = {}
+    for fixture_id, market in latest.items():
+        summary = format_one_x_two(market.outcomes.all())
+        if summary:
+            summaries[fixture_id] = summary
+    return summaries
+
+
+def _entry(fixture: FootballFixture, summary: Optional[str]) -> dict:
+    return {
+        'id': fixture.id,
+        'league_id': fixture.league_id,
+        'home': fixture.home_team.name,
+        'away': fixture.away_team.name,
+        'status': fixture.status,
+        'kickoff': fixture.match_date.isoformat() if fixture.match_date else None,
+        'home_score': fixture.home_team_score,
+        'away_score': fixture.away_team_score,
+        'summary': summary,
+    }
+
+
+def entry_kickoff(entry: dict) -> Optional[datetime]:
+    return datetime.fromisoformat(entry['kickoff']) if entry.get('kickoff') else None
+
+
+def build_snapshot() -> list[dict]:
+    """Bettable fixtures in browse order, as snapshot entries."""
+    from .betting_ux import _bettable_fixtures_qs
+    fixtures = list(_bettable_fixtures_qs())
+    summaries = one_x_two_summaries([fx.id for fx in fixtures])
+    return [_entry(fx, summaries.get(fx.id)) for fx in fixtures]
+
+
+def _ttl(entries: list[dict]) -> int:
+    ttl = int(getattr(settings, 'BETTABLE_SNAPSHOT_TTL', 60))
+    now = timezone.now()
+    for entry in entries:
+        kickoff = entry_kickoff(entry)
+        if entry['status'] == FootballFixture.FixtureStatus.SCHEDULED and kickoff:
+            # Entries are in kickoff order, so the first scheduled one is the earliest.
+            ttl = min(ttl, int((kickoff - now).total_seconds()) + 1)
+            break
+    return max(1, ttl)
+
+
+def _store(entries: list[dict]):
+    key, built_key = _keys()
+    ttl = _ttl(entries)
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(key)
+    if entries:
+        pipe.rpush(key, *(json.dumps(entry, separators=(',', ':')) for entry in entries))
+        pipe.expire(key, ttl)
+    pipe.set(built_key, '1', ex=ttl)
+    pipe.execute()
+
+
+def bettable_page(start: int, count: Optional[int]) -> tuple[list[dict], int]:
+    """
+    Snapshot entries [start, start + count) and the total number of bettable
+    fixtures. `count=None` returns everything from `start`.
+    """
+    end = -1 if count is None else start + count - 1
+    key, built_key = _keys()
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.exists(built_key)
+        pipe.lrange(key, start, end)
+        pipe.llen(key)
+        built, raw_entries, total = pipe.execute()
+        if built:
+            return [json.loads(raw) for raw in raw_entries], total
+    except Exception:
+        logger.warning("Redis unavailable reading the bettable fixture snapshot; building it from the database.", exc_info=True)
+        entries = build_snapshot()
+        return entries[start:None if count is None else start + count], len(entries)
+
+    entries = build_snapshot()
+    try:
+        _store(entries)
+    except Exception:
+        logger.warning("Redis unavailable storing the bettable fixture snapshot.", exc_info=True)
+    return entries[start:None if count is None else start + count], len(entries)
+
+
+def invalidate_snapshot():
+    """Drop the snapshot, now and at commit (redis_client.delete_keys)."""
+    delete_keys(_keys(), "the bettable fixture snapshot")
@@ -0,0 +1,172 @@
+# whatsappcrm_backend/football_data_app/fixtures_pdf.py
+"""
+Content-addressed cache of the fixtures PDF.
+
+Every "view matches" request (flow_actions.view_matches and the
+FETCH_FOOTBALL_DATA flow action) used to run utils.generate_fixtures_pdf: a
+new ReportLab document of up to 150 fixtures written to a new timestamped
+file -- seconds of CPU per request, for documents identical to the one built
+a minute earlier, and files that were never deleted.
+
+get_fixtures_pdf() names the document after a fingerprint of what it shows:
+the parameters (data type, league, days, odds cap) and, for the fixtures in
+the window, their ids, teams, status, scores, kickoff and last update plus
+the state of their consensus odds (odds_summary.odds_state). A few cheap
+queries decide whether MEDIA_ROOT/fixtures_pdfs/fixtures_<fingerprint>.pdf
+already exists; only a changed snapshot builds a new document, written to a
+temporary file and renamed into place so a reader never sees half a PDF.
+
+Pre-match odds refreshes (odds_ingest, The Odds API backup pipeline) call
+schedule_fixtures_pdf_prebuild() once their transaction commits. It
+coalesces a refresh burst into one prebuild_fixtures_pdfs_task run
+FIXTURES_PDF_PREBUILD_DELAY_SECONDS later, which builds the default
+documents (all leagues, FIXTURES_PDF_PREBUILD_DAYS_AHEAD) so users are
+served a ready file, then deletes documents nobody has been served for
+FIXTURES_PDF_RETENTION_SECONDS. The task also runs from Celery Beat in case
+a trigger is lost.
+
+The bookmaker set is not a parameter: the document shows consensus odds
+across all bookmakers.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Iterable, Optional
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from .odds_summary import odds_state
+from .utils import MAX_FIXTURES_IN_PDF, generate_fixtures_pdf, pdf_fixtures_queryset
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_PDF_DIR = 'fixtures_pdfs'
+PREBUILD_PENDING_KEY = 'football:fixtures_pdf:prebuild_pending:{}'
+
+
+def _pdf_dir() -> str:
+    return os.path.join(settings.MEDIA_ROOT, FIXTURES_PDF_DIR)
+
+
+def fixtures_pdf_fingerprint(data_type: str, league_code: Optional[str] = None, days_ahead: int = 10,
+                             days_past: int = 4, max_odds: float = 15.0) -> Optional[str]:
+    """
+    Hash of everything the document for these parameters shows, or None if it
+    would list no fixtures (or data_type is unknown).
+    """
+    fixtures_qs, _ = pdf_fixtures_queryset(data_type, league_code, days_ahead, days_past, timezone.now())
+    if fixtures_qs is None:
+        return None
+    fixtures = list(fixtures_qs[:MAX_FIXTURES_IN_PDF].values_list(
+        'id', 'league__name', 'home_team__name', 'away_team__name', 'status',
+        'home_team_score', 'away_team_score', 'match_date', 'updated_at',
+    ))
+    if not fixtures:
+        return None
+
+    odds = []
+    if data_type == "scheduled_fixtures":
+        odds = sorted(odds_state([row[0] for row in fixtures]).items())
+
+    snapshot = [[data_type, league_code, days_ahead, days_past, max_odds], fixtures, odds]
+    return hashlib.sha256(json.dumps(snapshot, default=str).encode()).hexdigest()
+
+
+def _build(path: str, **params) -> Optional[str]:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        if generate_fixtures_pdf(output_path=tmp_path, **params) is None:
+            return None
+        os.replace(tmp_path, path)
+        return path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_fixtures_pdf(data_type: str = "scheduled_fixtures", league_code: Optional[str] = None,
+                     days_ahead: int = 10, days_past: int = 4, max_odds: float = 15.0) -> Optional[str]:
+    """
+    Absolute path of the fixtures PDF for these parameters (as
+    generate_fixtures_pdf), built only if the current snapshot has no
+    document yet. None if there is nothing to list.
+    """
+    fingerprint = fixtures_pdf_fingerprint(data_type, league_code, days_ahead, days_past, max_odds)
+    if fingerprint is None:
+        return None
+    os.makedirs(_pdf_dir(), exist_ok=True)
+    path = os.path.join(_pdf_dir(), f"fixtures_{fingerprint[:32]}.pdf")
+    try:
+        # Touch so garbage collection keeps documents that are still being served.
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    started = time.monotonic()
+    built = _build(path, data_type=data_type, league_code=league_code, days_ahead=days_ahead,
+                   days_past=days_past, max_odds=max_odds)
+    if built:
+        logger.info(f"Built fixtures PDF {os.path.basename(built)} in {time.monotonic() - started:.2f}s.")
+    return built
+
+
+def collect_fixtures_pdfs(keep: Iterable[str] = ()) -> int:
+    """
+    Delete fixtures PDFs (and leftover temporary files) not served for
+    FIXTURES_PDF_RETENTION_SECONDS, except the paths in `keep`. Returns the
+    number of files removed.
+    """
+    retention = int(getattr(settings, 'FIXTURES_PDF_RETENTION_SECONDS', 3600))
+    cutoff = time.time() - retention
+    keep = {os.path.abspath(path) for path in keep}
+    removed = 0
+    try:
+        entries = list(os.scandir(_pdf_dir()))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.name.startswith('fixtures_') or os.path.abspath(entry.path) in keep:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} expired fixtures PDF file(s).")
+    return removed
+
+
+def _pending_key() -> str:
+    return database_key(PREBUILD_PENDING_KEY)
+
+
+def schedule_fixtures_pdf_prebuild():
+    """
+    Queue one prebuild_fixtures_pdfs_task for a burst of odds refreshes: the
+    first call in a FIXTURES_PDF_PREBUILD_DELAY_SECONDS window queues it to
+    run at the end of the window, later calls in the window do nothing.
+    """
+    delay = int(getattr(settings, 'FIXTURES_PDF_PREBUILD_DELAY_SECONDS', 60))
+    try:
+        if not get_redis().set(_pending_key(), '1', nx=True, ex=delay):
+            return
+    except Exception:
+        logger.warning("Redis unavailable scheduling the fixtures PDF prebuild; the beat run will catch up.", exc_info=True)
+        return
+    prebuild_fixtures_pdfs_task.apply_async(countdown=delay)
+
+
+@shared_task(name="football_data_app.prebuild_fixtures_pdfs", queue='cpu_heavy')
+def prebuild_fixtures_pdfs_task():
+    """Build the default fixtures PDF for the current snapshot and collect old ones."""
+    days_ahead = int(getattr(settings, 'FIXTURES_PDF_PREBUILD_DAYS_AHEAD', 10))
+    path = get_fixtures_pdf("scheduled_fixtures", days_ahead=days_ahead)
+    collect_fixtures_pdfs(keep=[path] if path else ())
@@ -10,7 +10,8 @@ from customer_data.utils import create_or_get_customer_account, get_customer_wal
 # IMPORTANT: Using 'FootballFixture' as the main fixture model name
 from .models import FootballFixture, MarketOutcome # Import FootballFixture directly
 from .football_engine import FootballEngine # Retained for other specific engine operations if any
-from .utils import get_formatted_football_data, parse_betting_string, generate_fixtures_pdf
+from .utils import get_formatted_football_data, parse_betting_string
+from .fixtures_pdf import get_fixtures_pdf
 from .betting_flow_actions import BETTING_UX_ACTIONS, handle_betting_ux_action
 from typing import Optional, List
 from django.utils import timezone # For footer timestamp in view_my_tickets
@@ -85,8 +86,8 @@ def handle_football_betting_action(
             )
 
         if action_type == 'view_matches':
-            # Generate PDF instead of text
-            pdf_path = generate_fixtures_pdf(
+            # PDF instead of text, reused while fixtures and odds are unchanged
+            pdf_path = get_fixtures_pdf(
                 data_type="scheduled_fixtures",
                 league_code=league_code,
                 days_ahead=days_ahead
@@ -0,0 +1,367 @@
+# whatsappcrm_backend/football_data_app/live_odds_poller.py
+"""
+Long-running in-play odds poller, run by the `run_live_odds_poller`
+management command.
+
+fetch_live_odds_v3_task runs from Celery Beat, whose finest cadence is one
+minute, and every tick re-queries the live fixture ids, looks each /odds/live
+entry's fixture up with its own query and re-reads that fixture's markets
+inside FixtureOddsUpsert -- so in-play prices were up to a minute old and
+every tick paid for reads whose answer had not changed.
+
+LiveOddsPoller keeps that state in memory instead:
+
+  * the live fixtures (LIVE, v3, with at least one market) are re-read every
+    API_FOOTBALL_LIVE_ODDS_FIXTURE_REFRESH seconds, and the market/outcome id
+    map of a fixture that goes live is loaded once, in one query for all of
+    them. Fixtures that stop being live are dropped from the map;
+  * each tick makes one /odds/live request (bypassing the response cache) and
+    matches every entry to the map. The map only supplies ids: what changed
+    is decided by the database, so a price written by anything else since
+    the map was loaded is never mistaken for the current one. One UPDATE
+    writes each market's new fingerprint where it differs from the stored
+    odds_hash and the fixture is still LIVE; a second writes the prices and
+    suspensions of those markets' outcomes -- and deactivates outcomes a
+    market no longer lists -- where they differ from the stored row. The
+    touched fixtures' consensus odds (odds_summary.py) are recomputed in the
+    same transaction;
+  * a fixture whose payload does not fit the map -- a new market or outcome,
+    a market a bookmaker dropped -- goes through FixtureOddsUpsert.apply() as
+    before, and its map is reloaded;
+  * the tick's deltas are published together once the writes commit
+    (odds_deltas.publish_odds_deltas), bumping each fixture's odds version and
+    announcing the tick on odds_deltas.LIVE_ODDS_TICK_CHANNEL.
+
+The poll interval adapts: with nothing live it idles
+(API_FOOTBALL_LIVE_ODDS_IDLE_INTERVAL), otherwise it shortens as more
+fixtures are live, between API_FOOTBALL_LIVE_ODDS_MAX_INTERVAL and
+API_FOOTBALL_LIVE_ODDS_MIN_INTERVAL, and never polls faster than
+API_FOOTBALL_LIVE_ODDS_BUDGET_SHARE of API_FOOTBALL_MAX_REQUESTS_PER_MINUTE
+allows. When the rate limiter defers the live lane, the poller sleeps until
+the slot it was given.
+
+While the poller runs it keeps LIVE_ODDS_POLLER_HEARTBEAT_KEY alive in Redis,
+and fetch_live_odds_v3_task skips its beat ticks so the provider is not
+polled twice.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from .api_football_v3_client import APIFootballV3Client
+from .models import FootballFixture, Market, MarketOutcome
+from .odds_deltas import LIVE_ODDS_TICK_CHANNEL, OddsDelta, publish_odds_deltas
+from .odds_summary import refresh_odds_summaries
+from .odds_ingest import FixtureOddsUpsert
+from .rate_limiter import LANE_LIVE_ODDS, RateLimitExceeded
+from .tasks_api_football_v3 import _collect_bookmaker_odds
+
+logger = logging.getLogger(__name__)
+
+LIVE_ODDS_POLLER_HEARTBEAT_KEY = 'football:live_odds:poller'
+
+_ODDS_PRECISION = Decimal('0.001')  # MarketOutcome.odds decimal_places
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def poller_is_running() -> bool:
+    """True while a LiveOddsPoller has a live heartbeat in Redis."""
+    try:
+        return bool(get_redis().exists(LIVE_ODDS_POLLER_HEARTBEAT_KEY))
+    except Exception:
+        logger.warning("Redis unavailable checking the live odds poller heartbeat.", exc_info=True)
+        return False
+
+
+@dataclass
+class _KnownMarket:
+    market_id: int
+    is_active: bool
+    # (outcome_name, point_value) -> outcome id
+    outcomes: Dict[Tuple[str, Optional[float]], int] = field(default_factory=dict)
+
+
+@dataclass
+class LiveOddsTickResult:
+    fixtures: int = 0
+    outcomes_updated: int = 0
+    markets_updated: int = 0
+    full_upserts: int = 0
+    deltas: List[OddsDelta] = field(default_factory=list)
+
+
+def _write_market_fingerprints(rows: List[Tuple[int, str]], now) -> set:
+    """
+    Store each market's new fingerprint where it differs from odds_hash and
+    its fixture is still LIVE, in one UPDATE. Returns the ids written: the
+    markets whose prices changed.
+    """
+    if not rows:
+        return set()
+    sql = f"""
+        UPDATE {Market._meta.db_table} AS market
+        SET odds_hash = new.odds_hash, last_updated_odds_api = %s, updated_at = %s
+        FROM (VALUES {', '.join(['(%s, %s)'] * len(rows))}) AS new (id, odds_hash),
+             {FootballFixture._meta.db_table} AS fixture
+        WHERE market.id = new.id
+          AND fixture.id = market.fixture_id
+          AND fixture.status = %s
+          AND market.odds_hash IS DISTINCT FROM new.odds_hash
+        RETURNING market.id
+    """
+    params = [now, now, *(value for row in rows for value in row), FootballFixture.FixtureStatus.LIVE]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _write_outcomes(rows: List[Tuple[int, Optional[Decimal], bool]], now) -> List[Tuple[int, Decimal, bool]]:
+    """
+    Write (id, odds, is_active) where either differs from the stored row, in
+    one UPDATE; odds None leaves the price as it is. Returns the rows written.
+    """
+    if not rows:
+        return []
+    sql = f"""
+        UPDATE {MarketOutcome._meta.db_table} AS outcome
+        SET odds = COALESCE(new.odds, outcome.odds), is_active = new.is_active, updated_at = %s
+        FROM (VALUES {', '.join(['(%s, CAST(%s AS numeric), CAST(%s AS boolean))'] * len(rows))})
+             AS new (id, odds, is_active)
+        WHERE outcome.id = new.id
+          AND (outcome.odds IS DISTINCT FROM COALESCE(new.odds, outcome.odds)
+               OR outcome.is_active IS DISTINCT FROM new.is_active)
+        RETURNING outcome.id, outcome.odds, outcome.is_active
+    """
+    params = [now, *(value for row in rows for value in row)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+class LiveOddsPoller:
+    """Polls /odds/live and applies only changed prices. See the module docstring."""
+
+    def __init__(self, client: Optional[APIFootballV3Client] = None):
+        self.client = client or APIFootballV3Client(lane=LANE_LIVE_ODDS, read_cache=False)
+        # api_id -> fixture, and fixture id -> (bookmaker key, market key) -> market.
+        self._fixtures: Dict[str, FootballFixture] = {}
+        self._markets: Dict[int, Dict[Tuple[str, str], _KnownMarket]] = {}
+        self._fixtures_loaded_at: Optional[float] = None
+        self._stop = threading.Event()
+
+    # --- in-memory map ---
+
+    def refresh_fixtures(self):
+        """Re-read the live fixtures; load the map for new ones, drop ended ones."""
+        live = {
+            fixture.api_id: fixture for fixture in
+            FootballFixture.objects.filter(
+                status=FootballFixture.FixtureStatus.LIVE,
+                api_id__startswith='v3_',
+                markets__isnull=False,
+            ).select_related('home_team', 'away_team').distinct()
+        }
+        live_ids = {fixture.id for fixture in live.values()}
+        for fixture_id in set(self._markets) - live_ids:
+            del self._markets[fixture_id]
+        self._fixtures = live
+        self._load_markets(live_ids - set(self._markets))
+        self._fixtures_loaded_at = time.monotonic()
+
+    def _load_markets(self, fixture_ids):
+        fixture_ids = list(fixture_ids)
+        if not fixture_ids:
+            return
+        loaded: Dict[int, Dict[Tuple[str, str], _KnownMarket]] = {fixture_id: {} for fixture_id in fixture_ids}
+        for market in (Market.objects.filter(fixture_id__in=fixture_ids)
+                       .values('id', 'fixture_id', 'bookmaker__api_bookmaker_key', 'api_market_key', 'is_active')):
+            loaded[market['fixture_id']][(market['bookmaker__api_bookmaker_key'], market['api_market_key'])] = \
+                _KnownMarket(market['id'], market['is_active'])
+        by_market_id = {known.market_id: known for markets in loaded.values() for known in markets.values()}
+        # Lowest id first: with duplicate rows for one key, that is the one kept up to date.
+        for outcome_id, market_id, name, point in (
+                MarketOutcome.objects.filter(market_id__in=list(by_market_id)).order_by('id')
+                .values_list('id', 'market_id', 'outcome_name', 'point_value')):
+            by_market_id[market_id].outcomes.setdefault((name, point), outcome_id)
+        self._markets.update(loaded)
+
+    def _fixtures_stale(self) -> bool:
+        return (self._fixtures_loaded_at is None or
+                time.monotonic() - self._fixtures_loaded_at >= _setting('API_FOOTBALL_LIVE_ODDS_FIXTURE_REFRESH', 60))
+
+    # --- one poll ---
+
+    def tick(self) -> LiveOddsTickResult:
+        """Poll /odds/live once and apply what changed. RateLimitExceeded propagates."""
+        result = LiveOddsTickResult()
+        if self._fixtures_stale():
+            self.refresh_fixtures()
+        if not self._fixtures:
+            return result
+
+        live_odds = self.client.get_live_odds()
+        now = timezone.now()
+        # market id -> (fixture id, new fingerprint, outcome rows, dropped outcome ids)
+        candidates: Dict[int, Tuple[int, str, List[Tuple[int, Decimal, bool]], List[int]]] = {}
+        full_upserts: List[FixtureOddsUpsert] = []
+
+        for entry in live_odds or []:
+            fixture = self._fixtures.get(f"v3_{(entry.get('fixture') or {}).get('id')}")
+            bookmakers_list = entry.get('odds') or entry.get('bookmakers') or []
+            if fixture is None or not bookmakers_list:
+                continue
+            upsert = FixtureOddsUpsert(fixture, last_updated=now)
+            for bookmaker_data in bookmakers_list:
+                _collect_bookmaker_odds(upsert, fixture, bookmaker_data, live=True)
+            result.fixtures += 1
+
+            diff = self._diff(fixture.id, upsert)
+            if diff is None:
+                full_upserts.append(upsert)
+                continue
+            for known, fingerprint, outcomes, dropped in diff:
+                candidates[known.market_id] = (fixture.id, fingerprint, outcomes, dropped)
+
+        if candidates:
+            with transaction.atomic():
+                changed_markets = _write_market_fingerprints(
+                    [(market_id, fingerprint) for market_id, (_, fingerprint, _, _) in candidates.items()], now)
+                outcome_rows, dropped_ids = [], set()
+                for market_id in changed_markets:
+                    _, _, outcomes, dropped = candidates[market_id]
+                    outcome_rows.extend(outcomes)
+                    outcome_rows.extend((outcome_id, None, False) for outcome_id in dropped)
+                    dropped_ids.update(dropped)
+                changed_outcomes = _write_outcomes(outcome_rows, now)
+
+                market_fixture = {market_id: candidates[market_id][0] for market_id in changed_markets}
+                outcome_fixture = {
+                    outcome_id: fixture_id
+                    for market_id, (fixture_id, _, outcomes, dropped) in candidates.items() if market_id in changed_markets
+                    for outcome_id in [row[0] for row in outcomes] + dropped
+                }
+                deltas: Dict[int, OddsDelta] = {}
+                for market_id in sorted(changed_markets):
+                    fixture_id = market_fixture[market_id]
+                    deltas.setdefault(fixture_id, OddsDelta(fixture_id=fixture_id)).markets.append(market_id)
+                for outcome_id, odds, _ in sorted(changed_outcomes):
+                    delta = deltas[outcome_fixture[outcome_id]]
+                    if outcome_id in dropped_ids:
+                        delta.deactivated_outcomes.append(outcome_id)
+                    else:
+                        delta.outcomes[outcome_id] = str(odds)
+                result.deltas = [delta for delta in deltas.values() if not delta.is_empty()]
+                published = list(result.deltas)
+                refresh_odds_summaries(delta.fixture_id for delta in published)
+                channel = database_key(LIVE_ODDS_TICK_CHANNEL)
+                transaction.on_commit(lambda: publish_odds_deltas(published, channel=channel))
+            result.markets_updated = len(changed_markets)
+            result.outcomes_updated = len(changed_outcomes)
+
+        if full_upserts:
+            # Fixtures that ended since the map was loaded are left alone.
+            still_live = set(FootballFixture.objects.filter(
+                id__in=[upsert.fixture.id for upsert in full_upserts], status=FootballFixture.FixtureStatus.LIVE,
+            ).values_list('id', flat=True))
+            full_upserts = [upsert for upsert in full_upserts if upsert.fixture.id in still_live]
+        for upsert in full_upserts:
+            upsert.apply()
+        if full_upserts:
+            self._load_markets(upsert.fixture.id for upsert in full_upserts)
+        result.full_upserts = len(full_upserts)
+        return result
+
+    def _diff(self, fixture_id: int, upsert: FixtureOddsUpsert):
+        """
+        Per market in the payload: (known market, new fingerprint, outcomes as
+        (id, odds, is_active), ids of known outcomes the market no longer
+        lists). None if the payload does not fit the map and needs a full
+        upsert. Nothing here says whether a price changed; the writes do.
+        """
+        known_markets = self._markets.get(fixture_id)
+        if known_markets is None:
+            return None
+        pending_markets = upsert.pending_markets()
+        bookmakers = {bookmaker_key for bookmaker_key, _ in pending_markets}
+        if any(known.is_active and key[0] in bookmakers and key not in pending_markets
+               for key, known in known_markets.items()):
+            return None
+
+        diff = []
+        for key, pending in pending_markets.items():
+            known = known_markets.get(key)
+            if known is None or not known.is_active or not set(pending.outcomes) <= set(known.outcomes):
+                return None
+            outcomes = [
+                (known.outcomes[outcome_key], odds.quantize(_ODDS_PRECISION), is_active)
+                for outcome_key, (odds, is_active) in pending.outcomes.items()
+            ]
+            dropped = [outcome_id for outcome_key, outcome_id in known.outcomes.items()
+                       if outcome_key not in pending.outcomes]
+            diff.append((known, pending.fingerprint(), outcomes, dropped))
+        return diff
+
+    # --- loop ---
+
+    def next_interval(self) -> float:
+        """Seconds until the next poll, from the live fixture count and the request budget."""
+        live_count = len(self._fixtures)
+        if not live_count:
+            return float(_setting('API_FOOTBALL_LIVE_ODDS_IDLE_INTERVAL', 60))
+        min_interval = float(_setting('API_FOOTBALL_LIVE_ODDS_MIN_INTERVAL', 5))
+        max_interval = float(_setting('API_FOOTBALL_LIVE_ODDS_MAX_INTERVAL', 30))
+        interval = min(max_interval, max(min_interval, max_interval / live_count))
+        budget = (_setting('API_FOOTBALL_MAX_REQUESTS_PER_MINUTE', 300) *
+                  _setting('API_FOOTBALL_LIVE_ODDS_BUDGET_SHARE', 0.25))
+        return max(interval, 60.0 / budget) if budget > 0 else max_interval
+
+    def _heartbeat(self, ttl: float):
+        try:
+            get_redis().set(LIVE_ODDS_POLLER_HEARTBEAT_KEY, timezone.now().isoformat(), ex=max(1, int(ttl)))
+        except Exception:
+            logger.warning("Redis unavailable updating the live odds poller heartbeat.", exc_info=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Poll until stop() is called."""
+        logger.info("Live odds poller started.")
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                result = self.tick()
+                delay = self.next_interval()
+                if result.fixtures:
+                    logger.info(
+                        f"Live odds tick: {result.fixtures} fixture(s), {result.outcomes_updated} outcome(s) and "
+                        f"{result.markets_updated} market(s) updated, {result.full_upserts} full upsert(s); "
+                        f"next poll in {delay:.1f}s."
+                    )
+            except RateLimitExceeded as e:
+                delay = max(self.next_interval(), e.retry_after or 0)
+                logger.info(f"Live odds poller deferred by the rate limiter; next poll in {delay:.1f}s.")
+            except Exception as e:
+                # Drop the map: it may no longer match what was committed.
+                logger.error(f"Live odds poller tick failed: {e}", exc_info=True)
+                self._markets.clear()
+                self._fixtures_loaded_at = None
+                delay = float(_setting('API_FOOTBALL_LIVE_ODDS_MAX_INTERVAL', 30))
+            self._heartbeat(delay * 2 + 5)
+            self._stop.wait(delay)
+        try:
+            get_redis().delete(LIVE_ODDS_POLLER_HEARTBEAT_KEY)
+        except Exception:
+            logger.warning("Redis unavailable clearing the live odds poller heartbeat.", exc_info=True)
+        logger.info("Live odds poller stopped.")
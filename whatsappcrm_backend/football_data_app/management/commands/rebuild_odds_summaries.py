@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from football_data_app.models import FootballFixture
+from football_data_app.odds_summary import refresh_odds_summaries
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the consensus odds (FixtureOddsSummary, see
+    football_data_app/odds_summary.py) of upcoming and live fixtures.
+
+    The odds pipelines keep the table current; run this once after deploying
+    it, or after editing odds by hand, to backfill.
+
+    Usage:
+        python manage.py rebuild_odds_summaries
+        python manage.py rebuild_odds_summaries --batch-size 100
+    """
+    help = 'Recomputes FixtureOddsSummary rows for scheduled and live fixtures.'
+
+    def add_arguments(self, parser):
+        """Adds command-line arguments to the command."""
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Fixtures recomputed per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        """The actual logic of the command."""
+        batch_size = options['batch_size']
+        fixture_ids = list(
+            FootballFixture.objects.filter(
+                Q(status=FootballFixture.FixtureStatus.SCHEDULED, match_date__gte=timezone.now()) |
+                Q(status=FootballFixture.FixtureStatus.LIVE)
+            ).order_by('id').values_list('id', flat=True)
+        )
+        for start in range(0, len(fixture_ids), batch_size):
+            refresh_odds_summaries(fixture_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt odds summaries for {len(fixture_ids)} fixture(s)."))
@@ -0,0 +1,45 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from football_data_app.live_odds_poller import LiveOddsPoller
+
+
+class Command(BaseCommand):
+    """
+    Runs the long-running in-play odds poller (football_data_app/live_odds_poller.py).
+
+    Run it as its own process next to the Celery workers. While it is up,
+    the fetch-live-football-odds-v3 beat task skips its ticks.
+
+    Usage:
+        python manage.py run_live_odds_poller
+        python manage.py run_live_odds_poller --once
+    """
+    help = 'Polls API-Football /odds/live on an adaptive sub-minute interval and applies changed prices.'
+
+    def add_arguments(self, parser):
+        """Adds command-line arguments to the command."""
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single poll and exit.',
+        )
+
+    def handle(self, *args, **options):
+        """The actual logic of the command."""
+        poller = LiveOddsPoller()
+
+        if options['once']:
+            result = poller.tick()
+            self.stdout.write(self.style.SUCCESS(
+                f"Polled live odds for {result.fixtures} fixture(s): {result.outcomes_updated} outcome(s) updated, "
+                f"{result.full_upserts} full upsert(s). Next poll would be in {poller.next_interval():.1f}s."
+            ))
+            return
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: poller.stop())
+        self.stdout.write("Live odds poller running. Stop with Ctrl+C or SIGTERM.")
+        poller.run()
+        self.stdout.write(self.style.SUCCESS("Live odds poller stopped."))
@@ -0,0 +1,114 @@
+# whatsappcrm_backend/football_data_app/market_screens.py
+"""
+Versioned Redis cache of the rendered market and outcome screens.
+
+Every market or outcome tap -- in the conversational flow
+(betting_flow_actions) and on the native BET_MARKETS / BET_OUTCOMES Flow
+screens (bet_flow_handler) -- used to reload the fixture, every active
+market across bookmakers and all of their outcomes, then pick one market per
+category in Python (betting_ux._ordered_markets). A busy fixture before
+kickoff gets thousands of those taps a minute, all rendering the same rows.
+
+The rendered screens of a fixture now live in one Redis hash per fixture
+(MARKET_SCREENS_KEY): a 'version' field plus one field per screen --
+'markets', and 'outcomes:<market id>' for each market opened. 'version' is
+the fixture's odds version (odds_deltas.odds_versions) at the time the
+screens were built. A read fetches the current odds version and the wanted
+screen in one round trip and only uses the screen if the versions match, so
+a price change invalidates exactly the fixture it touched without anyone
+deleting anything.
+
+Changes that do not publish an odds delta drop the hash instead: the score
+sweep (scores and status are in the markets screen header) and ORM writes to
+fixtures, markets and outcomes (signals.py). MARKET_SCREENS_TTL bounds what
+any missed invalidation can cost.
+
+Outcome taps only carry a market id. Its fixture id, which never changes, is
+remembered per process (one primary-key lookup the first time).
+
+If Redis is unavailable the screen is built from the database for the
+request and not stored.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+
+from whatsappcrm_backend.redis_client import database_key, delete_keys, get_redis
+from . import odds_deltas
+from .models import Market
+
+logger = logging.getLogger(__name__)
+
+MARKET_SCREENS_KEY = 'football:screens:{}:{}'
+# Process-local market id -> fixture id; cleared when it grows past this.
+MARKET_FIXTURE_CACHE_SIZE = 50000
+
+_market_fixture_ids: dict[int, int] = {}
+
+
+def _key(fixture_id: int) -> str:
+    return database_key(MARKET_SCREENS_KEY, fixture_id)
+
+
+def market_fixture_id(market_id: int) -> Optional[int]:
+    """The fixture a market belongs to, or None if the market does not exist."""
+    fixture_id = _market_fixture_ids.get(market_id)
+    if fixture_id is None:
+        fixture_id = Market.objects.filter(pk=market_id).values_list('fixture_id', flat=True).first()
+        if fixture_id is None:
+            return None
+        if len(_market_fixture_ids) >= MARKET_FIXTURE_CACHE_SIZE:
+            _market_fixture_ids.clear()
+        _market_fixture_ids[market_id] = fixture_id
+    return fixture_id
+
+
+def _store(fixture_id: int, version: str, stored_version: Optional[str], field: str, screen: dict):
+    key = _key(fixture_id)
+    ttl = int(getattr(settings, 'MARKET_SCREENS_TTL', 60))
+    pipe = get_redis().pipeline(transaction=True)
+    if stored_version != version:
+        # Screens of an older version are useless; start the hash over.
+        pipe.delete(key)
+        pipe.hset(key, mapping={'version': version, field: json.dumps(screen, separators=(',', ':'))})
+        pipe.expire(key, ttl)
+    else:
+        pipe.hset(key, field, json.dumps(screen, separators=(',', ':')))
+    pipe.execute()
+
+
+def cached_screen(fixture_id: int, field: str, build: Callable[[], Optional[dict]]) -> Optional[dict]:
+    """
+    The `field` screen of `fixture_id` at its current odds version, built
+    with `build()` and stored on a miss. `build` returning None (nothing to
+    show) is not cached.
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hget(database_key(odds_deltas.ODDS_VERSION_KEY), fixture_id)
+        pipe.hmget(_key(fixture_id), 'version', field)
+        version, (stored_version, raw) = pipe.execute()
+    except Exception:
+        logger.warning(f"Redis unavailable reading market screens for fixture {fixture_id}; building from the database.", exc_info=True)
+        return build()
+
+    version = version or '0'
+    if raw is not None and stored_version == version:
+        return json.loads(raw)
+
+    screen = build()
+    if screen is not None:
+        try:
+            _store(fixture_id, version, stored_version, field, screen)
+        except Exception:
+            logger.warning(f"Redis unavailable storing market screens for fixture {fixture_id}.", exc_info=True)
+    return screen
+
+
+def invalidate_market_screens(fixture_ids: Iterable[int]):
+    """Drop the screens of `fixture_ids` (redis_client.delete_keys)."""
+    delete_keys([_key(fixture_id) for fixture_id in set(fixture_ids) if fixture_id is not None], "market screens")
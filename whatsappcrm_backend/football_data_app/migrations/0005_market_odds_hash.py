@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('football_data_app', '0004_configuration_current_season_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='odds_hash',
+            field=models.CharField(blank=True, default='', help_text="Fingerprint of the last ingested outcome set; refreshes with the same fingerprint skip the market's writes.", max_length=32),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('football_data_app', '0005_market_odds_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FixtureOddsSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('market_key', models.CharField(help_text="Market.api_market_key, e.g. 'h2h', 'totals'.", max_length=50)),
+                ('market_name', models.CharField(help_text='Category name of the market, for display.', max_length=100)),
+                ('outcome_name', models.CharField(max_length=100)),
+                ('point_value', models.FloatField(blank=True, null=True)),
+                ('consensus_odds', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('median_odds', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('best_odds', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('bookmaker_count', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('consensus_outcome', models.ForeignKey(help_text='The bookmaker outcome whose odds are closest to the median; bets are placed on its id.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='football_data_app.marketoutcome')),
+                ('fixture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='odds_summaries', to='football_data_app.footballfixture')),
+            ],
+            options={
+                'verbose_name': 'Fixture Odds Summary',
+                'verbose_name_plural': 'Fixture Odds Summaries',
+                'indexes': [models.Index(fields=['fixture', 'market_key'], name='football_da_fixture_aa41a2_idx')],
+            },
+        ),
+    ]
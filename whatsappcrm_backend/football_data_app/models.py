@@ -118,6 +118,10 @@ class Market(models.Model):
     category = models.ForeignKey(MarketCategory, on_delete=models.CASCADE, related_name='category_markets')
     api_market_key = models.CharField(max_length=50, help_text="The market key from the API, e.g., 'h2h', 'totals'.")
     last_updated_odds_api = models.DateTimeField(help_text="Timestamp of the market update from the API.")
+    odds_hash = models.CharField(
+        max_length=32, blank=True, default='',
+        help_text="Fingerprint of the last ingested outcome set; refreshes with the same fingerprint skip the market's writes."
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -157,6 +161,37 @@ class MarketOutcome(models.Model):
         verbose_name_plural = _("Market Outcomes")
         ordering = ['market', 'outcome_name']
         
+class FixtureOddsSummary(models.Model):
+    """
+    Consensus and best odds across bookmakers for one outcome line of a
+    fixture, maintained by the odds ingestion pipelines (see odds_summary.py)
+    so the fixture list renderers do not aggregate every MarketOutcome.
+    """
+    fixture = models.ForeignKey(FootballFixture, on_delete=models.CASCADE, related_name='odds_summaries')
+    market_key = models.CharField(max_length=50, help_text="Market.api_market_key, e.g. 'h2h', 'totals'.")
+    market_name = models.CharField(max_length=100, help_text="Category name of the market, for display.")
+    outcome_name = models.CharField(max_length=100)
+    point_value = models.FloatField(null=True, blank=True)
+    consensus_outcome = models.ForeignKey(
+        MarketOutcome, on_delete=models.CASCADE, related_name='+',
+        help_text="The bookmaker outcome whose odds are closest to the median; bets are placed on its id."
+    )
+    consensus_odds = models.DecimalField(max_digits=10, decimal_places=3)
+    median_odds = models.DecimalField(max_digits=10, decimal_places=3)
+    best_odds = models.DecimalField(max_digits=10, decimal_places=3)
+    bookmaker_count = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        point_str = f" ({self.point_value})" if self.point_value is not None else ""
+        return f"{self.fixture_id} {self.market_key}: {self.outcome_name}{point_str} @ {self.consensus_odds}"
+
+    class Meta:
+        verbose_name = _("Fixture Odds Summary")
+        verbose_name_plural = _("Fixture Odds Summaries")
+        indexes = [models.Index(fields=['fixture', 'market_key'])]
+
+
 class FixturePrediction(models.Model):
     """
     Model-generated win/draw/loss probabilities for a fixture.
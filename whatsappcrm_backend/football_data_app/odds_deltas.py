@@ -0,0 +1,143 @@
+# whatsappcrm_backend/football_data_app/odds_deltas.py
+"""
+Compact records of what an odds refresh actually changed.
+
+Most refreshes return the same prices we already hold, and the ingestion
+path (odds_ingest.FixtureOddsUpsert) now skips those markets entirely. When a
+refresh does change something, it publishes one OddsDelta per fixture after
+the transaction commits:
+
+  * the delta is appended to the capped Redis stream ODDS_DELTA_STREAM, for
+    consumers that want to apply changes incrementally;
+  * the fixture's odds version (ODDS_VERSION_KEY, a hash of fixture id ->
+    version) is set to the delta's stream id. Stream ids only ever grow, even
+    across a Redis flush, so caches of fixture odds can be keyed by
+    (fixture, odds_version) and never serve a stale entry under a reused
+    version.
+
+The live-odds poller (live_odds_poller.py) publishes all of one tick's
+deltas together with publish_odds_deltas(), which also announces the tick on
+the LIVE_ODDS_TICK_CHANNEL pub/sub channel as {fixture id: new version}, for
+subscribers that only want to know which fixtures to re-read.
+
+Publishing also drops the bettable-fixture snapshot (fixture_snapshot.py),
+whose 1X2 summaries and market availability come from these odds.
+
+Publishing is best effort: if Redis is unavailable the write to Postgres has
+already happened and only the notification is lost, so readers fall back to
+treating the fixture's version as unknown ('0').
+"""
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from .fixture_snapshot import invalidate_snapshot
+
+logger = logging.getLogger(__name__)
+
+ODDS_DELTA_STREAM = 'football:odds:deltas:{}'  # database
+ODDS_VERSION_KEY = 'football:odds:version:{}'
+LIVE_ODDS_TICK_CHANNEL = 'football:odds:live_tick:{}'
+# Approximate cap on the delta stream; consumers that fall further behind than
+# this re-read from the database instead.
+ODDS_DELTA_STREAM_MAXLEN = 10000
+
+
+@dataclass
+class OddsDelta:
+    fixture_id: int
+    # Markets created or whose outcome set changed.
+    markets: List[int] = field(default_factory=list)
+    # Outcome id -> new odds (as a string) for created or repriced outcomes.
+    outcomes: Dict[int, str] = field(default_factory=dict)
+    deactivated_outcomes: List[int] = field(default_factory=list)
+    deactivated_markets: List[int] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.markets or self.outcomes or self.deactivated_outcomes or self.deactivated_markets)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, raw: str) -> 'OddsDelta':
+        data = json.loads(raw)
+        data['outcomes'] = {int(k): v for k, v in data.get('outcomes', {}).items()}
+        return cls(**data)
+
+
+def _keys():
+    return database_key(ODDS_DELTA_STREAM), database_key(ODDS_VERSION_KEY)
+
+
+def publish_odds_delta(delta: OddsDelta) -> Optional[str]:
+    """Append `delta` to the stream and bump the fixture's odds version.
+    Returns the new version, or None if nothing was published."""
+    if delta.is_empty():
+        return None
+    try:
+        stream_key, version_key = _keys()
+        redis_client = get_redis()
+        version = redis_client.xadd(
+            stream_key, {'fixture_id': delta.fixture_id, 'delta': delta.to_json()},
+            maxlen=ODDS_DELTA_STREAM_MAXLEN, approximate=True,
+        )
+        redis_client.hset(version_key, delta.fixture_id, version)
+    except Exception:
+        logger.warning(f"Redis unavailable; odds delta for fixture {delta.fixture_id} not published.", exc_info=True)
+        return None
+    invalidate_snapshot()
+    return version
+
+
+def publish_odds_deltas(deltas: Iterable[OddsDelta], channel: Optional[str] = None) -> Dict[int, str]:
+    """Publish several deltas in one round trip; with `channel`, also publish
+    the resulting {fixture id: version} map there. Returns that map."""
+    deltas = [delta for delta in deltas if not delta.is_empty()]
+    if not deltas:
+        return {}
+    try:
+        stream_key, version_key = _keys()
+        redis_client = get_redis()
+        pipe = redis_client.pipeline(transaction=False)
+        for delta in deltas:
+            pipe.xadd(
+                stream_key, {'fixture_id': delta.fixture_id, 'delta': delta.to_json()},
+                maxlen=ODDS_DELTA_STREAM_MAXLEN, approximate=True,
+            )
+        stream_ids = pipe.execute()
+        versions = {delta.fixture_id: version for delta, version in zip(deltas, stream_ids)}
+        pipe.hset(version_key, mapping=versions)
+        if channel:
+            pipe.publish(channel, json.dumps(versions, separators=(',', ':')))
+        pipe.execute()
+    except Exception:
+        logger.warning(f"Redis unavailable; {len(deltas)} odds delta(s) not published.", exc_info=True)
+        return {}
+    invalidate_snapshot()
+    return versions
+
+
+def odds_versions(fixture_ids: Iterable[int]) -> Dict[int, str]:
+    """Current odds version per fixture ('0' if never published or unknown)."""
+    fixture_ids = list(fixture_ids)
+    if not fixture_ids:
+        return {}
+    try:
+        values = get_redis().hmget(database_key(ODDS_VERSION_KEY), fixture_ids)
+    except Exception:
+        logger.warning("Redis unavailable reading odds versions.", exc_info=True)
+        values = [None] * len(fixture_ids)
+    return {fixture_id: value or '0' for fixture_id, value in zip(fixture_ids, values)}
+
+
+def odds_version(fixture_id: int) -> str:
+    return odds_versions([fixture_id])[fixture_id]
+
+
+def read_odds_deltas(after: str = '0-0', count: int = 500) -> List[tuple]:
+    """(stream id, OddsDelta) pairs published after stream id `after`."""
+    entries = get_redis().xrange(database_key(ODDS_DELTA_STREAM), min=f'({after}', count=count)
+    return [(entry_id, OddsDelta.from_json(fields['delta'])) for entry_id, fields in entries]
@@ -0,0 +1,257 @@
+# whatsappcrm_backend/football_data_app/odds_ingest.py
+"""
+Set-based upsert of one fixture's bookmakers, markets and outcomes.
+
+The odds pipelines used to walk a provider payload row by row --
+Bookmaker.get_or_create, Market.update_or_create and upsert_market_outcome
+per bookmaker/market/outcome, plus an exclude().update() per market -- so a
+fixture with 15 bookmakers x 30 markets cost thousands of round trips and
+the 30-minute full refresh outgrew its own interval.
+
+FixtureOddsUpsert collects the parsed payload first and then writes it in a
+fixed number of statements, however large the payload:
+
+  * missing Bookmakers / MarketCategories are inserted in one statement each;
+  * each market's outcome set is fingerprinted (Market.odds_hash). An active
+    market whose fingerprint matches the stored one is skipped entirely --
+    no market write, no outcome reads or writes -- which is the common case:
+    most refreshes return the prices we already hold. Its
+    last_updated_odds_api therefore records when its odds last changed;
+  * the remaining Markets are upserted with one
+    bulk_create(update_conflicts=True) on (fixture, bookmaker, api_market_key),
+    which returns the existing row's id for markets we already had;
+  * their existing MarketOutcomes are loaded once into a dict keyed by
+    (market, outcome_name, point_value) and diffed against the payload: new
+    outcomes are bulk_created, outcomes whose odds or is_active changed are
+    bulk_updated, unchanged ones are not written at all;
+  * outcomes missing from a market that is in the payload, and markets a
+    bookmaker in the payload no longer offers, are deactivated in one UPDATE
+    each.
+
+Whatever changed is published as an OddsDelta (see odds_deltas.py) once the
+transaction commits, for the caches built on fixture odds, and the fixture's
+consensus odds (odds_summary.py) are recomputed in the same transaction.
+
+It keeps the semantics placed bets rely on (see
+test_odds_refresh_preserves_bets.py): rows are updated in place and never
+deleted, so Market/MarketOutcome ids -- and every Bet.market_outcome pointing
+at them -- survive every refresh. As with upsert_market_outcome, when
+duplicate outcome rows already exist for one key the lowest id is the one
+kept up to date and the others are deactivated.
+"""
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .fixtures_pdf import schedule_fixtures_pdf_prebuild
+from .models import Bookmaker, FootballFixture, Market, MarketCategory, MarketOutcome
+from .odds_deltas import OddsDelta, publish_odds_delta
+from .odds_summary import refresh_odds_summaries
+
+logger = logging.getLogger(__name__)
+
+_ODDS_PRECISION = Decimal('0.001')  # MarketOutcome.odds decimal_places
+
+
+@dataclass
+class _PendingMarket:
+    bookmaker_key: str
+    category_name: str
+    api_market_key: str
+    # (outcome_name, point_value) -> (odds, is_active); a repeated line keeps
+    # the last value seen, as sequential upserts did.
+    outcomes: Dict[Tuple[str, Optional[float]], Tuple[Decimal, bool]] = field(default_factory=dict)
+
+    def fingerprint(self) -> str:
+        """Stable hash of the category and outcome set; odds are compared at
+        the column's precision, so '2.1' and '2.10' fingerprint the same."""
+        parts = [self.category_name]
+        for (name, point), (odds, is_active) in sorted(self.outcomes.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            parts.append(f"{name}|{point}|{odds.quantize(_ODDS_PRECISION)}|{int(is_active)}")
+        return hashlib.blake2b('\n'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+@dataclass
+class OddsUpsertResult:
+    bookmakers_created: int = 0
+    markets: int = 0
+    markets_unchanged: int = 0
+    outcomes_created: int = 0
+    outcomes_updated: int = 0
+    outcomes_unchanged: int = 0
+    outcomes_deactivated: int = 0
+    markets_deactivated: int = 0
+    delta: Optional[OddsDelta] = None
+
+
+class FixtureOddsUpsert:
+    """Collects one fixture's odds, then writes them with apply()."""
+
+    def __init__(self, fixture, last_updated=None):
+        self.fixture = fixture
+        self.last_updated = last_updated or timezone.now()
+        self._bookmaker_names: Dict[str, str] = {}
+        self._markets: Dict[Tuple[str, str], _PendingMarket] = {}
+
+    def add_bookmaker(self, api_bookmaker_key: str, name: str):
+        self._bookmaker_names.setdefault(api_bookmaker_key, name)
+
+    def add_market(self, api_bookmaker_key: str, category_name: str, api_market_key: str) -> _PendingMarket:
+        """Register a market offered by an added bookmaker. A market repeated
+        in the payload is merged into one."""
+        key = (api_bookmaker_key, api_market_key)
+        market = self._markets.get(key)
+        if market is None:
+            market = self._markets[key] = _PendingMarket(api_bookmaker_key, category_name, api_market_key)
+        return market
+
+    def add_outcome(self, market: _PendingMarket, outcome_name: str, point_value, odds: Decimal, is_active: bool = True):
+        market.outcomes[(outcome_name, point_value)] = (odds, is_active)
+
+    def pending_markets(self) -> Dict[Tuple[str, str], _PendingMarket]:
+        """The collected markets keyed by (api_bookmaker_key, api_market_key)."""
+        return self._markets
+
+    def apply(self) -> OddsUpsertResult:
+        result = OddsUpsertResult()
+        if not self._bookmaker_names:
+            return result
+        delta = OddsDelta(fixture_id=self.fixture.id)
+        with transaction.atomic():
+            bookmaker_ids = self._resolve_bookmakers(result)
+            existing_markets = {
+                (bookmaker_id, api_market_key): (market_id, odds_hash, is_active)
+                for market_id, bookmaker_id, api_market_key, odds_hash, is_active in
+                Market.objects.filter(fixture=self.fixture, bookmaker_id__in=bookmaker_ids.values())
+                .values_list('id', 'bookmaker_id', 'api_market_key', 'odds_hash', 'is_active')
+            }
+
+            changed, fingerprints = {}, {}
+            for key, pending in self._markets.items():
+                fingerprint = pending.fingerprint()
+                stored = existing_markets.get((bookmaker_ids[pending.bookmaker_key], pending.api_market_key))
+                if stored and stored[2] and stored[1] == fingerprint:
+                    result.markets_unchanged += 1
+                    continue
+                changed[key] = pending
+                fingerprints[key] = fingerprint
+
+            if changed:
+                category_ids = self._resolve_by_name(MarketCategory, {m.category_name for m in changed.values()})
+                market_ids = self._upsert_markets(changed, fingerprints, bookmaker_ids, category_ids, result)
+                self._upsert_outcomes(changed, market_ids, result, delta)
+                delta.markets = sorted(market_ids.values())
+
+            # A market a bookmaker in this payload no longer offers at all.
+            offered = {(bookmaker_ids[p.bookmaker_key], p.api_market_key) for p in self._markets.values()}
+            stale_market_ids = [
+                market_id for key, (market_id, _, is_active) in existing_markets.items()
+                if is_active and key not in offered
+            ]
+            if stale_market_ids:
+                Market.objects.filter(id__in=stale_market_ids).update(is_active=False, updated_at=self.last_updated)
+                delta.deactivated_markets = sorted(stale_market_ids)
+            result.markets_deactivated = len(stale_market_ids)
+
+            if not delta.is_empty():
+                refresh_odds_summaries([self.fixture.id])
+                transaction.on_commit(lambda: publish_odds_delta(delta))
+                if self.fixture.status == FootballFixture.FixtureStatus.SCHEDULED:
+                    transaction.on_commit(schedule_fixtures_pdf_prebuild)
+                result.delta = delta
+        return result
+
+    def _resolve_bookmakers(self, result: OddsUpsertResult) -> Dict[str, int]:
+        keys = set(self._bookmaker_names)
+        existing = dict(Bookmaker.objects.filter(api_bookmaker_key__in=keys).values_list('api_bookmaker_key', 'id'))
+        missing = keys - set(existing)
+        if missing:
+            Bookmaker.objects.bulk_create(
+                [Bookmaker(api_bookmaker_key=key, name=self._bookmaker_names[key]) for key in missing],
+                ignore_conflicts=True,
+            )
+            existing.update(Bookmaker.objects.filter(api_bookmaker_key__in=missing).values_list('api_bookmaker_key', 'id'))
+            result.bookmakers_created = len(missing)
+            logger.info(f"Created {len(missing)} new bookmaker(s): {', '.join(sorted(self._bookmaker_names[k] for k in missing))}")
+        return existing
+
+    @staticmethod
+    def _resolve_by_name(model, names) -> Dict[str, int]:
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = set(names) - set(existing)
+        if missing:
+            model.objects.bulk_create([model(name=name) for name in missing], ignore_conflicts=True)
+            existing.update(model.objects.filter(name__in=missing).values_list('name', 'id'))
+        return existing
+
+    def _upsert_markets(self, markets, fingerprints, bookmaker_ids, category_ids, result: OddsUpsertResult) -> Dict[Tuple[str, str], int]:
+        rows = [
+            Market(
+                fixture=self.fixture,
+                bookmaker_id=bookmaker_ids[pending.bookmaker_key],
+                category_id=category_ids[pending.category_name],
+                api_market_key=pending.api_market_key,
+                last_updated_odds_api=self.last_updated,
+                odds_hash=fingerprints[key],
+                is_active=True,
+            )
+            for key, pending in markets.items()
+        ]
+        Market.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['fixture', 'bookmaker', 'api_market_key'],
+            update_fields=['category', 'last_updated_odds_api', 'odds_hash', 'is_active', 'updated_at'],
+        )
+        result.markets = len(rows)
+        return {key: row.id for key, row in zip(markets, rows)}
+
+    def _upsert_outcomes(self, markets, market_ids, result: OddsUpsertResult, delta: OddsDelta):
+        existing = {}
+        duplicates = []
+        for outcome in (MarketOutcome.objects
+                        .filter(market_id__in=market_ids.values())
+                        .only('id', 'market_id', 'outcome_name', 'point_value', 'odds', 'is_active')
+                        .order_by('id')):
+            key = (outcome.market_id, outcome.outcome_name, outcome.point_value)
+            if key in existing:
+                duplicates.append(outcome)
+            else:
+                existing[key] = outcome
+
+        to_create, to_update, seen = [], [], set()
+        for market_key, pending in markets.items():
+            market_id = market_ids[market_key]
+            for (name, point), (odds, is_active) in pending.outcomes.items():
+                key = (market_id, name, point)
+                seen.add(key)
+                outcome = existing.get(key)
+                if outcome is None:
+                    to_create.append(MarketOutcome(
+                        market_id=market_id, outcome_name=name, point_value=point, odds=odds, is_active=is_active,
+                    ))
+                elif outcome.odds != odds or outcome.is_active != is_active:
+                    outcome.odds, outcome.is_active, outcome.updated_at = odds, is_active, self.last_updated
+                    to_update.append(outcome)
+                else:
+                    result.outcomes_unchanged += 1
+
+        stale_ids = [o.id for key, o in existing.items() if key not in seen and o.is_active]
+        stale_ids += [o.id for o in duplicates if o.is_active]
+
+        if to_create:
+            MarketOutcome.objects.bulk_create(to_create)
+        if to_update:
+            MarketOutcome.objects.bulk_update(to_update, ['odds', 'is_active', 'updated_at'], batch_size=500)
+        if stale_ids:
+            MarketOutcome.objects.filter(id__in=stale_ids).update(is_active=False, updated_at=self.last_updated)
+        result.outcomes_created = len(to_create)
+        result.outcomes_updated = len(to_update)
+        result.outcomes_deactivated = len(stale_ids)
+        delta.outcomes = {o.id: str(o.odds.quantize(_ODDS_PRECISION)) for o in to_create + to_update}
+        delta.deactivated_outcomes = sorted(stale_ids)
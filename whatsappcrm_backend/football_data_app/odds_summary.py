@@ -0,0 +1,171 @@
+# whatsappcrm_backend/football_data_app/odds_summary.py
+"""
+Per-fixture consensus odds, maintained at ingestion time.
+
+The text fixture list (utils.get_formatted_football_data) and the fixtures
+PDF (utils.generate_fixtures_pdf) used to prefetch every active market and
+outcome of up to 40-150 fixtures across all bookmakers -- tens of thousands
+of MarketOutcome objects -- and on every request group them by market key
+and line and take the median per outcome.
+
+FixtureOddsSummary now holds that result: one row per fixture, market key
+and outcome line, with the median, the best price, the number of bookmakers
+quoting it and the bookmaker outcome closest to the median (whose id the
+renderers show and bets are placed on, as before). refresh_odds_summaries()
+recomputes a fixture's rows from its active outcomes in one read and
+replaces them in two statements. It is called, inside their transaction,
+by every odds writer:
+
+  * odds_ingest.FixtureOddsUpsert, when a refresh changed anything;
+  * the live odds poller (live_odds_poller.py), for the fixtures of a tick;
+  * The Odds API backup pipeline, after each event's upsert.
+
+ORM writes to markets and outcomes outside those paths (admin edits, tests)
+drop the fixture's rows (signals.py). consensus_outcomes() computes the
+summary of a fixture without rows in memory, without writing -- a reader
+must not wait on the row locks of an ingestion in progress -- until the
+next refresh stores it. The rebuild_odds_summaries management command
+backfills fixtures ingested before this table existed.
+
+odds_state() is the cheap validator of that output, for caches of what is
+rendered from it (the fixtures PDF, the fixture feed's ETags).
+"""
+import logging
+import statistics
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import FixtureOddsSummary, FootballFixture, MarketOutcome
+
+logger = logging.getLogger(__name__)
+
+_ODDS_PRECISION = Decimal('0.001')  # MarketOutcome.odds decimal_places
+
+
+@dataclass
+class ConsensusOutcome:
+    """What the renderers show for one outcome line: `id` is the consensus
+    MarketOutcome's id and `odds` its price."""
+    id: int
+    outcome_name: str
+    point_value: Optional[float]
+    odds: Decimal
+    best_odds: Decimal
+    market_name: str
+
+
+def outcome_identifier(outcome_name: str, point_value: Optional[float]) -> str:
+    """The '<name>-<point>' key the renderers look outcomes up by."""
+    return f"{outcome_name}-{point_value if point_value is not None else ''}"
+
+
+def _compute(fixture_ids: List[int]) -> List[FixtureOddsSummary]:
+    """Unsaved summary rows for `fixture_ids`, from their active outcomes."""
+    groups: Dict[tuple, List[tuple]] = {}
+    names: Dict[tuple, str] = {}
+    for outcome_id, fixture_id, market_key, market_name, outcome_name, point_value, odds in (
+        MarketOutcome.objects.filter(market__fixture_id__in=fixture_ids, market__is_active=True, is_active=True)
+        .order_by('market_id', 'id')
+        .values_list('id', 'market__fixture_id', 'market__api_market_key', 'market__category__name',
+                     'outcome_name', 'point_value', 'odds')
+    ):
+        key = (fixture_id, market_key, outcome_name, point_value)
+        groups.setdefault(key, []).append((outcome_id, odds))
+        names.setdefault(key, market_name)
+
+    rows = []
+    for key, quotes in groups.items():
+        fixture_id, market_key, outcome_name, point_value = key
+        median = statistics.median(float(odds) for _, odds in quotes)
+        # The quote closest to the median, so the shown price is a real, bettable outcome.
+        consensus_id, consensus_odds = min(quotes, key=lambda quote: abs(float(quote[1]) - median))
+        rows.append(FixtureOddsSummary(
+            fixture_id=fixture_id, market_key=market_key, market_name=names[key],
+            outcome_name=outcome_name, point_value=point_value,
+            consensus_outcome_id=consensus_id, consensus_odds=consensus_odds,
+            median_odds=Decimal(str(median)).quantize(_ODDS_PRECISION),
+            best_odds=max(odds for _, odds in quotes), bookmaker_count=len(quotes),
+        ))
+    return rows
+
+
+def refresh_odds_summaries(fixture_ids: Iterable[int]):
+    """Recompute and replace the FixtureOddsSummary rows of `fixture_ids`."""
+    fixture_ids = sorted(set(fixture_ids))
+    if not fixture_ids:
+        return
+    with transaction.atomic():
+        # Serialise concurrent refreshes of a fixture, and read the outcomes only
+        # once holding the lock: computed before it, a refresh that waited could
+        # replace a newer refresh's rows with ones from older prices.
+        list(FootballFixture.objects.select_for_update().filter(id__in=fixture_ids)
+             .order_by('id').values_list('id', flat=True))
+        rows = _compute(fixture_ids)
+        FixtureOddsSummary.objects.filter(fixture_id__in=fixture_ids).delete()
+        FixtureOddsSummary.objects.bulk_create(rows, batch_size=1000)
+
+
+def drop_odds_summaries(fixture_ids: Iterable[int]):
+    """Forget the rows of `fixture_ids`; readers compute them in memory until
+    the next refresh."""
+    fixture_ids = [fixture_id for fixture_id in set(fixture_ids) if fixture_id is not None]
+    if fixture_ids:
+        FixtureOddsSummary.objects.filter(fixture_id__in=fixture_ids).delete()
+
+
+_FIELDS = ('fixture_id', 'market_key', 'market_name', 'outcome_name', 'point_value',
+           'consensus_outcome_id', 'consensus_odds', 'best_odds')
+
+
+def consensus_outcomes(fixture_ids: Iterable[int], max_odds: Optional[float] = None
+                       ) -> Dict[int, Dict[str, Dict[str, ConsensusOutcome]]]:
+    """
+    {fixture id: {market key: {outcome identifier: ConsensusOutcome}}} for
+    `fixture_ids`, leaving out lines whose consensus odds exceed `max_odds`.
+    """
+    fixture_ids = list(dict.fromkeys(fixture_ids))
+    rows = list(FixtureOddsSummary.objects.filter(fixture_id__in=fixture_ids).order_by('id').values_list(*_FIELDS))
+    covered = {row[0] for row in rows}
+    missing = [fixture_id for fixture_id in fixture_ids if fixture_id not in covered]
+    if missing:
+        rows.extend(tuple(getattr(summary, name) for name in _FIELDS) for summary in _compute(missing))
+
+    result: Dict[int, Dict[str, Dict[str, ConsensusOutcome]]] = {}
+    for fixture_id, market_key, market_name, outcome_name, point_value, outcome_id, odds, best_odds in rows:
+        if max_odds is not None and odds > Decimal(str(max_odds)):
+            continue
+        result.setdefault(fixture_id, {}).setdefault(market_key, {})[outcome_identifier(outcome_name, point_value)] = \
+            ConsensusOutcome(id=outcome_id, outcome_name=outcome_name, point_value=point_value,
+                             odds=odds, best_odds=best_odds, market_name=market_name)
+    return result
+
+
+def odds_state(fixture_ids: Iterable[int]) -> Dict[int, tuple]:
+    """
+    {fixture id: (source, rows, last update)} describing what
+    consensus_outcomes() reads for each fixture -- its summary rows, or for a
+    fixture without any its outcomes and markets -- in at most two aggregate
+    queries. Changes whenever that output can; fixtures with no odds at all
+    are left out.
+    """
+    fixture_ids = list(dict.fromkeys(fixture_ids))
+    state = {
+        fixture_id: ('summary', rows, latest)
+        for fixture_id, rows, latest in FixtureOddsSummary.objects.filter(fixture_id__in=fixture_ids)
+        .order_by().values('fixture_id').annotate(rows=Count('id'), latest=Max('updated_at'))
+        .values_list('fixture_id', 'rows', 'latest')
+    }
+    missing = [fixture_id for fixture_id in fixture_ids if fixture_id not in state]
+    if missing:
+        for fixture_id, rows, latest, markets_latest in (
+            MarketOutcome.objects.filter(market__fixture_id__in=missing)
+            .order_by().values('market__fixture_id')
+            .annotate(rows=Count('id'), latest=Max('updated_at'), markets_latest=Max('market__updated_at'))
+            .values_list('market__fixture_id', 'rows', 'latest', 'markets_latest')
+        ):
+            state[fixture_id] = ('outcomes', rows, max(latest, markets_latest))
+    return state
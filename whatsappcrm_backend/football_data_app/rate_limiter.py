@@ -1,139 +1,184 @@
 # football_data_app/rate_limiter.py
 """
-Rate limiter for API-Football requests to ensure we don't exceed 300 requests per minute.
-Uses Django cache backend for distributed rate limiting support.
+Rate limiter for API-Football requests, shared by every worker process and node.
+
+The previous limiter counted requests in a fixed window with a non-atomic
+get/compare/incr against Django's default cache -- which, with CACHES unset,
+is per-process LocMem, so each worker enforced the limit on its own -- and
+time.sleep()'d inside the Celery worker slot until the window reset, often
+for most of a minute.
+
+Requests are now admitted by GCRA (generic cell rate algorithm) in one Lua
+script against Redis, using the Redis server's clock so every node agrees:
+
+  * the limiter stores a single "theoretical arrival time" (TAT). Each
+    admitted request pushes it forward by one emission interval
+    (60 / API_FOOTBALL_MAX_REQUESTS_PER_MINUTE seconds); a request is admitted
+    while TAT - now stays within the burst tolerance;
+  * each priority lane has its own share of the burst
+    (API_FOOTBALL_RATE_LIMIT_BURST). Live odds may use all of it, scores and
+    settlement most of it, pre-match odds half and league/fixture catalogue
+    refreshes a quarter. A bulk refresh therefore stops well before the
+    bucket is full, and in-play pricing always finds headroom;
+  * a request that is not admitted gets the time its lane's next slot opens.
+    acquire() waits inline only for short gaps
+    (API_FOOTBALL_RATE_LIMIT_MAX_INLINE_WAIT); past that it raises
+    RateLimitExceeded carrying next_slot_at / retry_after, and the Celery
+    task reschedules itself with that countdown instead of holding a worker.
+
+If Redis is unavailable the limiter lets requests through and logs a warning;
+if the script itself fails it does the same but logs an error.
 """
 import time
 import logging
 from functools import wraps
-from typing import Optional
-from django.core.cache import cache
 from django.conf import settings
+from redis.exceptions import ResponseError
+
+from whatsappcrm_backend.redis_client import get_redis
 
 logger = logging.getLogger(__name__)
 
-# Rate limiting configuration
-MAX_REQUESTS_PER_MINUTE = getattr(settings, 'API_FOOTBALL_MAX_REQUESTS_PER_MINUTE', 300)
-RATE_LIMIT_WINDOW_SECONDS = 60
-RATE_LIMIT_CACHE_KEY_PREFIX = 'api_football_rate_limit'
+# Priority lanes, highest first.
+LANE_LIVE_ODDS = 'live_odds'
+LANE_SCORES = 'scores'
+LANE_PREMATCH_ODDS = 'prematch_odds'
+LANE_LEAGUES = 'leagues'
 
-# Rate limiting constants
-CACHE_TIMEOUT_BUFFER_SECONDS = 10  # Extra seconds added to cache timeout to prevent premature expiration
-WINDOW_RESET_BUFFER_SECONDS = 0.1  # Small buffer to ensure clean window reset
+# Share of the burst tolerance each lane may use.
+LANE_BURST_SHARE = {
+    LANE_LIVE_ODDS: 1.0,
+    LANE_SCORES: 0.75,
+    LANE_PREMATCH_ODDS: 0.5,
+    LANE_LEAGUES: 0.25,
+}
+
+RATE_LIMIT_TAT_KEY = 'api_football:gcra:tat'
+RATE_LIMIT_STATS_KEY = 'api_football:gcra:stats'
+
+# KEYS: TAT key, stats hash. ARGV: emission interval (ms), lane tolerance (ms), lane.
+# Returns {admitted (1/0), ms until the lane's next slot, TAT - now after the call (ms)}.
+_GCRA = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local wait = tat - tolerance - now
+if wait > 0 then
+    redis.call('HINCRBY', KEYS[2], ARGV[3] .. ':deferred', 1)
+    return {0, wait, tat - now}
+end
+tat = tat + interval
+redis.call('SET', KEYS[1], tat, 'PX', math.ceil(tat - now + 1000))
+redis.call('HINCRBY', KEYS[2], ARGV[3] .. ':admitted', 1)
+return {1, 0, tat - now}
+"""
+
+_script = None
 
 
 class RateLimitExceeded(Exception):
-    """Exception raised when rate limit is exceeded."""
-    def __init__(self, retry_after: float = None):
+    """Raised when a lane has no slot within the inline-wait budget."""
+    def __init__(self, retry_after: float = None, lane: str = None):
         self.retry_after = retry_after
+        self.lane = lane
+        self.next_slot_at = time.time() + retry_after if retry_after is not None else None
         message = f"Rate limit exceeded. Retry after {retry_after:.1f} seconds." if retry_after else "Rate limit exceeded."
         super().__init__(message)
 
+    @property
+    def countdown(self) -> int:
+        """retry_after rounded up to whole seconds, for Celery countdowns."""
+        return max(1, int(-(-(self.retry_after or 0) // 1)))
+
 
 class APIFootballRateLimiter:
     """
-    Rate limiter for API-Football requests.
-    Ensures we don't exceed MAX_REQUESTS_PER_MINUTE requests per minute.
+    GCRA rate limiter for API-Football requests with priority lanes.
+    See the module docstring.
     """
-    
-    def __init__(self, max_requests: int = MAX_REQUESTS_PER_MINUTE, window_seconds: int = RATE_LIMIT_WINDOW_SECONDS):
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
-        self.cache_key = f"{RATE_LIMIT_CACHE_KEY_PREFIX}_requests"
-        self.window_start_key = f"{RATE_LIMIT_CACHE_KEY_PREFIX}_window_start"
-    
-    def _get_current_window_data(self):
-        """Get current rate limit window data from cache."""
-        request_count = cache.get(self.cache_key, 0)
-        window_start = cache.get(self.window_start_key, time.time())
-        return request_count, window_start
-    
-    def _reset_window(self):
-        """Reset the rate limit window."""
-        cache.set(self.cache_key, 0, timeout=self.window_seconds + CACHE_TIMEOUT_BUFFER_SECONDS)
-        cache.set(self.window_start_key, time.time(), timeout=self.window_seconds + CACHE_TIMEOUT_BUFFER_SECONDS)
-        logger.info(f"Rate limit window reset. New window starts now.")
-    
-    def _increment_counter(self):
-        """Increment the request counter."""
+
+    def __init__(self, max_requests: int = None, burst: int = None):
+        self.max_requests = max_requests or getattr(settings, 'API_FOOTBALL_MAX_REQUESTS_PER_MINUTE', 300)
+        self.burst = burst or getattr(settings, 'API_FOOTBALL_RATE_LIMIT_BURST', 30)
+        self.interval_ms = 60000.0 / self.max_requests
+
+    def _tolerance_ms(self, lane: str) -> float:
+        share = LANE_BURST_SHARE.get(lane, LANE_BURST_SHARE[LANE_PREMATCH_ODDS])
+        return max(0.0, (self.burst * share - 1) * self.interval_ms)
+
+    def try_acquire(self, lane: str = LANE_PREMATCH_ODDS) -> float:
+        """Take a slot for `lane` if one is open now. Returns 0.0 when the
+        request may go ahead, otherwise the seconds until the lane's next slot."""
+        global _script
         try:
-            # Use atomic increment if available (Redis, Memcached)
-            new_count = cache.incr(self.cache_key)
-        except (ValueError, AttributeError):
-            # Fallback for cache backends that don't support incr
-            current_count = cache.get(self.cache_key, 0)
-            new_count = current_count + 1
-            cache.set(self.cache_key, new_count, timeout=self.window_seconds + CACHE_TIMEOUT_BUFFER_SECONDS)
-        return new_count
-    
-    def acquire(self, wait: bool = True) -> bool:
+            redis_client = get_redis()
+            if _script is None:
+                _script = redis_client.register_script(_GCRA)
+            admitted, wait_ms, _ = _script(
+                keys=[RATE_LIMIT_TAT_KEY, RATE_LIMIT_STATS_KEY],
+                args=[self.interval_ms, self._tolerance_ms(lane), lane],
+            )
+        except ResponseError:
+            logger.error("API-Football rate limiter script failed; request not rate limited.", exc_info=True)
+            return 0.0
+        except Exception:
+            logger.warning("Redis unavailable for the API-Football rate limiter; request not rate limited.", exc_info=True)
+            return 0.0
+        return 0.0 if int(admitted) else int(wait_ms) / 1000.0
+
+    def acquire(self, lane: str = LANE_PREMATCH_ODDS, max_wait: float = None) -> bool:
         """
-        Attempt to acquire a rate limit slot.
-        
-        Args:
-            wait: If True, wait until a slot becomes available. If False, raise exception immediately.
-        
-        Returns:
-            True if slot acquired successfully
-            
+        Acquire a slot for `lane`, waiting inline for at most `max_wait`
+        seconds (default API_FOOTBALL_RATE_LIMIT_MAX_INLINE_WAIT).
+
         Raises:
-            RateLimitExceeded: If rate limit exceeded and wait=False
+            RateLimitExceeded: if the lane's next slot is further away; its
+                retry_after / next_slot_at say when to try again.
         """
-        current_time = time.time()
-        request_count, window_start = self._get_current_window_data()
-        window_elapsed = current_time - window_start
-        
-        # Check if we need to start a new window
-        if window_elapsed >= self.window_seconds:
-            self._reset_window()
-            request_count = 0
-            window_start = current_time
-            window_elapsed = 0
-        
-        # Check if we're at the limit
-        if request_count >= self.max_requests:
-            # Calculate time to wait until window resets
-            time_until_reset = self.window_seconds - window_elapsed
-            
-            if not wait:
-                raise RateLimitExceeded(retry_after=time_until_reset)
-            
-            # Wait until window resets
-            logger.warning(
-                f"Rate limit reached ({request_count}/{self.max_requests} requests). "
-                f"Waiting {time_until_reset:.1f} seconds for window reset..."
-            )
-            time.sleep(time_until_reset + WINDOW_RESET_BUFFER_SECONDS)
-            
-            # Reset window and try again
-            self._reset_window()
-            request_count = 0
-        
-        # Increment counter and allow request
-        new_count = self._increment_counter()
-        
-        logger.debug(
-            f"Rate limit: {new_count}/{self.max_requests} requests in current window "
-            f"({window_elapsed:.1f}s elapsed)"
-        )
-        
-        return True
-    
+        if max_wait is None:
+            max_wait = getattr(settings, 'API_FOOTBALL_RATE_LIMIT_MAX_INLINE_WAIT', 1.0)
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(lane)
+            if wait <= 0:
+                return True
+            if waited + wait > max_wait:
+                logger.info(f"API-Football rate limit: no '{lane}' slot for {wait:.2f}s; deferring caller.")
+                raise RateLimitExceeded(retry_after=wait, lane=lane)
+            time.sleep(wait)
+            waited += wait
+
     def get_current_usage(self) -> dict:
-        """Get current rate limit usage statistics."""
-        current_time = time.time()
-        request_count, window_start = self._get_current_window_data()
-        window_elapsed = current_time - window_start
-        
-        return {
-            'requests_made': request_count,
+        """Current backlog and per-lane counters of admitted / deferred requests."""
+        usage = {
             'max_requests': self.max_requests,
-            'window_seconds': self.window_seconds,
-            'window_elapsed': window_elapsed,
-            'window_remaining': max(0, self.window_seconds - window_elapsed),
-            'requests_remaining': max(0, self.max_requests - request_count),
-            'percentage_used': (request_count / self.max_requests) * 100 if self.max_requests > 0 else 0
+            'burst': self.burst,
+            'backlog_seconds': 0.0,
+            'lanes': {lane: {'admitted': 0, 'deferred': 0} for lane in LANE_BURST_SHARE},
         }
+        try:
+            redis_client = get_redis()
+            tat = redis_client.get(RATE_LIMIT_TAT_KEY)
+            server_seconds, server_micros = redis_client.time()
+            stats = redis_client.hgetall(RATE_LIMIT_STATS_KEY)
+        except Exception:
+            logger.warning("Redis unavailable reading API-Football rate limit usage.", exc_info=True)
+            usage['error'] = 'redis_unavailable'
+            return usage
+        now_ms = server_seconds * 1000 + server_micros // 1000
+        backlog_ms = max(0.0, float(tat) - now_ms) if tat else 0.0
+        usage['backlog_seconds'] = round(backlog_ms / 1000.0, 3)
+        for lane, counters in usage['lanes'].items():
+            counters['admitted'] = int(stats.get(f'{lane}:admitted', 0))
+            counters['deferred'] = int(stats.get(f'{lane}:deferred', 0))
+            counters['headroom'] = max(0, int((self._tolerance_ms(lane) - backlog_ms) // self.interval_ms) + 1)
+        usage['percentage_used'] = min(100.0, backlog_ms / (self.burst * self.interval_ms) * 100)
+        return usage
 
 
 # Global rate limiter instance
@@ -148,15 +193,12 @@ def get_rate_limiter() -> APIFootballRateLimiter:
     return _rate_limiter
 
 
-def rate_limit(wait: bool = True):
+def rate_limit(lane: str = LANE_PREMATCH_ODDS, max_wait: float = None):
     """
     Decorator to apply rate limiting to API functions.
-    
-    Args:
-        wait: If True, wait for rate limit slot. If False, raise exception immediately.
-    
+
     Usage:
-        @rate_limit(wait=True)
+        @rate_limit(lane=LANE_SCORES)
         def fetch_data():
             # API call here
             pass
@@ -164,8 +206,7 @@ def rate_limit(wait: bool = True):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            limiter = get_rate_limiter()
-            limiter.acquire(wait=wait)
+            get_rate_limiter().acquire(lane=lane, max_wait=max_wait)
             return func(*args, **kwargs)
         return wrapper
     return decorator
@@ -174,9 +215,8 @@ def rate_limit(wait: bool = True):
 def check_rate_limit_status() -> dict:
     """
     Check current rate limit status without making a request.
-    
+
     Returns:
         Dictionary with current usage statistics
     """
-    limiter = get_rate_limiter()
-    return limiter.get_current_usage()
+    return get_rate_limiter().get_current_usage()
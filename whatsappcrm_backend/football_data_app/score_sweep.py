@@ -0,0 +1,213 @@
+# whatsappcrm_backend/football_data_app/score_sweep.py
+"""
+One shared sweep of live and recently finished scores for every fixture we
+are waiting on.
+
+The score pipeline used to fan out one fetch_scores_for_league_v3_task per
+active league. Each of them pulled the same global /fixtures?live=all
+payload plus a two-day FT window, filtered it down to its own league in
+Python and then locked and saved its fixtures one at a time -- so every
+5-minute tick paid for the same provider payload once per league and took a
+row lock per fixture.
+
+A sweep now does, once per tick:
+
+  * list the fixtures waiting on a score (LIVE, or SCHEDULED with a kick-off
+    in the past) -- one query for their api_ids;
+  * fetch /fixtures?live=all once, and only the waiting fixtures that are not
+    in it by id, in batches of IDS_PER_REQUEST (the provider's limit for the
+    `ids` parameter). That covers fixtures that finished since the last tick
+    without the per-league date-window queries;
+  * load every fixture the payload mentions in one select_for_update keyed by
+    api_id, diff scores and status in Python and write the rows that changed
+    with one bulk_update. Fixtures that were seen but did not change only get
+    last_score_update stamped, in one UPDATE;
+  * fixtures still missing from the provider past
+    API_FOOTBALL_V3_ASSUMED_COMPLETION_MINUTES after kick-off are finished
+    as before, in the same bulk_update;
+  * settle_fixture_pipeline_task is enqueued on commit, only for fixtures
+    that flipped to FINISHED in this sweep.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .fixture_snapshot import invalidate_snapshot
+from .market_screens import invalidate_market_screens
+from .models import FootballFixture
+
+logger = logging.getLogger(__name__)
+
+# API-Football accepts at most 20 fixture ids per /fixtures?ids= request.
+IDS_PER_REQUEST = 20
+
+FINISHED_STATUSES = {'FT', 'AET', 'PEN'}
+LIVE_STATUSES = {'LIVE', '1H', 'HT', '2H', 'ET', 'P', 'BT'}
+
+UPDATE_FIELDS = ['home_team_score', 'away_team_score', 'status', 'last_score_update', 'match_updated']
+
+
+@dataclass
+class ScoreSweepResult:
+    checked: int = 0
+    updated: int = 0
+    live: int = 0
+    finished: List[int] = field(default_factory=list)
+    assumed_finished: List[int] = field(default_factory=list)
+
+
+def _api_fixture_id(api_id: str) -> Optional[int]:
+    try:
+        return int(api_id.replace('v3_', ''))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _parse_score(value) -> Optional[int]:
+    try:
+        return int(value) if value is not None and value != '' else None
+    except (ValueError, TypeError):
+        return None
+
+
+def waiting_fixtures(league_ids: Optional[Iterable[int]] = None, now=None):
+    """
+    v3 fixtures waiting on a score: LIVE, or SCHEDULED with a kick-off in the
+    past. Limited to active leagues unless `league_ids` is given.
+    """
+    now = now or timezone.now()
+    qs = FootballFixture.objects.filter(api_id__startswith='v3_').filter(
+        Q(status=FootballFixture.FixtureStatus.LIVE) |
+        Q(status=FootballFixture.FixtureStatus.SCHEDULED, match_date__lt=now)
+    )
+    if league_ids is None:
+        return qs.filter(league__active=True)
+    return qs.filter(league_id__in=list(league_ids))
+
+
+def fetch_score_payload(client, waiting_api_ids: Iterable[str]) -> Dict[str, dict]:
+    """
+    Provider fixture items keyed by our api_id ('v3_<id>'): the live feed
+    once, plus any waiting fixture it does not contain, fetched by id.
+    """
+    payload: Dict[str, dict] = {}
+    for item in client.get_live_fixtures() or []:
+        api_fixture_id = (item.get('fixture') or {}).get('id')
+        if api_fixture_id:
+            payload[f"v3_{api_fixture_id}"] = item
+
+    missing = [i for i in (_api_fixture_id(a) for a in waiting_api_ids if a not in payload) if i is not None]
+    for start in range(0, len(missing), IDS_PER_REQUEST):
+        for item in client.get_fixtures(ids=missing[start:start + IDS_PER_REQUEST]) or []:
+            api_fixture_id = (item.get('fixture') or {}).get('id')
+            if api_fixture_id:
+                payload[f"v3_{api_fixture_id}"] = item
+    return payload
+
+
+def _enqueue_settlement(fixture_id: int):
+    from .tasks_apifootball import settle_fixture_pipeline_task
+    settle_fixture_pipeline_task.delay(fixture_id)
+
+
+def apply_score_payload(payload: Dict[str, dict], waiting_api_ids: Iterable[str],
+                        league_ids: Optional[Iterable[int]] = None, now=None) -> ScoreSweepResult:
+    """
+    Diff `payload` against our fixtures and write the changes. Fixtures in
+    `waiting_api_ids` that the payload does not mention are finished once
+    they are past the assumed-completion cutoff.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=getattr(settings, 'API_FOOTBALL_V3_ASSUMED_COMPLETION_MINUTES', 120))
+    waiting: Set[str] = set(waiting_api_ids)
+    result = ScoreSweepResult()
+
+    with transaction.atomic():
+        qs = (FootballFixture.objects.select_for_update(of=('self',))
+              .select_related('home_team', 'away_team')
+              .filter(api_id__in=waiting | set(payload))
+              .exclude(status=FootballFixture.FixtureStatus.FINISHED))
+        if league_ids is not None:
+            qs = qs.filter(league_id__in=list(league_ids))
+
+        changed: List[FootballFixture] = []
+        seen_unchanged: List[int] = []
+        for fixture in qs:
+            result.checked += 1
+            item = payload.get(fixture.api_id)
+
+            if item is None:
+                if fixture.api_id in waiting and fixture.match_date and fixture.match_date < cutoff:
+                    if fixture.home_team_score is None:
+                        fixture.home_team_score = 0
+                    if fixture.away_team_score is None:
+                        fixture.away_team_score = 0
+                    fixture.status = FootballFixture.FixtureStatus.FINISHED
+                    fixture.last_score_update = now
+                    changed.append(fixture)
+                    result.assumed_finished.append(fixture.id)
+                    logger.warning(
+                        f"Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) "
+                        f"not in API response and past assumed completion time. "
+                        f"Marking FINISHED with score: {fixture.home_team_score}-{fixture.away_team_score}"
+                    )
+                continue
+
+            goals = item.get('goals') or {}
+            provider_status = ((item.get('fixture') or {}).get('status') or {}).get('short', '')
+            before = (fixture.home_team_score, fixture.away_team_score, fixture.status)
+
+            home_score, away_score = _parse_score(goals.get('home')), _parse_score(goals.get('away'))
+            if home_score is not None:
+                fixture.home_team_score = home_score
+            if away_score is not None:
+                fixture.away_team_score = away_score
+            if provider_status in FINISHED_STATUSES:
+                fixture.status = FootballFixture.FixtureStatus.FINISHED
+            elif provider_status in LIVE_STATUSES:
+                fixture.status = FootballFixture.FixtureStatus.LIVE
+                result.live += 1
+
+            if (fixture.home_team_score, fixture.away_team_score, fixture.status) == before:
+                seen_unchanged.append(fixture.id)
+                continue
+            fixture.last_score_update = now
+            fixture.match_updated = now
+            changed.append(fixture)
+            if fixture.status == FootballFixture.FixtureStatus.FINISHED:
+                result.finished.append(fixture.id)
+                logger.info(f"Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) "
+                            f"marked FINISHED. Score: {fixture.home_team_score}-{fixture.away_team_score}")
+
+        if changed:
+            FootballFixture.objects.bulk_update(changed, UPDATE_FIELDS)
+        if seen_unchanged:
+            FootballFixture.objects.filter(pk__in=seen_unchanged).update(last_score_update=now)
+        result.updated = len(changed)
+
+        for fixture_id in result.finished + result.assumed_finished:
+            transaction.on_commit(partial(_enqueue_settlement, fixture_id))
+        if changed:
+            # Scores and statuses are shown in, and decide, the browse list,
+            # and head each fixture's markets screen.
+            invalidate_snapshot()
+            invalidate_market_screens(fixture.id for fixture in changed)
+
+    return result
+
+
+def sweep_scores(client, league_ids: Optional[Iterable[int]] = None) -> ScoreSweepResult:
+    """Fetch and apply scores for every waiting fixture (see the module docstring)."""
+    now = timezone.now()
+    waiting_api_ids = list(waiting_fixtures(league_ids, now).values_list('api_id', flat=True))
+    if not waiting_api_ids:
+        return ScoreSweepResult()
+    payload = fetch_score_payload(client, waiting_api_ids)
+    return apply_score_payload(payload, waiting_api_ids, league_ids=league_ids, now=now)
@@ -11,6 +11,7 @@ from rest_framework import serializers
 
 from customer_data.models import UserWallet, WalletTransaction, BetTicket, Bet
 from .models import FootballFixture, MarketOutcome
+from .odds_summary import consensus_outcomes
 
 
 class MarketOutcomeSerializer(serializers.ModelSerializer):
@@ -21,11 +22,21 @@ class MarketOutcomeSerializer(serializers.ModelSerializer):
         fields = ['id', 'outcome_name', 'odds', 'point_value', 'result_status']
 
 
+class ConsensusOutcomeSerializer(serializers.Serializer):
+    """A consensus outcome (odds_summary.ConsensusOutcome): `id` is the real
+    MarketOutcome bets are placed on, `best_odds` the best bookmaker price."""
+    id = serializers.IntegerField()
+    outcome_name = serializers.CharField()
+    odds = serializers.DecimalField(max_digits=10, decimal_places=3, coerce_to_string=False)
+    best_odds = serializers.DecimalField(max_digits=10, decimal_places=3, coerce_to_string=False)
+    point_value = serializers.FloatField(allow_null=True)
+
+
 class FixtureMarketSerializer(serializers.Serializer):
-    """One representative market per category with its outcomes."""
+    """One representative market per market key with its outcomes."""
     category = serializers.CharField()
     api_market_key = serializers.CharField()
-    outcomes = MarketOutcomeSerializer(many=True)
+    outcomes = ConsensusOutcomeSerializer(many=True)
 
 
 class FootballFixtureSerializer(serializers.ModelSerializer):
@@ -56,22 +67,21 @@ class FootballFixtureSerializer(serializers.ModelSerializer):
         }
 
     def get_markets(self, obj):
-        # One representative (most recently updated) active market per category,
-        # so displayed odds correspond to real outcome rows.
-        by_category = {}
-        for market in obj.markets.filter(is_active=True).select_related('category').prefetch_related('outcomes').order_by('-last_updated_odds_api'):
-            by_category.setdefault(market.category.name, market)
+        # Consensus odds per market key from the FixtureOddsSummary projection
+        # (odds_summary.py); FixtureViewSet loads them for a whole page into
+        # context['consensus'].
+        consensus = self.context.get('consensus')
+        if consensus is None:
+            consensus = consensus_outcomes([obj.id])
         data = []
-        for name, market in by_category.items():
-            outcomes = [o for o in market.outcomes.all() if o.is_active]
-            if not outcomes:
-                continue
+        for market_key, outcomes in consensus.get(obj.id, {}).items():
+            outcomes = list(outcomes.values())
             data.append({
-                'category': name,
-                'api_market_key': market.api_market_key,
-                'outcomes': MarketOutcomeSerializer(outcomes, many=True).data,
+                'category': outcomes[0].market_name,
+                'api_market_key': market_key,
+                'outcomes': outcomes,
             })
-        return data
+        return FixtureMarketSerializer(data, many=True).data
 
 
 class UserWalletSerializer(serializers.ModelSerializer):
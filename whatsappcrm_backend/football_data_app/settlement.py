@@ -0,0 +1,387 @@
+# whatsappcrm_backend/football_data_app/settlement.py
+"""
+Set-based settlement of a finished fixture: outcomes, then bets, then tickets.
+
+The settlement tasks used to walk everything row by row: one outcome query
+per market, a Python loop over the fixture's bets, and settle_ticket() per
+ticket -- lock, re-read the bets, credit the wallet, repeat -- so a derby
+with 20k tickets held Celery workers for minutes. Each step here costs a
+fixed number of statements instead:
+
+  * settle_fixture_outcomes() loads the fixture's pending outcomes once,
+    resolves every supported market key from the final score in Python
+    (outcome_result()) and writes one UPDATE per result status. Outcomes
+    that cannot be resolved from the full-time score -- half-time markets,
+    split Asian lines that land half-won/half-lost, markets we do not know
+    -- stay PENDING for manual settlement rather than being marked LOST;
+  * settle_bets() copies resolved outcome results onto pending bets with one
+    UPDATE ... FROM, mapping an outcome PUSH to the bet's REFUNDED status;
+  * settle_tickets() settles a batch of tickets together: the tickets are
+    locked once, every ticket's bets are read in one query, ticket statuses
+    are written with one UPDATE per status, and each user's winnings and
+    refunds across the batch are credited through the wallet ledger
+    (customer_data/ledger.py) -- one WalletTransaction per user and type,
+    one balance UPDATE and one ledger INSERT for the batch, and no wallet
+    row locks held while the batch is worked out.
+
+settle_tickets() applies exactly the rules of utils.settle_ticket(), which
+stays the single-ticket path (admin actions, the player portal): any LOST
+bet loses the ticket, otherwise any WON bet wins it at the total stake times
+the product of the won bets' odds, otherwise it is refunded. Referral
+commission / win-deduction hooks still run per ticket, but only for the
+tickets whose owner was referred by an agent, and settlement notifications
+are queued once the batch has committed.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from customer_data.ledger import LedgerPosting, post_many
+from customer_data.models import Bet, BetTicket, UserWallet, WalletTransaction
+from .models import FootballFixture, Market, MarketOutcome
+
+logger = logging.getLogger(__name__)
+
+WON = MarketOutcome.ResultStatus.WON
+LOST = MarketOutcome.ResultStatus.LOST
+PUSH = MarketOutcome.ResultStatus.PUSH
+
+SETTLEABLE_TICKET_STATUSES = [BetTicket.TicketStatus.PENDING, BetTicket.TicketStatus.PLACED]
+_CENT = Decimal('0.01')
+
+# Markets settled on the full-time score. Half-time markets (totals_1h,
+# handicap_2h, ...) are not listed: we do not store half-time scores.
+_FULL_TIME_TOTALS = ('totals', 'alternate_totals')
+_FULL_TIME_HANDICAPS = ('handicap', 'spreads')
+
+
+def _side(name: str, home_name: str, away_name: str) -> Optional[str]:
+    """'home' / 'draw' / 'away' for an outcome label, whichever naming the
+    provider used (team name, Home/Away, 1/X/2)."""
+    label = (name or '').strip()
+    lowered = label.lower()
+    if label == home_name or lowered in ('home', '1'):
+        return 'home'
+    if label == away_name or lowered in ('away', '2'):
+        return 'away'
+    if lowered in ('draw', 'x'):
+        return 'draw'
+    return None
+
+
+def _line_result(margin: float) -> str:
+    """Result of a single line given the bettor's adjusted goal margin."""
+    if margin > 0:
+        return WON
+    if margin < 0:
+        return LOST
+    return PUSH
+
+
+def _asian_line_result(margin: float, line: float) -> Optional[str]:
+    """Result of an Asian line, where `margin` is the bettor's goal margin
+    before the line is applied. Quarter lines (-0.25, 2.75, ...) split the
+    stake over the two neighbouring half lines; when the halves disagree the
+    bet is half won/lost, which a single result status cannot express."""
+    if (line * 4) % 2 == 0:
+        return _line_result(margin + line)
+    first, second = _line_result(margin + line - 0.25), _line_result(margin + line + 0.25)
+    return first if first == second else None
+
+
+def outcome_result(api_market_key: str, outcome_name: str, point_value, home_score: int, away_score: int,
+                   home_name: str = '', away_name: str = '') -> Optional[str]:
+    """WON / LOST / PUSH for one outcome given the full-time score, or None if
+    it cannot be settled from that score."""
+    if home_score > away_score:
+        winner = 'home'
+    elif away_score > home_score:
+        winner = 'away'
+    else:
+        winner = 'draw'
+    total = home_score + away_score
+    name = (outcome_name or '').strip()
+    lowered = name.lower()
+
+    if api_market_key == 'h2h':
+        side = _side(name, home_name, away_name)
+        return None if side is None else (WON if side == winner else LOST)
+
+    if api_market_key == 'double_chance':
+        parts = name.split('/') if '/' in name else (list(name) if name.upper() in ('1X', 'X2', '12') else [])
+        sides = {_side(part, home_name, away_name) for part in parts}
+        if len(sides) != 2 or None in sides:
+            return None
+        return WON if winner in sides else LOST
+
+    if api_market_key == 'draw_no_bet':
+        side = _side(name, home_name, away_name)
+        if side not in ('home', 'away'):
+            return None
+        return PUSH if winner == 'draw' else (WON if side == winner else LOST)
+
+    if api_market_key in _FULL_TIME_TOTALS:
+        if point_value is None:
+            return None
+        if lowered.startswith('over'):
+            return _asian_line_result(total, -float(point_value))
+        if lowered.startswith('under'):
+            return _asian_line_result(-total, float(point_value))
+        return None
+
+    if api_market_key in _FULL_TIME_HANDICAPS:
+        side = _side(name, home_name, away_name)
+        if point_value is None or side not in ('home', 'away'):
+            return None
+        margin = home_score - away_score if side == 'home' else away_score - home_score
+        return _asian_line_result(margin, float(point_value))
+
+    if api_market_key == 'btts':
+        both_scored = home_score > 0 and away_score > 0
+        if lowered == 'yes':
+            return WON if both_scored else LOST
+        if lowered == 'no':
+            return LOST if both_scored else WON
+        return None
+
+    if api_market_key == 'odd_even':
+        if lowered not in ('odd', 'even'):
+            return None
+        return WON if (total % 2 == 1) == (lowered == 'odd') else LOST
+
+    if api_market_key == 'correct_score':
+        for separator in (':', '-'):
+            if separator in name:
+                home_part, _, away_part = name.partition(separator)
+                try:
+                    return WON if (int(home_part), int(away_part)) == (home_score, away_score) else LOST
+                except ValueError:
+                    return None
+        return None
+
+    return None
+
+
+def settle_fixture_outcomes(fixture: FootballFixture) -> Dict[str, int]:
+    """Resolve every pending outcome of a finished fixture in one pass.
+    Returns the number of outcomes written per result status, plus how many
+    were left PENDING as 'unresolved'."""
+    home_score, away_score = fixture.home_team_score, fixture.away_team_score
+    home_name, away_name = fixture.home_team.name, fixture.away_team.name
+
+    by_status: Dict[str, List[int]] = defaultdict(list)
+    unresolved = 0
+    for outcome_id, market_key, outcome_name, point_value in (
+            MarketOutcome.objects
+            .filter(market__fixture=fixture, result_status=MarketOutcome.ResultStatus.PENDING)
+            .values_list('id', 'market__api_market_key', 'outcome_name', 'point_value')):
+        result = outcome_result(market_key, outcome_name, point_value, home_score, away_score, home_name, away_name)
+        if result is None:
+            unresolved += 1
+        else:
+            by_status[result].append(outcome_id)
+
+    now = timezone.now()
+    with transaction.atomic():
+        for status, outcome_ids in by_status.items():
+            MarketOutcome.objects.filter(id__in=outcome_ids).update(result_status=status, updated_at=now)
+
+    if unresolved:
+        logger.warning(
+            f"{unresolved} outcome(s) for fixture {fixture.id} cannot be settled from the full-time score "
+            f"and were left PENDING for manual settlement."
+        )
+    counts = {status: len(ids) for status, ids in by_status.items()}
+    counts['unresolved'] = unresolved
+    return counts
+
+
+def settle_bets(fixture_id: Optional[int] = None) -> Set[int]:
+    """Copy resolved outcome results onto pending bets -- for one fixture, or
+    for every fixture when fixture_id is None -- with a single UPDATE ... FROM.
+    Returns the ids of the tickets whose bets changed."""
+    sql = f"""
+        UPDATE {Bet._meta.db_table} AS bet
+        SET status = CASE outcome.result_status WHEN %s THEN %s ELSE outcome.result_status END,
+            updated_at = %s
+        FROM {MarketOutcome._meta.db_table} AS outcome
+        JOIN {Market._meta.db_table} AS market ON market.id = outcome.market_id
+        WHERE bet.market_outcome_id = outcome.id
+          AND bet.status = %s
+          AND outcome.result_status <> %s
+    """
+    params = [PUSH, Bet.BetStatus.PUSH, timezone.now(), Bet.BetStatus.PENDING, MarketOutcome.ResultStatus.PENDING]
+    if fixture_id is not None:
+        sql += " AND market.fixture_id = %s"
+        params.append(fixture_id)
+    sql += " RETURNING bet.ticket_id"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def pending_ticket_ids_for_fixture(fixture_id: int) -> List[int]:
+    return list(
+        BetTicket.objects
+        .filter(status__in=SETTLEABLE_TICKET_STATUSES, bets__market_outcome__market__fixture_id=fixture_id)
+        .distinct().order_by('id').values_list('id', flat=True)
+    )
+
+
+@dataclass
+class TicketSettlementResult:
+    won: int = 0
+    lost: int = 0
+    refunded: int = 0
+    waiting: int = 0
+    skipped: int = 0
+    credited_users: int = 0
+
+
+def _ticket_outcome(ticket, bets):
+    """(status, amount to credit) for a ticket, or None while any of its bets
+    is pending. Same rules as utils.settle_ticket()."""
+    statuses = {status for status, _ in bets}
+    if not bets:
+        return BetTicket.TicketStatus.LOST, Decimal('0.00')
+    if Bet.BetStatus.PENDING in statuses:
+        return None
+    if Bet.BetStatus.LOST in statuses:
+        return BetTicket.TicketStatus.LOST, Decimal('0.00')
+    if Bet.BetStatus.WON in statuses:
+        total_odds = Decimal('1.0')
+        for status, odds in bets:
+            if status == Bet.BetStatus.WON:
+                total_odds *= odds
+        return BetTicket.TicketStatus.WON, (ticket.total_stake * total_odds).quantize(_CENT)
+    return BetTicket.TicketStatus.REFUNDED, ticket.total_stake
+
+
+def _credit_description(status: str, ticket_ids: List[int]) -> str:
+    if status == BetTicket.TicketStatus.WON:
+        if len(ticket_ids) == 1:
+            return f"Winnings from bet ticket ID: {ticket_ids[0]}"
+        return f"Winnings from bet tickets: {', '.join(str(t) for t in ticket_ids)}"
+    if len(ticket_ids) == 1:
+        return f"Stake refund for pushed bet ticket ID: {ticket_ids[0]}"
+    return f"Stake refund for pushed bet tickets: {', '.join(str(t) for t in ticket_ids)}"
+
+
+def settle_tickets(ticket_ids: Iterable[int]) -> TicketSettlementResult:
+    """Settle a batch of tickets in one transaction; see the module docstring."""
+    from referrals.models import ReferralProfile
+    from .tasks import send_bet_ticket_settlement_notifications_task
+
+    result = TicketSettlementResult()
+    ticket_ids = sorted(set(ticket_ids))
+    if not ticket_ids:
+        return result
+
+    with transaction.atomic():
+        tickets = list(
+            BetTicket.objects.select_for_update(of=('self',)).select_related('user')
+            .filter(id__in=ticket_ids, status__in=SETTLEABLE_TICKET_STATUSES).order_by('id')
+        )
+        result.skipped = len(ticket_ids) - len(tickets)
+        if not tickets:
+            return result
+
+        bets_by_ticket = defaultdict(list)
+        for ticket_id, status, odds in (Bet.objects.filter(ticket_id__in=[t.id for t in tickets])
+                                        .values_list('ticket_id', 'status', 'market_outcome__odds')):
+            bets_by_ticket[ticket_id].append((status, odds))
+
+        decided = []
+        for ticket in tickets:
+            outcome = _ticket_outcome(ticket, bets_by_ticket.get(ticket.id, []))
+            if outcome is None:
+                result.waiting += 1
+            else:
+                decided.append((ticket, *outcome))
+
+        paying_users = {t.user_id for t, status, _ in decided if status != BetTicket.TicketStatus.LOST and t.user_id}
+        wallet_ids = dict(
+            UserWallet.objects.filter(user_id__in=paying_users).values_list('user_id', 'id')
+        )
+        settled = []
+        for ticket, status, amount in decided:
+            if status != BetTicket.TicketStatus.LOST and ticket.user_id not in wallet_ids:
+                # As in settle_ticket(): never mark a ticket paid that we could not pay.
+                logger.error(f"[Settle Tickets] Cannot pay ticket {ticket.id} - user or wallet not found. Left unsettled.")
+                result.skipped += 1
+                continue
+            settled.append((ticket, status, amount))
+
+        now = timezone.now()
+        by_status: Dict[str, List[int]] = defaultdict(list)
+        credits: Dict[tuple, List] = defaultdict(lambda: [Decimal('0.00'), []])
+        for ticket, status, amount in settled:
+            by_status[status].append(ticket.id)
+            if status != BetTicket.TicketStatus.LOST:
+                credit = credits[(wallet_ids[ticket.user_id], status)]
+                credit[0] += amount
+                credit[1].append(ticket.id)
+        for status, ids in by_status.items():
+            BetTicket.objects.filter(id__in=ids).update(status=status, updated_at=now)
+
+        credited = [(key, amount, ids) for key, (amount, ids) in credits.items() if amount > 0]
+        wallet_transactions = WalletTransaction.objects.bulk_create([
+            WalletTransaction(
+                wallet_id=wallet_id, amount=amount,
+                transaction_type='BET_WON' if status == BetTicket.TicketStatus.WON else 'BET_REFUNDED',
+                description=_credit_description(status, ids), status='COMPLETED', payment_method='manual',
+            )
+            for (wallet_id, status), amount, ids in credited
+        ])
+        # One balance UPDATE and one ledger INSERT for the whole batch (customer_data/ledger.py).
+        wallet_totals = post_many(
+            LedgerPosting(wallet_id=wallet_transaction.wallet_id, amount=wallet_transaction.amount,
+                          entry_type=wallet_transaction.transaction_type, wallet_transaction_id=wallet_transaction.id)
+            for wallet_transaction in wallet_transactions
+        )
+        result.credited_users = len(wallet_totals)
+
+        referred_users = set(
+            ReferralProfile.objects
+            .filter(user_id__in={t.user_id for t, _, _ in settled if t.user_id},
+                    referred_by__referral_profile__is_agent=True)
+            .values_list('user_id', flat=True)
+        )
+        for ticket, status, amount in settled:
+            if ticket.user_id in referred_users:
+                _apply_referral_hooks(ticket, status, amount)
+
+        # One task for the whole batch; it hands the messages to the batch sender.
+        notifications = [[t.id, status, f"{amount:.2f}"] for t, status, amount in settled]
+        if notifications:
+            transaction.on_commit(lambda: send_bet_ticket_settlement_notifications_task.delay(notifications))
+
+    result.won = len(by_status.get(BetTicket.TicketStatus.WON, []))
+    result.lost = len(by_status.get(BetTicket.TicketStatus.LOST, []))
+    result.refunded = len(by_status.get(BetTicket.TicketStatus.REFUNDED, []))
+    logger.info(
+        f"[Settle Tickets] Batch of {len(ticket_ids)}: {result.won} won, {result.lost} lost, "
+        f"{result.refunded} refunded, {result.waiting} waiting on other fixtures, {result.skipped} skipped; "
+        f"{result.credited_users} wallet(s) credited."
+    )
+    return result
+
+
+def _apply_referral_hooks(ticket, status: str, amount: Decimal):
+    """Agent commission on a loss / win deduction on a win. A failing hook must
+    never undo the player's own settlement, so each runs in a savepoint."""
+    from referrals.utils import apply_agent_win_deduction, award_agent_commission
+
+    try:
+        with transaction.atomic():
+            if status == BetTicket.TicketStatus.LOST:
+                award_agent_commission(ticket)
+            elif status == BetTicket.TicketStatus.WON:
+                apply_agent_win_deduction(ticket, amount)
+    except Exception as e:
+        logger.error(f"[Settle Tickets] Referral hook failed for ticket {ticket.id}: {e}", exc_info=True)
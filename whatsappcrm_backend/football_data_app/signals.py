@@ -0,0 +1,36 @@
+# whatsappcrm_backend/football_data_app/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fixture_snapshot import invalidate_snapshot
+from .market_screens import invalidate_market_screens, market_fixture_id
+from .odds_summary import drop_odds_summaries
+from .models import FootballFixture, Market, MarketOutcome
+
+
+@receiver(post_save, sender=FootballFixture)
+@receiver(post_delete, sender=FootballFixture)
+@receiver(post_save, sender=Market)
+@receiver(post_delete, sender=Market)
+@receiver(post_save, sender=MarketOutcome)
+@receiver(post_delete, sender=MarketOutcome)
+def bettable_fixture_changed(sender, instance, **kwargs):
+    """ORM writes to fixtures and odds drop the bettable-fixture snapshot (see
+    fixture_snapshot.py) and the fixture's market screens (market_screens.py);
+    odds writes also drop its consensus odds (odds_summary.py). The bulk
+    ingestion paths maintain all of these themselves."""
+    invalidate_snapshot()
+    if sender is FootballFixture:
+        fixture_id = instance.pk
+    elif sender is Market:
+        fixture_id = instance.fixture_id
+    elif MarketOutcome.market.is_cached(instance):
+        fixture_id = instance.market.fixture_id
+    else:
+        # Cached per market, so saving a market's outcomes one by one does
+        # not look the market up for each.
+        fixture_id = market_fixture_id(instance.market_id)
+    invalidate_market_screens([fixture_id])
+    if sender is not FootballFixture:
+        drop_odds_summaries([fixture_id])
@@ -40,6 +40,7 @@ from .tasks_apifootball import (
     process_ticket_settlement_batch_task,
     reconcile_and_settle_pending_items_task,
     send_bet_ticket_settlement_notification_task,
+    send_bet_ticket_settlement_notifications_task,
 )
 
 # Import API-Football v3 tasks (optional, will not fail if not available)
@@ -84,6 +85,7 @@ __all__ = [
     'process_ticket_settlement_batch_task',
     'reconcile_and_settle_pending_items_task',
     'send_bet_ticket_settlement_notification_task',
+    'send_bet_ticket_settlement_notifications_task',
 ]
 
 # Add v3 tasks to exports if available
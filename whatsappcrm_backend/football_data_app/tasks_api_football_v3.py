@@ -14,10 +14,13 @@ from typing import List, Dict, Any, Optional
 import random
 import time
 
-from .models import League, FootballFixture, Bookmaker, MarketCategory, Market, MarketOutcome, Team
+from .models import League, FootballFixture, MarketOutcome, Team
 from customer_data.models import Bet, BetTicket
-from .utils import settle_ticket, upsert_market_outcome
+from .utils import settle_ticket
+from .odds_ingest import FixtureOddsUpsert
+from . import score_sweep
 from .api_football_v3_client import APIFootballV3Client, APIFootballV3Exception
+from .rate_limiter import RateLimitExceeded, LANE_LIVE_ODDS, LANE_SCORES, LANE_PREMATCH_ODDS, LANE_LEAGUES
 
 from meta_integration.utils import send_whatsapp_message, create_text_message_data
 
@@ -94,53 +97,39 @@ def parse_api_football_v3_datetime(timestamp_str: str) -> Optional[datetime]:
         return None
 
 
-@transaction.atomic
 def _map_bet_to_category_and_key(bet_name: str, bet_id):
     """Map an API-Football v3 bet ('Match Winner', 'Asian Handicap', ...) to
-    our MarketCategory + api_market_key. Shared by the pre-match odds
+    our MarketCategory name + api_market_key. Shared by the pre-match odds
     processor and the live-odds processor so the mapping never drifts
     between the two pipelines.
 
     Based on API-Football v3 documentation: https://www.api-football.com/documentation-v3
     """
     if bet_name == 'Match Winner' or bet_id == 1:
-        category, _ = MarketCategory.objects.get_or_create(name='Match Winner')
-        return category, 'h2h'
+        return 'Match Winner', 'h2h'
     if bet_name == 'Double Chance' or bet_id == 2:
-        category, _ = MarketCategory.objects.get_or_create(name='Double Chance')
-        return category, 'double_chance'
+        return 'Double Chance', 'double_chance'
     if ('Asian Handicap' in bet_name or 'Handicap' in bet_name) or bet_id == 3:
         if '2nd Half' in bet_name or '2H' in bet_name or bet_id == 20:
-            category, _ = MarketCategory.objects.get_or_create(name='Asian Handicap (2nd Half)')
-            return category, 'handicap_2h'
+            return 'Asian Handicap (2nd Half)', 'handicap_2h'
         if '1st Half' in bet_name or '1H' in bet_name or bet_id == 19:
-            category, _ = MarketCategory.objects.get_or_create(name='Asian Handicap (1st Half)')
-            return category, 'handicap_1h'
-        category, _ = MarketCategory.objects.get_or_create(name='Asian Handicap')
-        return category, 'handicap'
+            return 'Asian Handicap (1st Half)', 'handicap_1h'
+        return 'Asian Handicap', 'handicap'
     if 'Draw No Bet' in bet_name or bet_id == 4:
-        category, _ = MarketCategory.objects.get_or_create(name='Draw No Bet')
-        return category, 'draw_no_bet'
+        return 'Draw No Bet', 'draw_no_bet'
     if ('Goals' in bet_name and 'Over' in bet_name) or bet_id == 5:
         if '2nd Half' in bet_name or '2H' in bet_name or bet_id == 22:
-            category, _ = MarketCategory.objects.get_or_create(name='Totals (2nd Half)')
-            return category, 'totals_2h'
+            return 'Totals (2nd Half)', 'totals_2h'
         if '1st Half' in bet_name or '1H' in bet_name or bet_id == 21:
-            category, _ = MarketCategory.objects.get_or_create(name='Totals (1st Half)')
-            return category, 'totals_1h'
-        category, _ = MarketCategory.objects.get_or_create(name='Totals')
-        return category, 'totals'
+            return 'Totals (1st Half)', 'totals_1h'
+        return 'Totals', 'totals'
     if 'Odd/Even' in bet_name or bet_id == 7:
-        category, _ = MarketCategory.objects.get_or_create(name='Odd/Even Goals')
-        return category, 'odd_even'
+        return 'Odd/Even Goals', 'odd_even'
     if 'Both Teams Score' in bet_name or bet_id == 8:
-        category, _ = MarketCategory.objects.get_or_create(name='Both Teams To Score')
-        return category, 'btts'
+        return 'Both Teams To Score', 'btts'
     if ('Exact Score' in bet_name or 'Correct Score' in bet_name) or bet_id == 9:
-        category, _ = MarketCategory.objects.get_or_create(name='Correct Score')
-        return category, 'correct_score'
-    category, _ = MarketCategory.objects.get_or_create(name=bet_name)
-    return category, (f"bet_{bet_id}" if bet_id else bet_name.lower().replace(' ', '_'))
+        return 'Correct Score', 'correct_score'
+    return bet_name, (f"bet_{bet_id}" if bet_id else bet_name.lower().replace(' ', '_'))
 
 
 def _parse_outcome_name_and_point(api_market_key: str, outcome_value: str, fixture: FootballFixture):
@@ -208,116 +197,64 @@ def _process_api_football_v3_odds_data(fixture: FootballFixture, odds_data: List
         return
     
     logger.info(f"Found {len(odds_data)} odds items to process")
-    total_markets_created = 0
-    total_outcomes_created = 0
+    # Markets and outcomes are upserted in place, never deleted and recreated:
+    # Market -> MarketOutcome -> Bet are all on_delete=CASCADE, so deleting a
+    # Market here previously cascade-deleted any Bet a user had already placed
+    # against one of its outcomes. Keeping the same rows (and ids) means
+    # Bet.market_outcome stays valid across refreshes; settlement reads
+    # MarketOutcome.result_status, not .odds, and a Bet's payout is stored on
+    # the Bet at placement time, so updating odds in place never changes an
+    # already-placed bet. Outcomes a bookmaker dropped, and markets it no
+    # longer offers at all, are deactivated rather than deleted. The writes
+    # themselves are batched -- see odds_ingest.FixtureOddsUpsert.
+    upsert = FixtureOddsUpsert(fixture)
     bookmakers_encountered = 0
-    bookmakers_created = 0
-    # Tracks which of this fixture's existing markets are still offered by each
-    # bookmaker in this refresh, so a market a bookmaker has dropped entirely
-    # (not just one outcome within a market that's still offered) gets
-    # deactivated below rather than left active with odds that can never
-    # change again.
-    seen_market_ids_by_bookmaker_id = {}
 
     for odds_item in odds_data:
         bookmakers_list = odds_item.get('bookmakers', [])
         logger.info(f"Processing {len(bookmakers_list)} bookmakers for fixture {fixture.id}")
-        
         for bookmaker_data in bookmakers_list:
-            bookmaker_name = bookmaker_data.get('name', 'Unknown')
-            bookmaker_id = bookmaker_data.get('id')
-            
-            # Create or get bookmaker
-            bookmaker, bookmaker_created = Bookmaker.objects.get_or_create(
-                api_bookmaker_key=str(bookmaker_id) if bookmaker_id else bookmaker_name.lower().replace(' ', '_'),
-                defaults={'name': bookmaker_name}
-            )
+            _collect_bookmaker_odds(upsert, fixture, bookmaker_data)
             bookmakers_encountered += 1
-            if bookmaker_created:
-                logger.info(f"Created new bookmaker: {bookmaker_name}")
-                bookmakers_created += 1
-            seen_market_ids = seen_market_ids_by_bookmaker_id.setdefault(bookmaker.id, set())
-
-            # Process bets (markets)
-            bets_list = bookmaker_data.get('bets', [])
-            logger.debug(f"Processing {len(bets_list)} markets for bookmaker {bookmaker_name}")
-            
-            for bet_data in bets_list:
-                bet_name = bet_data.get('name', 'Unknown Market')
-                bet_id = bet_data.get('id')
-                category, api_market_key = _map_bet_to_category_and_key(bet_name, bet_id)
-
-                # Update the existing market in place if one already exists for this
-                # fixture/bookmaker/market_key, instead of deleting and recreating it.
-                # Market -> MarketOutcome -> Bet are all on_delete=CASCADE, so deleting
-                # a Market here previously cascade-deleted every MarketOutcome under it,
-                # which in turn cascade-deleted any Bet a user had already placed against
-                # one of those outcomes -- silently destroying placed bets (and orphaning
-                # their BetTicket) on every single odds-refresh cycle, not just settling
-                # them late. update_or_create keeps the same Market/MarketOutcome rows
-                # (and thus the same ids Bet.market_outcome points at) across refreshes.
-                market, _ = Market.objects.update_or_create(
-                    fixture=fixture,
-                    bookmaker=bookmaker,
-                    api_market_key=api_market_key,
-                    defaults={
-                        'category': category,
-                        'last_updated_odds_api': timezone.now(),
-                        'is_active': True,
-                    }
-                )
-                total_markets_created += 1
-                seen_market_ids.add(market.id)
-
-                # Process outcomes (values)
-                seen_outcome_ids = set()
-                for value_data in bet_data.get('values', []):
-                    outcome_value = value_data.get('value')
-                    odd = value_data.get('odd')
-                    
-                    if outcome_value and odd:
-                        try:
-                            outcome_name, point_value = _parse_outcome_name_and_point(
-                                api_market_key, outcome_value, fixture
-                            )
-
-                            # update_or_create rather than always inserting a fresh row --
-                            # keeps the same MarketOutcome id (and thus keeps any existing
-                            # Bet.market_outcome pointing at it valid) across refreshes,
-                            # just updating its odds in place. Settlement reads
-                            # MarketOutcome.result_status, not .odds, and a Bet's payout
-                            # (potential_winnings) is computed and stored on the Bet itself
-                            # at placement time -- so updating odds here never retroactively
-                            # changes an already-placed bet's payout.
-                            outcome = upsert_market_outcome(
-                                market, outcome_name, point_value, Decimal(str(odd))
-                            )
-                            seen_outcome_ids.add(outcome.id)
-                            total_outcomes_created += 1
-                        except (ValueError, TypeError) as e:
-                            logger.warning(f"Could not parse odd value: {odd}, error: {e}")
-
-                if seen_outcome_ids:
-                    logger.debug(f"Upserted market '{bet_name}' with {len(seen_outcome_ids)} outcomes for bookmaker {bookmaker_name}")
-                else:
-                    logger.warning(f"No valid outcomes upserted for market '{bet_name}' from bookmaker {bookmaker_name}")
 
-                # Outcomes that existed before this refresh but weren't present in this
-                # response (e.g. the bookmaker dropped that specific line) are deactivated,
-                # not deleted -- hides them from new bets while leaving any placed Bet
-                # referencing them, and their settlement history, intact.
-                market.outcomes.exclude(id__in=seen_outcome_ids).update(is_active=False)
+    result = upsert.apply()
+    logger.info(
+        f"✓ Odds processing complete for fixture {fixture.id}: {bookmakers_encountered} bookmakers "
+        f"({result.bookmakers_created} new), {result.markets} markets, outcomes: {result.outcomes_created} new, "
+        f"{result.outcomes_updated} updated, {result.outcomes_unchanged} unchanged, {result.outcomes_deactivated} deactivated"
+    )
+
 
-    # A market a bookmaker no longer offers at all (not just one outcome within
-    # a market that's still offered) never gets touched by the loop above, so it
-    # would otherwise stay is_active=True forever with odds that can never
-    # change again -- deactivate it here instead.
-    for bookmaker_id, seen_market_ids in seen_market_ids_by_bookmaker_id.items():
-        Market.objects.filter(
-            fixture=fixture, bookmaker_id=bookmaker_id
-        ).exclude(id__in=seen_market_ids).update(is_active=False)
+def _collect_bookmaker_odds(upsert: FixtureOddsUpsert, fixture: FootballFixture, bookmaker_data: dict, live: bool = False):
+    """Parse one bookmaker's markets from a pre-match /odds or live /odds/live
+    payload into `upsert`. Live outcomes carry the provider's "suspended"
+    flag, which becomes the outcome's is_active."""
+    bookmaker_name = bookmaker_data.get('name', 'Unknown')
+    bookmaker_id = bookmaker_data.get('id')
+    bookmaker_key = str(bookmaker_id) if bookmaker_id else bookmaker_name.lower().replace(' ', '_')
+    upsert.add_bookmaker(bookmaker_key, bookmaker_name)
+
+    for bet_data in bookmaker_data.get('bets', []):
+        bet_name = bet_data.get('name', 'Unknown Market')
+        category_name, api_market_key = _map_bet_to_category_and_key(bet_name, bet_data.get('id'))
+        market = upsert.add_market(bookmaker_key, category_name, api_market_key)
+
+        valid_outcomes = 0
+        for value_data in bet_data.get('values', []):
+            outcome_value = value_data.get('value')
+            odd = value_data.get('odd')
+            if not (outcome_value and odd):
+                continue
+            try:
+                outcome_name, point_value = _parse_outcome_name_and_point(api_market_key, outcome_value, fixture)
+                is_active = not bool(value_data.get('suspended', False)) if live else True
+                upsert.add_outcome(market, outcome_name, point_value, Decimal(str(odd)), is_active=is_active)
+                valid_outcomes += 1
+            except (ValueError, TypeError, ArithmeticError) as e:
+                logger.warning(f"{'Live odds: c' if live else 'C'}ould not parse odd value: {odd}, error: {e}")
 
-    logger.info(f"✓ Odds processing complete for fixture {fixture.id}: {bookmakers_encountered} bookmakers ({bookmakers_created} new), {total_markets_created} markets, {total_outcomes_created} outcomes")
+        if not valid_outcomes and not live:
+            logger.warning(f"No valid outcomes upserted for market '{bet_name}' from bookmaker {bookmaker_name}")
 
 
 def _process_api_football_v3_live_odds_data(fixture: FootballFixture, live_odds_entry: dict):
@@ -332,7 +269,7 @@ def _process_api_football_v3_live_odds_data(fixture: FootballFixture, live_odds_
     The one real difference: live odds carry a provider-set per-outcome
     "suspended" flag (true around live events -- goals, cards, VAR reviews,
     etc., while the provider's own pricing is momentarily unreliable).
-    upsert_market_outcome's is_active is set from that flag directly, so a
+    The outcome's is_active is set from that flag directly, so a
     suspended outcome is immediately excluded from both the browse/outcome
     list (which only ever shows is_active=True outcomes) and bet placement
     (process_bet_ticket_submission only accepts is_active=True outcome ids)
@@ -346,62 +283,13 @@ def _process_api_football_v3_live_odds_data(fixture: FootballFixture, live_odds_
     if not bookmakers_list:
         return
 
-    seen_market_ids_by_bookmaker_id = {}
-
+    # An outcome missing from this live-odds tick (not just flagged suspended
+    # -- genuinely absent) is deactivated the same way the pre-match pipeline
+    # does, not deleted.
+    upsert = FixtureOddsUpsert(fixture)
     for bookmaker_data in bookmakers_list:
-        bookmaker_name = bookmaker_data.get('name', 'Unknown')
-        bookmaker_id = bookmaker_data.get('id')
-        bookmaker, _ = Bookmaker.objects.get_or_create(
-            api_bookmaker_key=str(bookmaker_id) if bookmaker_id else bookmaker_name.lower().replace(' ', '_'),
-            defaults={'name': bookmaker_name}
-        )
-        seen_market_ids = seen_market_ids_by_bookmaker_id.setdefault(bookmaker.id, set())
-
-        for bet_data in bookmaker_data.get('bets', []):
-            bet_name = bet_data.get('name', 'Unknown Market')
-            bet_id = bet_data.get('id')
-            category, api_market_key = _map_bet_to_category_and_key(bet_name, bet_id)
-
-            market, _ = Market.objects.update_or_create(
-                fixture=fixture,
-                bookmaker=bookmaker,
-                api_market_key=api_market_key,
-                defaults={
-                    'category': category,
-                    'last_updated_odds_api': timezone.now(),
-                    'is_active': True,
-                }
-            )
-            seen_market_ids.add(market.id)
-
-            seen_outcome_ids = set()
-            for value_data in bet_data.get('values', []):
-                outcome_value = value_data.get('value')
-                odd = value_data.get('odd')
-                if not (outcome_value and odd):
-                    continue
-                try:
-                    outcome_name, point_value = _parse_outcome_name_and_point(
-                        api_market_key, outcome_value, fixture
-                    )
-                    suspended = bool(value_data.get('suspended', False))
-                    outcome = upsert_market_outcome(
-                        market, outcome_name, point_value, Decimal(str(odd)),
-                        is_active=not suspended,
-                    )
-                    seen_outcome_ids.add(outcome.id)
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Live odds: could not parse odd value: {odd}, error: {e}")
-
-            # An outcome missing from this live-odds tick (not just flagged
-            # suspended -- genuinely absent) is deactivated the same way the
-            # pre-match pipeline does, not deleted.
-            market.outcomes.exclude(id__in=seen_outcome_ids).update(is_active=False)
-
-    for bookmaker_id, seen_market_ids in seen_market_ids_by_bookmaker_id.items():
-        Market.objects.filter(
-            fixture=fixture, bookmaker_id=bookmaker_id
-        ).exclude(id__in=seen_market_ids).update(is_active=False)
+        _collect_bookmaker_odds(upsert, fixture, bookmaker_data, live=True)
+    upsert.apply()
 
 
 @shared_task(name="football_data_app.fetch_live_odds_v3", queue='cpu_heavy')
@@ -416,21 +304,34 @@ def fetch_live_odds_v3_task():
     A single GET /odds/live call covers every live fixture the provider has
     odds for in one request, so this scales with "how many matches are live
     right now", not with a per-fixture request count.
+
+    Skipped while the long-running live odds poller (live_odds_poller.py,
+    `manage.py run_live_odds_poller`) is up; it polls faster than beat can.
     """
-    live_fixture_ids = set(
+    from .live_odds_poller import poller_is_running
+    if poller_is_running():
+        logger.debug("fetch_live_odds_v3_task: live odds poller is running, skipping.")
+        return
+
+    live_fixtures = {
+        fixture.api_id: fixture for fixture in
         FootballFixture.objects.filter(
             status=FootballFixture.FixtureStatus.LIVE,
             api_id__startswith='v3_',
             markets__isnull=False,
-        ).distinct().values_list('id', flat=True)
-    )
-    if not live_fixture_ids:
+        ).select_related('home_team', 'away_team').distinct()
+    }
+    if not live_fixtures:
         logger.debug("fetch_live_odds_v3_task: no live fixtures with existing markets, skipping.")
         return
 
-    client = APIFootballV3Client()
+    client = APIFootballV3Client(lane=LANE_LIVE_ODDS)
     try:
         live_odds = client.get_live_odds()
+    except RateLimitExceeded as e:
+        # The next beat tick is sooner than any useful countdown.
+        logger.info(f"fetch_live_odds_v3_task: no live-odds rate limit slot ({e}); skipping this tick.")
+        return
     except Exception as e:
         logger.error(f"fetch_live_odds_v3_task: get_live_odds() failed: {e}", exc_info=True)
         return
@@ -444,10 +345,8 @@ def fetch_live_odds_v3_task():
         api_fixture_id = entry.get('fixture', {}).get('id')
         if not api_fixture_id:
             continue
-        fixture_api_id = f"v3_{api_fixture_id}"
-        try:
-            fixture = FootballFixture.objects.get(api_id=fixture_api_id, id__in=live_fixture_ids)
-        except FootballFixture.DoesNotExist:
+        fixture = live_fixtures.get(f"v3_{api_fixture_id}")
+        if fixture is None:
             continue
         _process_api_football_v3_live_odds_data(fixture, entry)
         processed += 1
@@ -485,7 +384,7 @@ def fetch_and_update_leagues_v3_task(self, _=None):
     logger.info(f"Task ID: {self.request.id}, Retry: {self.request.retries}/{self.max_retries}")
     logger.info("="*80)
     
-    client = APIFootballV3Client()
+    client = APIFootballV3Client(lane=LANE_LEAGUES)
     
     try:
         logger.info("Calling APIFootballV3Client.get_leagues()...")
@@ -544,6 +443,9 @@ def fetch_and_update_leagues_v3_task(self, _=None):
         logger.info("="*80)
         return processed_league_ids
         
+    except RateLimitExceeded as e:
+        logger.info(f"League update deferred by the rate limiter; retrying in {e.countdown}s.")
+        raise self.retry(exc=e, countdown=e.countdown)
     except APIFootballV3Exception as e:
         logger.error(f"TASK ERROR: API-Football v3 API error during league update: {e}", exc_info=True)
         logger.error(f"Retry {self.request.retries + 1}/{self.max_retries} will be attempted in {self.default_retry_delay}s")
@@ -628,7 +530,7 @@ def fetch_events_for_league_v3_task(self, league_id: int):
         
         api_league_id = int(league.api_id.replace('v3_', ''))
         
-        client = APIFootballV3Client()
+        client = APIFootballV3Client(lane=LANE_LEAGUES)
         
         # Calculate date range for upcoming fixtures
         from_date = datetime.now()
@@ -786,6 +688,9 @@ def fetch_events_for_league_v3_task(self, league_id: int):
         logger.info(f"TASK END: fetch_events_for_league_v3_task - FAILED (League not found)")
         logger.info("="*80)
         return {"league_id": league_id, "status": "error", "message": "League not found"}
+    except RateLimitExceeded as e:
+        logger.info(f"Events fetch for league {league_id} deferred by the rate limiter; retrying in {e.countdown}s.")
+        raise self.retry(exc=e, countdown=e.countdown)
     except APIFootballV3Exception as e:
         logger.error(f"TASK ERROR: API-Football v3 API error for league {league_id}: {e}", exc_info=True)
         if self.request.retries >= self.max_retries:
@@ -913,7 +818,7 @@ def fetch_odds_for_single_event_v3_task(self, fixture_id: int):
         
         api_fixture_id = int(fixture.api_id.replace('v3_', ''))
         
-        client = APIFootballV3Client()
+        client = APIFootballV3Client(lane=LANE_PREMATCH_ODDS)
         
         logger.debug(f"Calling APIFootballV3Client.get_odds(fixture_id={api_fixture_id})...")
         odds_data = client.get_odds(fixture_id=api_fixture_id)
@@ -945,6 +850,8 @@ def fetch_odds_for_single_event_v3_task(self, fixture_id: int):
         logger.error(f"TASK ERROR: Fixture with ID {fixture_id} not found in database")
         logger.info(f"TASK END: fetch_odds_for_single_event_v3_task - FAILED (Fixture not found)")
         return {"fixture_id": fixture_id, "status": "error", "message": "Fixture not found"}
+    except RateLimitExceeded as e:
+        raise self.retry(exc=e, countdown=e.countdown)
     except APIFootballV3Exception as e:
         logger.error(f"TASK ERROR: API-Football v3 API error for fixture {fixture_id}: {e}", exc_info=True)
         logger.error(f"Retry {self.request.retries + 1}/{self.max_retries} will be attempted in {self.default_retry_delay}s")
@@ -976,7 +883,7 @@ def fetch_odds_for_league_date_v3_task(self, league_pk: int, date_str: str):
         api_league_id = int(league.api_id.replace('v3_', ''))
         season = get_current_season()
 
-        client = APIFootballV3Client()
+        client = APIFootballV3Client(lane=LANE_PREMATCH_ODDS)
         odds_items = client.get_odds(
             league_id=api_league_id,
             season=season,
@@ -1025,6 +932,8 @@ def fetch_odds_for_league_date_v3_task(self, league_pk: int, date_str: str):
     except League.DoesNotExist:
         logger.error(f"League {league_pk} not found for bulk odds fetch.")
         return {"league_pk": league_pk, "date": date_str, "status": "error", "message": "League not found"}
+    except RateLimitExceeded as e:
+        raise self.retry(exc=e, countdown=e.countdown)
     except APIFootballV3Exception as e:
         logger.error(f"API-Football v3 error during bulk odds fetch (league {league_pk}, {date_str}): {e}")
         raise self.retry(exc=e)
@@ -1035,21 +944,22 @@ def fetch_odds_for_league_date_v3_task(self, league_pk: int, date_str: str):
 
 # --- PIPELINE 2: Score Fetching and Settlement ---
 
-@shared_task(name="football_data_app.run_score_and_settlement_v3_task", queue='cpu_heavy')
-def run_score_and_settlement_v3_task():
-    """Entry point for fetching scores and updating statuses using API-Football v3."""
+@shared_task(bind=True, name="football_data_app.run_score_and_settlement_v3_task", max_retries=2, default_retry_delay=900, queue='cpu_heavy')
+def run_score_and_settlement_v3_task(self):
+    """
+    Entry point for fetching scores and updating statuses using API-Football v3.
+
+    Runs one shared sweep (score_sweep.sweep_scores) over every active league
+    instead of fanning out a task per league: the live feed is fetched once,
+    fixtures are diffed and written in bulk, and settlement is enqueued only
+    for fixtures that flipped to FINISHED.
+    """
     logger.info("="*80)
     logger.info("TASK START: run_score_and_settlement_v3_task (Score & Settlement Pipeline)")
     logger.info("="*80)
     
     try:
-        logger.info("Fetching active v3 leagues from database...")
-        active_leagues = League.objects.filter(active=True, api_id__startswith='v3_').values_list('id', flat=True)
-        league_count = len(active_leagues)
-        
-        logger.info(f"Found {league_count} active API-Football v3 leagues")
-        
-        if not league_count:
+        if not League.objects.filter(active=True, api_id__startswith='v3_').exists():
             logger.warning("="*80)
             logger.warning("No active API-Football v3 leagues found. Skipping score fetching.")
             logger.warning("")
@@ -1066,221 +976,51 @@ def run_score_and_settlement_v3_task():
             logger.info("TASK END: run_score_and_settlement_v3_task - No active leagues")
             return
         
-        logger.info(f"Creating {league_count} score fetching tasks (one per league)...")
-        tasks = [fetch_scores_for_league_v3_task.s(league_id) for league_id in active_leagues]
-        
-        if tasks:
-            group(tasks).apply_async()
-            logger.info(f"Successfully dispatched {len(tasks)} score fetching tasks to the queue")
-            logger.info("="*80)
-            logger.info("TASK END: run_score_and_settlement_v3_task - SUCCESS")
-            logger.info(f"Dispatched {len(tasks)} tasks")
-            logger.info("="*80)
+        result = score_sweep.sweep_scores(APIFootballV3Client(lane=LANE_SCORES))
+        logger.info("="*80)
+        logger.info("TASK END: run_score_and_settlement_v3_task - SUCCESS")
+        logger.info(
+            f"Checked: {result.checked}, Updated: {result.updated}, Live: {result.live}, "
+            f"Finished: {len(result.finished)}, Assumed finished: {len(result.assumed_finished)}"
+        )
+        logger.info("="*80)
+        return {"checked": result.checked, "updated": result.updated,
+                "finished": len(result.finished) + len(result.assumed_finished)}
+    except RateLimitExceeded as e:
+        logger.info(f"Score sweep deferred by the rate limiter; retrying in {e.countdown}s.")
+        raise self.retry(exc=e, countdown=e.countdown)
+    except APIFootballV3Exception as e:
+        logger.error(f"TASK ERROR: API-Football v3 API error during score sweep: {e}", exc_info=True)
+        raise self.retry(exc=e)
     except Exception as e:
-        logger.error(f"TASK ERROR: Failed to dispatch score fetching tasks: {e}", exc_info=True)
+        logger.error(f"TASK ERROR: Unexpected error during score sweep: {e}", exc_info=True)
         raise
 
 
 @shared_task(bind=True, max_retries=2, default_retry_delay=900, queue='cpu_heavy')
 def fetch_scores_for_league_v3_task(self, league_id: int):
     """
-    Fetches live and finished match scores for a league from API-Football v3.
+    Fetches live and finished match scores for a single league from
+    API-Football v3. The scheduled pipeline sweeps every league at once
+    (run_score_and_settlement_v3_task); this is kept for refreshing one
+    league on demand.
     """
     logger.info("="*80)
     logger.info(f"TASK START: fetch_scores_for_league_v3_task - League ID: {league_id}")
     logger.info(f"Task ID: {self.request.id}, Retry: {self.request.retries}/{self.max_retries}")
     logger.info("="*80)
     
-    now = timezone.now()
-    assumed_completion_cutoff = now - timedelta(minutes=API_FOOTBALL_V3_ASSUMED_COMPLETION_MINUTES)
-    
     try:
-        logger.debug(f"Fetching league {league_id} from database...")
         league = League.objects.get(id=league_id)
-        logger.info(f"Processing scores for league: {league.name} (API ID: {league.api_id})")
-        
-        # Extract numeric league ID
         if not league.api_id.startswith('v3_'):
             logger.warning(f"League {league_id} is not a v3 league, skipping")
             return
         
-        api_league_id = int(league.api_id.replace('v3_', ''))
-        
-        # Get fixtures that need score updates (live or recently started)
-        logger.debug("Querying fixtures that need score updates...")
-        fixtures_to_check_qs = FootballFixture.objects.filter(
-            league=league,
-            api_id__startswith='v3_'
-        ).filter(
-            models.Q(status=FootballFixture.FixtureStatus.LIVE) |
-            models.Q(
-                status=FootballFixture.FixtureStatus.SCHEDULED,
-                match_date__lt=now
-            )
-        )
-        
-        fixture_count = fixtures_to_check_qs.count()
-        logger.info(f"Found {fixture_count} fixtures requiring score updates (LIVE or past SCHEDULED)")
-        
-        if not fixtures_to_check_qs.exists():
-            logger.info(f"No fixtures need a score update for league {league.name}.")
-            logger.info("="*80)
-            logger.info("TASK END: fetch_scores_for_league_v3_task - No updates needed")
-            logger.info("="*80)
-            return
-        
-        client = APIFootballV3Client()
-        
-        logger.info(f"Calling APIFootballV3Client.get_live_fixtures()...")
-        live_fixtures = client.get_live_fixtures()
-        logger.info(f"Received {len(live_fixtures) if live_fixtures else 0} live fixtures from API")
-        
-        # Get current season from Configuration or settings
-        current_season = get_current_season()
-        
-        # Get finished matches from the past few days
-        date_from = (now - timedelta(days=2)).strftime('%Y-%m-%d')
-        date_to = now.strftime('%Y-%m-%d')
-        logger.info(f"Calling APIFootballV3Client.get_fixtures(league_id={api_league_id}, season={current_season}, date_from={date_from}, date_to={date_to}, status=FT)...")
-        finished_fixtures = client.get_fixtures(
-            league_id=api_league_id,
-            season=current_season,
-            date_from=date_from,
-            date_to=date_to,
-            status='FT'  # Full Time
-        )
-        logger.info(f"Received {len(finished_fixtures) if finished_fixtures else 0} finished fixtures from API")
-        
-        # Combine live and finished fixtures
-        all_fixtures = []
-        if live_fixtures:
-            all_fixtures.extend(live_fixtures)
-        if finished_fixtures:
-            all_fixtures.extend(finished_fixtures)
-        
-        # Filter to only fixtures from this league
-        league_fixtures = [f for f in all_fixtures if f.get('league', {}).get('id') == api_league_id]
-        logger.info(f"Total fixtures for this league after filtering: {len(league_fixtures)}")
-        
-        processed_api_ids = set()
-        fixtures_updated = 0
-        fixtures_finished = 0
-        fixtures_live = 0
-        
-        if league_fixtures:
-            logger.info(f"Processing {len(league_fixtures)} fixture updates...")
-            for idx, fixture_data in enumerate(league_fixtures, 1):
-                fixture_info = fixture_data.get('fixture', {})
-                goals_info = fixture_data.get('goals', {})
-                
-                api_fixture_id = fixture_info.get('id')
-                if not api_fixture_id:
-                    logger.warning(f"Fixture item {idx} missing ID, skipping")
-                    continue
-                
-                fixture_api_id_str = f"v3_{api_fixture_id}"
-                processed_api_ids.add(fixture_api_id_str)
-                
-                try:
-                    with transaction.atomic():
-                        fixture = FootballFixture.objects.select_for_update().get(api_id=fixture_api_id_str)
-                        
-                        if fixture.status == FootballFixture.FixtureStatus.FINISHED:
-                            logger.debug(f"Fixture {fixture.id} already FINISHED, skipping")
-                            continue
-                        
-                        # Get scores
-                        home_score = goals_info.get('home')
-                        away_score = goals_info.get('away')
-                        fixture_status = fixture_info.get('status', {}).get('short', '')
-                        
-                        # Parse scores
-                        try:
-                            home_score = int(home_score) if home_score is not None and home_score != '' else None
-                        except (ValueError, TypeError):
-                            home_score = None
-                        
-                        try:
-                            away_score = int(away_score) if away_score is not None and away_score != '' else None
-                        except (ValueError, TypeError):
-                            away_score = None
-                        
-                        # Update scores if available
-                        if home_score is not None:
-                            fixture.home_team_score = home_score
-                        if away_score is not None:
-                            fixture.away_team_score = away_score
-                        
-                        fixture.last_score_update = timezone.now()
-                        fixture.match_updated = timezone.now()
-                        
-                        update_fields = ['home_team_score', 'away_team_score', 'status', 'last_score_update', 'match_updated']
-                        
-                        # Update status
-                        if fixture_status in ['FT', 'AET', 'PEN']:  # Finished statuses
-                            fixture.status = FootballFixture.FixtureStatus.FINISHED
-                            fixture.save(update_fields=update_fields)
-                            fixtures_finished += 1
-                            logger.info(f"Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) marked FINISHED. Score: {home_score}-{away_score}")
-                            
-                            # Import settlement tasks from legacy tasks (reusable)
-                            from .tasks_apifootball import settle_fixture_pipeline_task
-                            logger.info(f"Triggering settlement pipeline for fixture {fixture.id}...")
-                            settle_fixture_pipeline_task.delay(fixture.id)
-                        elif fixture_status in ['LIVE', '1H', 'HT', '2H', 'ET', 'P']:  # Live statuses
-                            fixture.status = FootballFixture.FixtureStatus.LIVE
-                            fixture.save(update_fields=update_fields)
-                            fixtures_live += 1
-                            logger.debug(f"Fixture {fixture.id} is LIVE. Score: {home_score}-{away_score}")
-                        else:
-                            fixture.save(update_fields=update_fields)
-                        
-                        fixtures_updated += 1
-                
-                except FootballFixture.DoesNotExist:
-                    logger.warning(f"Received score data for unknown fixture API ID: {fixture_api_id_str}")
-        
-        # Handle fixtures past assumed completion time
-        unprocessed_fixtures = fixtures_to_check_qs.exclude(api_id__in=processed_api_ids)
-        unprocessed_count = unprocessed_fixtures.count()
-        
-        if unprocessed_count > 0:
-            logger.info(f"Checking {unprocessed_count} unprocessed fixtures for assumed completion...")
-            fixtures_assumed_finished = 0
-            
-            for fixture in unprocessed_fixtures:
-                if fixture.match_date and fixture.match_date < assumed_completion_cutoff:
-                    with transaction.atomic():
-                        fixture_to_finish = FootballFixture.objects.select_for_update().get(id=fixture.id)
-                        
-                        if fixture_to_finish.status == FootballFixture.FixtureStatus.FINISHED:
-                            continue
-                        
-                        if fixture_to_finish.home_team_score is None:
-                            fixture_to_finish.home_team_score = 0
-                        if fixture_to_finish.away_team_score is None:
-                            fixture_to_finish.away_team_score = 0
-                        
-                        fixture_to_finish.status = FootballFixture.FixtureStatus.FINISHED
-                        fixture_to_finish.last_score_update = timezone.now()
-                        fixture_to_finish.save(update_fields=['home_team_score', 'away_team_score', 'status', 'last_score_update'])
-                        
-                        fixtures_assumed_finished += 1
-                        logger.warning(
-                            f"Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) "
-                            f"not in API response and past assumed completion time. "
-                            f"Marking FINISHED with score: {fixture_to_finish.home_team_score}-{fixture_to_finish.away_team_score}"
-                        )
-                        
-                        from .tasks_apifootball import settle_fixture_pipeline_task
-                        settle_fixture_pipeline_task.delay(fixture.id)
-            
-            if fixtures_assumed_finished > 0:
-                logger.info(f"Marked {fixtures_assumed_finished} fixtures as assumed finished")
-        
+        result = score_sweep.sweep_scores(APIFootballV3Client(lane=LANE_SCORES), league_ids=[league.id])
         logger.info("="*80)
         logger.info(f"TASK END: fetch_scores_for_league_v3_task - SUCCESS")
-        logger.info(f"League: {league.name}, Updated: {fixtures_updated}, Finished: {fixtures_finished}, Live: {fixtures_live}")
+        logger.info(f"League: {league.name}, Updated: {result.updated}, Finished: {len(result.finished)}, "
+                    f"Assumed finished: {len(result.assumed_finished)}, Live: {result.live}")
         logger.info("="*80)
     
     except League.DoesNotExist:
@@ -1288,6 +1028,9 @@ def fetch_scores_for_league_v3_task(self, league_id: int):
         logger.info("="*80)
         logger.info(f"TASK END: fetch_scores_for_league_v3_task - FAILED (League not found)")
         logger.info("="*80)
+    except RateLimitExceeded as e:
+        logger.info(f"Score fetch for league {league_id} deferred by the rate limiter; retrying in {e.countdown}s.")
+        raise self.retry(exc=e, countdown=e.countdown)
     except APIFootballV3Exception as e:
         logger.error(f"TASK ERROR: API-Football v3 API error for league {league_id}: {e}", exc_info=True)
         logger.error(f"Retry {self.request.retries + 1}/{self.max_retries} will be attempted in {self.default_retry_delay}s")
@@ -15,9 +15,11 @@ from typing import List, Dict, Any, Optional
 import random
 import time
 
-from .models import League, FootballFixture, Bookmaker, MarketCategory, Market, MarketOutcome, Team
-from customer_data.models import Bet, BetTicket
-from .utils import settle_ticket, upsert_market_outcome
+from .models import League, FootballFixture, Team
+from customer_data.models import BetTicket
+from .utils import settle_ticket
+from .odds_ingest import FixtureOddsUpsert
+from . import settlement
 from .apifootball_client import APIFootballClient, APIFootballException
 
 from meta_integration.utils import send_whatsapp_message, create_text_message_data, create_template_message_data
@@ -125,9 +127,6 @@ def _process_apifootball_odds_data(fixture: FootballFixture, odds_data: dict):
     bookmakers_count = len(odds_data.get('odd_bookmakers', []))
     logger.debug(f"Processing odds from {bookmakers_count} bookmaker(s)")
     
-    total_markets_created = 0
-    total_outcomes_created = 0
-
     def _to_odds(raw):
         """Decimal(str(raw)) raises decimal.InvalidOperation for values like
         '', '-', or 'N/A' -- a subclass of ArithmeticError, not ValueError, so
@@ -140,85 +139,40 @@ def _process_apifootball_odds_data(fixture: FootballFixture, odds_data: dict):
             logger.warning(f"Skipping unparsable odd '{raw}' for fixture {fixture.id}")
             return None
 
+    # Markets/outcomes are upserted in place rather than deleted and recreated:
+    # Market -> MarketOutcome -> Bet are all on_delete=CASCADE, so deleting a
+    # Market here cascade-deletes any Bet a user already placed against one of
+    # its outcomes -- see the identical fix and full explanation in
+    # tasks_api_football_v3.py's _process_api_football_v3_odds_data. A
+    # bookmaker that no longer returns any odds for this fixture has its h2h
+    # market deactivated rather than left active with stale odds forever.
+    # Unchanged markets are skipped and writes are batched -- see
+    # odds_ingest.FixtureOddsUpsert.
+    upsert = FixtureOddsUpsert(fixture)
     for bookmaker_data in odds_data.get('odd_bookmakers', []):
         bookmaker_name = bookmaker_data.get('bookmaker_name', 'Unknown')
-
-        # Create or get bookmaker
-        bookmaker, bookmaker_created = Bookmaker.objects.get_or_create(
-            api_bookmaker_key=bookmaker_name.lower().replace(' ', '_'),
-            defaults={'name': bookmaker_name}
-        )
-        if bookmaker_created:
-            logger.debug(f"Created new bookmaker: {bookmaker_name}")
-
-        # This bookmaker's h2h market for this fixture, if this refresh still
-        # offers it -- used below to deactivate a market the bookmaker has
-        # dropped entirely, which would otherwise stay is_active=True forever
-        # with odds that can never change again.
-        market_still_offered = False
+        bookmaker_key = bookmaker_name.lower().replace(' ', '_')
+        upsert.add_bookmaker(bookmaker_key, bookmaker_name)
 
         # Process odds (match winner - H2H market)
         for odds_entry in bookmaker_data.get('bookmaker_odds', []):
             odd_1 = odds_entry.get('odd_1')  # Home win
             odd_x = odds_entry.get('odd_x')  # Draw
             odd_2 = odds_entry.get('odd_2')  # Away win
+            if not (odd_1 or odd_x or odd_2):
+                continue
 
-            if odd_1 or odd_x or odd_2:
-                market_still_offered = True
-                # Create H2H market
-                category, _ = MarketCategory.objects.get_or_create(name='Match Winner')
-                
-                # Update the existing market/outcomes in place rather than deleting and
-                # recreating them. Market -> MarketOutcome -> Bet are all
-                # on_delete=CASCADE, so deleting a Market here cascade-deletes every
-                # MarketOutcome under it, which cascade-deletes any Bet a user already
-                # placed against one of those outcomes -- see the identical fix and
-                # full explanation in tasks_api_football_v3.py's
-                # _process_api_football_v3_odds_data.
-                market, _ = Market.objects.update_or_create(
-                    fixture=fixture,
-                    bookmaker=bookmaker,
-                    api_market_key='h2h',
-                    defaults={
-                        'category': category,
-                        'last_updated_odds_api': timezone.now(),
-                        'is_active': True,
-                    }
-                )
-                total_markets_created += 1
-
-                seen_outcome_ids = set()
-
-                odds_value = _to_odds(odd_1) if odd_1 else None
-                if odds_value is not None:
-                    outcome = upsert_market_outcome(market, fixture.home_team.name, None, odds_value)
-                    seen_outcome_ids.add(outcome.id)
-
-                odds_value = _to_odds(odd_x) if odd_x else None
-                if odds_value is not None:
-                    outcome = upsert_market_outcome(market, 'Draw', None, odds_value)
-                    seen_outcome_ids.add(outcome.id)
-
-                odds_value = _to_odds(odd_2) if odd_2 else None
+            market = upsert.add_market(bookmaker_key, 'Match Winner', 'h2h')
+            for outcome_name, raw in ((fixture.home_team.name, odd_1), ('Draw', odd_x), (fixture.away_team.name, odd_2)):
+                odds_value = _to_odds(raw) if raw else None
                 if odds_value is not None:
-                    outcome = upsert_market_outcome(market, fixture.away_team.name, None, odds_value)
-                    seen_outcome_ids.add(outcome.id)
-
-                if seen_outcome_ids:
-                    total_outcomes_created += len(seen_outcome_ids)
-                    logger.debug(f"Upserted market with {len(seen_outcome_ids)} outcomes for bookmaker {bookmaker_name}")
-
-                market.outcomes.exclude(id__in=seen_outcome_ids).update(is_active=False)
-
-        if not market_still_offered:
-            # This bookmaker no longer returned any odds at all for this
-            # fixture in this refresh -- deactivate its h2h market rather
-            # than leaving it active with stale odds forever.
-            Market.objects.filter(
-                fixture=fixture, bookmaker=bookmaker, api_market_key='h2h', is_active=True
-            ).update(is_active=False)
+                    upsert.add_outcome(market, outcome_name, None, odds_value)
 
-    logger.debug(f"Odds processing complete for fixture {fixture.id}: {total_markets_created} markets, {total_outcomes_created} outcomes")
+    result = upsert.apply()
+    logger.debug(
+        f"Odds processing complete for fixture {fixture.id}: {result.markets} markets written "
+        f"({result.markets_unchanged} unchanged), {result.outcomes_created + result.outcomes_updated} outcomes written"
+    )
 
 # --- PIPELINE 1: Full Data Update (Leagues, Events, Odds) ---
 
@@ -956,14 +910,28 @@ def process_ticket_settlement_task(ticket_id: int):
 
 @shared_task(name="football_data_app.tasks_apifootball.process_ticket_settlement_batch_task", queue='cpu_heavy')
 def process_ticket_settlement_batch_task(ticket_ids: List[int]):
-    """Process a batch of bet tickets for settlement."""
+    """Process a batch of bet tickets for settlement in one transaction
+    (settlement.settle_tickets). If the batch fails as a whole, falls back to
+    settling its tickets one by one so one bad ticket cannot hold up the rest."""
     logger.info(f"Processing settlement for a batch of {len(ticket_ids)} tickets.")
+    try:
+        settlement.settle_tickets(ticket_ids)
+        return
+    except Exception as e:
+        logger.error(f"Batch settlement failed for {len(ticket_ids)} tickets, settling individually: {e}", exc_info=True)
     for ticket_id in ticket_ids:
         try:
             settle_ticket(ticket_id)
         except Exception as e:
             logger.error(f"Error during batch settlement for BetTicket ID {ticket_id}: {e}", exc_info=True)
 
+
+def _dispatch_ticket_settlement(ticket_ids: List[int]):
+    """Queue one process_ticket_settlement_batch_task per SETTLEMENT_TICKET_BATCH_SIZE tickets."""
+    batch_size = max(1, getattr(settings, 'SETTLEMENT_TICKET_BATCH_SIZE', 500))
+    for start in range(0, len(ticket_ids), batch_size):
+        process_ticket_settlement_batch_task.delay(ticket_ids[start:start + batch_size])
+
 @shared_task(bind=True, name="football_data_app.tasks_apifootball.reconcile_and_settle_pending_items", queue='cpu_heavy')
 def reconcile_and_settle_pending_items_task(self):
     """Periodic task to find and settle any bets or tickets that might have been missed."""
@@ -1002,36 +970,18 @@ def reconcile_and_settle_pending_items_task(self):
                 stuck_fixtures_triggered_count += 1
     
     # Settle individual bets whose outcomes are resolved
-    bets_to_settle_qs = Bet.objects.filter(
-        status='PENDING',
-        market_outcome__result_status__in=[
-            MarketOutcome.ResultStatus.WON,
-            MarketOutcome.ResultStatus.LOST,
-            MarketOutcome.ResultStatus.PUSH
-        ]
-    ).select_related('market_outcome')
-    
-    bets_updated_count = 0
-    if bets_to_settle_qs.exists():
-        with transaction.atomic():
-            bets_to_update_list = []
-            for bet in bets_to_settle_qs:
-                bet.status = bet.market_outcome.result_status
-                bets_to_update_list.append(bet)
-            
-            if bets_to_update_list:
-                Bet.objects.bulk_update(bets_to_update_list, ['status'])
-                bets_updated_count = len(bets_to_update_list)
+    tickets_with_settled_bets = len(settlement.settle_bets())
     
     # Settle bet tickets
-    ticket_ids_to_check = list(BetTicket.objects.filter(status='PENDING').values_list('id', flat=True))
+    ticket_ids_to_check = list(BetTicket.objects.filter(
+        status__in=settlement.SETTLEABLE_TICKET_STATUSES).order_by('id').values_list('id', flat=True))
     
     tickets_settled_count = 0
     if ticket_ids_to_check:
-        process_ticket_settlement_batch_task.chunks(zip(ticket_ids_to_check), 100).apply_async()
+        _dispatch_ticket_settlement(ticket_ids_to_check)
         tickets_settled_count = len(ticket_ids_to_check)
     
-    logger.info(f"[Reconciliation] FINISHED - Stuck: {stuck_fixtures_triggered_count}, Bets: {bets_updated_count}, Tickets: {tickets_settled_count}")
+    logger.info(f"[Reconciliation] FINISHED - Stuck: {stuck_fixtures_triggered_count}, Tickets with settled bets: {tickets_with_settled_bets}, Tickets: {tickets_settled_count}")
 
 @shared_task(name="football_data_app.tasks_apifootball.settle_fixture_pipeline", queue='cpu_heavy')
 def settle_fixture_pipeline_task(fixture_id: int):
@@ -1046,54 +996,18 @@ def settle_fixture_pipeline_task(fixture_id: int):
 
 @shared_task(bind=True, queue='cpu_heavy')
 def settle_outcomes_for_fixture_task(self, fixture_id):
-    """Settles market outcomes for a finished fixture."""
+    """Settles market outcomes for a finished fixture (see settlement.py)."""
     logger.info(f"Settling outcomes for fixture ID: {fixture_id}")
     try:
-        fixture = FootballFixture.objects.get(id=fixture_id, status=FootballFixture.FixtureStatus.FINISHED)
+        fixture = FootballFixture.objects.select_related('home_team', 'away_team').get(
+            id=fixture_id, status=FootballFixture.FixtureStatus.FINISHED)
         
         if fixture.home_team_score is None or fixture.away_team_score is None:
             logger.error(f"Cannot settle outcomes for fixture ID {fixture_id} - missing score data.")
             return
         
-        home_score, away_score = fixture.home_team_score, fixture.away_team_score
-        outcomes_to_update = []
-        
-        for market in fixture.markets.prefetch_related('outcomes'):
-            for outcome in market.outcomes.filter(result_status='PENDING'):
-                new_status = 'LOST'
-                
-                if market.api_market_key == 'h2h':
-                    if ((outcome.outcome_name == fixture.home_team.name and home_score > away_score) or
-                        (outcome.outcome_name == fixture.away_team.name and away_score > home_score) or
-                        (outcome.outcome_name.lower() == 'draw' and home_score == away_score)):
-                        new_status = 'WON'
-                
-                elif market.api_market_key in ['totals', 'alternate_totals'] and hasattr(outcome, 'point_value') and outcome.point_value is not None:
-                    total_score = home_score + away_score
-                    if 'over' in outcome.outcome_name.lower():
-                        if total_score > outcome.point_value:
-                            new_status = 'WON'
-                        elif total_score == outcome.point_value:
-                            new_status = 'PUSH'
-                    elif 'under' in outcome.outcome_name.lower():
-                        if total_score < outcome.point_value:
-                            new_status = 'WON'
-                        elif total_score == outcome.point_value:
-                            new_status = 'PUSH'
-                
-                elif market.api_market_key == 'btts':
-                    if ((outcome.outcome_name == 'Yes' and home_score > 0 and away_score > 0) or
-                        (outcome.outcome_name == 'No' and not (home_score > 0 and away_score > 0))):
-                        new_status = 'WON'
-                
-                if new_status != 'PENDING':
-                    outcome.result_status = new_status
-                    outcomes_to_update.append(outcome)
-        
-        if outcomes_to_update:
-            MarketOutcome.objects.bulk_update(outcomes_to_update, ['result_status'])
-        
-        logger.info(f"Settled {len(outcomes_to_update)} outcomes for fixture {fixture_id}.")
+        counts = settlement.settle_fixture_outcomes(fixture)
+        logger.info(f"Settled outcomes for fixture {fixture_id}: {counts}.")
     except FootballFixture.DoesNotExist:
         logger.warning(f"Fixture {fixture_id} not found for outcome settlement.")
     except Exception as e:
@@ -1108,24 +1022,58 @@ def settle_bets_for_fixture_task(self, fixture_id: int):
         return
     logger.info(f"Settling bets for fixture ID: {fixture_id}")
     try:
-        bets_to_update = []
-        for bet in Bet.objects.filter(
-            market_outcome__market__fixture_id=fixture_id,
-            status='PENDING'
-        ).select_related('market_outcome'):
-            if bet.market_outcome.result_status != 'PENDING':
-                bet.status = bet.market_outcome.result_status
-                bets_to_update.append(bet)
-        
-        if bets_to_update:
-            Bet.objects.bulk_update(bets_to_update, ['status'])
-            logger.info(f"Settled {len(bets_to_update)} bets for fixture {fixture_id}.")
+        ticket_ids = settlement.settle_bets(fixture_id)
+        if ticket_ids:
+            logger.info(f"Settled bets on {len(ticket_ids)} tickets for fixture {fixture_id}.")
         
         return fixture_id
     except Exception as e:
         logger.exception(f"Error settling bets for fixture {fixture_id}")
         raise self.retry(exc=e)
 
+def _settlement_notification(ticket, new_status: str, winnings: str):
+    """The (message_type, data) notifying the ticket's owner that it settled
+    as `new_status`, or None for a status there is no message for."""
+    balance = ticket.user.wallet.balance
+    if new_status == 'WON':
+        outcome_phrase = "a WINNER 🎉"
+        amount = Decimal(winnings)
+        message_body = (
+            f"🎉 Congratulations! Your bet ticket (ID: {ticket.id}) has WON!\n\n"
+            f"Amount Won: ${amount:.2f}\n"
+            f"Your wallet has been credited. New balance: ${balance:.2f}."
+        )
+    elif new_status == 'LOST':
+        outcome_phrase = "not a winner this time 😔"
+        amount = Decimal('0.00')
+        message_body = (
+            f"😔 Unfortunately, your bet ticket (ID: {ticket.id}) has lost.\n\n"
+            f"Better luck next time! Reply 'bet' to see upcoming matches."
+        )
+    elif new_status == 'REFUNDED':
+        outcome_phrase = "refunded (push/void)"
+        amount = Decimal(winnings)
+        message_body = (
+            f"ℹ️ Your bet ticket (ID: {ticket.id}) has been refunded.\n\n"
+            f"The match result was a push/void. Your stake of ${amount:.2f} has been returned to your wallet.\n"
+            f"New balance: ${balance:.2f}"
+        )
+    else:
+        return None
+
+    # Prefer an approved template so the notification also delivers outside
+    # WhatsApp's 24h customer-service window; fall back to text when no
+    # template is configured.
+    template_name = getattr(settings, 'BET_SETTLEMENT_TEMPLATE_NAME', '')
+    if template_name:
+        return 'template', create_template_message_data(
+            name=template_name,
+            language_code=getattr(settings, 'BET_SETTLEMENT_TEMPLATE_LANG', 'en_US'),
+            body_parameters=[str(ticket.id), outcome_phrase, f"{amount:.2f}", f"{balance:.2f}"],
+        )
+    return 'text', create_text_message_data(text_body=message_body)
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=120, queue='cpu_heavy')
 def send_bet_ticket_settlement_notification_task(self, ticket_id: int, new_status: str, winnings: str = "0.00"):
     """Sends WhatsApp notification about ticket status change."""
@@ -1139,49 +1087,12 @@ def send_bet_ticket_settlement_notification_task(self, ticket_id: int, new_statu
             return
         
         contact = ticket.user.customer_profile.contact
-        balance = ticket.user.wallet.balance
-
-        if new_status == 'WON':
-            outcome_phrase = "a WINNER 🎉"
-            amount = Decimal(winnings)
-            message_body = (
-                f"🎉 Congratulations! Your bet ticket (ID: {ticket.id}) has WON!\n\n"
-                f"Amount Won: ${amount:.2f}\n"
-                f"Your wallet has been credited. New balance: ${balance:.2f}."
-            )
-        elif new_status == 'LOST':
-            outcome_phrase = "not a winner this time 😔"
-            amount = Decimal('0.00')
-            message_body = (
-                f"😔 Unfortunately, your bet ticket (ID: {ticket.id}) has lost.\n\n"
-                f"Better luck next time! Reply 'bet' to see upcoming matches."
-            )
-        elif new_status == 'REFUNDED':
-            outcome_phrase = "refunded (push/void)"
-            amount = Decimal(winnings)
-            message_body = (
-                f"ℹ️ Your bet ticket (ID: {ticket.id}) has been refunded.\n\n"
-                f"The match result was a push/void. Your stake of ${amount:.2f} has been returned to your wallet.\n"
-                f"New balance: ${balance:.2f}"
-            )
-        else:
+        notification = _settlement_notification(ticket, new_status, winnings)
+        if notification is None:
             logger.warning(f"Unhandled status '{new_status}' for ticket {ticket_id}.")
             return
-
-        # Prefer an approved template so the notification also delivers outside
-        # WhatsApp's 24h customer-service window; fall back to text when no
-        # template is configured.
-        template_name = getattr(settings, 'BET_SETTLEMENT_TEMPLATE_NAME', '')
-        if template_name:
-            message_data = create_template_message_data(
-                name=template_name,
-                language_code=getattr(settings, 'BET_SETTLEMENT_TEMPLATE_LANG', 'en_US'),
-                body_parameters=[str(ticket.id), outcome_phrase, f"{amount:.2f}", f"{balance:.2f}"],
-            )
-            send_whatsapp_message(to_phone_number=contact.whatsapp_id, message_type='template', data=message_data)
-        else:
-            message_data = create_text_message_data(text_body=message_body)
-            send_whatsapp_message(to_phone_number=contact.whatsapp_id, message_type='text', data=message_data)
+        message_type, message_data = notification
+        send_whatsapp_message(to_phone_number=contact.whatsapp_id, message_type=message_type, data=message_data)
         logger.info(f"Sent settlement notification to {contact.whatsapp_id} for ticket {ticket_id} (status={new_status}).")
     
     except BetTicket.DoesNotExist:
@@ -1192,6 +1103,72 @@ def send_bet_ticket_settlement_notification_task(self, ticket_id: int, new_statu
         logger.exception(f"Error sending notification for ticket {ticket_id}: {e}")
         raise self.retry(exc=e)
 
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=120, queue='cpu_heavy')
+def send_bet_ticket_settlement_notifications_task(self, notifications: list):
+    """
+    Notify the owners of many settled tickets at once. `notifications` holds
+    [ticket_id, new_status, winnings] entries. The messages are saved as
+    outgoing Messages and handed to the batch sender, one batch task per
+    META_SEND_BATCH_SIZE messages per config, instead of one send task each.
+    """
+    from conversations.models import Message
+    from meta_integration.models import MetaAppConfig
+    from meta_integration.sender import queue_outgoing_messages
+
+    logger.info(f"Sending {len(notifications)} settlement notifications.")
+    try:
+        tickets = BetTicket.objects.select_related(
+            'user__customer_profile__contact__associated_app_config', 'user__wallet'
+        ).in_bulk([ticket_id for ticket_id, _, _ in notifications])
+        default_config = None
+        messages, config_ids = [], []
+        for ticket_id, new_status, winnings in notifications:
+            ticket = tickets.get(ticket_id)
+            if ticket is None:
+                logger.error(f"BetTicket {ticket_id} not found for notification.")
+                continue
+            profile = getattr(ticket.user, 'customer_profile', None)
+            contact = profile.contact if profile is not None else None
+            if contact is None:
+                logger.warning(f"Cannot send notification - no contact found for ticket {ticket_id}.")
+                continue
+            notification = _settlement_notification(ticket, new_status, winnings)
+            if notification is None:
+                logger.warning(f"Unhandled status '{new_status}' for ticket {ticket_id}.")
+                continue
+            # Reply from the number the user messaged, as flows do.
+            config = contact.associated_app_config
+            if config is None:
+                if default_config is None:
+                    try:
+                        default_config = MetaAppConfig.objects.get_active_config()
+                    except MetaAppConfig.DoesNotExist:
+                        logger.error("No active MetaAppConfig found; cannot send settlement notifications.")
+                        return
+                config = default_config
+            message_type, message_data = notification
+            messages.append(Message(
+                contact=contact, direction='out', message_type=message_type, content_payload=message_data,
+                text_content=message_data.get('body') if message_type == 'text' else None,
+                status='pending_dispatch',
+            ))
+            config_ids.append(config.id)
+
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+    except Exception as e:
+        logger.exception(f"Error sending settlement notifications: {e}")
+        raise self.retry(exc=e)
+
+    # Not retried from here on: a retry would save the messages twice.
+    message_ids_by_config = {}
+    for message, config_id in zip(messages, config_ids):
+        message_ids_by_config.setdefault(config_id, []).append(message.id)
+    for config_id, message_ids in message_ids_by_config.items():
+        queue_outgoing_messages(message_ids, config_id)
+    logger.info(f"Queued {len(messages)} settlement notifications for {len(message_ids_by_config)} config(s).")
+
 @shared_task(bind=True, queue='cpu_heavy')
 def settle_tickets_for_fixture_task(self, fixture_id: int):
     """Settles bet tickets based on bet statuses."""
@@ -1199,16 +1176,13 @@ def settle_tickets_for_fixture_task(self, fixture_id: int):
         return
     logger.info(f"Settling tickets for fixture ID: {fixture_id}")
     try:
-        affected_ticket_ids = list(BetTicket.objects.filter(
-            status='PENDING',
-            bets__market_outcome__market__fixture_id=fixture_id
-        ).distinct().values_list('id', flat=True))
+        affected_ticket_ids = settlement.pending_ticket_ids_for_fixture(fixture_id)
         
         if not affected_ticket_ids:
             logger.info(f"No pending tickets found for fixture {fixture_id}.")
             return
         
-        process_ticket_settlement_batch_task.chunks(zip(affected_ticket_ids), 100).apply_async()
+        _dispatch_ticket_settlement(affected_ticket_ids)
         logger.info(f"Dispatched settlement for {len(affected_ticket_ids)} tickets for fixture {fixture_id}.")
     except Exception as e:
         logger.exception(f"Error settling tickets for fixture {fixture_id}")
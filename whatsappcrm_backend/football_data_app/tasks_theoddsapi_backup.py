@@ -13,6 +13,8 @@ import time
 from .models import League, FootballFixture, Bookmaker, MarketCategory, Market, MarketOutcome, Team
 from customer_data.models import Bet, BetTicket
 from .utils import settle_ticket, upsert_market_outcome # Import the new utility function
+from .odds_summary import refresh_odds_summaries
+from .fixtures_pdf import schedule_fixtures_pdf_prebuild
 from .the_odds_api_client import TheOddsAPIClient, TheOddsAPIException
 
 from meta_integration.models import MetaAppConfig
@@ -302,6 +304,8 @@ def _apply_odds_event(fixture_for_update, odds_data):
 
     fixture_for_update.last_odds_update = timezone.now()
     fixture_for_update.save(update_fields=['last_odds_update'] + team_fields_to_update)
+    refresh_odds_summaries([fixture_for_update.id])
+    transaction.on_commit(schedule_fixtures_pdf_prebuild)
 
 
 @shared_task(bind=True, max_retries=2, default_retry_delay=300)
@@ -7,22 +7,25 @@ from decimal import Decimal
 from datetime import timedelta
 from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
-from .api_football_v3_client import APIFootballV3Client
+from whatsappcrm_backend.redis_client import get_redis
+from . import api_football_v3_client
+from .api_football_v3_client import APIFootballV3Client, APIFootballV3Exception
 from .models import League, Team, FootballFixture
 
 
 class ClientPaginationTests(TestCase):
     def test_request_all_pages_concatenates(self):
         client = APIFootballV3Client(api_key='x')
-        pages = [
-            {'response': [{'a': 1}, {'a': 2}], 'paging': {'current': 1, 'total': 3}},
-            {'response': [{'a': 3}], 'paging': {'current': 2, 'total': 3}},
-            {'response': [{'a': 4}], 'paging': {'current': 3, 'total': 3}},
-        ]
-        with mock.patch.object(client, '_request', side_effect=pages) as m:
+        pages = {
+            1: {'response': [{'a': 1}, {'a': 2}], 'paging': {'current': 1, 'total': 3}},
+            2: {'response': [{'a': 3}], 'paging': {'current': 2, 'total': 3}},
+            3: {'response': [{'a': 4}], 'paging': {'current': 3, 'total': 3}},
+        }
+        # Pages 2..N are fetched concurrently, so answer by page number.
+        with mock.patch.object(client, '_request', side_effect=lambda endpoint, params: pages[params['page']]) as m:
             out = client._request_all_pages('odds', {'league': 1})
         self.assertEqual([o['a'] for o in out], [1, 2, 3, 4])
         self.assertEqual(m.call_count, 3)  # exactly one request per page
@@ -52,6 +55,69 @@ class ClientPaginationTests(TestCase):
         self.assertEqual(captured['params']['ids'], '10-20-30')
 
 
+@override_settings(API_FOOTBALL_CACHE_TTLS={'leagues': 60, 'fixtures': 60, 'odds': 60, 'live': 5})
+@mock.patch('football_data_app.api_football_v3_client.RESPONSE_CACHE_KEY', 'test:api_football:resp:{}')
+@mock.patch('football_data_app.api_football_v3_client.RATE_LIMITER_AVAILABLE', False)
+class ResponseCacheTests(TestCase):
+    """Repeated identical queries within the TTL are served from Redis and
+    cost no API credit; requests share one pooled session."""
+
+    def setUp(self):
+        self.redis = get_redis()
+        self._clear()
+        self.addCleanup(self._clear)
+        self.addCleanup(api_football_v3_client.close_session)
+
+    def _clear(self):
+        keys = self.redis.keys('test:api_football:resp:*')
+        if keys:
+            self.redis.delete(*keys)
+
+    @staticmethod
+    def _response(payload):
+        response = mock.MagicMock(status_code=200)
+        response.json.return_value = payload
+        return response
+
+    def test_identical_queries_hit_cache(self):
+        client = APIFootballV3Client(api_key='x')
+        payload = {'errors': [], 'response': [{'league': {'id': 39}}], 'paging': {'total': 1}}
+        with mock.patch.object(api_football_v3_client.requests.Session, 'get', return_value=self._response(payload)) as get:
+            first = client.get_leagues(country='England')
+            second = APIFootballV3Client(api_key='y').get_leagues(country='England')
+            client.get_leagues(country='Spain')
+        self.assertEqual(first, second)
+        self.assertEqual(get.call_count, 2)
+        for key in self.redis.keys('test:api_football:resp:*'):
+            self.assertLessEqual(self.redis.ttl(key), 60)
+
+    def test_live_queries_use_live_ttl_and_errors_are_not_cached(self):
+        client = APIFootballV3Client(api_key='x')
+        with mock.patch.object(api_football_v3_client.requests.Session, 'get',
+                               return_value=self._response({'errors': [], 'response': []})):
+            client.get_live_fixtures()
+        (key,) = self.redis.keys('test:api_football:resp:*')
+        self.assertLessEqual(self.redis.ttl(key), 5)
+
+        self._clear()
+        with mock.patch.object(api_football_v3_client.requests.Session, 'get',
+                               return_value=self._response({'errors': {'token': 'bad'}, 'response': []})):
+            with self.assertRaises(APIFootballV3Exception):
+                client.get_leagues()
+        self.assertEqual(self.redis.keys('test:api_football:resp:*'), [])
+
+    def test_pages_fetched_once_then_cached(self):
+        client = APIFootballV3Client(api_key='x')
+        pages = {p: {'errors': [], 'response': [{'p': p}], 'paging': {'current': p, 'total': 4}} for p in range(1, 5)}
+        with mock.patch.object(api_football_v3_client.requests.Session, 'get',
+                               side_effect=lambda url, params, **kw: self._response(pages[params['page']])) as get:
+            out = client.get_odds(league_id=39, season=2024, date='2024-08-01', paginate=True)
+            again = client.get_odds(league_id=39, season=2024, date='2024-08-01', paginate=True)
+        self.assertEqual([o['p'] for o in out], [1, 2, 3, 4])
+        self.assertEqual(out, again)
+        self.assertEqual(sorted(c.kwargs['params']['page'] for c in get.call_args_list), [1, 2, 3, 4])
+
+
 class BulkOddsTaskTests(TestCase):
     def setUp(self):
         self.league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
@@ -0,0 +1,105 @@
+# whatsappcrm_backend/football_data_app/test_fixture_feed.py
+"""
+Coverage for the player portal fixture feed (views.FixtureViewSet): cursor
+pages read odds from the consensus projection in a fixed number of queries,
+polling with the page's ETag gets a 304 until its odds change, and responses
+are gzipped on request.
+"""
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import odds_deltas
+from .models import FootballFixture, League, Team
+from .tasks_api_football_v3 import _process_api_football_v3_odds_data
+
+URL = '/crm-api/football/fixtures/'
+
+
+def _payload(home_odds, bookmakers=1):
+    return [{'bookmakers': [{
+        'id': 100 + b, 'name': f'Book {b}',
+        'bets': [{'id': 1, 'name': 'Match Winner', 'values': [
+            {'value': 'Home', 'odd': home_odds}, {'value': 'Draw', 'odd': '3.40'}, {'value': 'Away', 'odd': '2.80'},
+        ]}],
+    } for b in range(bookmakers)]}]
+
+
+@patch.object(odds_deltas, 'ODDS_DELTA_STREAM', 'test:football:feed:deltas:{}')
+@patch.object(odds_deltas, 'ODDS_VERSION_KEY', 'test:football:feed:version:{}')
+class FixtureFeedTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('player1', password='x'))
+        self.league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.fixtures = [self._fixture(i) for i in range(3)]
+        self.addCleanup(get_redis().delete, database_key('test:football:feed:deltas:{}'),
+                        database_key('test:football:feed:version:{}'))
+
+    def _fixture(self, i):
+        return FootballFixture.objects.create(
+            league=self.league, home_team=Team.objects.create(name=f'Home {i}'),
+            away_team=Team.objects.create(name=f'Away {i}'), api_id=f'v3_{5000 + i}',
+            match_date=timezone.now() + timedelta(hours=i + 1), status=FootballFixture.FixtureStatus.SCHEDULED,
+        )
+
+    def _ingest(self, fixture, home_odds, bookmakers=1):
+        fixture = FootballFixture.objects.select_related('home_team', 'away_team').get(pk=fixture.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            _process_api_football_v3_odds_data(fixture, _payload(home_odds, bookmakers))
+
+    def test_cursor_pages_with_consensus_odds(self):
+        for fixture in self.fixtures:
+            self._ingest(fixture, '2.10')
+        with CaptureQueriesContext(connection) as small:
+            first = self.client.get(URL, {'page_size': 2}).json()
+        self._ingest(self.fixtures[0], '2.20', bookmakers=6)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(URL, {'page_size': 2})
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual([fx['id'] for fx in first['results']], [f.id for f in self.fixtures[:2]])
+        market = first['results'][0]['markets'][0]
+        self.assertEqual(market['category'], 'Match Winner')
+        self.assertIn({'outcome_name': 'Home 0', 'odds': 2.1}, [
+            {'outcome_name': o['outcome_name'], 'odds': o['odds']} for o in market['outcomes']])
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual([fx['id'] for fx in second['results']], [self.fixtures[2].id])
+
+    def test_unchanged_page_is_not_modified_until_odds_change(self):
+        for fixture in self.fixtures:
+            self._ingest(fixture, '2.10')
+        response = self.client.get(URL)
+        etag = response['ETag']
+        # A page is validated by its ETag alone; it has no Last-Modified to go stale.
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('Last-Modified', self.client.get(f'{URL}{self.fixtures[0].id}/'))
+        self.assertEqual(self.client.get(URL, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)).status_code, 200)
+
+        with self.assertNumQueries(2):  # the page, and its odds state
+            not_modified = self.client.get(URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        self._ingest(self.fixtures[0], '2.40')
+        changed = self.client.get(URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_gzipped_on_request(self):
+        for fixture in self.fixtures:
+            self._ingest(fixture, '2.10')
+        response = self.client.get(URL, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
@@ -0,0 +1,104 @@
+# whatsappcrm_backend/football_data_app/test_fixture_snapshot.py
+"""
+Coverage for the bettable-fixture snapshot (fixture_snapshot.py) behind both
+browse screens: a page is served from Redis without touching the database,
+building the snapshot does not query per fixture, and odds or fixture
+changes drop it so the next browse shows them.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import betting_ux as ux
+from . import bet_flow_handler as H
+from . import fixture_snapshot, odds_deltas
+from .models import Bookmaker, FootballFixture, League, Market, MarketCategory, MarketOutcome, Team
+from .odds_deltas import OddsDelta
+
+
+@patch.object(fixture_snapshot, 'BETTABLE_SNAPSHOT_KEY', 'test:football:bettable:snapshot:{}')
+@patch.object(fixture_snapshot, 'BETTABLE_SNAPSHOT_BUILT_KEY', 'test:football:bettable:snapshot_built:{}')
+class BettableSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.redis = get_redis()
+        self.addCleanup(lambda: self.redis.delete(*fixture_snapshot._keys()))
+        self.league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.bookmaker = Bookmaker.objects.create(name='Bet365', api_bookmaker_key='8')
+        self.category = MarketCategory.objects.create(name='Match Winner')
+
+    def _fixture(self, i, hours=3, home='2.10'):
+        fixture = FootballFixture.objects.create(
+            league=self.league, home_team=Team.objects.create(name=f'Home {i}'),
+            away_team=Team.objects.create(name=f'Away {i}'), api_id=f'v3_snap_{i}',
+            match_date=timezone.now() + timedelta(hours=hours), status=FootballFixture.FixtureStatus.SCHEDULED,
+        )
+        market = Market.objects.create(fixture=fixture, bookmaker=self.bookmaker, category=self.category,
+                                       api_market_key='h2h', last_updated_odds_api=timezone.now())
+        for name, odds in (('Home', home), ('Draw', '3.40'), ('Away', '2.80')):
+            MarketOutcome.objects.create(market=market, outcome_name=name, odds=Decimal(odds))
+        return fixture
+
+    def _build_queries(self):
+        fixture_snapshot.invalidate_snapshot()
+        with CaptureQueriesContext(connection) as ctx:
+            fixture_snapshot.bettable_page(0, 8)
+        return len(ctx.captured_queries)
+
+    def test_pages_served_from_redis(self):
+        fixtures = [self._fixture(i, hours=i + 1) for i in range(11)]
+        ux.build_fixtures_screen(page=0)
+
+        with self.assertNumQueries(0):
+            screen = ux.build_fixtures_screen(page=1)
+            options = H._fixtures_options(page=0)
+
+        rows = [row for section in screen['sections'] for row in section['rows'] if row['id'].startswith('fx:')]
+        self.assertEqual([row['id'] for row in rows], [f"fx:{f.id}" for f in fixtures[8:]])
+        self.assertIn('1X2 2.10/3.40/2.80', rows[0]['description'])
+        self.assertFalse(screen['has_more'])
+        self.assertEqual([o['id'] for o in options[:3]], [str(f.id) for f in fixtures[:3]])
+
+    def test_build_does_not_query_per_fixture(self):
+        self._fixture(0)
+        small = self._build_queries()
+        for i in range(1, 12):
+            self._fixture(i)
+        self.assertEqual(self._build_queries(), small)
+
+    def test_odds_delta_and_orm_writes_drop_the_snapshot(self):
+        fixture = self._fixture(0)
+        fixture_snapshot.bettable_page(0, 8)
+        with patch.object(odds_deltas, 'ODDS_DELTA_STREAM', 'test:football:odds:deltas:{}'), \
+                patch.object(odds_deltas, 'ODDS_VERSION_KEY', 'test:football:odds:version:{}'):
+            self.addCleanup(self.redis.delete, database_key('test:football:odds:deltas:{}'),
+                            database_key('test:football:odds:version:{}'))
+            odds_deltas.publish_odds_delta(OddsDelta(fixture_id=fixture.id, markets=[1]))
+        self.assertFalse(self.redis.exists(*fixture_snapshot._keys()))
+
+        fixture_snapshot.bettable_page(0, 8)
+        fixture.status = FootballFixture.FixtureStatus.LIVE
+        fixture.home_team_score, fixture.away_team_score = 1, 0
+        fixture.save()
+        (entry,), _ = fixture_snapshot.bettable_page(0, 8)
+        self.assertEqual(ux._snapshot_kickoff_label(entry), '🔴 LIVE · 1-0')
+
+    def test_snapshot_expires_at_next_kickoff(self):
+        self._fixture(0, hours=0.01)
+        self._fixture(1, hours=5)
+        fixture_snapshot.bettable_page(0, 8)
+        key, _ = fixture_snapshot._keys()
+        self.assertLessEqual(self.redis.ttl(key), 37)
+
+    def test_redis_down_builds_from_database(self):
+        self._fixture(0)
+        with patch.object(fixture_snapshot, 'get_redis', side_effect=ConnectionError("down")):
+            entries, total = fixture_snapshot.bettable_page(0, 8)
+        self.assertEqual(total, 1)
+        self.assertEqual(entries[0]['summary'], '1X2 2.10/3.40/2.80')
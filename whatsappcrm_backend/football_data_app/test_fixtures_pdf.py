@@ -0,0 +1,106 @@
+# whatsappcrm_backend/football_data_app/test_fixtures_pdf.py
+"""
+Coverage for the content-addressed fixtures PDF cache (fixtures_pdf.py): an
+unchanged snapshot is served without rebuilding, an odds refresh yields a new
+document and queues one prebuild per burst, and garbage collection keeps
+documents that are current or still being served.
+"""
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import get_redis
+from . import fixtures_pdf
+from .models import FootballFixture, League, Team
+from .tasks_api_football_v3 import _process_api_football_v3_odds_data
+
+
+def _payload(home_odds):
+    return [{'bookmakers': [{
+        'id': 8, 'name': 'Bet365',
+        'bets': [{'id': 1, 'name': 'Match Winner', 'values': [
+            {'value': 'Home', 'odd': home_odds}, {'value': 'Draw', 'odd': '3.40'}, {'value': 'Away', 'odd': '2.80'},
+        ]}],
+    }]}]
+
+
+PENDING_KEY = 'test:football:fixtures_pdf:prebuild_pending:{}'
+
+
+@patch.object(fixtures_pdf, 'PREBUILD_PENDING_KEY', PENDING_KEY)
+class FixturesPdfCacheTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, FIXTURES_PDF_RETENTION_SECONDS=600)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        pending_key = PENDING_KEY.format(connection.settings_dict.get('NAME'))
+        get_redis().delete(pending_key)
+        self.addCleanup(get_redis().delete, pending_key)
+
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.fixture = FootballFixture.objects.create(
+            league=league, home_team=Team.objects.create(name='Home FC'),
+            away_team=Team.objects.create(name='Away FC'), api_id='v3_4001',
+            match_date=timezone.now() + timedelta(days=1), status=FootballFixture.FixtureStatus.SCHEDULED,
+        )
+
+    def _ingest(self, home_odds):
+        fixture = FootballFixture.objects.select_related('home_team', 'away_team').get(pk=self.fixture.pk)
+        _process_api_football_v3_odds_data(fixture, _payload(home_odds))
+
+    def test_unchanged_snapshot_served_without_rebuilding(self):
+        with patch.object(fixtures_pdf.prebuild_fixtures_pdfs_task, 'apply_async'):
+            self._ingest('2.10')
+        first = fixtures_pdf.get_fixtures_pdf(days_ahead=10)
+        self.assertTrue(os.path.getsize(first) > 0)
+
+        with patch.object(fixtures_pdf, 'generate_fixtures_pdf') as generate:
+            self.assertEqual(fixtures_pdf.get_fixtures_pdf(days_ahead=10), first)
+        generate.assert_not_called()
+        # Other parameters are a different document.
+        self.assertNotEqual(fixtures_pdf.fixtures_pdf_fingerprint('scheduled_fixtures', days_ahead=3),
+                            fixtures_pdf.fixtures_pdf_fingerprint('scheduled_fixtures', days_ahead=10))
+
+    def test_odds_refresh_changes_document_and_queues_one_prebuild(self):
+        with patch.object(fixtures_pdf.prebuild_fixtures_pdfs_task, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self._ingest('2.10')
+            before = fixtures_pdf.get_fixtures_pdf()
+            with self.captureOnCommitCallbacks(execute=True):
+                self._ingest('2.40')
+        self.assertEqual(apply_async.call_count, 1)
+
+        after = fixtures_pdf.get_fixtures_pdf()
+        self.assertNotEqual(before, after)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'fixtures_pdfs'))),
+                         sorted([os.path.basename(before), os.path.basename(after)]))
+
+    def test_no_fixtures_builds_nothing(self):
+        self.fixture.delete()
+        self.assertIsNone(fixtures_pdf.get_fixtures_pdf())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'fixtures_pdfs')))
+
+    def test_collection_keeps_current_and_recently_served_documents(self):
+        pdf_dir = os.path.join(self.media_root, 'fixtures_pdfs')
+        os.makedirs(pdf_dir)
+        stale = time.time() - 3600
+        paths = {}
+        for name in ('fixtures_20240101_120000.pdf', 'fixtures_old.pdf', 'fixtures_current.pdf',
+                     'fixtures_recent.pdf', 'fixtures_old.pdf.abc.tmp'):
+            paths[name] = os.path.join(pdf_dir, name)
+            open(paths[name], 'wb').close()
+            if name != 'fixtures_recent.pdf':
+                os.utime(paths[name], (stale, stale))
+
+        self.assertEqual(fixtures_pdf.collect_fixtures_pdfs(keep=[paths['fixtures_current.pdf']]), 3)
+        self.assertEqual(sorted(os.listdir(pdf_dir)), ['fixtures_current.pdf', 'fixtures_recent.pdf'])
@@ -0,0 +1,173 @@
+# whatsappcrm_backend/football_data_app/test_live_odds_poller.py
+"""
+Coverage for the long-running live odds poller (live_odds_poller.py): once
+a fixture's market/outcome map is in memory a tick reads nothing back, only
+prices that differ from the stored rows are written -- in one statement per
+table for the whole tick, and only while the fixture is live -- and the
+tick's deltas are published together. A payload that does not fit the map
+falls back to FixtureOddsUpsert, and the poll interval follows the number of
+live fixtures and the request budget.
+"""
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import live_odds_poller, odds_deltas
+from .live_odds_poller import LiveOddsPoller
+from .models import Bookmaker, FootballFixture, League, Market, MarketCategory, MarketOutcome, Team
+from .tasks_api_football_v3 import _process_api_football_v3_live_odds_data, fetch_live_odds_v3_task
+
+
+def _entry(api_fixture_id, home='2.10', draw='3.20', suspended=False, extra_market=False):
+    bets = [{'id': 1, 'name': 'Match Winner', 'values': [
+        {'value': 'Home', 'odd': home, 'suspended': suspended},
+        {'value': 'Draw', 'odd': draw},
+        {'value': 'Away', 'odd': '3.50'},
+    ]}]
+    if extra_market:
+        bets.append({'id': 5, 'name': 'Goals Over/Under', 'values': [{'value': 'Over 2.5', 'odd': '1.90'}]})
+    return {'fixture': {'id': api_fixture_id}, 'odds': [{'id': 8, 'name': 'Bet365', 'bets': bets}]}
+
+
+@patch.object(odds_deltas, 'ODDS_DELTA_STREAM', 'test:football:odds:deltas:{}')
+@patch.object(odds_deltas, 'ODDS_VERSION_KEY', 'test:football:odds:version:{}')
+@patch.object(live_odds_poller, 'LIVE_ODDS_TICK_CHANNEL', 'test:football:odds:live_tick:{}')
+class LiveOddsPollerTests(TestCase):
+
+    def setUp(self):
+        self.redis = get_redis()
+        self.redis.delete(database_key('test:football:odds:deltas:{}'), database_key('test:football:odds:version:{}'))
+        self.addCleanup(self.redis.delete, database_key('test:football:odds:deltas:{}'),
+                        database_key('test:football:odds:version:{}'))
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.fixtures = [
+            FootballFixture.objects.create(
+                league=league, home_team=Team.objects.create(name=f'Home {i}'),
+                away_team=Team.objects.create(name=f'Away {i}'), api_id=f'v3_{500 + i}',
+                match_date=timezone.now() - timedelta(minutes=20), status=FootballFixture.FixtureStatus.LIVE,
+            ) for i in range(2)
+        ]
+        # A pre-match market the live feed no longer lists, so the first tick
+        # cannot use the map and upserts each fixture in full.
+        bookmaker = Bookmaker.objects.create(name='Bet365', api_bookmaker_key='8')
+        category = MarketCategory.objects.create(name='Pre-match special')
+        for fixture in self.fixtures:
+            Market.objects.create(fixture=fixture, bookmaker=bookmaker, category=category,
+                                  api_market_key='bet_99', last_updated_odds_api=timezone.now())
+        self.client = MagicMock()
+        self.poller = LiveOddsPoller(client=self.client)
+        self.client.get_live_odds.return_value = [_entry(500), _entry(501)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.poller.tick().full_upserts, 2)
+
+    def _tick(self, *entries):
+        self.client.get_live_odds.return_value = list(entries)
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            result = self.poller.tick()
+        return result, [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def _fingerprint_updates(self, queries):
+        return [sql for sql in queries if sql.lstrip().startswith(f'UPDATE {Market._meta.db_table}')]
+
+    def test_unchanged_tick_only_checks_fingerprints(self):
+        result, queries = self._tick(_entry(500), _entry(501))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(self._fingerprint_updates(queries)), 1)
+        self.assertEqual((result.fixtures, result.outcomes_updated, result.markets_updated, result.full_upserts),
+                         (2, 0, 0, 0))
+
+    def test_repriced_outcomes_written_in_bulk_and_published_together(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(database_key('test:football:odds:live_tick:{}'))
+        self.addCleanup(pubsub.close)
+        pubsub.get_message(timeout=1)  # the subscribe confirmation
+
+        result, queries = self._tick(_entry(500, home='2.40'), _entry(501, draw='3.00', suspended=True))
+
+        # One UPDATE per price table, plus one refresh of both fixtures' consensus odds.
+        summary = [sql for sql in queries if not sql.lstrip().startswith('UPDATE')]
+        self.assertEqual(len(queries) - len(summary), 2)
+        self.assertEqual(len(summary), 4)
+        self.assertEqual((result.outcomes_updated, result.markets_updated), (3, 2))
+        home = MarketOutcome.objects.get(market__fixture=self.fixtures[0], market__api_market_key='h2h',
+                                         odds=Decimal('2.400'))
+        suspended = MarketOutcome.objects.filter(market__fixture=self.fixtures[1], is_active=False)
+        self.assertEqual(suspended.count(), 1)
+
+        versions = odds_deltas.odds_versions([f.id for f in self.fixtures])
+        deltas = dict((d.fixture_id, d) for _, d in odds_deltas.read_odds_deltas())
+        self.assertEqual(deltas[self.fixtures[0].id].outcomes, {home.id: '2.400'})
+        message = pubsub.get_message(timeout=1)
+        self.assertEqual({int(k): v for k, v in json.loads(message['data']).items()}, versions)
+
+        # The stored fingerprints now match: the same payload again writes nothing.
+        result, queries = self._tick(_entry(500, home='2.40'), _entry(501, draw='3.00', suspended=True))
+        self.assertEqual((len(queries), result.markets_updated, result.deltas), (1, 0, []))
+
+        # And a later full refresh with these prices agrees with the stored fingerprint.
+        market = Market.objects.get(fixture=self.fixtures[0], api_market_key='h2h')
+        stamp = market.last_updated_odds_api
+        _process_api_football_v3_live_odds_data(self.fixtures[0], _entry(500, home='2.40'))
+        market.refresh_from_db()
+        self.assertEqual(market.last_updated_odds_api, stamp)
+
+    def test_new_market_falls_back_to_full_upsert(self):
+        result, _ = self._tick(_entry(500, extra_market=True))
+        self.assertEqual(result.full_upserts, 1)
+        self.assertTrue(Market.objects.filter(fixture=self.fixtures[0], api_market_key='totals').exists())
+
+        result, queries = self._tick(_entry(500, extra_market=True))
+        self.assertEqual((result.full_upserts, result.markets_updated, len(queries)), (0, 0, 1))
+
+    def test_prices_are_compared_with_the_database_not_the_map(self):
+        # Another writer moves the price after the map was loaded...
+        home = MarketOutcome.objects.get(market__fixture=self.fixtures[0], market__api_market_key='h2h',
+                                         outcome_name='Home 0')
+        MarketOutcome.objects.filter(pk=home.pk).update(odds=Decimal('2.500'))
+        Market.objects.filter(pk=home.market_id).update(odds_hash='written elsewhere')
+
+        # ...so a feed back at the price the map remembers is still written.
+        result, _ = self._tick(_entry(500))
+        home.refresh_from_db()
+        self.assertEqual(home.odds, Decimal('2.100'))
+        self.assertEqual((result.markets_updated, result.outcomes_updated), (1, 1))
+        self.assertEqual(result.deltas[0].outcomes, {home.pk: '2.100'})
+
+    def test_fixture_that_is_no_longer_live_is_not_written(self):
+        FootballFixture.objects.filter(pk=self.fixtures[0].pk).update(status=FootballFixture.FixtureStatus.FINISHED)
+        result, _ = self._tick(_entry(500, home='2.40'))
+        self.assertEqual((result.markets_updated, result.outcomes_updated, result.deltas), (0, 0, []))
+        self.assertFalse(MarketOutcome.objects.filter(odds=Decimal('2.400')).exists())
+
+    def test_interval_follows_live_fixtures_and_budget(self):
+        with override_settings(API_FOOTBALL_LIVE_ODDS_MIN_INTERVAL=5, API_FOOTBALL_LIVE_ODDS_MAX_INTERVAL=30,
+                               API_FOOTBALL_LIVE_ODDS_IDLE_INTERVAL=60, API_FOOTBALL_LIVE_ODDS_BUDGET_SHARE=0.25,
+                               API_FOOTBALL_MAX_REQUESTS_PER_MINUTE=300):
+            self.assertEqual(self.poller.next_interval(), 15.0)
+            self.poller._fixtures = {str(i): None for i in range(20)}
+            self.assertEqual(self.poller.next_interval(), 5.0)
+            with override_settings(API_FOOTBALL_MAX_REQUESTS_PER_MINUTE=30):
+                self.assertEqual(self.poller.next_interval(), 8.0)
+            self.poller._fixtures = {}
+            self.assertEqual(self.poller.next_interval(), 60.0)
+
+
+class BeatTaskYieldsToPollerTests(TestCase):
+
+    def test_beat_task_skips_while_poller_heartbeat_is_alive(self):
+        redis = get_redis()
+        with patch.object(live_odds_poller, 'LIVE_ODDS_POLLER_HEARTBEAT_KEY', 'test:football:live_odds:poller'):
+            redis.set('test:football:live_odds:poller', '1', ex=30)
+            self.addCleanup(redis.delete, 'test:football:live_odds:poller')
+            with patch('football_data_app.tasks_api_football_v3.APIFootballV3Client') as client_cls, \
+                    patch.object(FootballFixture.objects, 'filter') as fixture_filter:
+                fetch_live_odds_v3_task()
+        client_cls.assert_not_called()
+        fixture_filter.assert_not_called()
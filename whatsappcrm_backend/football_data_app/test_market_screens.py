@@ -0,0 +1,120 @@
+# whatsappcrm_backend/football_data_app/test_market_screens.py
+"""
+Coverage for the per-fixture market/outcome screen cache (market_screens.py):
+repeat taps on both betting surfaces are served without touching the
+database, a published odds delta replaces only the affected fixture's
+screens, and score or ORM changes drop them.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import bet_flow_handler as H
+from . import betting_ux as ux
+from . import market_screens, odds_deltas
+from .models import Bookmaker, FootballFixture, League, Market, MarketCategory, MarketOutcome, Team
+from .odds_deltas import OddsDelta
+from .score_sweep import apply_score_payload
+
+
+@patch.object(market_screens, 'MARKET_SCREENS_KEY', 'test:football:screens:{}:{}')
+@patch.object(odds_deltas, 'ODDS_DELTA_STREAM', 'test:football:odds:deltas:{}')
+@patch.object(odds_deltas, 'ODDS_VERSION_KEY', 'test:football:odds:version:{}')
+class MarketScreensCacheTests(TestCase):
+
+    def setUp(self):
+        self.redis = get_redis()
+        market_screens._market_fixture_ids.clear()
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        bookmaker = Bookmaker.objects.create(name='Bet365', api_bookmaker_key='8')
+        category = MarketCategory.objects.create(name='Match Winner')
+        self.fixtures, self.markets = [], []
+        for i in range(2):
+            fixture = FootballFixture.objects.create(
+                league=league, home_team=Team.objects.create(name=f'Home {i}'),
+                away_team=Team.objects.create(name=f'Away {i}'), api_id=f'v3_{700 + i}',
+                match_date=timezone.now() + timedelta(hours=2), status=FootballFixture.FixtureStatus.SCHEDULED,
+            )
+            market = Market.objects.create(fixture=fixture, bookmaker=bookmaker, category=category,
+                                           api_market_key='h2h', last_updated_odds_api=timezone.now())
+            for name, odds in (('Home', '2.10'), ('Draw', '3.40'), ('Away', '2.80')):
+                MarketOutcome.objects.create(market=market, outcome_name=name, odds=Decimal(odds))
+            self.fixtures.append(fixture)
+            self.markets.append(market)
+        self.addCleanup(self.redis.delete, database_key('test:football:odds:deltas:{}'),
+                        database_key('test:football:odds:version:{}'),
+                        *(market_screens._key(f.id) for f in self.fixtures))
+
+    def _warm(self):
+        for fixture, market in zip(self.fixtures, self.markets):
+            ux.build_markets_screen(fixture.id)
+            ux.build_outcomes_screen(market.id)
+
+    def test_repeat_taps_served_from_cache(self):
+        self._warm()
+        with self.assertNumQueries(0):
+            markets = ux.build_markets_screen(self.fixtures[0].id)
+            outcomes = ux.build_outcomes_screen(self.markets[0].id)
+            flow_markets = H._markets_screen(self.fixtures[0].id, None)
+            flow_outcomes = H._outcomes_screen(self.markets[0].id, None)
+
+        self.assertEqual(markets['sections'][0]['rows'][0]['id'], f"mk:{self.markets[0].id}")
+        self.assertIn('Home 0 vs Away 0', markets['body'])
+        self.assertEqual([row['title'] for row in outcomes['sections'][0]['rows']], ['Away 0', 'Draw', 'Home 0'])
+        self.assertEqual(flow_markets['data']['fixture_label'], 'Home 0 v Away 0')
+        self.assertEqual(flow_outcomes['data']['market_label'], 'Match Winner')
+
+    def test_odds_delta_replaces_only_that_fixture(self):
+        self._warm()
+        outcome = self.markets[0].outcomes.get(outcome_name='Home')
+        # A bulk write, as ingestion does, so only the delta announces it.
+        MarketOutcome.objects.filter(pk=outcome.pk).update(odds=Decimal('2.50'))
+        odds_deltas.publish_odds_delta(OddsDelta(fixture_id=self.fixtures[0].id, outcomes={outcome.id: '2.500'}))
+
+        with self.assertNumQueries(0):
+            ux.build_outcomes_screen(self.markets[1].id)
+        rows = ux.build_outcomes_screen(self.markets[0].id)['sections'][0]['rows']
+        self.assertIn({'id': f"ou:{outcome.id}", 'title': 'Home 0', 'description': 'Odds 2.50'}, rows)
+
+    def test_score_change_drops_markets_screen(self):
+        self._warm()
+        fixture = self.fixtures[0]
+        FootballFixture.objects.filter(pk=fixture.pk).update(match_date=timezone.now() - timedelta(minutes=30))
+        payload = {fixture.api_id: {'fixture': {'id': 700, 'status': {'short': '1H'}}, 'goals': {'home': 1, 'away': 0}}}
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_score_payload(payload, [fixture.api_id])
+
+        self.assertIn('🔴 LIVE · 1-0', ux.build_markets_screen(fixture.id)['body'])
+        with self.assertNumQueries(0):
+            ux.build_markets_screen(self.fixtures[1].id)
+
+    def test_orm_deactivation_drops_screens(self):
+        self._warm()
+        self.markets[0].is_active = False
+        self.markets[0].save()
+        self.assertIsNone(ux.build_outcomes_screen(self.markets[0].id))
+        self.assertFalse(ux.build_markets_screen(self.fixtures[0].id)['has_markets'])
+
+    def test_outcome_saves_look_their_market_up_once(self):
+        self._warm()
+        outcomes = list(MarketOutcome.objects.filter(market=self.markets[1]))
+        market_screens._market_fixture_ids.clear()
+        with CaptureQueriesContext(connection) as queries:
+            for outcome in outcomes:
+                outcome.odds += Decimal('0.10')
+                outcome.save()
+        market_reads = [q['sql'] for q in queries.captured_queries
+                        if q['sql'].startswith('SELECT') and 'FROM "football_data_app_market"' in q['sql']]
+        self.assertEqual(len(market_reads), 1)
+        self.assertIn('Odds 2.20', str(ux.build_outcomes_screen(self.markets[1].id)))
+
+    def test_redis_down_builds_from_database(self):
+        with patch.object(market_screens, 'get_redis', side_effect=ConnectionError("down")):
+            screen = ux.build_markets_screen(self.fixtures[0].id)
+        self.assertTrue(screen['has_markets'])
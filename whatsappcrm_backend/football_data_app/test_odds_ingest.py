@@ -0,0 +1,169 @@
+# whatsappcrm_backend/football_data_app/test_odds_ingest.py
+"""
+Coverage for the set-based odds upsert (odds_ingest.FixtureOddsUpsert) behind
+_process_api_football_v3_odds_data: the number of statements must not grow
+with the payload, unchanged outcomes must not be rewritten, and the
+preserve-ids / deactivate-don't-delete rules placed bets depend on (see
+test_odds_refresh_preserves_bets.py) must still hold.
+
+Also covers change detection: a refresh that returns the prices we already
+hold must not write anything, and one that does change something publishes
+an OddsDelta and bumps the fixture's odds version.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import odds_deltas
+from .models import Bookmaker, FootballFixture, League, Market, MarketCategory, MarketOutcome, Team
+from .odds_ingest import FixtureOddsUpsert
+from .tasks_api_football_v3 import _process_api_football_v3_odds_data
+
+
+def _payload(bookmakers, markets, home_odd='2.10'):
+    return [{
+        'bookmakers': [{
+            'id': 100 + b,
+            'name': f'Book {b}',
+            'bets': [{
+                'id': 1000 + m,
+                'name': f'Special {m}',
+                'values': [
+                    {'value': 'Yes', 'odd': home_odd},
+                    {'value': 'No', 'odd': '1.70'},
+                ],
+            } for m in range(markets)],
+        } for b in range(bookmakers)],
+    }]
+
+
+class FixtureOddsUpsertTests(TestCase):
+
+    def setUp(self):
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.fixture = FootballFixture.objects.create(
+            league=league, home_team=Team.objects.create(name='Home FC'), away_team=Team.objects.create(name='Away FC'),
+            api_id='v3_2001', match_date=timezone.now() + timedelta(hours=3),
+            status=FootballFixture.FixtureStatus.SCHEDULED,
+        )
+
+    def _refresh(self, payload):
+        fixture = FootballFixture.objects.select_related('home_team', 'away_team').get(pk=self.fixture.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            _process_api_football_v3_odds_data(fixture, payload)
+        return len(ctx.captured_queries)
+
+    def test_statement_count_does_not_grow_with_payload(self):
+        self._refresh(_payload(2, 3))
+        small = self._refresh(_payload(2, 3, home_odd='2.20'))
+        self._refresh(_payload(6, 10))
+        large = self._refresh(_payload(6, 10, home_odd='2.30'))
+        self.assertEqual(small, large)
+        self.assertEqual(MarketOutcome.objects.filter(market__fixture=self.fixture, odds=Decimal('2.30')).count(), 60)
+
+    def test_ids_kept_and_unchanged_outcomes_not_rewritten(self):
+        self._refresh(_payload(1, 2))
+        before = {o.id: o.updated_at for o in MarketOutcome.objects.filter(market__fixture=self.fixture)}
+
+        self._refresh(_payload(1, 2, home_odd='2.50'))
+        after = {o.id: (o.updated_at, o.odds) for o in MarketOutcome.objects.filter(market__fixture=self.fixture)}
+        self.assertEqual(set(before), set(after))
+        for outcome_id, (updated_at, odds) in after.items():
+            if odds == Decimal('2.50'):
+                self.assertGreater(updated_at, before[outcome_id])
+            else:
+                self.assertEqual(updated_at, before[outcome_id])
+
+    def test_dropped_market_and_outcome_deactivated_other_bookmakers_untouched(self):
+        other = Bookmaker.objects.create(name='Other', api_bookmaker_key='other')
+        category = MarketCategory.objects.create(name='Match Winner')
+        other_market = Market.objects.create(fixture=self.fixture, bookmaker=other, category=category,
+                                             api_market_key='h2h', last_updated_odds_api=timezone.now())
+        self._refresh(_payload(1, 2))
+        self._refresh([{'bookmakers': [{'id': 100, 'name': 'Book 0', 'bets': [
+            {'id': 1000, 'name': 'Special 0', 'values': [{'value': 'Yes', 'odd': '2.10'}]},
+        ]}]}])
+
+        markets = {m.api_market_key: m.is_active for m in Market.objects.filter(fixture=self.fixture, bookmaker__api_bookmaker_key='100')}
+        self.assertEqual(markets, {'bet_1000': True, 'bet_1001': False})
+        outcomes = dict(MarketOutcome.objects.filter(market__api_market_key='bet_1000').values_list('outcome_name', 'is_active'))
+        self.assertEqual(outcomes, {'Yes': True, 'No': False})
+        other_market.refresh_from_db()
+        self.assertTrue(other_market.is_active)
+
+    def test_duplicate_rows_keep_lowest_id(self):
+        bookmaker = Bookmaker.objects.create(name='Book 0', api_bookmaker_key='100')
+        category = MarketCategory.objects.create(name='Special 0')
+        market = Market.objects.create(fixture=self.fixture, bookmaker=bookmaker, category=category,
+                                       api_market_key='bet_1000', last_updated_odds_api=timezone.now())
+        first = MarketOutcome.objects.create(market=market, outcome_name='Yes', odds=Decimal('1.50'))
+        duplicate = MarketOutcome.objects.create(market=market, outcome_name='Yes', odds=Decimal('1.50'))
+
+        upsert = FixtureOddsUpsert(self.fixture)
+        upsert.add_bookmaker('100', 'Book 0')
+        pending = upsert.add_market('100', 'Special 0', 'bet_1000')
+        upsert.add_outcome(pending, 'Yes', None, Decimal('1.90'))
+        result = upsert.apply()
+
+        first.refresh_from_db()
+        duplicate.refresh_from_db()
+        self.assertEqual((first.odds, first.is_active), (Decimal('1.90'), True))
+        self.assertFalse(duplicate.is_active)
+        self.assertEqual((result.outcomes_updated, result.outcomes_deactivated), (1, 1))
+
+
+@patch.object(odds_deltas, 'ODDS_DELTA_STREAM', 'test:football:odds:deltas:{}')
+@patch.object(odds_deltas, 'ODDS_VERSION_KEY', 'test:football:odds:version:{}')
+class OddsChangeDetectionTests(TestCase):
+
+    def setUp(self):
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.fixture = FootballFixture.objects.create(
+            league=league, home_team=Team.objects.create(name='Home FC'), away_team=Team.objects.create(name='Away FC'),
+            api_id='v3_2002', match_date=timezone.now() + timedelta(hours=3),
+            status=FootballFixture.FixtureStatus.SCHEDULED,
+        )
+        self.redis = get_redis()
+        self.redis.delete(database_key('test:football:odds:deltas:{}'), database_key('test:football:odds:version:{}'))
+        self.addCleanup(self.redis.delete, database_key('test:football:odds:deltas:{}'),
+                        database_key('test:football:odds:version:{}'))
+
+    def _refresh(self, payload):
+        fixture = FootballFixture.objects.select_related('home_team', 'away_team').get(pk=self.fixture.pk)
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            _process_api_football_v3_odds_data(fixture, payload)
+        return [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def test_identical_refresh_writes_nothing(self):
+        self._refresh(_payload(3, 5))
+        version = odds_deltas.odds_version(self.fixture.id)
+        self.assertNotEqual(version, '0')
+        market_stamps = dict(Market.objects.values_list('id', 'last_updated_odds_api'))
+
+        # Same prices, different string form: still unchanged.
+        queries = self._refresh(_payload(3, 5, home_odd='2.100'))
+        self.assertFalse([sql for sql in queries if not sql.startswith('SELECT')])
+        self.assertEqual(dict(Market.objects.values_list('id', 'last_updated_odds_api')), market_stamps)
+        self.assertEqual(odds_deltas.odds_version(self.fixture.id), version)
+        self.assertEqual(self.redis.xlen(database_key('test:football:odds:deltas:{}')), 1)
+
+    def test_changed_market_publishes_delta(self):
+        self._refresh(_payload(1, 2))
+        first_version = odds_deltas.odds_version(self.fixture.id)
+        changed = _payload(1, 2)
+        changed[0]['bookmakers'][0]['bets'][1]['values'][0]['odd'] = '2.40'
+        self._refresh(changed)
+
+        (stream_id, delta), = odds_deltas.read_odds_deltas(after=first_version)
+        repriced = MarketOutcome.objects.get(market__api_market_key='bet_1001', outcome_name='Yes')
+        self.assertEqual(delta.fixture_id, self.fixture.id)
+        self.assertEqual(delta.markets, [repriced.market_id])
+        self.assertEqual(delta.outcomes, {repriced.id: '2.400'})
+        self.assertEqual(odds_deltas.odds_version(self.fixture.id), stream_id)
+        self.assertGreater(stream_id, first_version)
@@ -0,0 +1,92 @@
+# whatsappcrm_backend/football_data_app/test_odds_summary.py
+"""
+Coverage for the consensus-odds projection (odds_summary.py): ingestion keeps
+FixtureOddsSummary current, the text fixture list reads it in a number of
+queries that does not grow with the number of bookmakers, and ORM edits fall
+back to an in-memory summary until the next refresh.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import FixtureOddsSummary, FootballFixture, League, MarketOutcome, Team
+from .odds_summary import consensus_outcomes, refresh_odds_summaries
+from .tasks_api_football_v3 import _process_api_football_v3_odds_data
+from .utils import get_formatted_football_data
+
+
+def _payload(yes_odds):
+    return [{'bookmakers': [{
+        'id': 100 + b, 'name': f'Book {b}',
+        'bets': [{'id': 8, 'name': 'Both Teams Score', 'values': [
+            {'value': 'Yes', 'odd': odd}, {'value': 'No', 'odd': '1.70'},
+        ]}],
+    } for b, odd in enumerate(yes_odds)]}]
+
+
+class FixtureOddsSummaryTests(TestCase):
+
+    def setUp(self):
+        self.league = League.objects.create(name='EPL', api_id='epl', sport_key='soccer')
+        self.fixture = self._fixture('v3_3001')
+
+    def _fixture(self, api_id):
+        return FootballFixture.objects.create(
+            league=self.league, home_team=Team.objects.create(name=f'Home {api_id}'),
+            away_team=Team.objects.create(name=f'Away {api_id}'), api_id=api_id,
+            match_date=timezone.now() + timedelta(hours=3), status=FootballFixture.FixtureStatus.SCHEDULED,
+        )
+
+    def _ingest(self, fixture, yes_odds):
+        fixture = FootballFixture.objects.select_related('home_team', 'away_team').get(pk=fixture.pk)
+        _process_api_football_v3_odds_data(fixture, _payload(yes_odds))
+
+    def test_ingestion_maintains_consensus_and_best_odds(self):
+        self._ingest(self.fixture, ['2.00', '2.10', '5.00'])
+        summary = FixtureOddsSummary.objects.get(fixture=self.fixture, outcome_name='Yes')
+        self.assertEqual((summary.consensus_odds, summary.median_odds, summary.best_odds, summary.bookmaker_count),
+                         (Decimal('2.100'), Decimal('2.100'), Decimal('5.000'), 3))
+        self.assertEqual(summary.consensus_outcome.odds, Decimal('2.100'))
+
+        self._ingest(self.fixture, ['2.00', '2.40', '5.00'])
+        summary = FixtureOddsSummary.objects.get(fixture=self.fixture, outcome_name='Yes')
+        self.assertEqual(summary.consensus_odds, Decimal('2.400'))
+        self.assertEqual(FixtureOddsSummary.objects.filter(fixture=self.fixture).count(), 2)
+
+    def test_fixture_list_queries_do_not_grow_with_bookmakers(self):
+        self._ingest(self.fixture, ['2.00', '2.10'])
+        with CaptureQueriesContext(connection) as small:
+            get_formatted_football_data('scheduled_fixtures', league_code='epl', days_ahead=2)
+
+        self._ingest(self._fixture('v3_3002'), ['1.90', '2.00', '2.05', '2.10', '2.20', '2.30', '2.40', '2.50'])
+        with CaptureQueriesContext(connection) as large:
+            result = get_formatted_football_data('scheduled_fixtures', league_code='epl', days_ahead=2)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        consensus = FixtureOddsSummary.objects.get(fixture=self.fixture, outcome_name='Yes')
+        self.assertIn(f"Yes: *2.00* (ID: {consensus.consensus_outcome_id})", ' '.join(result))
+
+    def test_orm_edit_served_in_memory_until_next_refresh(self):
+        self._ingest(self.fixture, ['2.00', '2.10', '5.00'])
+        for outcome in MarketOutcome.objects.filter(market__fixture=self.fixture, outcome_name='Yes'):
+            outcome.odds = Decimal('3.00')
+            outcome.save()
+
+        self.assertFalse(FixtureOddsSummary.objects.filter(fixture=self.fixture).exists())
+        lines = consensus_outcomes([self.fixture.id])[self.fixture.id]
+        self.assertEqual(lines[next(iter(lines))]['Yes-'].odds, Decimal('3.000'))
+        self.assertEqual(consensus_outcomes([self.fixture.id], max_odds=2.5)[self.fixture.id][next(iter(lines))].keys(),
+                         {'No-'})
+
+    def test_refresh_reads_prices_after_taking_the_fixture_lock(self):
+        self._ingest(self.fixture, ['2.00', '2.10'])
+        with CaptureQueriesContext(connection) as ctx:
+            refresh_odds_summaries([self.fixture.id])
+        sql = [q['sql'] for q in ctx.captured_queries]
+        lock = next(i for i, q in enumerate(sql) if 'FOR UPDATE' in q)
+        read = next(i for i, q in enumerate(sql) if q.startswith('SELECT') and MarketOutcome._meta.db_table in q)
+        self.assertLess(lock, read)
@@ -0,0 +1,109 @@
+# whatsappcrm_backend/football_data_app/test_rate_limiter.py
+"""
+Coverage for the Redis GCRA rate limiter (rate_limiter.py): the limit is
+shared through Redis rather than per process, lower-priority lanes stop
+short of the burst so live odds keep headroom, and a caller with no slot
+gets a retry time instead of sleeping in the worker.
+"""
+from unittest.mock import patch
+
+from celery.exceptions import Retry
+from django.test import SimpleTestCase, TestCase
+
+from whatsappcrm_backend.redis_client import get_redis
+from . import rate_limiter
+from .api_football_v3_client import APIFootballV3Client
+from .models import FootballFixture, League, Team
+from .rate_limiter import (
+    APIFootballRateLimiter, LANE_LEAGUES, LANE_LIVE_ODDS, LANE_PREMATCH_ODDS, RateLimitExceeded,
+)
+from .tasks_api_football_v3 import fetch_scores_for_league_v3_task
+
+
+class _RedisKeysMixin:
+    def setUp(self):
+        super().setUp()
+        patcher_tat = patch.object(rate_limiter, 'RATE_LIMIT_TAT_KEY', 'test:api_football:gcra:tat')
+        patcher_stats = patch.object(rate_limiter, 'RATE_LIMIT_STATS_KEY', 'test:api_football:gcra:stats')
+        patcher_tat.start()
+        patcher_stats.start()
+        self.addCleanup(patcher_tat.stop)
+        self.addCleanup(patcher_stats.stop)
+        self.redis = get_redis()
+        self.redis.delete('test:api_football:gcra:tat', 'test:api_football:gcra:stats')
+        self.addCleanup(self.redis.delete, 'test:api_football:gcra:tat', 'test:api_football:gcra:stats')
+
+
+class GCRALimiterTests(_RedisKeysMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # One request per second, burst of 4.
+        self.limiter = APIFootballRateLimiter(max_requests=60, burst=4)
+
+    def test_lanes_share_of_burst(self):
+        self.assertEqual(self.limiter.try_acquire(LANE_LEAGUES), 0.0)
+        self.assertAlmostEqual(self.limiter.try_acquire(LANE_LEAGUES), 1.0, delta=0.05)
+        self.assertEqual(self.limiter.try_acquire(LANE_PREMATCH_ODDS), 0.0)
+        self.assertGreater(self.limiter.try_acquire(LANE_PREMATCH_ODDS), 0)
+        # Live odds still find the rest of the burst.
+        self.assertEqual([self.limiter.try_acquire(LANE_LIVE_ODDS) for _ in range(2)], [0.0, 0.0])
+        self.assertAlmostEqual(self.limiter.try_acquire(LANE_LIVE_ODDS), 1.0, delta=0.05)
+
+        usage = self.limiter.get_current_usage()
+        self.assertEqual(usage['lanes'][LANE_LIVE_ODDS], {'admitted': 2, 'deferred': 1, 'headroom': 0})
+        self.assertEqual(usage['lanes'][LANE_LEAGUES]['deferred'], 1)
+
+    def test_limit_is_shared_between_limiter_instances(self):
+        other = APIFootballRateLimiter(max_requests=60, burst=4)
+        self.assertEqual(self.limiter.try_acquire(LANE_LEAGUES), 0.0)
+        self.assertGreater(other.try_acquire(LANE_LEAGUES), 0)
+
+    def test_acquire_raises_with_next_slot_instead_of_sleeping(self):
+        self.limiter.acquire(LANE_LEAGUES)
+        with patch.object(rate_limiter.time, 'sleep') as sleep, self.assertRaises(RateLimitExceeded) as ctx:
+            self.limiter.acquire(LANE_LEAGUES, max_wait=0.5)
+        sleep.assert_not_called()
+        self.assertEqual(ctx.exception.lane, LANE_LEAGUES)
+        self.assertAlmostEqual(ctx.exception.retry_after, 1.0, delta=0.05)
+        self.assertEqual(ctx.exception.countdown, 1)
+
+    def test_rate_that_does_not_divide_a_minute(self):
+        # 450/min gives a fractional emission interval (133.3ms).
+        limiter = APIFootballRateLimiter(max_requests=450, burst=4)
+        with patch.object(rate_limiter.logger, 'error') as error:
+            self.assertEqual([limiter.try_acquire(LANE_LIVE_ODDS) for _ in range(4)], [0.0] * 4)
+            self.assertGreater(limiter.try_acquire(LANE_LIVE_ODDS), 0)
+        error.assert_not_called()
+
+    def test_redis_down_lets_requests_through(self):
+        with patch.object(rate_limiter, 'get_redis', side_effect=ConnectionError("down")):
+            self.assertEqual(self.limiter.try_acquire(LANE_LEAGUES), 0.0)
+
+
+class RateLimitedCallerTests(TestCase):
+
+    def test_client_uses_live_lane_for_live_odds(self):
+        client = APIFootballV3Client(api_key='x', lane=LANE_LEAGUES)
+        limiter = rate_limiter.APIFootballRateLimiter()
+        with patch('football_data_app.api_football_v3_client.RESPONSE_CACHE_KEY', 'test:api_football:resp:{}'), \
+                patch.object(rate_limiter, '_rate_limiter', limiter), \
+                patch.object(limiter, 'acquire', side_effect=RateLimitExceeded(retry_after=3, lane=LANE_LIVE_ODDS)) as acquire, \
+                patch('football_data_app.api_football_v3_client.requests.Session.get') as get, \
+                self.assertRaises(RateLimitExceeded):
+            client.get_live_odds()
+        acquire.assert_called_once_with(lane=LANE_LIVE_ODDS)
+        get.assert_not_called()
+
+    def test_scores_task_reschedules_with_countdown(self):
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        FootballFixture.objects.create(
+            league=league, home_team=Team.objects.create(name='A'), away_team=Team.objects.create(name='B'),
+            api_id='v3_77', status=FootballFixture.FixtureStatus.LIVE,
+        )
+        with patch('football_data_app.tasks_api_football_v3.APIFootballV3Client') as client_cls, \
+                patch.object(fetch_scores_for_league_v3_task, 'retry', side_effect=Retry()) as retry:
+            client_cls.return_value.get_live_fixtures.side_effect = RateLimitExceeded(retry_after=4.2)
+            with self.assertRaises(Retry):
+                fetch_scores_for_league_v3_task.run(league.id)
+        self.assertEqual(retry.call_args.kwargs['countdown'], 5)
@@ -0,0 +1,125 @@
+# whatsappcrm_backend/football_data_app/test_score_sweep.py
+"""
+Coverage for the shared score sweep (score_sweep.py) behind
+run_score_and_settlement_v3_task: the live feed is fetched once for every
+league, waiting fixtures missing from it are fetched by id in batches, the
+writes do not grow with the number of fixtures, and settlement is enqueued
+only for fixtures that flipped to FINISHED.
+"""
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import score_sweep
+from .models import FootballFixture, League, Team
+from .tasks_api_football_v3 import run_score_and_settlement_v3_task
+
+
+def _item(api_fixture_id, short, home=None, away=None):
+    return {'fixture': {'id': api_fixture_id, 'status': {'short': short}}, 'goals': {'home': home, 'away': away}}
+
+
+@patch('football_data_app.tasks_apifootball.settle_fixture_pipeline_task')
+class ScoreSweepTests(TestCase):
+
+    def setUp(self):
+        self.leagues = [League.objects.create(name=f'L{i}', api_id=f'v3_{i}', sport_key='soccer', active=True)
+                        for i in range(3)]
+        self.kicked_off = timezone.now() - timedelta(minutes=30)
+
+    def _fixture(self, api_fixture_id, league=None, status=FootballFixture.FixtureStatus.LIVE, match_date=None):
+        return FootballFixture.objects.create(
+            league=league or self.leagues[0],
+            home_team=Team.objects.create(name=f'H{api_fixture_id}'),
+            away_team=Team.objects.create(name=f'A{api_fixture_id}'),
+            api_id=f'v3_{api_fixture_id}', status=status, match_date=match_date or self.kicked_off,
+        )
+
+    def test_one_live_fetch_for_every_league(self, mock_settle):
+        live = self._fixture(1, self.leagues[0])
+        finished = self._fixture(2, self.leagues[1])
+        untouched = self._fixture(3, self.leagues[2])
+        client = MagicMock()
+        client.get_live_fixtures.return_value = [_item(1, '2H', 1, 0), _item(3, '1H', 0, 0), _item(999, '1H', 4, 4)]
+        client.get_fixtures.return_value = [_item(2, 'FT', 2, 2)]
+        untouched.home_team_score = untouched.away_team_score = 0
+        untouched.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = score_sweep.sweep_scores(client)
+
+        client.get_live_fixtures.assert_called_once_with()
+        client.get_fixtures.assert_called_once_with(ids=[2])
+        self.assertEqual((result.checked, result.updated, result.finished), (3, 2, [finished.id]))
+        live.refresh_from_db()
+        finished.refresh_from_db()
+        self.assertEqual((live.home_team_score, live.away_team_score, live.status), (1, 0, 'LIVE'))
+        self.assertEqual((finished.home_team_score, finished.status), (2, 'FINISHED'))
+        mock_settle.delay.assert_called_once_with(finished.id)
+
+    def test_missing_fixtures_fetched_by_id_in_batches(self, mock_settle):
+        for i in range(45):
+            self._fixture(100 + i, status=FootballFixture.FixtureStatus.SCHEDULED)
+        client = MagicMock()
+        client.get_live_fixtures.return_value = []
+        client.get_fixtures.return_value = []
+
+        score_sweep.sweep_scores(client)
+
+        batches = [call.kwargs['ids'] for call in client.get_fixtures.call_args_list]
+        self.assertEqual([len(b) for b in batches], [20, 20, 5])
+        self.assertEqual(sorted(sum(batches, [])), list(range(100, 145)))
+
+    def test_statement_count_does_not_grow_with_fixtures(self, mock_settle):
+        def measure(start, n):
+            for i in range(n):
+                self._fixture(start + i)
+            client = MagicMock()
+            client.get_live_fixtures.return_value = [_item(start + i, 'FT', 1, 0) for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                score_sweep.sweep_scores(client)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(measure(200, 2), measure(300, 25))
+        self.assertEqual(mock_settle.delay.call_count, 27)
+
+    def test_finished_fixture_is_not_settled_again(self, mock_settle):
+        fixture = self._fixture(4)
+        client = MagicMock()
+        client.get_live_fixtures.return_value = [_item(4, 'FT', 0, 1)]
+        with self.captureOnCommitCallbacks(execute=True):
+            score_sweep.sweep_scores(client)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = score_sweep.sweep_scores(client)
+        self.assertEqual(result.updated, 0)
+        mock_settle.delay.assert_called_once_with(fixture.id)
+
+    def test_stale_fixture_assumed_finished(self, mock_settle):
+        stale = self._fixture(5, match_date=timezone.now() - timedelta(hours=5))
+        recent = self._fixture(6)
+        client = MagicMock()
+        client.get_live_fixtures.return_value = []
+        client.get_fixtures.return_value = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = score_sweep.sweep_scores(client)
+
+        self.assertEqual(result.assumed_finished, [stale.id])
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, stale.home_team_score, stale.away_team_score), ('FINISHED', 0, 0))
+        self.assertEqual(recent.status, 'LIVE')
+        mock_settle.delay.assert_called_once_with(stale.id)
+
+    def test_entry_task_sweeps_instead_of_fanning_out(self, mock_settle):
+        self._fixture(7)
+        with patch('football_data_app.tasks_api_football_v3.APIFootballV3Client') as client_cls, \
+                patch('football_data_app.tasks_api_football_v3.group') as group:
+            client_cls.return_value.get_live_fixtures.return_value = [_item(7, 'HT', 1, 1)]
+            run_score_and_settlement_v3_task.run()
+        group.assert_not_called()
+        client_cls.return_value.get_live_fixtures.assert_called_once_with()
@@ -0,0 +1,210 @@
+# whatsappcrm_backend/football_data_app/test_settlement_engine.py
+"""
+Coverage for the set-based settlement engine (settlement.py) behind the
+settle_*_for_fixture tasks: every supported market key resolves from the
+full-time score, markets it cannot resolve stay PENDING instead of being
+marked LOST, and a batch of tickets settles in a fixed number of statements
+with one wallet credit per user -- paying exactly what settle_ticket() pays.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from conversations.models import Contact, Message
+from customer_data.models import Bet, BetTicket, CustomerProfile, UserWallet, WalletTransaction
+from meta_integration.models import MetaAppConfig
+from referrals.models import AgentDeduction, ReferralSettings
+from referrals.utils import get_or_create_referral_profile
+from . import settlement
+from .models import Bookmaker, FootballFixture, League, Market, MarketCategory, MarketOutcome, Team
+from .settlement import outcome_result
+from .tasks import send_bet_ticket_settlement_notifications_task
+
+
+class OutcomeResultTests(SimpleTestCase):
+    """Outcome results for a 2-1 home win, per market key."""
+
+    def _result(self, key, name, point=None, home=2, away=1):
+        return outcome_result(key, name, point, home, away, 'Home FC', 'Away FC')
+
+    def test_full_time_markets(self):
+        cases = [
+            ('h2h', 'Home FC', None, 'WON'), ('h2h', 'Draw', None, 'LOST'), ('h2h', 'Away', None, 'LOST'),
+            ('double_chance', 'Home/Draw', None, 'WON'), ('double_chance', 'Draw/Away', None, 'LOST'),
+            ('double_chance', '12', None, 'WON'),
+            ('draw_no_bet', 'Home FC', None, 'WON'), ('draw_no_bet', 'Away FC', None, 'LOST'),
+            ('totals', 'Over', 2.5, 'WON'), ('totals', 'Under', 2.5, 'LOST'), ('totals', 'Over', 3.0, 'PUSH'),
+            ('handicap', 'Home FC', -1.0, 'PUSH'), ('handicap', 'Home FC', -1.5, 'LOST'),
+            ('handicap', 'Away FC', 1.5, 'WON'),
+            ('btts', 'Yes', None, 'WON'), ('btts', 'No', None, 'LOST'),
+            ('odd_even', 'Odd', None, 'WON'), ('odd_even', 'Even', None, 'LOST'),
+            ('correct_score', '2:1', None, 'WON'), ('correct_score', '1-1', None, 'LOST'),
+        ]
+        for key, name, point, expected in cases:
+            with self.subTest(key=key, name=name, point=point):
+                self.assertEqual(self._result(key, name, point), expected)
+
+    def test_draw_pushes_draw_no_bet(self):
+        self.assertEqual(self._result('draw_no_bet', 'Home FC', home=1, away=1), 'PUSH')
+
+    def test_quarter_lines(self):
+        self.assertEqual(self._result('handicap', 'Home FC', -0.75, home=3, away=1), 'WON')
+        self.assertEqual(self._result('totals', 'Under', 3.75), 'WON')
+        # Half won / half pushed cannot be expressed as one result status.
+        self.assertIsNone(self._result('handicap', 'Home FC', -1.25))
+
+    def test_unresolvable_markets(self):
+        self.assertIsNone(self._result('totals_1h', 'Over', 0.5))
+        self.assertIsNone(self._result('handicap_2h', 'Home FC', -0.5))
+        self.assertIsNone(self._result('bet_99', 'Yes'))
+
+
+@patch('football_data_app.tasks.send_bet_ticket_settlement_notifications_task')
+class FixtureSettlementTests(TestCase):
+
+    def setUp(self):
+        league = League.objects.create(name='EPL', api_id='v3_39', sport_key='soccer')
+        self.fixture = FootballFixture.objects.create(
+            league=league, home_team=Team.objects.create(name='Home FC'), away_team=Team.objects.create(name='Away FC'),
+            api_id='v3_settle_engine', match_date=timezone.now() - timedelta(hours=2),
+            status=FootballFixture.FixtureStatus.FINISHED, home_team_score=2, away_team_score=1,
+        )
+        self.bookmaker = Bookmaker.objects.create(name='bet365', api_bookmaker_key='8')
+        self.home_win = self._make_outcome('h2h', 'Home FC', odds='2.00')
+        self.away_win = self._make_outcome('h2h', 'Away FC', odds='3.00')
+        self.over = self._make_outcome('totals', 'Over', point=2.5, odds='1.50')
+        self.total_push = self._make_outcome('totals', 'Over', point=3.0, odds='2.00')
+        self.first_half = self._make_outcome('totals_1h', 'Over', point=0.5, odds='1.40')
+
+    def _make_outcome(self, key, name, point=None, odds='2.00'):
+        category, _ = MarketCategory.objects.get_or_create(name=key)
+        market, _ = Market.objects.get_or_create(
+            fixture=self.fixture, bookmaker=self.bookmaker, api_market_key=key,
+            defaults={'category': category, 'last_updated_odds_api': timezone.now()})
+        return MarketOutcome.objects.create(market=market, outcome_name=name, point_value=point, odds=Decimal(odds))
+
+    def _ticket(self, user, stake, *outcomes):
+        ticket = BetTicket.objects.create(user=user, total_stake=Decimal(stake), status='PENDING')
+        for outcome in outcomes:
+            Bet.objects.create(ticket=ticket, market_outcome=outcome, amount=Decimal(stake),
+                               potential_winnings=Decimal(stake) * outcome.odds)
+        return ticket
+
+    def _user(self, name):
+        user = User.objects.create_user(name)
+        UserWallet.objects.filter(user=user).update(balance=Decimal('0.00'))
+        return user
+
+    def _settle(self):
+        settlement.settle_fixture_outcomes(self.fixture)
+        settlement.settle_bets(self.fixture.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            return settlement.settle_tickets(settlement.pending_ticket_ids_for_fixture(self.fixture.id))
+
+    def test_outcomes_and_bets_resolved_in_one_pass(self, mock_notify):
+        counts = settlement.settle_fixture_outcomes(self.fixture)
+        self.assertEqual(counts, {'WON': 2, 'LOST': 1, 'PUSH': 1, 'unresolved': 1})
+        self.first_half.refresh_from_db()
+        self.assertEqual(self.first_half.result_status, 'PENDING')
+
+        user = self._user('bets')
+        pushed = self._ticket(user, '5.00', self.total_push)
+        self.assertEqual(settlement.settle_bets(self.fixture.id), {pushed.id})
+        self.assertEqual(pushed.bets.get().status, Bet.BetStatus.PUSH)
+
+    def test_batch_credits_each_user_once(self, mock_notify):
+        alice, bob = self._user('alice'), self._user('bob')
+        won_single = self._ticket(alice, '10.00', self.home_win)             # 10 * 2.00
+        won_double = self._ticket(alice, '4.00', self.home_win, self.over)   # 4 * 2.00 * 1.50
+        refunded = self._ticket(alice, '3.00', self.total_push)
+        lost = self._ticket(bob, '7.00', self.away_win)
+        waiting = self._ticket(bob, '2.00', self.home_win, self.first_half)
+
+        result = self._settle()
+
+        self.assertEqual((result.won, result.lost, result.refunded, result.waiting), (2, 1, 1, 1))
+        statuses = dict(BetTicket.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {won_single.id: 'WON', won_double.id: 'WON', refunded.id: 'REFUNDED',
+                                    lost.id: 'LOST', waiting.id: 'PENDING'})
+        alice.wallet.refresh_from_db()
+        bob.wallet.refresh_from_db()
+        self.assertEqual(alice.wallet.balance, Decimal('35.00'))
+        self.assertEqual(bob.wallet.balance, Decimal('0.00'))
+        transactions = {t.transaction_type: t.amount for t in WalletTransaction.objects.filter(wallet=alice.wallet)}
+        self.assertEqual(transactions, {'BET_WON': Decimal('32.00'), 'BET_REFUNDED': Decimal('3.00')})
+        # One notification task for the whole batch.
+        mock_notify.delay.assert_called_once()
+        self.assertEqual(sorted(mock_notify.delay.call_args.args[0]), sorted([
+            [won_single.id, 'WON', '20.00'], [won_double.id, 'WON', '12.00'],
+            [refunded.id, 'REFUNDED', '3.00'], [lost.id, 'LOST', '0.00'],
+        ]))
+
+        # Re-running the batch settles nothing twice.
+        self._settle()
+        alice.wallet.refresh_from_db()
+        self.assertEqual(alice.wallet.balance, Decimal('35.00'))
+
+    def test_statement_count_does_not_grow_with_tickets(self, mock_notify):
+        settlement.settle_fixture_outcomes(self.fixture)
+
+        def measure(prefix, n):
+            ids = [self._ticket(self._user(f'{prefix}{i}'), '1.00', self.home_win if i % 2 else self.away_win).id
+                   for i in range(n)]
+            settlement.settle_bets(self.fixture.id)
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                settlement.settle_tickets(ids)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(measure('small', 2), measure('large', 30))
+
+    @patch('referrals.utils.send_bonus_notification_task')
+    def test_agent_win_deduction_still_applied(self, mock_bonus, mock_notify):
+        agent, player = self._user('agent'), self._user('player')
+        agent_profile = get_or_create_referral_profile(agent)
+        agent_profile.is_agent = True
+        agent_profile.save(update_fields=['is_agent'])
+        player_profile = get_or_create_referral_profile(player)
+        player_profile.referred_by = agent
+        player_profile.save(update_fields=['referred_by'])
+        referral_settings = ReferralSettings.load()
+        referral_settings.agent_win_deduction_percentage = Decimal('0.2500')
+        referral_settings.save()
+
+        ticket = self._ticket(player, '10.00', self.home_win)
+        self._settle()
+
+        self.assertEqual(AgentDeduction.objects.get(bet_ticket=ticket).deduction_amount, Decimal('5.00'))
+        agent.wallet.refresh_from_db()
+        self.assertEqual(agent.wallet.balance, Decimal('-5.00'))
+
+
+class SettlementNotificationTests(TestCase):
+
+    @patch('meta_integration.sender.queue_outgoing_messages')
+    def test_notifications_are_saved_and_queued_per_config(self, queue):
+        config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+        tickets = []
+        for i in range(2):
+            user = User.objects.create_user(f'notify{i}')
+            contact = Contact.objects.create(whatsapp_id=f'26377111000{i}', associated_app_config=config)
+            CustomerProfile.objects.create(user=user, contact=contact)
+            tickets.append(BetTicket.objects.create(user=user, total_stake=Decimal('5.00'), status='WON'))
+
+        send_bet_ticket_settlement_notifications_task.apply(args=[[
+            [tickets[0].id, 'WON', '10.00'], [tickets[1].id, 'LOST', '0.00'], [999999, 'WON', '1.00'],
+        ]])
+
+        messages = list(Message.objects.filter(direction='out').order_by('id'))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual({m.status for m in messages}, {'pending_dispatch'})
+        self.assertIn('Amount Won: $10.00', messages[0].text_content)
+        queue.assert_called_once_with([m.id for m in messages], config.id)
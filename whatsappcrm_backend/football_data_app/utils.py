@@ -2,9 +2,8 @@
 
 import re
 import logging
-import statistics
 from django.db import transaction
-from django.db.models import Q, Prefetch
+from django.db.models import Q
 from django.apps import apps
 from django.utils import timezone
 from datetime import timedelta
@@ -28,7 +27,6 @@ MAX_CORRECT_SCORES_TO_DISPLAY = 4  # Maximum correct score options to show per f
 # PDF generation constants
 FIXTURES_PER_PAGE = 6  # Number of fixtures per PDF page before page break
 MAX_FIXTURES_IN_PDF = 150  # Maximum number of fixtures to include in a single PDF (increased for 10-day coverage)
-MAX_BOOKMAKERS = 3  # Maximum number of bookmakers to include in odds (to limit data volume)
 
 
 def upsert_market_outcome(market, outcome_name, point_value, odds, is_active=True):
@@ -175,7 +173,8 @@ def get_formatted_football_data(
     This function now returns a list of strings (message parts) OR None if no data is found.
     """
     # --- Local Import to Prevent Circular Dependency ---
-    from football_data_app.models import FootballFixture, MarketOutcome, Market
+    from football_data_app.models import FootballFixture, MarketOutcome
+    from football_data_app.odds_summary import consensus_outcomes
 
     logger.info(f"Function Call: get_formatted_football_data(data_type='{data_type}', league_code='{league_code}', days_ahead={days_ahead}, days_past={days_past})")
 
@@ -197,10 +196,7 @@ def get_formatted_football_data(
         fixtures_qs = FootballFixture.objects.filter(
             Q(status=FootballFixture.FixtureStatus.SCHEDULED, match_date__gte=start_date, match_date__lte=end_date) |
             Q(status=FootballFixture.FixtureStatus.LIVE)
-        ).select_related('home_team', 'away_team', 'league').prefetch_related(
-            Prefetch('markets', queryset=Market.objects.filter(is_active=True)),
-            Prefetch('markets__outcomes', queryset=MarketOutcome.objects.filter(is_active=True))
-        ).order_by('match_date')
+        ).select_related('home_team', 'away_team', 'league').order_by('match_date')
 
 
         if league_code:
@@ -224,7 +220,12 @@ def get_formatted_football_data(
                 match_time_local = timezone.localtime(fixture.match_date)
                 return match_time_local.strftime('%a, %b %d - %I:%M %p')
 
-        for fixture in fixtures_qs[:num_fixtures_to_display]:
+        fixtures_to_display = list(fixtures_qs[:num_fixtures_to_display])
+        # Consensus (median) odds per outcome line across bookmakers, maintained
+        # by the odds pipelines -- see odds_summary.py.
+        consensus_by_fixture = consensus_outcomes([fixture.id for fixture in fixtures_to_display])
+
+        for fixture in fixtures_to_display:
             time_str = format_match_time(fixture)
 
             line = f"\n🏆 *{fixture.league.name}* (ID: {fixture.id})"
@@ -235,48 +236,9 @@ def get_formatted_football_data(
             else:
                 line += f"\n{fixture.home_team.name} vs {fixture.away_team.name}"
 
-            # Collect all odds for each outcome across bookmakers
-            # We'll use median odds instead of highest odds for more realistic pricing
-            odds_by_outcome: Dict[str, Dict[str, List[MarketOutcome]]] = {}
-            markets_list = list(fixture.markets.all())
-            
-            # Count total outcomes from all markets (used for diagnostic logging)
-            total_outcome_count = 0
-            
-            for market in markets_list:
-                market_key = market.api_market_key
-                if market_key not in odds_by_outcome:
-                    odds_by_outcome[market_key] = {}
-                outcomes_list = list(market.outcomes.all())
-                total_outcome_count += len(outcomes_list)
-                
-                for outcome in outcomes_list:
-                    outcome_identifier = f"{outcome.outcome_name}-{outcome.point_value if outcome.point_value is not None else ''}"
-                    if outcome_identifier not in odds_by_outcome[market_key]:
-                        odds_by_outcome[market_key][outcome_identifier] = []
-                    odds_by_outcome[market_key][outcome_identifier].append(outcome)
-            
-            # Calculate median odds for each outcome
-            aggregated_outcomes: Dict[str, Dict[str, MarketOutcome]] = {}
-            for market_key, outcomes_dict in odds_by_outcome.items():
-                if market_key not in aggregated_outcomes:
-                    aggregated_outcomes[market_key] = {}
-                for outcome_identifier, outcome_list in outcomes_dict.items():
-                    if outcome_list:
-                        # Calculate median odds from all bookmakers
-                        odds_values = [float(outcome.odds) for outcome in outcome_list]
-                        median_odds = statistics.median(odds_values)
-                        # Use the outcome closest to median for more realistic odds
-                        closest_outcome = min(outcome_list, key=lambda x: abs(float(x.odds) - median_odds))
-                        aggregated_outcomes[market_key][outcome_identifier] = closest_outcome
-            
-            # Enhanced debug logging
+            aggregated_outcomes = consensus_by_fixture.get(fixture.id, {})
             if not aggregated_outcomes:
-                markets_count = len(markets_list)
-                if markets_count == 0:
-                    logger.warning(f"SKIPPING Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) - NO active markets in database")
-                else:
-                    logger.warning(f"SKIPPING Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) - has {markets_count} active markets with {total_outcome_count} outcomes but no valid odds aggregated")
+                logger.warning(f"SKIPPING Fixture {fixture.id} ({fixture.home_team.name} vs {fixture.away_team.name}) - NO active odds in database")
             else:
                 logger.debug(f"Fixture {fixture.id} has {len(aggregated_outcomes)} market types with odds: {list(aggregated_outcomes.keys())}")
 
@@ -473,15 +435,8 @@ def get_formatted_football_data(
                     # Format the market name from the key
                     market_name = market_key.replace('_', ' ').title()
                     if market_key.startswith('bet_'):
-                        # Get a better name from the actual market category if available
-                        # Use the first outcome's market to get category name
-                        try:
-                            first_outcome = next(iter(outcomes_dict.values()))
-                            if hasattr(first_outcome, 'market') and hasattr(first_outcome.market, 'category'):
-                                market_name = first_outcome.market.category.name
-                        except (StopIteration, AttributeError):
-                            # If we can't get a better name, keep the formatted key name
-                            pass
+                        # Use the market category's name for generic provider keys
+                        market_name = next(iter(outcomes_dict.values())).market_name or market_name
                     
                     other_parts = []
                     for outcome in outcomes_dict.values():
@@ -872,13 +827,47 @@ def _get_outcome_from_keys(outcomes_dict: Dict, *keys) -> Optional[Any]:
     return None
 
 
+def pdf_fixtures_queryset(data_type: str, league_code: Optional[str], days_ahead: int, days_past: int, now):
+    """
+    The fixtures the fixtures PDF lists, in document order, with its title;
+    (None, None) for an unknown data_type. Shared with fixtures_pdf so a
+    cached document is fingerprinted over exactly the rows it shows.
+    """
+    from football_data_app.models import FootballFixture
+
+    if data_type == "scheduled_fixtures":
+        start_date = now
+        end_date = now + timedelta(days=days_ahead)
+        fixtures_qs = FootballFixture.objects.filter(
+            status=FootballFixture.FixtureStatus.SCHEDULED,
+            match_date__gte=start_date,
+            match_date__lte=end_date
+        ).select_related('home_team', 'away_team', 'league').order_by('league__name', 'match_date')  # Order by league first, then by date
+        title = f"Upcoming Football Fixtures (Next {days_ahead} Days)"
+    elif data_type == "finished_results":
+        end_date = now
+        start_date = now - timedelta(days=days_past)
+        fixtures_qs = FootballFixture.objects.filter(
+            status=FootballFixture.FixtureStatus.FINISHED,
+            match_date__gte=start_date,
+            match_date__lte=end_date
+        ).select_related('home_team', 'away_team', 'league').order_by('league__name', '-match_date')
+        title = "Recent Football Results"
+    else:
+        return None, None
+    
+    if league_code:
+        fixtures_qs = fixtures_qs.filter(league__api_id=league_code)
+    return fixtures_qs, title
+
+
 def generate_fixtures_pdf(
     data_type: str,
     league_code: Optional[str] = None,
     days_ahead: int = 10,
     days_past: int = 4,
     max_odds: float = 15.0,
-    max_bookmakers: int = MAX_BOOKMAKERS
+    output_path: Optional[str] = None,
 ) -> Optional[str]:
     """
     Generates a PDF document containing football fixtures with odds.
@@ -890,7 +879,9 @@ def generate_fixtures_pdf(
         days_ahead: Days ahead for scheduled fixtures (default: 10 days)
         days_past: Days past for finished results
         max_odds: Maximum odds to display (odds higher than this are filtered out)
-        max_bookmakers: Maximum number of bookmakers to include (default: 3)
+        output_path: File to write; defaults to a new timestamped file in
+            MEDIA_ROOT/fixtures_pdfs. Callers serving users go through
+            fixtures_pdf.get_fixtures_pdf, which reuses identical documents.
     
     Returns:
         Absolute path to generated PDF file, or None if no data
@@ -905,58 +896,32 @@ def generate_fixtures_pdf(
     import os
     
     # Local imports
-    from football_data_app.models import FootballFixture, MarketOutcome, Market, Bookmaker
+    from football_data_app.models import FootballFixture, MarketOutcome
+    from football_data_app.odds_summary import consensus_outcomes
     
-    logger.info(f"Generating PDF for data_type='{data_type}', league_code='{league_code}', max_bookmakers={max_bookmakers}")
+    logger.info(f"Generating PDF for data_type='{data_type}', league_code='{league_code}'")
     
-    # Get list of bookmaker IDs to use (limit to max_bookmakers)
-    # Select the first N bookmakers ordered by name for consistency
-    bookmaker_ids = list(Bookmaker.objects.order_by('name').values_list('id', flat=True)[:max_bookmakers])
-    logger.info(f"Using {len(bookmaker_ids)} bookmaker(s) for PDF generation")
-    
-    # Query fixtures
     now = timezone.now()
-    
-    if data_type == "scheduled_fixtures":
-        start_date = now
-        end_date = now + timedelta(days=days_ahead)
-        fixtures_qs = FootballFixture.objects.filter(
-            status=FootballFixture.FixtureStatus.SCHEDULED,
-            match_date__gte=start_date,
-            match_date__lte=end_date
-        ).select_related('home_team', 'away_team', 'league').prefetch_related(
-            Prefetch('markets', queryset=Market.objects.filter(is_active=True, bookmaker_id__in=bookmaker_ids) if bookmaker_ids else Market.objects.filter(is_active=True)),
-            Prefetch('markets__outcomes', queryset=MarketOutcome.objects.filter(is_active=True, odds__lte=max_odds))
-        ).order_by('league__name', 'match_date')  # Order by league first, then by date
-        title = f"Upcoming Football Fixtures (Next {days_ahead} Days)"
-    elif data_type == "finished_results":
-        end_date = now
-        start_date = now - timedelta(days=days_past)
-        fixtures_qs = FootballFixture.objects.filter(
-            status=FootballFixture.FixtureStatus.FINISHED,
-            match_date__gte=start_date,
-            match_date__lte=end_date
-        ).select_related('home_team', 'away_team', 'league').order_by('league__name', '-match_date')
-        title = "Recent Football Results"
-    else:
+    fixtures_qs, title = pdf_fixtures_queryset(data_type, league_code, days_ahead, days_past, now)
+    if fixtures_qs is None:
         logger.error(f"Invalid data_type: {data_type}")
         return None
     
-    if league_code:
-        fixtures_qs = fixtures_qs.filter(league__api_id=league_code)
-    
     if not fixtures_qs.exists():
         logger.info("No fixtures found for PDF generation")
         return None
     
     # Create PDF
-    media_root = settings.MEDIA_ROOT
-    pdf_dir = os.path.join(media_root, 'fixtures_pdfs')
-    os.makedirs(pdf_dir, exist_ok=True)
-    
-    timestamp = now.strftime('%Y%m%d_%H%M%S')
-    filename = f"fixtures_{timestamp}.pdf"
-    filepath = os.path.join(pdf_dir, filename)
+    if output_path:
+        filepath = output_path
+    else:
+        media_root = settings.MEDIA_ROOT
+        pdf_dir = os.path.join(media_root, 'fixtures_pdfs')
+        os.makedirs(pdf_dir, exist_ok=True)
+        
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
+        filename = f"fixtures_{timestamp}.pdf"
+        filepath = os.path.join(pdf_dir, filename)
     
     doc = SimpleDocTemplate(filepath, pagesize=letter,
                           rightMargin=0.5*inch, leftMargin=0.5*inch,
@@ -1043,7 +1008,15 @@ def generate_fixtures_pdf(
     fixtures_added = 0
     current_league = None
     
-    for fixture in fixtures_qs[:MAX_FIXTURES_IN_PDF]:  # Limit fixtures to avoid excessively large PDFs
+    fixtures = list(fixtures_qs[:MAX_FIXTURES_IN_PDF])  # Limit fixtures to avoid excessively large PDFs
+    # Consensus (median) odds across all bookmakers from the summary table
+    # (odds_summary.py), capped at max_odds as a safety check.
+    consensus_by_fixture = (
+        consensus_outcomes([fixture.id for fixture in fixtures], max_odds=max_odds)
+        if data_type == "scheduled_fixtures" else {}
+    )
+
+    for fixture in fixtures:
         # Add league header when league changes
         if fixture.league.name != current_league:
             if fixtures_added > 0:
@@ -1093,35 +1066,7 @@ def generate_fixtures_pdf(
         
         # Get odds data for scheduled fixtures
         if data_type == "scheduled_fixtures":
-            # Collect all odds for each outcome across bookmakers, then use median
-            # This provides more realistic odds instead of always showing the highest
-            odds_by_outcome: Dict[str, Dict[str, List[MarketOutcome]]] = {}
-            for market in fixture.markets.all():
-                market_key = market.api_market_key
-                if market_key not in odds_by_outcome:
-                    odds_by_outcome[market_key] = {}
-                for outcome in market.outcomes.all():
-                    # Skip odds that are too high (safety check)
-                    if float(outcome.odds) > max_odds:
-                        continue
-                    outcome_identifier = f"{outcome.outcome_name}-{outcome.point_value if outcome.point_value is not None else ''}"
-                    if outcome_identifier not in odds_by_outcome[market_key]:
-                        odds_by_outcome[market_key][outcome_identifier] = []
-                    odds_by_outcome[market_key][outcome_identifier].append(outcome)
-            
-            # Calculate median odds for each outcome
-            aggregated_outcomes: Dict[str, Dict[str, MarketOutcome]] = {}
-            for market_key, outcomes_dict in odds_by_outcome.items():
-                if market_key not in aggregated_outcomes:
-                    aggregated_outcomes[market_key] = {}
-                for outcome_identifier, outcome_list in outcomes_dict.items():
-                    if outcome_list:
-                        # Calculate median odds from all bookmakers
-                        odds_values = [float(outcome.odds) for outcome in outcome_list]
-                        median_odds = statistics.median(odds_values)
-                        # Use the outcome closest to median for more realistic odds
-                        closest_outcome = min(outcome_list, key=lambda x: abs(float(x.odds) - median_odds))
-                        aggregated_outcomes[market_key][outcome_identifier] = closest_outcome
+            aggregated_outcomes = consensus_by_fixture.get(fixture.id, {})
             
             if aggregated_outcomes:
                 # Create odds table with improved design
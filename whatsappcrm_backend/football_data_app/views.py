@@ -8,36 +8,106 @@ user for their own wallet/tickets/transactions. Placing bets is intentionally
 not exposed here — it goes through the WhatsApp guided flow which owns
 validation (funds, fixture status, odds, stake limits).
 """
+import hashlib
+import json
+
 from django.db.models import Count, Q
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.gzip import gzip_page
 from rest_framework import viewsets, permissions, mixins
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 
 from customer_data.models import UserWallet, WalletTransaction, BetTicket
 from .models import FootballFixture
+from .odds_deltas import odds_versions
+from .odds_summary import consensus_outcomes, odds_state
 from .serializers import (
     FootballFixtureSerializer, UserWalletSerializer,
     WalletTransactionSerializer, BetTicketSerializer,
 )
 
 
+class FixtureCursorPagination(CursorPagination):
+    """Kickoff-ordered pages that stay stable while fixtures are added, with no
+    COUNT or OFFSET scan."""
+    ordering = ('match_date', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+@method_decorator(gzip_page, name='dispatch')
 class FixtureViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
-    """Upcoming, bettable fixtures with representative markets/odds."""
+    """
+    Upcoming, bettable fixtures with representative (consensus) odds.
+
+    Odds come from the FixtureOddsSummary projection (odds_summary.py) in one
+    query per page, not from every bookmaker's markets and outcomes. Responses
+    carry an ETag derived from the fixtures on them, their odds version
+    (odds_deltas) and their summary rows, so a polling client sending
+    If-None-Match gets a 304 -- without the odds being loaded or serialized --
+    until something on the page changes. A single fixture also carries
+    Last-Modified; a list page does not, as fixtures leaving or entering the
+    page (kickoff passing, a new fixture) change it without any of its
+    timestamps moving. Responses are gzipped for clients that accept it.
+    """
     serializer_class = FootballFixtureSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FixtureCursorPagination
 
     def get_queryset(self):
-        qs = (
-            FootballFixture.objects
-            .select_related('league', 'home_team', 'away_team')
-            .prefetch_related('markets__category', 'markets__outcomes')
-        )
+        qs = FootballFixture.objects.select_related('league', 'home_team', 'away_team', 'prediction')
         # Default to upcoming scheduled fixtures; allow ?status=all for history.
         if self.request.query_params.get('status') != 'all':
             qs = qs.filter(status=FootballFixture.FixtureStatus.SCHEDULED,
                            match_date__gte=timezone.now())
-        return qs.order_by('match_date')
+        return qs.order_by('match_date', 'id')
+
+    def list(self, request, *args, **kwargs):
+        fixtures = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        links = [self.paginator.get_next_link(), self.paginator.get_previous_link()]
+        return self._conditional_response(request, fixtures, links, self.get_paginated_response, dated=False)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_response(request, [self.get_object()], [], lambda data: Response(data[0]))
+
+    def _validators(self, fixtures, extra):
+        """(ETag, Last-Modified timestamp) of a response listing `fixtures`."""
+        fixture_ids = [fixture.id for fixture in fixtures]
+        state = odds_state(fixture_ids)
+        versions = odds_versions(fixture_ids)
+        rows, timestamps = [], []
+        for fixture in fixtures:
+            prediction = getattr(fixture, 'prediction', None)
+            computed_at = prediction.computed_at if prediction else None
+            odds = state.get(fixture.id)
+            rows.append([fixture.id, fixture.status, fixture.home_team_score, fixture.away_team_score,
+                         fixture.match_date, fixture.updated_at, computed_at, odds, versions[fixture.id]])
+            timestamps.extend(ts for ts in (fixture.updated_at, computed_at, odds and odds[2]) if ts)
+        etag = hashlib.sha256(json.dumps([extra, rows], default=str).encode()).hexdigest()[:32]
+        return etag, int(max(timestamps).timestamp()) if timestamps else None
+
+    def _conditional_response(self, request, fixtures, extra, respond, dated=True):
+        etag, last_modified = self._validators(fixtures, extra)
+        if not dated:
+            last_modified = None
+        response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+        if response is None:
+            context = {**self.get_serializer_context(),
+                       'consensus': consensus_outcomes([fixture.id for fixture in fixtures])}
+            response = respond(self.get_serializer(fixtures, many=True, context=context).data)
+        response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Per user (authenticated), and always revalidated.
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
 
 
 class WalletViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
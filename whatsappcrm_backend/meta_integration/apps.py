@@ -8,5 +8,4 @@ class MetaIntegrationConfig(AppConfig):
     verbose_name = "Meta Integration"
 
     def ready(self):
-        # You can import signals or other setup code here if needed
-        pass
+        from . import signals  # noqa: F401
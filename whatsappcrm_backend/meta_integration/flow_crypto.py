@@ -49,6 +49,17 @@ def generate_rsa_key_pair():
     return private_key_pem, public_key_pem
 
 
+def load_private_key(private_key_pem):
+    """
+    Parse a PEM-encoded RSA private key. Parsing is expensive; callers that
+    decrypt repeatedly should keep the result (see flow_keys.py).
+    """
+    return serialization.load_pem_private_key(
+        data=private_key_pem.encode('utf-8'),
+        password=None,
+    )
+
+
 def decrypt_flow_request(encrypted_flow_data_b64, encrypted_aes_key_b64,
                          initial_vector_b64, private_key_pem):
     """
@@ -58,7 +69,8 @@ def decrypt_flow_request(encrypted_flow_data_b64, encrypted_aes_key_b64,
         encrypted_flow_data_b64: Base64-encoded AES-GCM encrypted flow data (with tag appended).
         encrypted_aes_key_b64: Base64-encoded RSA-OAEP encrypted AES key.
         initial_vector_b64: Base64-encoded 12-byte IV for AES-GCM.
-        private_key_pem: PEM-encoded RSA private key string.
+        private_key_pem: PEM-encoded RSA private key string, or a key already
+            parsed with load_private_key().
 
     Returns:
         tuple: (decrypted_data: dict, aes_key: bytes, iv: bytes)
@@ -67,10 +79,10 @@ def decrypt_flow_request(encrypted_flow_data_b64, encrypted_aes_key_b64,
     iv = base64.b64decode(initial_vector_b64)
     encrypted_aes_key = base64.b64decode(encrypted_aes_key_b64)
 
-    private_key = serialization.load_pem_private_key(
-        data=private_key_pem.encode('utf-8'),
-        password=None,
-    )
+    if isinstance(private_key_pem, str):
+        private_key = load_private_key(private_key_pem)
+    else:
+        private_key = private_key_pem
 
     aes_key = private_key.decrypt(
         encrypted_aes_key,
@@ -0,0 +1,111 @@
+# whatsappcrm_backend/meta_integration/flow_keys.py
+"""
+Process-local cache of parsed WhatsApp Flow private keys.
+
+Every encrypted request to WhatsAppFlowEndpointView used to look its
+MetaAppConfig up in the database and re-parse the PEM with
+load_pem_private_key before the RSA-OAEP decrypt -- key parsing and OAEP
+being the dominant CPU cost of an endpoint Meta fails the screen on if we
+are slow. The parsed key object is now kept per phone_number_id (None for
+the legacy endpoint without one in the URL), following the same lookup as
+before: the active config for that number with a key, else the first active
+config with a key.
+
+Invalidation follows flows/flow_graph.py: saving or deleting a MetaAppConfig
+(see signals.py) clears this process's cache immediately and, once the write
+commits, bumps a shared counter in Redis so every other process drops its
+keys on its next check. Processes re-check that counter at most every
+VERSION_CHECK_INTERVAL_SECONDS; if Redis is unreachable cached keys are
+trusted for FALLBACK_TTL_SECONDS and then re-read.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Optional
+
+from whatsappcrm_backend.redis_client import after_commit, commit_pending, database_key
+from .flow_crypto import load_private_key
+from .models import MetaAppConfig
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'meta:flow_keys_version:{}'  # database
+VERSION_CHECK_INTERVAL_SECONDS = 5
+FALLBACK_TTL_SECONDS = 60
+
+# phone_number_id -> parsed private key (or None when no config has one).
+_keys: dict[Optional[str], Any] = {}
+_version: Optional[int] = None
+_checked_at = 0.0
+_loaded_at = 0.0
+
+
+def _shared_version() -> Optional[int]:
+    from whatsappcrm_backend.redis_client import get_redis
+    try:
+        return int(get_redis().get(database_key(VERSION_KEY)) or 0)
+    except Exception:
+        logger.warning("Flow keys: Redis unavailable for version check; falling back to TTL reloads.", exc_info=True)
+        return None
+
+
+def _bump_shared_version():
+    from whatsappcrm_backend.redis_client import get_redis
+    try:
+        get_redis().incr(database_key(VERSION_KEY))
+    except Exception:
+        logger.warning("Flow keys: Redis unavailable; other processes will pick up the change after their fallback TTL.", exc_info=True)
+
+
+def invalidate_flow_keys():
+    """Drop this process's keys now and bump the shared version once the
+    current transaction (if any) commits."""
+    _keys.clear()
+    after_commit(_bump_shared_version)
+
+
+def _revalidate():
+    """Clear the cache if another process changed a config since we last looked."""
+    global _version, _checked_at, _loaded_at
+    now = time.monotonic()
+    if now - _checked_at < VERSION_CHECK_INTERVAL_SECONDS:
+        return
+    _checked_at = now
+    version = _shared_version()
+    if version is None:
+        if now - _loaded_at >= FALLBACK_TTL_SECONDS:
+            _keys.clear()
+            _loaded_at = now
+        return
+    if version != _version:
+        _keys.clear()
+        _version = version
+        _loaded_at = now
+
+
+def _private_key_pem(phone_number_id: Optional[str]) -> Optional[str]:
+    configs = MetaAppConfig.objects.filter(
+        is_active=True, flow_private_key_pem__isnull=False,
+    ).exclude(flow_private_key_pem='')
+    if phone_number_id:
+        config = configs.filter(phone_number_id=phone_number_id).first()
+        if config:
+            return config.flow_private_key_pem
+    config = configs.first()
+    return config.flow_private_key_pem if config else None
+
+
+def get_flow_private_key(phone_number_id: Optional[str] = None):
+    """The parsed private key for `phone_number_id`, or None if no active
+    config has one configured."""
+    _revalidate()
+    if phone_number_id in _keys:
+        return _keys[phone_number_id]
+    pem = _private_key_pem(phone_number_id)
+    key = load_private_key(pem) if pem else None
+    # Keys read while our own config write is uncommitted are not cached: a
+    # rollback would never invalidate them.
+    if not commit_pending(_bump_shared_version):
+        _keys[phone_number_id] = key
+    return key
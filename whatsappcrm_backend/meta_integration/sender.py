@@ -0,0 +1,214 @@
+# whatsappcrm_backend/meta_integration/sender.py
+"""
+Pooled, keep-alive HTTP sessions for the Graph API and batch dispatch of
+outgoing Messages.
+
+Every send used to go through a bare requests.post, so each message opened a
+new TCP + TLS connection to graph.facebook.com. Sends now go through one
+requests.Session per MetaAppConfig (per worker process), whose connection pool
+keeps connections open between messages and tasks. A session is keyed by the
+config's access token as well, so rotating the token in the admin replaces
+the session instead of sending with stale headers.
+
+For fan-out (timeout notices, settlement notifications, broadcasts) outgoing
+Message rows can be handed over in bulk with queue_outgoing_messages(): each
+send_whatsapp_messages_batch_task loads its Messages and the config once,
+sends them concurrently over the pooled session (META_SEND_CONCURRENCY
+threads; the session is shared, so connections are reused across threads),
+and writes every status back with a single bulk_update. Ordering between the
+messages of one batch is not guaranteed, so flow replies that must arrive in
+order keep using send_whatsapp_message_task with staggered countdowns.
+Both paths reserve their sends from the outbound throttle (throttle.py).
+
+A batch send that fails with a 429, a 5xx or a connection error is not
+marked failed: those messages are re-queued together as a later batch, after
+META_SEND_RETRY_BACKOFF_SECONDS doubled per attempt (or Meta's Retry-After,
+if longer), up to META_SEND_MAX_RETRIES times.
+"""
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from . import throttle
+
+logger = logging.getLogger('meta_integration')
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def send_concurrency() -> int:
+    return max(1, int(getattr(settings, 'META_SEND_CONCURRENCY', 16)))
+
+
+def batch_size() -> int:
+    return max(1, int(getattr(settings, 'META_SEND_BATCH_SIZE', 100)))
+
+
+def get_session(config) -> requests.Session:
+    """The pooled Graph API session for `config` in this process."""
+    key = (config.pk, config.access_token)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            # Drop sessions left behind by an earlier access token for this config.
+            for stale_key in [k for k in _sessions if k[0] == config.pk]:
+                _sessions.pop(stale_key).close()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=send_concurrency())
+            session.mount('https://', adapter)
+            session.headers.update({
+                "Authorization": f"Bearer {config.access_token}",
+                "Content-Type": "application/json",
+            })
+            _sessions[key] = session
+    return session
+
+
+def close_sessions():
+    """Close every pooled session (tests, worker shutdown)."""
+    with _sessions_lock:
+        while _sessions:
+            _sessions.popitem()[1].close()
+
+
+def queue_outgoing_messages(message_ids, config_id: int):
+    """Queue already-saved outgoing Messages for sending in batches of
+    META_SEND_BATCH_SIZE. Call after the Messages are committed."""
+    from .tasks import send_whatsapp_messages_batch_task
+
+    message_ids = list(message_ids)
+    size = batch_size()
+    for start in range(0, len(message_ids), size):
+        send_whatsapp_messages_batch_task.delay(message_ids[start:start + size], config_id)
+
+
+def _retry_delay(attempt: int, errors) -> int:
+    delay = float(getattr(settings, 'META_SEND_RETRY_BACKOFF_SECONDS', 15)) * (2 ** attempt)
+    retry_after = [error['retry_after'] for error in errors if error.get('retry_after')]
+    return math.ceil(max([delay] + retry_after))
+
+
+def _send_error(error: Exception) -> dict:
+    """error_details for a failed send; 'retryable' for 429, 5xx and connection errors."""
+    response = getattr(error, 'response', None)
+    status_code = response.status_code if response is not None else None
+    details = {'error': str(error), 'type': type(error).__name__, 'status_code': status_code,
+               'retryable': status_code is None or status_code == 429 or status_code >= 500}
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and str(retry_after).isdigit():
+        details['retry_after'] = int(retry_after)
+    return details
+
+
+def send_outgoing_batch(message_ids, config_id: int, throttled: bool = False, attempt: int = 0) -> dict:
+    """
+    Send the outgoing Messages in `message_ids` with MetaAppConfig `config_id`
+    and record the outcome of each with one bulk_update. Messages that are not
+    outgoing or already have a wamid (were sent) are skipped. Unless the batch was already
+    deferred (`throttled`), each send reserves a slot from the send throttle
+    and messages that have to wait are re-queued as later batches. Retryable
+    failures are re-queued with backoff (see the module docstring); `attempt`
+    counts the retries so far. Returns counts by outcome.
+    """
+    from conversations.models import Message
+    from .models import MetaAppConfig
+    from .tasks import send_whatsapp_messages_batch_task
+    from .utils import send_whatsapp_message
+
+    messages = [
+        msg for msg in Message.objects.select_related('contact').filter(pk__in=message_ids)
+        # A wamid means Meta accepted the message; its status may have moved
+        # on to delivered/read since, so a redelivered batch must not resend it.
+        if msg.direction == 'out' and not msg.wamid
+    ]
+    counts = {'sent': 0, 'failed': 0, 'retried': 0, 'deferred': 0, 'skipped': len(set(message_ids)) - len(messages)}
+    if not messages:
+        return counts
+
+    config = MetaAppConfig.objects.filter(pk=config_id).first()
+    if config is not None and not throttled:
+        waits = throttle.reserve_many(config.phone_number_id, [msg.contact.whatsapp_id for msg in messages])
+        deferred = {}
+        for msg, wait in zip(messages, waits):
+            if wait > 0:
+                deferred.setdefault(math.ceil(wait), []).append(msg.id)
+        for countdown, ids in sorted(deferred.items()):
+            send_whatsapp_messages_batch_task.apply_async(
+                args=[ids, config_id], kwargs={'throttled': True, 'attempt': attempt}, countdown=countdown
+            )
+            counts['deferred'] += len(ids)
+        if deferred:
+            messages = [msg for msg, wait in zip(messages, waits) if wait <= 0]
+            if not messages:
+                return counts
+
+    if config is None:
+        logger.error(f"send_outgoing_batch: MetaAppConfig with ID {config_id} not found; failing {len(messages)} message(s).")
+        results = [None] * len(messages)
+        errors = [{'error': f'MetaAppConfig ID {config_id} not found for sending.'}] * len(messages)
+    else:
+        def send(msg):
+            if not isinstance(msg.content_payload, dict):
+                return None, {'error': 'Message content_payload is not a valid dictionary for sending.', 'type': 'ValueError'}
+            try:
+                response = send_whatsapp_message(
+                    to_phone_number=msg.contact.whatsapp_id,
+                    message_type=msg.message_type,
+                    data=msg.content_payload,
+                    config=config,
+                    raise_errors=True,
+                )
+            except requests.exceptions.RequestException as e:
+                return None, _send_error(e)
+            except Exception as e:
+                logger.error(f"send_outgoing_batch: error sending Message {msg.id}: {e}", exc_info=True)
+                return None, {'error': str(e), 'type': type(e).__name__}
+            return response, None
+
+        with ThreadPoolExecutor(max_workers=min(send_concurrency(), len(messages))) as pool:
+            outcomes = list(pool.map(send, messages))
+        results = [response for response, _ in outcomes]
+        errors = [error for _, error in outcomes]
+
+    now = timezone.now()
+    can_retry = attempt < int(getattr(settings, 'META_SEND_MAX_RETRIES', 4))
+    retry_ids, retry_errors = [], []
+    for msg, response, error in zip(messages, results, errors):
+        if response and response.get('messages') and response['messages'][0].get('id'):
+            msg.wamid = response['messages'][0]['id']
+            msg.status = 'sent'
+            msg.error_details = None
+            counts['sent'] += 1
+        elif error and error.get('retryable') and can_retry:
+            # Status left as it was; the error is kept for the record.
+            msg.error_details = error
+            retry_ids.append(msg.id)
+            retry_errors.append(error)
+            counts['retried'] += 1
+        else:
+            msg.status = 'failed'
+            msg.error_details = error or response or {'error': 'Meta API call failed or returned unexpected response.'}
+            counts['failed'] += 1
+        msg.status_timestamp = now
+
+    Message.objects.bulk_update(messages, ['wamid', 'status', 'error_details', 'status_timestamp'], batch_size=500)
+    if retry_ids:
+        send_whatsapp_messages_batch_task.apply_async(
+            args=[retry_ids, config_id], kwargs={'attempt': attempt + 1},
+            countdown=_retry_delay(attempt, retry_errors),
+        )
+    logger.info(
+        f"send_outgoing_batch: config {config_id}: {counts['sent']} sent, {counts['failed']} failed, "
+        f"{counts['retried']} retried, {counts['deferred']} deferred, {counts['skipped']} skipped."
+    )
+    return counts
@@ -0,0 +1,14 @@
+# whatsappcrm_backend/meta_integration/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .flow_keys import invalidate_flow_keys
+from .models import MetaAppConfig
+
+
+@receiver(post_save, sender=MetaAppConfig)
+@receiver(post_delete, sender=MetaAppConfig)
+def meta_app_config_changed(sender, **kwargs):
+    """Any config write drops the cached Flow private keys (see meta_integration/flow_keys.py)."""
+    invalidate_flow_keys()
@@ -6,12 +6,13 @@ from django.utils import timezone
 
 from .utils import send_whatsapp_message, send_read_receipt_api # Your existing function to call Meta API
 from .models import MetaAppConfig
+from . import throttle
 from conversations.models import Message, Contact # To update message status
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60, queue='celery', priority=9)
-def send_whatsapp_message_task(self, outgoing_message_id: int, active_config_id: int):
+def send_whatsapp_message_task(self, outgoing_message_id: int, active_config_id: int, throttled: bool = False):
     """
     Celery task to send a WhatsApp message asynchronously.
     Updates the Message object's status based on the outcome.
@@ -19,6 +20,8 @@ def send_whatsapp_message_task(self, outgoing_message_id: int, active_config_id:
     Args:
         outgoing_message_id (int): The ID of the outgoing Message object to send.
         active_config_id (int): The ID of the active MetaAppConfig to use for sending.
+        throttled (bool): True when this run was deferred by the send throttle
+                          and already holds its reservation (see throttle.py).
     """
     logger.info("="*80)
     logger.info(f"TASK START: send_whatsapp_message_task")
@@ -77,6 +80,15 @@ def send_whatsapp_message_task(self, outgoing_message_id: int, active_config_id:
          return
 
 
+    if not throttled:
+        wait = throttle.reserve(active_config.phone_number_id, outgoing_msg.contact.whatsapp_id)
+        if wait > 0:
+            logger.info(f"Send throttle: deferring Message {outgoing_message_id} by {wait:.2f}s.")
+            send_whatsapp_message_task.apply_async(
+                args=[outgoing_message_id, active_config_id], kwargs={'throttled': True}, countdown=wait
+            )
+            return
+
     logger.info(f"Preparing to send WhatsApp message to contact: {outgoing_msg.contact.whatsapp_id}")
     logger.debug(f"Message type: {outgoing_msg.message_type}")
 
@@ -166,3 +178,37 @@ def send_read_receipt_task(self, wamid: str, config_id: int, show_typing_indicat
             raise self.retry(exc=e)
         except self.MaxRetriesExceededError:
             logger.error(f"Max retries exceeded for sending read receipt for WAMID {wamid}.")
+
+
+@shared_task(name="meta_integration.drain_webhook_stream_task", queue='celery', priority=9)
+def drain_webhook_stream_task():
+    """
+    Consume webhook bodies queued by the fast-ack webhook view (see
+    webhook_ingest.py) and write them in batches. Triggered once per burst by
+    the view and periodically by Celery Beat as a safety net.
+    """
+    from .webhook_ingest import drain_stream
+    try:
+        processed = drain_stream()
+    except Exception as e:
+        logger.error(f"drain_webhook_stream_task failed; unacknowledged entries will be retried: {e}", exc_info=True)
+        return
+    if processed:
+        logger.info(f"drain_webhook_stream_task: processed {processed} queued webhook(s).")
+
+
+@shared_task(name="meta_integration.send_whatsapp_messages_batch_task", queue='celery', priority=9)
+def send_whatsapp_messages_batch_task(outgoing_message_ids: list, active_config_id: int, throttled: bool = False,
+                                      attempt: int = 0):
+    """
+    Send many outgoing Messages with one config over the pooled Graph API
+    session and write their statuses back in bulk (see sender.py). Queue it
+    through sender.queue_outgoing_messages(). `throttled` marks a batch the
+    send throttle already deferred; `attempt` counts retries of a batch that
+    failed with a retryable error.
+    """
+    from .sender import send_outgoing_batch
+    try:
+        send_outgoing_batch(outgoing_message_ids, active_config_id, throttled=throttled, attempt=attempt)
+    except Exception as e:
+        logger.error(f"send_whatsapp_messages_batch_task failed for {len(outgoing_message_ids)} message(s): {e}", exc_info=True)
@@ -0,0 +1,122 @@
+# whatsappcrm_backend/meta_integration/test_flow_endpoint.py
+"""
+Coverage for the WhatsApp Flow endpoint's hot path: the private key is
+parsed once per process and dropped when a MetaAppConfig changes
+(flow_keys.py), every encrypted request records its decrypt/handler/encrypt
+timings per screen, and a handler that overruns the response budget -- or
+raises -- is answered with a screen the Flow can still render.
+"""
+import json
+import time
+from unittest.mock import patch
+
+from django.test import RequestFactory, TestCase, override_settings
+
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import flow_crypto, flow_keys, views
+from . import tests as endpoint_tests
+from .flow_crypto import generate_rsa_key_pair
+from .models import MetaAppConfig
+from .views import WhatsAppFlowEndpointView
+
+
+@patch.object(flow_keys, 'VERSION_KEY', 'test:meta:flow_keys_version:{}')
+@patch.object(views, 'FLOW_LATENCY_KEY', 'test:meta:flow_endpoint:latency:{}')
+class FlowEndpointHotPathTests(TestCase):
+
+    def setUp(self):
+        self.redis = get_redis()
+        self.latency_key = database_key('test:meta:flow_endpoint:latency:{}')
+        keys = database_key('test:meta:flow_keys_version:{}'), self.latency_key
+        self.redis.delete(*keys)
+        self.addCleanup(self.redis.delete, *keys)
+        self.factory = RequestFactory()
+        self.private_pem, self.public_pem = generate_rsa_key_pair()
+        # Run the config's commit hooks, so the cache fills as it would after
+        # a real commit rather than treating the write as still pending.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config = MetaAppConfig.objects.create(
+                name="Flow Hot Path Config", access_token="test_token", phone_number_id="555555555",
+                waba_id="waba_test", verify_token="verify_test", is_active=True,
+                flow_private_key_pem=self.private_pem,
+            )
+        flow_keys._keys.clear()
+        self.addCleanup(flow_keys._keys.clear)
+
+    def _post(self, payload):
+        body, aes_key, iv = endpoint_tests.WhatsAppFlowEndpointTestCase._encrypt_payload(self, payload)
+        request = self.factory.post('/flow-endpoint/555555555/', data=json.dumps(body).encode('utf-8'),
+                                    content_type='application/json')
+        response = WhatsAppFlowEndpointView.as_view()(request, phone_number_id='555555555')
+        self.assertEqual(response.status_code, 200)
+        return endpoint_tests.WhatsAppFlowEndpointTestCase._decrypt_response(
+            self, response.content.decode(), aes_key, iv)
+
+    def test_private_key_parsed_once(self):
+        with patch.object(flow_keys, 'load_private_key', wraps=flow_crypto.load_private_key) as load:
+            for _ in range(3):
+                self.assertEqual(self._post({"action": "ping"}), {"data": {"status": "active"}})
+        self.assertEqual(load.call_count, 1)
+
+    def test_config_change_drops_cached_key(self):
+        self._post({"action": "ping"})
+        self.private_pem, self.public_pem = generate_rsa_key_pair()
+        self.config.flow_private_key_pem = self.private_pem
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.save()
+        self.assertEqual(flow_keys._keys, {})
+        self.assertEqual(self.redis.get(database_key('test:meta:flow_keys_version:{}')), '1')
+        self.assertEqual(self._post({"action": "ping"}), {"data": {"status": "active"}})
+
+    def test_timings_recorded_per_screen(self):
+        self._post({"action": "ping"})
+        self._post({"action": "ping"})
+        counters = self.redis.hgetall(self.latency_key)
+        self.assertEqual(counters['ping:count'], '2')
+        for field in ('ping:decrypt_ms', 'ping:handler_ms', 'ping:encrypt_ms'):
+            self.assertGreater(float(counters[field]), 0)
+        self.assertNotIn('ping:over_budget', counters)
+
+    @override_settings(WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS=0.05)
+    def test_over_budget_handler_answered_with_busy_screen(self):
+        def slow(body):
+            time.sleep(0.5)
+            return {"screen": "BET_SUCCESS", "data": {}}
+
+        # Outside a transaction the handler runs on the pool with the budget.
+        with patch.object(views, 'connection') as conn, \
+                patch.object(WhatsAppFlowEndpointView, '_process_body', side_effect=slow):
+            conn.in_atomic_block = False
+            response = self._post({"action": "data_exchange", "screen": "BET_STAKE",
+                                   "flow_token": "263771234567", "data": {"slip": "12,13"}})
+
+        self.assertEqual(response['screen'], 'BET_STAKE')
+        self.assertTrue(response['data']['is_error'])
+        self.assertEqual(response['data']['slip'], '12,13')
+        counters = self.redis.hgetall(self.latency_key)
+        self.assertEqual(counters['BET_STAKE:over_budget'], '1')
+
+    @override_settings(WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS=0.05)
+    def test_placement_is_never_cut_off_by_the_budget(self):
+        def slow(body):
+            time.sleep(0.2)
+            return {"screen": "BET_SUCCESS", "data": {"message": "placed"}}
+
+        with patch.object(views, 'connection') as conn, \
+                patch.object(WhatsAppFlowEndpointView, '_process_body', side_effect=slow):
+            conn.in_atomic_block = False
+            confirm = self._post({"action": "data_exchange", "screen": "BET_CONFIRM",
+                                  "flow_token": "263771234567", "data": {"outcome_id": "12", "stake": "5"}})
+            slip = self._post({"action": "data_exchange", "screen": "BET_SLIP",
+                               "flow_token": "263771234567", "data": {"slip": "12,13", "stake": "5"}})
+
+        self.assertEqual(confirm['screen'], 'BET_SUCCESS')
+        self.assertEqual(slip['screen'], 'BET_SUCCESS')
+        self.assertNotIn('BET_CONFIRM:over_budget', self.redis.hgetall(self.latency_key))
+
+    def test_handler_error_on_bet_screen_stays_on_screen(self):
+        with patch.object(WhatsAppFlowEndpointView, '_process_body', side_effect=RuntimeError("boom")):
+            response = self._post({"action": "data_exchange", "screen": "BET_STAKE",
+                                   "flow_token": "263771234567", "data": {"slip": "7"}})
+        self.assertEqual(response['screen'], 'BET_STAKE')
+        self.assertEqual(response['data']['error_message'], "An internal error occurred. Please try again.")
@@ -0,0 +1,149 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from django.test import TestCase, override_settings
+
+from conversations.models import Contact, Message
+from . import sender
+from .models import MetaAppConfig
+from .utils import send_whatsapp_message
+
+
+def _response(wamid):
+    response = MagicMock()
+    response.json.return_value = {"messages": [{"id": wamid}]}
+    return response
+
+
+class PooledSessionTests(TestCase):
+    """Sends must reuse one keep-alive session per config rather than opening
+    a connection per message, and a rotated access token must not keep
+    sending with the old Authorization header."""
+
+    def setUp(self):
+        self.config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token-1",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+        self.addCleanup(sender.close_sessions)
+
+    def test_session_is_reused_and_replaced_on_token_change(self):
+        session = sender.get_session(self.config)
+        self.assertIs(sender.get_session(self.config), session)
+        self.assertEqual(session.headers["Authorization"], "Bearer token-1")
+
+        self.config.access_token = "token-2"
+        rotated = sender.get_session(self.config)
+        self.assertIsNot(rotated, session)
+        self.assertEqual(rotated.headers["Authorization"], "Bearer token-2")
+        self.assertEqual(len(sender._sessions), 1)
+
+    def test_send_whatsapp_message_posts_through_pooled_session(self):
+        with patch.object(sender.requests.Session, 'post', return_value=_response("wamid.X")) as post:
+            result = send_whatsapp_message("263771111111", "text", {"body": "hi"}, config=self.config)
+        self.assertEqual(result, {"messages": [{"id": "wamid.X"}]})
+        url = post.call_args.args[0]
+        self.assertTrue(url.endswith("/987654321/messages"))
+        self.assertEqual(post.call_args.kwargs["json"]["to"], "263771111111")
+
+
+@override_settings(META_SEND_BATCH_SIZE=2, META_SEND_CONCURRENCY=4, META_SEND_RATE_PER_SECOND=0)
+class BatchDispatchTests(TestCase):
+    """A batch task loads its Messages once, sends them over the pooled
+    session and records every outcome with one bulk write, skipping Messages
+    that were already sent."""
+
+    def setUp(self):
+        self.config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+        self.addCleanup(sender.close_sessions)
+        self.messages = [
+            Message.objects.create(
+                contact=Contact.objects.create(whatsapp_id=f"26377000000{i}"), direction='out',
+                message_type='text', content_payload={"body": f"msg {i}"}, status='pending_dispatch',
+            )
+            for i in range(3)
+        ]
+
+    def test_statuses_written_in_bulk(self):
+        def fake_send(to_phone_number, message_type, data, config, **kwargs):
+            return None if to_phone_number.endswith("1") else {"messages": [{"id": f"wamid.{to_phone_number}"}]}
+
+        already_sent = Message.objects.create(
+            contact=self.messages[0].contact, direction='out', message_type='text',
+            content_payload={"body": "old"}, status='sent', wamid="wamid.OLD",
+        )
+        ids = [m.id for m in self.messages] + [already_sent.id]
+        with patch('meta_integration.utils.send_whatsapp_message', side_effect=fake_send) as send, \
+                self.assertNumQueries(3):
+            counts = sender.send_outgoing_batch(ids, self.config.id)
+        self.assertEqual(counts, {'sent': 2, 'failed': 1, 'retried': 0, 'deferred': 0, 'skipped': 1})
+        self.assertEqual(send.call_count, 3)
+
+        statuses = {m.contact.whatsapp_id: (m.status, m.wamid) for m in Message.objects.filter(pk__in=ids[:3])}
+        self.assertEqual(statuses["263770000000"], ('sent', "wamid.263770000000"))
+        self.assertEqual(statuses["263770000001"][0], 'failed')
+        self.assertEqual(statuses["263770000002"], ('sent', "wamid.263770000002"))
+
+    def test_redelivered_batch_does_not_resend_delivered_messages(self):
+        ids = [m.id for m in self.messages]
+        with patch('meta_integration.utils.send_whatsapp_message',
+                   return_value={"messages": [{"id": "wamid.FIRST"}]}):
+            sender.send_outgoing_batch(ids, self.config.id)
+        Message.objects.filter(pk=ids[0]).update(status='delivered')
+        Message.objects.filter(pk=ids[1]).update(status='read')
+
+        with patch('meta_integration.utils.send_whatsapp_message') as send:
+            counts = sender.send_outgoing_batch(ids, self.config.id)
+        send.assert_not_called()
+        self.assertEqual(counts['skipped'], 3)
+        self.assertEqual(Message.objects.get(pk=ids[0]).status, 'delivered')
+
+    @override_settings(META_SEND_MAX_RETRIES=2, META_SEND_RETRY_BACKOFF_SECONDS=10)
+    def test_throttled_and_server_errors_are_retried_with_backoff(self):
+        def http_error(status_code, retry_after=None):
+            response = requests.Response()
+            response.status_code = status_code
+            if retry_after:
+                response.headers['Retry-After'] = retry_after
+            return requests.exceptions.HTTPError(f"{status_code}", response=response)
+
+        errors = {"263770000000": http_error(429, '60'), "263770000001": http_error(503),
+                  "263770000002": http_error(400)}
+
+        def fake_send(to_phone_number, message_type, data, config, raise_errors=False):
+            raise errors[to_phone_number]
+
+        ids = [m.id for m in self.messages]
+        with patch('meta_integration.utils.send_whatsapp_message', side_effect=fake_send), \
+                patch('meta_integration.tasks.send_whatsapp_messages_batch_task.apply_async') as apply_async:
+            counts = sender.send_outgoing_batch(ids, self.config.id)
+        self.assertEqual((counts['retried'], counts['failed']), (2, 1))
+        # Retry-After (60s) outweighs the first backoff step (10s).
+        apply_async.assert_called_once_with(args=[ids[:2], self.config.id], kwargs={'attempt': 1}, countdown=60)
+        statuses = dict(Message.objects.filter(pk__in=ids).values_list('id', 'status'))
+        self.assertEqual(statuses, {ids[0]: 'pending_dispatch', ids[1]: 'pending_dispatch', ids[2]: 'failed'})
+
+        # Out of retries: the same errors fail the messages.
+        with patch('meta_integration.utils.send_whatsapp_message', side_effect=fake_send), \
+                patch('meta_integration.tasks.send_whatsapp_messages_batch_task.apply_async') as apply_async:
+            counts = sender.send_outgoing_batch(ids[:2], self.config.id, attempt=2)
+        apply_async.assert_not_called()
+        self.assertEqual(counts['failed'], 2)
+        self.assertEqual(Message.objects.get(pk=ids[1]).error_details['status_code'], 503)
+
+    def test_missing_config_fails_messages(self):
+        with patch('meta_integration.utils.send_whatsapp_message') as send:
+            counts = sender.send_outgoing_batch([m.id for m in self.messages], 999999)
+        send.assert_not_called()
+        self.assertEqual(counts['failed'], 3)
+        self.assertFalse(Message.objects.filter(pk__in=[m.id for m in self.messages]).exclude(status='failed').exists())
+
+    def test_queue_outgoing_messages_chunks(self):
+        with patch('meta_integration.tasks.send_whatsapp_messages_batch_task.delay') as delay:
+            sender.queue_outgoing_messages([m.id for m in self.messages], self.config.id)
+        self.assertEqual([c.args[0] for c in delay.call_args_list],
+                         [[self.messages[0].id, self.messages[1].id], [self.messages[2].id]])
@@ -0,0 +1,110 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from conversations.models import Contact, Message
+from whatsappcrm_backend.redis_client import get_redis
+from . import sender, throttle
+from .models import MetaAppConfig
+from .tasks import send_whatsapp_message_task
+
+
+class _RedisKeysMixin:
+    def setUp(self):
+        super().setUp()
+        self.redis = get_redis()
+        self._clear()
+        self.addCleanup(self._clear)
+
+    def _clear(self):
+        keys = self.redis.keys('test:meta:throttle:*')
+        if keys:
+            self.redis.delete(*keys)
+
+
+@patch.object(throttle, 'SENDER_BUCKET_KEY', 'test:meta:throttle:pn:{}')
+@patch.object(throttle, 'PAIR_BUCKET_KEY', 'test:meta:throttle:pair:{}:{}')
+@patch.object(throttle, 'STATS_KEY', 'test:meta:throttle:stats:{}')
+@override_settings(META_SEND_RATE_PER_SECOND=10, META_SEND_BURST=5,
+                   META_SEND_PAIR_RATE_PER_SECOND=1, META_SEND_PAIR_BURST=2)
+class TokenBucketTests(_RedisKeysMixin, SimpleTestCase):
+    """Sends within the burst go out at once; beyond it each send is given a
+    later slot at the configured rate instead of being rejected, and the
+    per-recipient pair bucket holds back a single chatty recipient."""
+
+    def test_burst_then_spaced_slots(self):
+        recipients = [f"26377{i:07d}" for i in range(8)]
+        waits = throttle.reserve_many("pn-1", recipients)
+        self.assertEqual(waits[:5], [0.0] * 5)
+        self.assertAlmostEqual(waits[5], 0.1, delta=0.02)
+        self.assertAlmostEqual(waits[7], 0.3, delta=0.02)
+
+        metrics = throttle.bucket_metrics("pn-1")
+        self.assertEqual(metrics['backlog'], 3)
+        self.assertEqual(metrics['tokens'], 0)
+        self.assertEqual((metrics['immediate'], metrics['deferred']), (5, 3))
+
+    def test_pair_rate_limits_one_recipient(self):
+        waits = throttle.reserve_many("pn-2", ["263771111111"] * 3)
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 1.0, delta=0.02)
+        self.assertEqual(throttle.reserve("pn-2", "263772222222"), 0.0)
+
+    def test_disabled_or_redis_down_sends_immediately(self):
+        with override_settings(META_SEND_RATE_PER_SECOND=0):
+            self.assertEqual(throttle.reserve_many("pn-3", ["a"] * 20), [0.0] * 20)
+        with patch.object(throttle, 'get_redis', side_effect=ConnectionError("down")):
+            self.assertEqual(throttle.reserve("pn-3", "a"), 0.0)
+
+
+@patch.object(throttle, 'SENDER_BUCKET_KEY', 'test:meta:throttle:pn:{}')
+@patch.object(throttle, 'PAIR_BUCKET_KEY', 'test:meta:throttle:pair:{}:{}')
+@patch.object(throttle, 'STATS_KEY', 'test:meta:throttle:stats:{}')
+@override_settings(META_SEND_RATE_PER_SECOND=10, META_SEND_BURST=2, META_SEND_PAIR_RATE_PER_SECOND=0)
+class ThrottledSendTests(_RedisKeysMixin, TestCase):
+    """Senders defer over-rate messages with a countdown and send them later
+    without reserving a second slot."""
+
+    def setUp(self):
+        super().setUp()
+        self.config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+        self.addCleanup(sender.close_sessions)
+        self.messages = [
+            Message.objects.create(
+                contact=Contact.objects.create(whatsapp_id=f"26377000000{i}"), direction='out',
+                message_type='text', content_payload={"body": f"msg {i}"}, status='pending_dispatch',
+            )
+            for i in range(4)
+        ]
+
+    def test_single_send_task_defers_when_over_rate(self):
+        throttle.reserve_many(self.config.phone_number_id, ["x", "y"])
+        message = self.messages[0]
+        with patch('meta_integration.tasks.send_whatsapp_message') as send, \
+                patch.object(send_whatsapp_message_task, 'apply_async') as apply_async:
+            send_whatsapp_message_task.apply(args=[message.id, self.config.id])
+        send.assert_not_called()
+        self.assertEqual(apply_async.call_args.kwargs['kwargs'], {'throttled': True})
+        self.assertGreater(apply_async.call_args.kwargs['countdown'], 0)
+
+        with patch('meta_integration.tasks.send_whatsapp_message', return_value={"messages": [{"id": "wamid.T"}]}) as send:
+            send_whatsapp_message_task.apply(args=[message.id, self.config.id], kwargs={'throttled': True})
+        send.assert_called_once()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.wamid), ('sent', "wamid.T"))
+
+    def test_batch_sends_burst_and_requeues_rest(self):
+        ids = [m.id for m in self.messages]
+        with patch('meta_integration.utils.send_whatsapp_message',
+                   side_effect=lambda to_phone_number, **kw: {"messages": [{"id": f"wamid.{to_phone_number}"}]}) as send, \
+                patch('meta_integration.tasks.send_whatsapp_messages_batch_task.apply_async') as apply_async:
+            counts = sender.send_outgoing_batch(ids, self.config.id)
+        self.assertEqual((counts['sent'], counts['deferred']), (2, 2))
+        self.assertEqual(send.call_count, 2)
+        requeued = [i for c in apply_async.call_args_list for i in c.kwargs['args'][0]]
+        self.assertEqual(sorted(requeued), ids[2:])
+        self.assertTrue(all(c.kwargs['kwargs'] == {'throttled': True, 'attempt': 0} for c in apply_async.call_args_list))
+        self.assertEqual(Message.objects.filter(pk__in=ids[2:], status='pending_dispatch').count(), 2)
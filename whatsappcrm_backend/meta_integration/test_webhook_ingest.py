@@ -0,0 +1,245 @@
+import hashlib
+import hmac
+import json
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from conversations.models import Contact, Message
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from . import webhook_ingest
+from .models import MetaAppConfig, WebhookEventLog
+from .views import MetaWebhookAPIView
+
+
+def _message_payload(messages, phone_number_id="987654321"):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "111222333",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "metadata": {"phone_number_id": phone_number_id},
+                    "contacts": [{"wa_id": messages[0]["from"], "profile": {"name": "Nyasha"}}],
+                    "messages": messages,
+                },
+            }],
+        }],
+    }
+
+
+def _text(wamid, sender, body="hi", ts="1700000000"):
+    return {"id": wamid, "from": sender, "type": "text", "timestamp": ts, "text": {"body": body}}
+
+
+class WebhookBatchIngestTests(TestCase):
+    """In fast-ack mode the webhook view no longer writes anything itself;
+    process_webhook_batch has to produce the same Contact/Message/
+    WebhookEventLog rows the synchronous handle_message path did, in a number
+    of queries that doesn't grow with the batch, and must not start a flow
+    twice when Meta redelivers a message."""
+
+    def setUp(self):
+        self.config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+
+    def _entry(self, payload):
+        return {"body": json.dumps(payload), "config_id": str(self.config.id)}
+
+    def _run(self, payloads):
+        with patch('flows.tasks.process_flow_for_message_task.delay') as flow_delay, \
+                patch('meta_integration.tasks.send_read_receipt_task.delay') as receipt_delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            webhook_ingest.process_webhook_batch([self._entry(p) for p in payloads])
+        return flow_delay, receipt_delay
+
+    def test_messages_are_stored_and_dispatched_in_order(self):
+        flow_delay, receipt_delay = self._run([
+            _message_payload([_text("wamid.A", "263771111111", "first")]),
+            _message_payload([_text("wamid.B", "263771111111", "second", ts="1700000050")]),
+        ])
+        contact = Contact.objects.get(whatsapp_id="263771111111")
+        self.assertEqual(contact.name, "Nyasha")
+        self.assertEqual(contact.associated_app_config, self.config)
+        messages = list(Message.objects.filter(contact=contact).order_by('id'))
+        self.assertEqual([m.text_content for m in messages], ["first", "second"])
+        self.assertEqual([c.args[0] for c in flow_delay.call_args_list], [m.id for m in messages])
+        self.assertEqual(receipt_delay.call_count, 2)
+        log = WebhookEventLog.objects.get(event_identifier="wamid.A")
+        self.assertEqual(log.processing_status, 'processing_queued')
+        self.assertEqual(log.message, messages[0])
+
+    def test_redelivered_message_is_not_processed_twice(self):
+        payload = _message_payload([_text("wamid.A", "263771111111")])
+        self._run([payload, payload])
+        flow_delay, _ = self._run([payload])
+        self.assertEqual(Message.objects.filter(wamid="wamid.A").count(), 1)
+        self.assertEqual(WebhookEventLog.objects.filter(event_identifier="wamid.A").count(), 1)
+        flow_delay.assert_not_called()
+
+    def test_status_updates_and_other_events(self):
+        contact = Contact.objects.create(whatsapp_id="263772222222")
+        outgoing = Message.objects.create(contact=contact, direction='out', wamid="wamid.OUT", content_payload={})
+        status_payload = {
+            "object": "whatsapp_business_account",
+            "entry": [{"id": "111222333", "changes": [
+                {"field": "messages", "value": {"metadata": {"phone_number_id": "987654321"}, "statuses": [
+                    {"id": "wamid.OUT", "status": "delivered", "timestamp": "1700000000"},
+                    {"id": "wamid.OUT", "status": "read", "timestamp": "1700000100"},
+                    {"id": "wamid.UNKNOWN", "status": "read", "timestamp": "1700000100"},
+                ]}},
+                {"field": "message_template_status_update", "value": {"message_template_id": 7, "event": "APPROVED"}},
+            ]}],
+        }
+        self._run([status_payload])
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, 'read')
+        self.assertEqual(WebhookEventLog.objects.get(event_identifier="wamid.OUT").processing_status, 'processed')
+        self.assertEqual(WebhookEventLog.objects.get(event_identifier="wamid.UNKNOWN").processing_status, 'ignored')
+        self.assertTrue(WebhookEventLog.objects.filter(event_type='template_status').exists())
+
+    def test_status_update_records_conversation_and_pricing(self):
+        contact = Contact.objects.create(whatsapp_id="263772222222")
+        outgoing = Message.objects.create(contact=contact, direction='out', wamid="wamid.OUT", content_payload={})
+        self._run([{
+            "object": "whatsapp_business_account",
+            "entry": [{"id": "111222333", "changes": [
+                {"field": "messages", "value": {"metadata": {"phone_number_id": "987654321"}, "statuses": [
+                    {"id": "wamid.OUT", "status": "sent", "timestamp": "1700000000",
+                     "conversation": {"id": "conv-123", "origin": {"type": "service"}},
+                     "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}},
+                    {"id": "wamid.OUT", "status": "delivered", "timestamp": "1700000050"},
+                ]}},
+            ]}],
+        }])
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, 'delivered')
+        self.assertEqual(outgoing.conversation_id_from_meta, "conv-123")
+        self.assertEqual(outgoing.pricing_model_from_meta, "CBP")
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def count(prefix, n):
+            payloads = [_message_payload([_text(f"wamid.{prefix}{i}", f"26377{prefix}{i:05d}")]) for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                self._run(payloads)
+            return len(ctx.captured_queries)
+        self.assertEqual(count("1", 3), count("2", 30))
+
+    def test_invalid_body_is_logged_not_raised(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            webhook_ingest.process_webhook_batch([{"body": "{not json", "config_id": str(self.config.id)}])
+        self.assertEqual(WebhookEventLog.objects.get().processing_status, 'error')
+
+
+class WebhookFastAckViewTests(TestCase):
+    """The fast-ack view must still reject bad signatures, and must fall back
+    to synchronous processing rather than drop an event Redis didn't take."""
+
+    def setUp(self):
+        self.config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+        self.body = json.dumps(_message_payload([_text("wamid.V", "263773333333")])).encode()
+
+    def _post(self, secret="secret"):
+        signature = 'sha256=' + hmac.new(secret.encode(), self.body, hashlib.sha256).hexdigest()
+        request = RequestFactory().post('/webhook/', data=self.body, content_type='application/json',
+                                        HTTP_X_HUB_SIGNATURE_256=signature)
+        return MetaWebhookAPIView.as_view()(request)
+
+    @override_settings(META_WEBHOOK_FAST_ACK=True)
+    def test_queues_and_returns_without_db_writes(self):
+        with patch.object(webhook_ingest, 'enqueue_webhook', return_value=True) as enqueue:
+            response = self._post()
+        self.assertEqual(response.status_code, 200)
+        enqueue.assert_called_once()
+        self.assertFalse(WebhookEventLog.objects.exists())
+
+    @override_settings(META_WEBHOOK_FAST_ACK=True)
+    def test_bad_signature_is_still_rejected(self):
+        with patch.object(webhook_ingest, 'enqueue_webhook') as enqueue:
+            response = self._post(secret="wrong")
+        self.assertEqual(response.status_code, 403)
+        enqueue.assert_not_called()
+
+    @override_settings(META_WEBHOOK_FAST_ACK=True)
+    def test_falls_back_to_synchronous_when_queueing_fails(self):
+        with patch.object(webhook_ingest, 'enqueue_webhook', return_value=False), \
+                patch('flows.tasks.process_flow_for_message_task.delay'), \
+                patch('meta_integration.tasks.send_read_receipt_task.delay'):
+            response = self._post()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Message.objects.filter(wamid="wamid.V").exists())
+
+
+@patch.object(webhook_ingest, 'STREAM_KEY', 'test:meta:webhook:events:{}')
+@patch.object(webhook_ingest, 'DRAIN_SCHEDULED_KEY', 'test:meta:webhook:drain_scheduled:{}')
+class WebhookStreamRoundTripTests(TestCase):
+    """Queue -> drain against the real Redis stream: every queued body is
+    written once and acknowledged, so a second drain finds nothing."""
+
+    def setUp(self):
+        self.config = MetaAppConfig.objects.create(
+            name="Test Config", app_secret="secret", access_token="token",
+            phone_number_id="987654321", waba_id="111222333", verify_token="verify", is_active=True,
+        )
+        self.stream_key = database_key('test:meta:webhook:events:{}')
+        keys = self.stream_key, database_key('test:meta:webhook:drain_scheduled:{}')
+        get_redis().delete(*keys)
+        self.addCleanup(get_redis().delete, *keys)
+
+    def test_enqueue_then_drain(self):
+        with patch('meta_integration.tasks.drain_webhook_stream_task.delay') as drain_delay:
+            for i in range(3):
+                body = json.dumps(_message_payload([_text(f"wamid.S{i}", "263774444444")]))
+                self.assertTrue(webhook_ingest.enqueue_webhook(body, self.config))
+        drain_delay.assert_called_once()
+
+        with patch('flows.tasks.process_flow_for_message_task.delay'), \
+                patch('meta_integration.tasks.send_read_receipt_task.delay'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(webhook_ingest.drain_stream(batch_size=2), 3)
+        self.assertEqual(Message.objects.filter(wamid__startswith="wamid.S").count(), 3)
+        self.assertEqual(webhook_ingest.drain_stream(), 0)
+
+    @override_settings(META_WEBHOOK_MAX_DELIVERIES=2)
+    def test_failing_entry_does_not_hold_up_the_stream(self):
+        real_batch = webhook_ingest.process_webhook_batch
+
+        def process(entries):
+            if any('wamid.BAD' in fields['body'] for fields in entries):
+                raise ValueError("cannot process")
+            return real_batch(entries)
+
+        with patch('meta_integration.tasks.drain_webhook_stream_task.delay'):
+            for wamid in ("wamid.S0", "wamid.BAD", "wamid.S1"):
+                body = json.dumps(_message_payload([_text(wamid, "263774444444")]))
+                self.assertTrue(webhook_ingest.enqueue_webhook(body, self.config))
+
+        def drain():
+            with patch.object(webhook_ingest, 'process_webhook_batch', side_effect=process), \
+                    patch.object(webhook_ingest, 'CLAIM_IDLE_MS', 0), \
+                    patch('flows.tasks.process_flow_for_message_task.delay'), \
+                    patch('meta_integration.tasks.send_read_receipt_task.delay'), \
+                    self.captureOnCommitCallbacks(execute=True):
+                return webhook_ingest.drain_stream()
+
+        # The good entries go through; the bad one stays pending for a retry.
+        self.assertEqual(drain(), 2)
+        self.assertEqual(Message.objects.filter(wamid__startswith="wamid.S").count(), 2)
+        self.assertEqual(get_redis().xpending(self.stream_key, webhook_ingest.GROUP_NAME)['pending'], 1)
+        self.assertFalse(WebhookEventLog.objects.filter(processing_status='failed').exists())
+
+        # Second delivery reaches the limit: recorded as failed and acknowledged.
+        self.assertEqual(drain(), 0)
+        failed = WebhookEventLog.objects.get(processing_status='failed')
+        self.assertEqual(failed.payload['entry'][0]['changes'][0]['value']['messages'][0]['id'], "wamid.BAD")
+        self.assertEqual(failed.app_config, self.config)
+        self.assertEqual(get_redis().xpending(self.stream_key, webhook_ingest.GROUP_NAME)['pending'], 0)
+        self.assertEqual(drain(), 0)
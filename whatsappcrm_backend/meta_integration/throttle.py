@@ -0,0 +1,172 @@
+# whatsappcrm_backend/meta_integration/throttle.py
+"""
+Redis token buckets for outbound WhatsApp sends.
+
+Meta limits both the throughput of a business phone number and the rate at
+which one phone number may message the same user (the pair rate). Nothing
+enforced either, so a fan-out overshot them, Meta rejected the excess, and
+the failed sends came back as 60s Celery retries all at once.
+
+Every send now reserves one token from two buckets, atomically in one Lua
+script:
+
+  * the sender bucket, keyed by MetaAppConfig.phone_number_id
+    (META_SEND_RATE_PER_SECOND, burst META_SEND_BURST);
+  * the pair bucket, keyed by phone_number_id + recipient
+    (META_SEND_PAIR_RATE_PER_SECOND, burst META_SEND_PAIR_BURST).
+
+A reservation always succeeds and returns how long the caller has to wait
+before sending: buckets may go negative, and a negative balance is the queue
+of sends already scheduled ahead. The caller defers the send by that wait
+(Celery countdown) and then sends without reserving again, so a burst is
+spread out at the configured rate instead of being retried in waves.
+
+bucket_metrics() reports fill level and backlog for a phone number, plus
+counters of immediate and deferred sends. If Redis is unavailable the
+throttle lets sends through unthrottled. META_SEND_RATE_PER_SECOND = 0
+disables throttling.
+"""
+import logging
+import math
+import time
+
+from django.conf import settings
+
+from whatsappcrm_backend.redis_client import get_redis
+
+logger = logging.getLogger('meta_integration')
+
+SENDER_BUCKET_KEY = 'meta:throttle:pn:{}'
+PAIR_BUCKET_KEY = 'meta:throttle:pair:{}:{}'
+STATS_KEY = 'meta:throttle:stats:{}'
+
+# KEYS: bucket hashes..., then the stats hash.
+# ARGV: now_ms, then (tokens_per_ms, capacity) for each bucket.
+# Refills each bucket, reserves one token from every bucket and returns the
+# wait in ms until the reservation falls due (0 = send now).
+_RESERVE = """
+local now = tonumber(ARGV[1])
+local buckets = #KEYS - 1
+local wait = 0
+local state = {}
+for i = 1, buckets do
+    local rate = tonumber(ARGV[2 * i])
+    local capacity = tonumber(ARGV[2 * i + 1])
+    local current = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(current[1]) or capacity
+    local ts = tonumber(current[2]) or now
+    if now > ts then
+        tokens = math.min(capacity, tokens + (now - ts) * rate)
+    end
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    state[i] = {tokens, rate, capacity}
+end
+for i = 1, buckets do
+    local tokens = state[i][1] - 1
+    local rate = state[i][2]
+    local capacity = state[i][3]
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil((capacity - tokens) / rate) + 1000)
+end
+if wait > 0 then
+    redis.call('HINCRBY', KEYS[#KEYS], 'deferred', 1)
+else
+    redis.call('HINCRBY', KEYS[#KEYS], 'immediate', 1)
+end
+return math.ceil(wait)
+"""
+
+_script = None
+
+
+def _reserve_script(redis_client):
+    global _script
+    if _script is None:
+        _script = redis_client.register_script(_RESERVE)
+    return _script
+
+
+def _rates():
+    sender_rate = float(getattr(settings, 'META_SEND_RATE_PER_SECOND', 80) or 0)
+    sender_burst = float(getattr(settings, 'META_SEND_BURST', 0) or 0) or sender_rate
+    pair_rate = float(getattr(settings, 'META_SEND_PAIR_RATE_PER_SECOND', 1 / 6) or 0)
+    pair_burst = float(getattr(settings, 'META_SEND_PAIR_BURST', 10) or 0) or 1
+    return sender_rate, sender_burst, pair_rate, pair_burst
+
+
+def throttle_enabled() -> bool:
+    return _rates()[0] > 0
+
+
+def _reserve_args(phone_number_id, recipient, now_ms):
+    sender_rate, sender_burst, pair_rate, pair_burst = _rates()
+    keys = [SENDER_BUCKET_KEY.format(phone_number_id)]
+    args = [now_ms, sender_rate / 1000.0, sender_burst]
+    if recipient and pair_rate > 0:
+        keys.append(PAIR_BUCKET_KEY.format(phone_number_id, recipient))
+        args += [pair_rate / 1000.0, pair_burst]
+    keys.append(STATS_KEY.format(phone_number_id))
+    return keys, args
+
+
+def reserve(phone_number_id: str, recipient: str = None) -> float:
+    """Reserve a send from `phone_number_id` to `recipient`. Returns seconds
+    to wait before sending (0.0 = send now)."""
+    return reserve_many(phone_number_id, [recipient])[0]
+
+
+def reserve_many(phone_number_id: str, recipients) -> list:
+    """reserve() for many recipients in one round trip; waits in the same order."""
+    recipients = list(recipients)
+    if not throttle_enabled() or not phone_number_id:
+        return [0.0] * len(recipients)
+    try:
+        redis_client = get_redis()
+        script = _reserve_script(redis_client)
+        now_ms = int(time.time() * 1000)
+        pipe = redis_client.pipeline(transaction=False)
+        for recipient in recipients:
+            keys, args = _reserve_args(phone_number_id, recipient, now_ms)
+            script(keys=keys, args=args, client=pipe)
+        waits_ms = pipe.execute()
+    except Exception:
+        logger.warning(f"Redis unavailable for the send throttle; sending from {phone_number_id} unthrottled.", exc_info=True)
+        return [0.0] * len(recipients)
+    return [int(wait_ms) / 1000.0 for wait_ms in waits_ms]
+
+
+def bucket_metrics(phone_number_id: str) -> dict:
+    """Current fill level and backlog of a phone number's sender bucket, and
+    how many sends went out immediately vs. deferred."""
+    sender_rate, sender_burst, _, _ = _rates()
+    metrics = {
+        'phone_number_id': phone_number_id,
+        'enabled': sender_rate > 0,
+        'rate_per_second': sender_rate,
+        'capacity': sender_burst,
+        'tokens': sender_burst,
+        'backlog': 0,
+        'backlog_seconds': 0.0,
+        'immediate': 0,
+        'deferred': 0,
+    }
+    try:
+        redis_client = get_redis()
+        tokens, ts = redis_client.hmget(SENDER_BUCKET_KEY.format(phone_number_id), 'tokens', 'ts')
+        stats = redis_client.hgetall(STATS_KEY.format(phone_number_id))
+    except Exception:
+        logger.warning(f"Redis unavailable reading send throttle metrics for {phone_number_id}.", exc_info=True)
+        metrics['error'] = 'redis_unavailable'
+        return metrics
+
+    if tokens is not None and sender_rate > 0:
+        elapsed_ms = max(0, int(time.time() * 1000) - int(ts))
+        current = min(sender_burst, float(tokens) + elapsed_ms * sender_rate / 1000.0)
+        metrics['tokens'] = round(max(current, 0.0), 2)
+        metrics['backlog'] = math.ceil(max(-current, 0.0))
+        metrics['backlog_seconds'] = round(max(-current, 0.0) / sender_rate, 2)
+    metrics['immediate'] = int(stats.get('immediate', 0))
+    metrics['deferred'] = int(stats.get('deferred', 0))
+    return metrics
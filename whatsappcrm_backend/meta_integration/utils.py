@@ -6,6 +6,7 @@ import logging
 # from django.conf import settings # No longer using settings for API creds
 from .models import MetaAppConfig # Import the model
 from django.core.exceptions import ObjectDoesNotExist
+from .sender import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +42,8 @@ def get_config_by_phone_number_id(phone_number_id: str):
         logger.error(f"Error retrieving MetaAppConfig by phone_number_id {phone_number_id}: {e}", exc_info=True)
         return None
 
-def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, config: MetaAppConfig = None):
+def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, config: MetaAppConfig = None,
+                          raise_errors: bool = False):
     """
     Sends a WhatsApp message using the Meta Graph API.
     Uses MetaAppConfig from the database.
@@ -52,6 +54,9 @@ def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, c
         data (dict): The payload specific to the message type.
         config (MetaAppConfig, optional): The MetaAppConfig instance to use. 
                                           If None, tries to fetch the active one.
+        raise_errors (bool): Re-raise HTTP and connection errors (after logging
+                             them) instead of returning None, so the caller
+                             can tell a retryable failure from a final one.
     Returns:
         dict: The JSON response from Meta API, or None if an error occurs.
     """
@@ -64,7 +69,6 @@ def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, c
 
     api_version = config.api_version
     phone_number_id = config.phone_number_id
-    access_token = config.access_token
 
     # No need to check settings from django.conf anymore
     # if not all([api_version, phone_number_id, access_token]):
@@ -72,11 +76,6 @@ def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, c
     #     return None
 
     url = f"https://graph.facebook.com/{api_version}/{phone_number_id}/messages"
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-    }
 
     payload = {
         "messaging_product": "whatsapp",
@@ -94,7 +93,8 @@ def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, c
     logger.debug(f"Sending WhatsApp message via config '{config.name}'. URL: {url}, Payload: {json.dumps(payload)}")
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=20)
+        # Pooled keep-alive session (see sender.py); it carries the auth headers.
+        response = get_session(config).post(url, json=payload, timeout=20)
         response.raise_for_status()
         
         response_json = response.json()
@@ -108,8 +108,12 @@ def send_whatsapp_message(to_phone_number: str, message_type: str, data: dict, c
             logger.error(f"Meta API error details: {error_details}")
         except json.JSONDecodeError:
             logger.error("Could not decode Meta API error response as JSON.")
+        if raise_errors:
+            raise
     except requests.exceptions.RequestException as e:
         logger.error(f"Error sending message to {to_phone_number} via config '{config.name}': {e}")
+        if raise_errors:
+            raise
     except Exception as e:
         logger.error(f"An unexpected error occurred while sending message to {to_phone_number} via config '{config.name}': {e}", exc_info=True)
         
@@ -194,13 +198,8 @@ def send_read_receipt_api(wamid: str, config: MetaAppConfig, show_typing_indicat
     
     api_version = config.api_version
     phone_number_id = config.phone_number_id
-    access_token = config.access_token
     
     url = f"https://graph.facebook.com/{api_version}/{phone_number_id}/messages"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-    }
     
     payload = {
         "messaging_product": "whatsapp",
@@ -209,7 +208,7 @@ def send_read_receipt_api(wamid: str, config: MetaAppConfig, show_typing_indicat
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
+        response = get_session(config).post(url, json=payload, timeout=10)
         response.raise_for_status()
         
         logger.info(f"Read receipt sent for WAMID {wamid}")
@@ -4,6 +4,8 @@ import json
 import logging
 import hashlib # For signature verification
 import hmac    # For signature verification
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 from django.http import HttpResponse, JsonResponse
 from django.views import View
@@ -12,7 +14,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 from datetime import datetime
-from django.db import transaction
+from django.db import connection, connections, transaction
 from django.conf import settings # To get APP_SECRET for signature verification
 
 from rest_framework import viewsets, permissions, status
@@ -28,10 +30,54 @@ from .serializers import (
 from conversations.models import Contact, Message
 # from flows.services import process_message_for_flow # Import moved into handle_message
 from .tasks import send_whatsapp_message_task, send_read_receipt_task
+from . import throttle, webhook_ingest
 
 # Use a logger specific to this app
 logger = logging.getLogger('meta_integration')
 
+# Per-screen latency counters for the WhatsApp Flow endpoint: a hash with
+# "<screen>:count", "<screen>:decrypt_ms", "<screen>:handler_ms",
+# "<screen>:encrypt_ms" and "<screen>:over_budget" fields.
+FLOW_LATENCY_KEY = 'meta:flow_endpoint:latency:{}'  # database
+
+_flow_executor = None
+
+
+def _get_flow_executor():
+    global _flow_executor
+    if _flow_executor is None:
+        _flow_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'WHATSAPP_FLOW_HANDLER_WORKERS', 8),
+            thread_name_prefix='flow-endpoint',
+        )
+    return _flow_executor
+
+
+def _run_and_close_connections(func, *args):
+    """Run `func` on a pool thread, closing the thread's DB connections after."""
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def _record_flow_latency(screen, decrypt_ms, handler_ms, encrypt_ms, over_budget):
+    """Best-effort: add one request's timings to the per-screen counters."""
+    from whatsappcrm_backend.redis_client import database_key, get_redis
+    key = database_key(FLOW_LATENCY_KEY)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(key, f"{screen}:count", 1)
+        pipe.hincrbyfloat(key, f"{screen}:decrypt_ms", round(decrypt_ms, 3))
+        pipe.hincrbyfloat(key, f"{screen}:handler_ms", round(handler_ms, 3))
+        pipe.hincrbyfloat(key, f"{screen}:encrypt_ms", round(encrypt_ms, 3))
+        if over_budget:
+            pipe.hincrby(key, f"{screen}:over_budget", 1)
+        pipe.execute()
+    except Exception:
+        logger.warning("Redis unavailable recording WhatsApp Flow endpoint latency.", exc_info=True)
+
+
 # Sensitive header names that should be filtered from logs
 SENSITIVE_HEADER_NAMES = ['authorization', 'cookie', 'x-access-token', 'x-api-key']
 
@@ -188,6 +234,12 @@ class MetaWebhookAPIView(View):
                 )
                 return HttpResponse("Invalid signature", status=403)
 
+        # Fast-ack mode: queue the verified body and answer Meta immediately;
+        # drain_webhook_stream_task writes it in a batch. Falls through to
+        # synchronous processing if it can't be queued.
+        if webhook_ingest.fast_ack_enabled() and webhook_ingest.enqueue_webhook(raw_payload_str, active_config):
+            return HttpResponse("EVENT_RECEIVED", status=200)
+
         logger.info(f"Webhook POST request received (Signature OK if secret configured). Body size: {len(raw_payload_str)}. Config: {active_config.name}, Phone Number ID: {phone_number_id_from_payload}")
         logger.debug(f"Raw webhook payload: {raw_payload_str}")
 
@@ -278,7 +330,7 @@ class MetaWebhookAPIView(View):
         Creates Contact and Message objects, then queues flow processing asynchronously.
         """
         from conversations.services import get_or_create_contact_by_wa_id
-        from flows.tasks import process_flow_for_message_task
+        from flows.lanes import dispatch_flow_processing
 
         whatsapp_message_id = message_data.get("id")
         from_phone = message_data.get("from")
@@ -343,9 +395,9 @@ class MetaWebhookAPIView(View):
             
             # Queue flow processing asynchronously
             transaction.on_commit(
-                lambda: process_flow_for_message_task.delay(incoming_msg_obj.id)
+                lambda: dispatch_flow_processing(incoming_msg_obj.id, contact.whatsapp_id)
             )
-            logger.info(f"Queued process_flow_for_message_task for message {incoming_msg_obj.id}")
+            logger.info(f"Queued flow processing for message {incoming_msg_obj.id}")
             
             # Send read receipt asynchronously
             self._send_read_receipt(whatsapp_message_id, app_config)
@@ -504,57 +556,131 @@ class WhatsAppFlowEndpointView(View):
 
     def _handle_encrypted_request(self, encrypted_flow_data, encrypted_aes_key,
                                   initial_vector, phone_number_id=None):
-        """Decrypt the request, process it, and return an encrypted response."""
+        """
+        Decrypt the request, process it, and return an encrypted response.
+
+        Decrypt, handler and encrypt times are logged and added to the
+        per-screen counters in FLOW_LATENCY_KEY. A handler still running
+        once WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS have passed since the
+        request arrived is answered with a fallback screen instead (see
+        _process_within_budget).
+        """
         from .flow_crypto import decrypt_flow_request, encrypt_flow_response
+        from .flow_keys import get_flow_private_key
+
+        started = time.monotonic()
 
-        # Find a config that has a private key, preferring the one matching phone_number_id
-        private_key_pem = self._get_private_key(phone_number_id)
-        if not private_key_pem:
+        # Parsed key for the config matching phone_number_id (or the first active
+        # config with a key), cached per process -- see flow_keys.py.
+        try:
+            private_key = get_flow_private_key(phone_number_id)
+        except Exception as e:
+            logger.error(f"WhatsApp Flow endpoint: Could not load the private key: {e}", exc_info=True)
+            return HttpResponse(status=500)
+        if private_key is None:
             logger.error("WhatsApp Flow endpoint: No private key configured for decryption.")
             return HttpResponse(status=500)
 
         try:
             body, aes_key, iv = decrypt_flow_request(
                 encrypted_flow_data, encrypted_aes_key,
-                initial_vector, private_key_pem,
+                initial_vector, private_key,
             )
         except Exception as e:
             logger.error(f"WhatsApp Flow endpoint: Decryption failed: {e}", exc_info=True)
             return HttpResponse(status=500)
+        decrypted = time.monotonic()
 
         logger.info(
             f"WhatsApp Flow endpoint (encrypted). Action: {body.get('action')}, "
             f"flow_token: {body.get('flow_token')}"
         )
 
+        over_budget = False
         try:
-            response_data = self._process_body(body)
+            response_data, over_budget = self._process_within_budget(body, started)
         except Exception as e:
             logger.error(f"WhatsApp Flow endpoint: Unhandled error processing body: {e}", exc_info=True)
-            # Fall back to the last known screen so Meta can display a meaningful error
-            # instead of a generic "something went wrong" overlay.
-            fallback_screen = body.get('screen', '') if isinstance(body, dict) else ''
-            if not fallback_screen or fallback_screen not in ('LOGIN', 'REGISTER'):
-                # data_exchange requests come from an already-open form screen.
-                # Default to REGISTER since it has both fields (error_message, is_error)
-                # defined; LOGIN uses the same data contract.
-                fallback_screen = 'REGISTER' if body.get('action') == 'data_exchange' else 'LOGIN'
-            response_data = {
-                "screen": fallback_screen,
-                "data": {
-                    "error_message": "An internal error occurred. Please try again.",
-                    "is_error": True,
-                },
-            }
+            response_data = self._fallback_response(body, "An internal error occurred. Please try again.")
+        handled = time.monotonic()
 
         try:
             encrypted_response = encrypt_flow_response(response_data, aes_key, iv)
         except Exception as e:
             logger.error(f"WhatsApp Flow endpoint: Encryption failed: {e}", exc_info=True)
             return HttpResponse(status=500)
+        encrypted = time.monotonic()
+
+        screen = body.get('screen') or body.get('action') or 'unknown'
+        decrypt_ms = (decrypted - started) * 1000
+        handler_ms = (handled - decrypted) * 1000
+        encrypt_ms = (encrypted - handled) * 1000
+        logger.info(
+            f"WhatsApp Flow endpoint timings: screen={screen}, decrypt={decrypt_ms:.1f}ms, "
+            f"handler={handler_ms:.1f}ms, encrypt={encrypt_ms:.1f}ms, over_budget={over_budget}"
+        )
+        _record_flow_latency(screen, decrypt_ms, handler_ms, encrypt_ms, over_budget)
 
         return HttpResponse(encrypted_response, content_type='text/plain')
 
+    def _process_within_budget(self, body, started):
+        """
+        Run _process_body, giving up on it once the response budget is spent.
+
+        Returns (response_data, over_budget). The handler runs on a pool thread
+        so the request thread can stop waiting for it; a handler that overruns
+        still finishes in the background. Inside an open transaction (tests,
+        ATOMIC_REQUESTS) another thread could not see its uncommitted rows, so
+        the handler runs inline there without a budget.
+
+        Bet placement also runs inline without a budget: a fallback screen
+        answered while the ticket is still being placed invites a resubmit
+        that places it a second time.
+        """
+        from football_data_app.bet_flow_handler import is_placement
+
+        if connection.in_atomic_block or (
+                body.get('action') == 'data_exchange' and is_placement(body.get('screen'), body.get('data'))):
+            return self._process_body(body), False
+        budget = getattr(settings, 'WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS', 8)
+        future = _get_flow_executor().submit(_run_and_close_connections, self._process_body, body)
+        try:
+            return future.result(timeout=max(0.0, budget - (time.monotonic() - started))), False
+        except FutureTimeoutError:
+            logger.warning(
+                f"WhatsApp Flow endpoint: screen={body.get('screen')} action={body.get('action')} "
+                f"exceeded the {budget}s response budget; answering with a fallback screen."
+            )
+            return self._fallback_response(body), True
+
+    def _fallback_response(self, body, message=None):
+        """
+        A screen Meta can render in place of the real response, so the user
+        sees `message` (default: a "taking longer than usual" notice) instead
+        of a generic "something went wrong" overlay. Betting Flow screens stay
+        where they are; anything else falls back to the last known
+        LOGIN/REGISTER screen.
+        """
+        from football_data_app.bet_flow_handler import busy_screen, is_bet_screen
+
+        fallback_screen = body.get('screen', '') if isinstance(body, dict) else ''
+        if is_bet_screen(fallback_screen):
+            if message:
+                return busy_screen(fallback_screen, body.get('data') or {}, message)
+            return busy_screen(fallback_screen, body.get('data') or {})
+        if not fallback_screen or fallback_screen not in ('LOGIN', 'REGISTER'):
+            # data_exchange requests come from an already-open form screen.
+            # Default to REGISTER since it has both fields (error_message, is_error)
+            # defined; LOGIN uses the same data contract.
+            fallback_screen = 'REGISTER' if body.get('action') == 'data_exchange' else 'LOGIN'
+        return {
+            "screen": fallback_screen,
+            "data": {
+                "error_message": message or "This is taking longer than usual. Please try again.",
+                "is_error": True,
+            },
+        }
+
     def _handle_plaintext_request(self, body):
         """Handle an unencrypted request (draft flows / testing)."""
         action = body.get('action')
@@ -580,33 +706,6 @@ class WhatsAppFlowEndpointView(View):
         logger.warning(f"WhatsApp Flow endpoint: Unknown action '{action}'")
         return {"data": {"error": "Unknown action"}}
 
-    def _get_private_key(self, phone_number_id=None):
-        """Retrieve the private key for the given phone_number_id, or fall back to
-        the first active config that has a private key configured.
-
-        Args:
-            phone_number_id (str, optional): The phone number ID to match against
-                MetaAppConfig. When provided, the matching config's key is returned.
-                Falls back to the first active config with a key if no match is found.
-
-        Returns:
-            str or None: The private key PEM string, or None if no config with a key
-                is found.
-        """
-        if phone_number_id:
-            config = MetaAppConfig.objects.filter(
-                phone_number_id=phone_number_id,
-                is_active=True,
-                flow_private_key_pem__isnull=False,
-            ).exclude(flow_private_key_pem='').first()
-            if config:
-                return config.flow_private_key_pem
-        config = MetaAppConfig.objects.filter(
-            is_active=True, flow_private_key_pem__isnull=False,
-        ).exclude(flow_private_key_pem='').first()
-        return config.flow_private_key_pem if config else None
-
-
     def _handle_init(self, body):
         """Handle INIT action - return the appropriate initial screen dict."""
         flow_token = body.get('flow_token', '')
@@ -1018,6 +1117,12 @@ class MetaAppConfigViewSet(viewsets.ModelViewSet):
         config.save(update_fields=['is_active', 'updated_at'])
         return Response(self.get_serializer(config).data, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'], url_path='send-throttle', permission_classes=[permissions.IsAdminUser])
+    def send_throttle(self, request, pk=None):
+        """Outbound send throttle fill level, backlog and counters for this number."""
+        config = self.get_object()
+        return Response(throttle.bucket_metrics(config.phone_number_id), status=status.HTTP_200_OK)
+
 class WebhookEventLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = WebhookEventLog.objects.all().select_related('app_config').order_by('-received_at')
     permission_classes = [permissions.IsAdminUser]
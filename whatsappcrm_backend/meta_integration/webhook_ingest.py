@@ -0,0 +1,512 @@
+# whatsappcrm_backend/meta_integration/webhook_ingest.py
+"""
+Fast-ack webhook ingestion.
+
+With settings.META_WEBHOOK_FAST_ACK on, MetaWebhookAPIView.post only verifies
+the signature, appends the raw body to a Redis stream and returns 200 -- no
+database work in the request. Meta retries (and eventually disables) webhooks
+that answer slowly, and a campaign can bring back several hundred replies a
+second; doing a WebhookEventLog write plus an atomic Contact/Message
+update_or_create per event inside the request doesn't keep up with that.
+
+drain_webhook_stream_task consumes the stream through a consumer group and
+processes events in batches (process_webhook_batch):
+
+  * message events: contacts are fetched/created in bulk, Message and
+    WebhookEventLog rows are written with bulk_create/bulk_update, and
+    flow processing (flows.lanes.dispatch_flow_processing) plus a read
+    receipt are dispatched per message, in arrival order, once the batch
+    commits;
+  * status events update outgoing Messages with one bulk_update;
+  * everything else (errors, template status, unhandled fields) is only
+    logged, as in the synchronous path.
+
+A redelivered message whose WebhookEventLog is already past 'pending'/'error'
+is skipped, so Meta's retries don't start the flow twice.
+
+Stream entries are acknowledged only after their batch commits. If a batch
+fails, its entries are retried one at a time; one that keeps failing stays
+pending until it has been delivered META_WEBHOOK_MAX_DELIVERIES times and is
+then recorded as a 'failed' WebhookEventLog and acknowledged. Entries left
+pending by a failure or by a worker that died mid-batch are reclaimed by the
+next drain once they have been idle for CLAIM_IDLE_MS; a periodic drain
+(CELERY_BEAT_SCHEDULE) covers a lost trigger. If Redis is unavailable the view falls back to the
+synchronous path.
+"""
+import json
+import logging
+import os
+import socket
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from conversations.models import Contact, Message
+from whatsappcrm_backend.redis_client import database_key, get_redis
+from .models import MetaAppConfig, WebhookEventLog
+
+logger = logging.getLogger('meta_integration')
+
+STREAM_KEY = 'meta:webhook:events:{}'  # database
+GROUP_NAME = 'webhook-ingest'
+DRAIN_SCHEDULED_KEY = 'meta:webhook:drain_scheduled:{}'
+DRAIN_SCHEDULED_TTL_SECONDS = 5
+STREAM_MAXLEN = 100_000
+CLAIM_IDLE_MS = 60_000
+
+# WebhookEventLog statuses meaning the message was already handed to the flow engine.
+HANDLED_MESSAGE_STATUSES = ('processing_queued', 'processed', 'ignored', 'error_final')
+
+
+def fast_ack_enabled() -> bool:
+    return getattr(settings, 'META_WEBHOOK_FAST_ACK', False)
+
+
+def _stream_key() -> str:
+    return database_key(STREAM_KEY)
+
+
+def enqueue_webhook(raw_body: str, config: MetaAppConfig) -> bool:
+    """
+    Append a verified webhook body to the ingestion stream and make sure a
+    drain is scheduled. Returns False if the body could not be queued, in which
+    case the caller should process it synchronously.
+    """
+    redis_client = get_redis()
+    try:
+        redis_client.xadd(
+            _stream_key(),
+            {'body': raw_body, 'config_id': str(config.id)},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+    except Exception:
+        logger.warning("Redis unavailable for webhook fast-ack; processing synchronously.", exc_info=True)
+        return False
+
+    # One drain per burst: whoever sets the flag schedules the task. If this
+    # fails the entry is still safe in the stream for the periodic drain.
+    try:
+        if redis_client.set(database_key(DRAIN_SCHEDULED_KEY), '1', nx=True, ex=DRAIN_SCHEDULED_TTL_SECONDS):
+            from .tasks import drain_webhook_stream_task
+            drain_webhook_stream_task.delay()
+    except Exception:
+        logger.warning("Could not schedule webhook stream drain; the periodic drain will pick it up.", exc_info=True)
+    return True
+
+
+def _ensure_group(redis_client):
+    try:
+        redis_client.xgroup_create(_stream_key(), GROUP_NAME, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def drain_stream(batch_size: int = None) -> int:
+    """Process stream entries in batches until the stream is empty. Returns
+    the number of entries processed."""
+    batch_size = batch_size or getattr(settings, 'META_WEBHOOK_BATCH_SIZE', 200)
+    redis_client = get_redis()
+    _ensure_group(redis_client)
+    # Cleared before reading so events arriving from here on schedule another drain.
+    redis_client.delete(database_key(DRAIN_SCHEDULED_KEY))
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    processed = 0
+    # Entries a crashed consumer read but never acknowledged.
+    _, stale, *_ = redis_client.xautoclaim(_stream_key(), GROUP_NAME, consumer, CLAIM_IDLE_MS, '0-0', count=batch_size)
+    if stale:
+        logger.warning(f"Reclaimed {len(stale)} stale webhook stream entries.")
+        processed += _process_and_ack(redis_client, stale)
+
+    while True:
+        response = redis_client.xreadgroup(GROUP_NAME, consumer, {_stream_key(): '>'}, count=batch_size)
+        entries = response[0][1] if response else []
+        if not entries:
+            break
+        processed += _process_and_ack(redis_client, entries)
+    return processed
+
+
+def _ack(redis_client, ids):
+    redis_client.xack(_stream_key(), GROUP_NAME, *ids)
+    redis_client.xdel(_stream_key(), *ids)
+
+
+def _process_and_ack(redis_client, entries) -> int:
+    # Entries trimmed from the stream while pending come back without fields.
+    bodies = [fields for _, fields in entries if fields]
+    try:
+        if bodies:
+            process_webhook_batch(bodies)
+    except Exception:
+        logger.error(f"Webhook batch of {len(bodies)} failed; retrying its entries one at a time.", exc_info=True)
+        return _process_one_by_one(redis_client, entries)
+    _ack(redis_client, [entry_id for entry_id, _ in entries])
+    return len(bodies)
+
+
+def _process_one_by_one(redis_client, entries) -> int:
+    """
+    Process and ack each entry on its own. An entry that still fails stays
+    pending, to be reclaimed by a later drain, until it has been delivered
+    META_WEBHOOK_MAX_DELIVERIES times; it is then recorded as a 'failed'
+    WebhookEventLog and acked, so it cannot hold up the stream.
+    """
+    max_deliveries = int(getattr(settings, 'META_WEBHOOK_MAX_DELIVERIES', 5))
+    processed = 0
+    for entry_id, fields in entries:
+        if not fields:
+            _ack(redis_client, [entry_id])
+            continue
+        try:
+            process_webhook_batch([fields])
+        except Exception as e:
+            pending = redis_client.xpending_range(_stream_key(), GROUP_NAME, min=entry_id, max=entry_id, count=1)
+            deliveries = pending[0]['times_delivered'] if pending else max_deliveries
+            if deliveries < max_deliveries:
+                logger.warning(f"Webhook stream entry {entry_id} failed (delivery {deliveries}/{max_deliveries}); "
+                               f"leaving it pending for a retry.", exc_info=True)
+                continue
+            logger.error(f"Webhook stream entry {entry_id} failed {deliveries} times; giving up on it.", exc_info=True)
+            _dead_letter(fields, e)
+        else:
+            processed += 1
+        _ack(redis_client, [entry_id])
+    return processed
+
+
+def _dead_letter(fields, error):
+    body = fields.get('body') or ''
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = {'raw_body': body[:5000]}
+    config_id = str(fields.get('config_id', ''))
+    WebhookEventLog.objects.create(
+        app_config=MetaAppConfig.objects.filter(pk=int(config_id)).first() if config_id.isdigit() else None,
+        payload=payload, processing_status='failed',
+        processing_notes=f"Gave up after repeated failures: {error}"[:5000],
+    )
+
+
+def _timestamp(ts_str):
+    return timezone.make_aware(datetime.fromtimestamp(int(ts_str))) if ts_str and str(ts_str).isdigit() else timezone.now()
+
+
+class _WebhookBatch:
+    """Events collected from a batch of webhook bodies, written together."""
+
+    def __init__(self):
+        self.messages = []      # (msg_data, value, config, log_fields)
+        self.statuses = []      # (status_data, log_fields)
+        self.other_logs = []    # unsaved WebhookEventLog rows with their final status
+
+    def add_payload(self, payload: dict, config: MetaAppConfig):
+        entry0 = (payload.get('entry') or [{}])[0]
+        base_log_fields = {
+            'app_config': config,
+            'waba_id_received': entry0.get('id'),
+            'phone_number_id_received': (entry0.get('changes') or [{}])[0].get('value', {}).get('metadata', {}).get('phone_number_id'),
+            'payload_object_type': payload.get('object'),
+        }
+        if payload.get('object') != 'whatsapp_business_account':
+            logger.warning(f"Unknown webhook object type: {payload.get('object')}")
+            self.other_logs.append(WebhookEventLog(
+                **base_log_fields, payload=payload, event_type='unknown',
+                processing_status='ignored', processing_notes=f"Unknown object: {payload.get('object')}",
+            ))
+            return
+
+        now = timezone.now()
+        for entry in payload.get('entry', []):
+            for change in entry.get('changes', []):
+                value = change.get('value', {})
+                field = change.get('field')
+                log_fields = {
+                    **base_log_fields,
+                    'waba_id_received': entry.get('id'),
+                    'phone_number_id_received': value.get('metadata', {}).get('phone_number_id'),
+                }
+                if field == 'messages' and 'messages' in value:
+                    for msg_data in value['messages']:
+                        self.messages.append((msg_data, value, config, log_fields))
+                elif field == 'messages' and 'statuses' in value:
+                    for status_data in value['statuses']:
+                        self.statuses.append((status_data, log_fields))
+                elif field == 'messages' and 'errors' in value:
+                    for error_data in value['errors']:
+                        logger.error(f"Received error notification from Meta: {error_data}")
+                        self.other_logs.append(WebhookEventLog(
+                            **log_fields, payload=error_data, event_type='error',
+                            event_identifier=f"error_{error_data.get('code')}_{now.timestamp()}",
+                            processing_status='processed', processed_at=now,
+                            processing_notes=f"Error notification logged: {error_data.get('title')}",
+                        ))
+                elif field == 'messages':
+                    logger.warning(f"Messages field '{field}' but no 'messages', 'statuses', or 'errors' key. Value: {value.keys()}")
+                elif field == 'message_template_status_update':
+                    self.other_logs.append(WebhookEventLog(
+                        **log_fields, payload=value, event_type='template_status',
+                        event_identifier=value.get('message_template_id') or f"template_{value.get('message_template_name')}_{value.get('event')}",
+                        processing_status='processed', processed_at=now,
+                        processing_notes=f"Template status update logged for: {value.get('message_template_name')}",
+                    ))
+                else:
+                    logger.warning(f"Unhandled change field '{field}'. Value: {value}")
+                    self.other_logs.append(WebhookEventLog(
+                        **log_fields, payload=value, event_type='unknown',
+                        processing_status='ignored', processing_notes=f"Unhandled field: {field}",
+                    ))
+
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _existing_logs(event_type, identifiers):
+        logs = {}
+        for log in WebhookEventLog.objects.filter(event_type=event_type, event_identifier__in=identifiers).order_by('id'):
+            logs.setdefault(log.event_identifier, log)
+        return logs
+
+    def save(self):
+        if self.other_logs:
+            WebhookEventLog.objects.bulk_create(self.other_logs)
+        if self.statuses:
+            self._save_statuses()
+        if self.messages:
+            self._save_messages()
+
+    def _save_statuses(self):
+        now = timezone.now()
+        wamids = {status_data.get('id') for status_data, _ in self.statuses}
+        outgoing = {}
+        for msg in Message.objects.filter(wamid__in=wamids, direction='out'):
+            outgoing.setdefault(msg.wamid, msg)
+        existing_logs = self._existing_logs('message_status', wamids)
+
+        new_logs, updated_logs, touched = [], [], {}
+        for status_data, log_fields in self.statuses:
+            wamid = status_data.get('id')
+            status_value = status_data.get('status')
+            msg = outgoing.get(wamid)
+            if msg is not None:
+                msg.status = status_value
+                msg.status_timestamp = _timestamp(status_data.get('timestamp'))
+                if isinstance(status_data.get('conversation'), dict):
+                    msg.conversation_id_from_meta = status_data['conversation'].get('id')
+                if isinstance(status_data.get('pricing'), dict):
+                    msg.pricing_model_from_meta = status_data['pricing'].get('pricing_model')
+                touched[msg.pk] = msg
+                log_status, notes = 'processed', f"Status for WAMID {wamid} is {status_value}. DB record updated."
+            else:
+                log_status, notes = 'ignored', f"No matching outgoing msg for WAMID {wamid}."
+
+            log = existing_logs.get(wamid)
+            if log is None:
+                log = WebhookEventLog(event_identifier=wamid, event_type='message_status')
+                existing_logs[wamid] = log
+                new_logs.append(log)
+            elif log not in updated_logs and log.pk:
+                updated_logs.append(log)
+            for name, val in log_fields.items():
+                setattr(log, name, val)
+            log.payload = status_data
+            log.processing_status = log_status
+            log.processing_notes = notes
+            log.processed_at = now
+
+        if touched:
+            Message.objects.bulk_update(touched.values(), [
+                'status', 'status_timestamp', 'conversation_id_from_meta', 'pricing_model_from_meta',
+            ])
+        if new_logs:
+            WebhookEventLog.objects.bulk_create(new_logs)
+        if updated_logs:
+            WebhookEventLog.objects.bulk_update(updated_logs, [
+                'app_config', 'waba_id_received', 'phone_number_id_received', 'payload_object_type',
+                'payload', 'processing_status', 'processing_notes', 'processed_at',
+            ])
+        logger.info(f"Webhook batch: applied {len(self.statuses)} status updates ({len(touched)} messages updated).")
+
+    def _save_messages(self):
+        # First occurrence of each WAMID wins; Meta can repeat one within a burst.
+        unique = {}
+        for item in self.messages:
+            wamid = item[0].get('id')
+            if wamid and wamid not in unique:
+                unique[wamid] = item
+
+        existing_logs = self._existing_logs('message', unique.keys())
+        for wamid, log in existing_logs.items():
+            if log.processing_status in HANDLED_MESSAGE_STATUSES:
+                logger.info(f"Skipping reprocessing for already handled message WAMID: {wamid}, Status: {log.processing_status}")
+                unique.pop(wamid, None)
+        if not unique:
+            return
+
+        contacts = self._contacts_for(unique.values())
+        existing_messages = {}
+        for msg in Message.objects.filter(wamid__in=unique.keys(), direction='in'):
+            existing_messages.setdefault(msg.wamid, msg)
+
+        new_messages, updated_messages, ordered = [], [], []
+        last_seen = {}
+        for wamid, (msg_data, value, config, _) in unique.items():
+            contact = contacts.get(self._contact_wa_id(msg_data, value))
+            if contact is None:
+                continue
+            msg_ts = _timestamp(msg_data.get('timestamp'))
+            message_type = msg_data.get('type', 'unknown')
+            msg = existing_messages.get(wamid)
+            if msg is None:
+                msg = Message(
+                    wamid=wamid, contact=contact, direction='in', message_type=message_type,
+                    content_payload=msg_data, timestamp=msg_ts, status='delivered', status_timestamp=msg_ts,
+                    # Message.save() derives this for text messages; bulk_create skips save().
+                    text_content=msg_data.get('text', {}).get('body') if message_type == 'text' else None,
+                )
+                new_messages.append(msg)
+            else:
+                msg.timestamp = msg_ts
+                msg.content_payload = msg_data
+                updated_messages.append(msg)
+            ordered.append((msg, config, contact.whatsapp_id))
+            if contact.pk not in last_seen or msg_ts > last_seen[contact.pk].last_seen:
+                contact.last_seen = msg_ts
+                last_seen[contact.pk] = contact
+
+        if new_messages:
+            Message.objects.bulk_create(new_messages)
+        if updated_messages:
+            Message.objects.bulk_update(updated_messages, ['timestamp', 'content_payload'])
+        if last_seen:
+            Contact.objects.bulk_update(last_seen.values(), ['last_seen'])
+
+        message_by_wamid = {msg.wamid: msg for msg, _, _ in ordered}
+        new_logs, updated_logs = [], []
+        for wamid, (msg_data, _, _, log_fields) in unique.items():
+            msg = message_by_wamid.get(wamid)
+            log = existing_logs.get(wamid)
+            if log is None:
+                log = WebhookEventLog(event_identifier=wamid, event_type='message')
+                new_logs.append(log)
+            else:
+                updated_logs.append(log)
+            for name, val in log_fields.items():
+                setattr(log, name, val)
+            log.payload = msg_data
+            if msg is not None:
+                log.message = msg
+                log.processing_status = 'processing_queued'
+            else:
+                log.processing_status = 'error'
+                log.processing_notes = f"Contact creation failed for {self._contact_wa_id(msg_data, unique[wamid][1])}"
+        if new_logs:
+            WebhookEventLog.objects.bulk_create(new_logs)
+        if updated_logs:
+            WebhookEventLog.objects.bulk_update(updated_logs, [
+                'app_config', 'waba_id_received', 'phone_number_id_received', 'payload_object_type',
+                'payload', 'message', 'processing_status', 'processing_notes',
+            ])
+
+        dispatch = [(msg.id, wa_id, msg.wamid, config.id if config else None) for msg, config, wa_id in ordered]
+        transaction.on_commit(lambda: _dispatch_messages(dispatch))
+        logger.info(f"Webhook batch: stored {len(new_messages)} new / {len(updated_messages)} updated incoming messages.")
+
+    @staticmethod
+    def _contact_wa_id(msg_data, value):
+        contacts = value.get('contacts') or []
+        if contacts and isinstance(contacts[0], dict):
+            return contacts[0].get('wa_id', msg_data.get('from'))
+        return msg_data.get('from')
+
+    @staticmethod
+    def _contact_name(value):
+        contacts = value.get('contacts') or []
+        if contacts and isinstance(contacts[0], dict):
+            return contacts[0].get('profile', {}).get('name', "Unknown")
+        return "Unknown"
+
+    def _contacts_for(self, items):
+        """Fetch or create every sender's Contact, applying the same name /
+        associated_app_config updates get_or_create_contact_by_wa_id does."""
+        wanted = {}
+        for msg_data, value, config, _ in items:
+            wa_id = self._contact_wa_id(msg_data, value)
+            if wa_id:
+                wanted[wa_id] = (self._contact_name(value), config)
+
+        contacts = {c.whatsapp_id: c for c in Contact.objects.filter(whatsapp_id__in=wanted.keys())}
+        missing = [
+            Contact(whatsapp_id=wa_id, name=name, associated_app_config=config)
+            for wa_id, (name, config) in wanted.items() if wa_id not in contacts
+        ]
+        if missing:
+            # ignore_conflicts: a concurrent synchronous request may create the same contact.
+            Contact.objects.bulk_create(missing, ignore_conflicts=True)
+            contacts.update({c.whatsapp_id: c for c in Contact.objects.filter(whatsapp_id__in=[c.whatsapp_id for c in missing])})
+            logger.info(f"Webhook batch: created {len(missing)} new contacts.")
+
+        changed = []
+        for wa_id, (name, config) in wanted.items():
+            contact = contacts.get(wa_id)
+            if contact is None:
+                logger.error(f"Failed to create/get contact for {wa_id}")
+                continue
+            dirty = False
+            if name and contact.name != name:
+                contact.name = name
+                dirty = True
+            if config and contact.associated_app_config_id != config.id:
+                contact.associated_app_config = config
+                dirty = True
+            if dirty:
+                changed.append(contact)
+        if changed:
+            Contact.objects.bulk_update(changed, ['name', 'associated_app_config'])
+        return contacts
+
+
+def _dispatch_messages(dispatch):
+    from flows.lanes import dispatch_flow_processing
+    from .tasks import send_read_receipt_task
+
+    for message_id, whatsapp_id, wamid, config_id in dispatch:
+        dispatch_flow_processing(message_id, whatsapp_id)
+        if config_id:
+            send_read_receipt_task.delay(wamid=wamid, config_id=config_id, show_typing_indicator=False)
+    logger.info(f"Queued flow processing and read receipts for {len(dispatch)} incoming messages.")
+
+
+def process_webhook_batch(entries):
+    """Write a batch of queued webhook bodies (stream entry field dicts) in a
+    single transaction."""
+    config_ids = {int(fields['config_id']) for fields in entries if str(fields.get('config_id', '')).isdigit()}
+    configs = MetaAppConfig.objects.in_bulk(config_ids)
+
+    batch = _WebhookBatch()
+    for fields in entries:
+        config = configs.get(int(fields['config_id'])) if str(fields.get('config_id', '')).isdigit() else None
+        try:
+            payload = json.loads(fields.get('body') or '')
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON in queued webhook: {e}. Body: {(fields.get('body') or '')[:500]}...")
+            batch.other_logs.append(WebhookEventLog(
+                app_config=config, payload={'raw_error': (fields.get('body') or '')[:5000]},
+                processing_status='error', processing_notes=f"Invalid JSON: {e}",
+            ))
+            continue
+        try:
+            batch.add_payload(payload, config)
+        except Exception as e:
+            logger.error(f"Error unpacking queued webhook: {e}", exc_info=True)
+            batch.other_logs.append(WebhookEventLog(
+                app_config=config, payload=payload,
+                processing_status='error', processing_notes=f"Unhandled exception: {str(e)}",
+            ))
+
+    with transaction.atomic():
+        batch.save()
@@ -8,7 +8,8 @@ from django.utils import timezone
 
 from .services import PaynowService
 from meta_integration.utils import send_whatsapp_message, create_text_message_data
-from customer_data.models import WalletTransaction, UserWallet
+from customer_data.ledger import post_to_ledger
+from customer_data.models import WalletTransaction
 from customer_data.tasks import send_deposit_confirmation_whatsapp
 
 logger = logging.getLogger(__name__)
@@ -256,11 +257,9 @@ def poll_paynow_transaction_status(self, transaction_reference: str):
                 if status.lower() == 'paid':
                     logger.info(f"{log_prefix} Status is PAID - Processing successful payment...")
                     wallet = pending_tx.wallet
-                    # This second lock is good for protecting the wallet from other simultaneous operations.
-                    wallet_to_update = UserWallet.objects.select_for_update().get(pk=wallet.pk)
-                    old_balance = wallet_to_update.balance
-                    wallet_to_update.balance += pending_tx.amount
-                    wallet_to_update.save(update_fields=['balance', 'updated_at'])
+                    old_balance = wallet.balance
+                    # Atomic balance UPDATE plus ledger entry; no wallet row lock needed.
+                    post_to_ledger(wallet.pk, pending_tx.amount, 'DEPOSIT', wallet_transaction=pending_tx)
 
                     pending_tx.status = 'COMPLETED'
                     pending_tx.description = f"Paynow deposit successful. Paynow Ref: {pending_tx.external_reference}"
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stats.rollups import rollup_range
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the hourly and daily dashboard counters (stats/rollups.py) "
+        "for every closed hour of the last N days. Run once after deploying to "
+        "backfill history; safe to re-run. Event counters (flow starts and "
+        "completions, handovers) only exist for the last week."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='How many days back to recompute.')
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError("--days must be a positive integer.")
+        hours = rollup_range(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Compacted {hours} hour(s) of dashboard counters."))
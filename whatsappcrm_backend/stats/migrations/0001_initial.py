@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=40)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField(help_text='Start of the hour (UTC) or of the local day counted.')),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'period_start'], name='stats_metri_granula_50047a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'granularity', 'period_start'), name='unique_metric_rollup_period')],
+            },
+        ),
+    ]
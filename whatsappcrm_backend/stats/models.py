@@ -1,3 +1,29 @@
+# whatsappcrm_backend/stats/models.py
 from django.db import models
 
-# Create your models here.
+
+class MetricRollup(models.Model):
+    """
+    One dashboard counter for one hour or one day (stats/rollups.py), so the
+    dashboard reads a few rows per day instead of counting messages.
+    """
+    class Granularity(models.TextChoices):
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+
+    metric = models.CharField(max_length=40)
+    granularity = models.CharField(max_length=4, choices=Granularity.choices)
+    period_start = models.DateTimeField(help_text="Start of the hour (UTC) or of the local day counted.")
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.metric} {self.granularity} {self.period_start:%Y-%m-%d %H:%M}: {self.value}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'granularity', 'period_start'], name='unique_metric_rollup_period'),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'period_start']),
+        ]
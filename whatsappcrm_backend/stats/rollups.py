@@ -0,0 +1,309 @@
+# whatsappcrm_backend/stats/rollups.py
+"""
+Hourly and daily rollups of the dashboard counters.
+
+DashboardSummaryStatsAPIView used to count its numbers from the source
+tables on every refresh -- a full-table COUNT of incoming messages, 24h
+counts per direction, a 7-day TruncDate group-by over Message -- and the
+admin dashboard auto-refreshes for every agent. Message grows into the tens
+of millions.
+
+Counters now live in MetricRollup rows, one per metric per hour (UTC) and
+per local day:
+
+  * messages in/out, new contacts and active contacts (distinct contacts
+    with a message in the hour) are counted from the source tables by
+    compact_hours(), which recomputes a range of hours in two grouped
+    queries, so re-running it is harmless;
+  * flow starts, flow completions and human handovers leave no row behind
+    to count, so they are counted as they happen (record_event) into a Redis
+    hash per hour, which compact_hours() copies into rows;
+  * each compaction then rewrites the day rows of the days it touched from
+    their hourly rows (active contacts are distinct counts and are only kept
+    per hour).
+
+rollup_metrics_task runs from Celery Beat and recomputes the last
+STATS_ROLLUP_RECOMPUTE_HOURS closed hours (catching late messages), or
+everything since the last compacted hour if it fell behind. The dashboard
+reads rows for the compacted hours and counts only the hours since from the
+source tables (dashboard_counts). `manage.py rollup_metrics --days N`
+backfills history.
+
+The all-time incoming total also needs the messages from before the first
+compacted hour. Compaction counts those once into a single
+MESSAGES_IN_BEFORE_ROLLUPS row, whose period_start is that first hour, and
+counts them again only when a backfill moves the first hour back. If nothing
+has been compacted yet, the first dashboard request compacts the recent hours
+itself, so no request ever counts the whole table.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from conversations.models import Contact, Message
+from whatsappcrm_backend.redis_client import after_commit, database_key, get_redis
+from .models import MetricRollup
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_IN = 'messages_in'
+MESSAGES_OUT = 'messages_out'
+NEW_CONTACTS = 'new_contacts'
+ACTIVE_CONTACTS = 'active_contacts'
+FLOW_STARTS = 'flow_starts'
+FLOW_COMPLETIONS = 'flow_completions'
+HANDOVERS = 'handovers'
+# Incoming messages from before the first compacted hour (one DAY row).
+MESSAGES_IN_BEFORE_ROLLUPS = 'messages_in_before_rollups'
+
+SOURCE_METRICS = (MESSAGES_IN, MESSAGES_OUT, NEW_CONTACTS, ACTIVE_CONTACTS)
+EVENT_METRICS = (FLOW_STARTS, FLOW_COMPLETIONS, HANDOVERS)
+DAILY_METRICS = (MESSAGES_IN, MESSAGES_OUT, NEW_CONTACTS) + EVENT_METRICS
+
+EVENTS_KEY = 'stats:events:{}:{}'  # database, hour (epoch seconds)
+EVENTS_TTL_SECONDS = 8 * 24 * 3600
+
+HOUR = MetricRollup.Granularity.HOUR
+DAY = MetricRollup.Granularity.DAY
+
+
+def hour_start(moment: datetime) -> datetime:
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(day: date) -> datetime:
+    """Local midnight starting `day` (hours line up with it in whole-hour time zones)."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _hours(start: datetime, end: datetime) -> List[datetime]:
+    hours, hour = [], hour_start(start)
+    while hour < end:
+        hours.append(hour)
+        hour += timedelta(hours=1)
+    return hours
+
+
+def _events_key(hour: datetime) -> str:
+    return database_key(EVENTS_KEY, int(hour.timestamp()))
+
+
+# --- Counting ----------------------------------------------------------------- #
+
+def record_event(metric: str, at: Optional[datetime] = None):
+    """Count one `metric` event in its hour, once the current transaction commits."""
+    key = _events_key(hour_start(at or timezone.now()))
+
+    def increment():
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.hincrby(key, metric, 1)
+            pipe.expire(key, EVENTS_TTL_SECONDS)
+            pipe.execute()
+        except Exception:
+            logger.warning(f"Redis unavailable counting a {metric} event; it is left out of the dashboard.", exc_info=True)
+
+    after_commit(increment)
+
+
+def _event_counts(hours: List[datetime]) -> Dict[datetime, Optional[Dict[str, int]]]:
+    """Per hour, the events counted in Redis (None if nothing was counted)."""
+    if not hours:
+        return {}
+    pipe = get_redis().pipeline(transaction=False)
+    for hour in hours:
+        pipe.hgetall(_events_key(hour))
+    return {
+        hour: {metric: int(value) for metric, value in counts.items()} if counts else None
+        for hour, counts in zip(hours, pipe.execute())
+    }
+
+
+def _source_counts(start: datetime, end: datetime) -> Dict[tuple, int]:
+    """(metric, hour) -> count from the source tables, for [start, end)."""
+    counts = {}
+    messages = (Message.objects.filter(timestamp__gte=start, timestamp__lt=end)
+                .annotate(hour=TruncHour('timestamp', tzinfo=dt_timezone.utc)).values('hour')
+                .annotate(incoming=Count('id', filter=Q(direction='in')),
+                          outgoing=Count('id', filter=Q(direction='out')),
+                          active=Count('contact', distinct=True))
+                .order_by())
+    for row in messages:
+        counts[(MESSAGES_IN, row['hour'])] = row['incoming']
+        counts[(MESSAGES_OUT, row['hour'])] = row['outgoing']
+        counts[(ACTIVE_CONTACTS, row['hour'])] = row['active']
+    contacts = (Contact.objects.filter(first_seen__gte=start, first_seen__lt=end)
+                .annotate(hour=TruncHour('first_seen', tzinfo=dt_timezone.utc)).values('hour')
+                .annotate(new=Count('id')).order_by())
+    for row in contacts:
+        counts[(NEW_CONTACTS, row['hour'])] = row['new']
+    return counts
+
+
+def _hour_counts(start: datetime, end: datetime) -> Dict[tuple, int]:
+    """(metric, hour) -> count for the hours in [start, end), from the
+    sources and Redis; event counts missing from Redis are left out."""
+    counts = _source_counts(start, end)
+    try:
+        events = _event_counts(_hours(start, end))
+    except Exception:
+        logger.warning("Redis unavailable reading dashboard event counts.", exc_info=True)
+        events = {}
+    for hour, hour_events in events.items():
+        for metric, value in (hour_events or {}).items():
+            counts[(metric, hour)] = value
+    return counts
+
+
+# --- Compaction --------------------------------------------------------------- #
+
+def _upsert(rows: List[MetricRollup]):
+    MetricRollup.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['metric', 'granularity', 'period_start'], update_fields=['value', 'updated_at'],
+    )
+
+
+def compact_hours(start: datetime, end: datetime) -> int:
+    """
+    Recompute the hourly rows of every hour in [start, end) and the day rows
+    of the days they fall in. Returns the number of hours compacted.
+    """
+    hours = _hours(start, end)
+    if not hours:
+        return 0
+    counts = _source_counts(hours[0], hours[-1] + timedelta(hours=1))
+    try:
+        events = _event_counts(hours)
+    except Exception:
+        logger.warning("Redis unavailable reading event counts; keeping the event rows as they are.", exc_info=True)
+        events = dict.fromkeys(hours)
+    rows = []
+    for hour in hours:
+        for metric in SOURCE_METRICS:
+            rows.append(MetricRollup(metric=metric, granularity=HOUR, period_start=hour,
+                                     value=counts.get((metric, hour), 0)))
+        # No hash: nothing was counted, or it expired -- keep what the rows say.
+        for metric, value in (events[hour] or {}).items():
+            rows.append(MetricRollup(metric=metric, granularity=HOUR, period_start=hour, value=value))
+
+    first_day = timezone.localtime(hours[0]).date()
+    last_day = timezone.localtime(hours[-1]).date()
+    with transaction.atomic():
+        _upsert(rows)
+        days = (MetricRollup.objects
+                .filter(granularity=HOUR, metric__in=DAILY_METRICS,
+                        period_start__gte=day_start(first_day), period_start__lt=day_start(last_day + timedelta(days=1)))
+                .annotate(day=TruncDay('period_start')).values('metric', 'day')
+                .annotate(total=Sum('value')).order_by())
+        _upsert([MetricRollup(metric=row['metric'], granularity=DAY, period_start=row['day'], value=row['total'])
+                 for row in days])
+        _count_messages_before_rollups()
+    return len(hours)
+
+
+def _count_messages_before_rollups():
+    """Count the incoming messages from before the first compacted hour into
+    the MESSAGES_IN_BEFORE_ROLLUPS row, unless it already covers that hour."""
+    first = (MetricRollup.objects.filter(granularity=HOUR, metric=MESSAGES_IN)
+             .aggregate(first=Min('period_start'))['first'])
+    current = MetricRollup.objects.filter(metric=MESSAGES_IN_BEFORE_ROLLUPS, granularity=DAY).first()
+    if first is None or (current is not None and current.period_start == first):
+        return
+    MetricRollup.objects.filter(metric=MESSAGES_IN_BEFORE_ROLLUPS).exclude(period_start=first).delete()
+    _upsert([MetricRollup(metric=MESSAGES_IN_BEFORE_ROLLUPS, granularity=DAY, period_start=first,
+                          value=Message.objects.filter(direction='in', timestamp__lt=first).count())])
+
+
+def last_compacted_hour() -> Optional[datetime]:
+    # Every compacted hour has a row for each source metric.
+    return (MetricRollup.objects.filter(metric=MESSAGES_IN, granularity=HOUR)
+            .aggregate(last=Max('period_start'))['last'])
+
+
+def compact_recent_hours(now: Optional[datetime] = None) -> int:
+    """Compact the last STATS_ROLLUP_RECOMPUTE_HOURS closed hours, or every
+    closed hour since the last compaction if that is further back."""
+    end = hour_start(now or timezone.now())
+    start = end - timedelta(hours=int(getattr(settings, 'STATS_ROLLUP_RECOMPUTE_HOURS', 3)))
+    last = last_compacted_hour()
+    if last is not None:
+        start = min(start, last + timedelta(hours=1))
+    return compact_hours(start, end)
+
+
+# --- Reading ------------------------------------------------------------------ #
+
+@dataclass
+class DashboardCounts:
+    last_24h: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    today: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # Local date -> metric -> count, for the last 7 days including today.
+    by_day: Dict[date, Dict[str, int]] = field(default_factory=lambda: defaultdict(lambda: defaultdict(int)))
+    total_messages_in: int = 0
+
+
+def dashboard_counts(now: Optional[datetime] = None) -> DashboardCounts:
+    """
+    The dashboard's counters: the last 24 hours (the current hour and the 23
+    before it), today, each of the last 7 days, and all incoming messages.
+    Compacted hours and past days are read from rows; only the hours since
+    the last compaction are counted from the source tables.
+    """
+    now = now or timezone.now()
+    today = timezone.localtime(now).date()
+    today_start = day_start(today)
+    window_start = hour_start(now) - timedelta(hours=23)
+    since = min(window_start, hour_start(today_start))
+
+    last = last_compacted_hour()
+    if last is None:
+        # First use: compact rather than count the table on every request.
+        compact_recent_hours(now)
+        last = last_compacted_hour()
+    live_start = max(since, last + timedelta(hours=1)) if last is not None else since
+
+    hourly: Dict[tuple, int] = {
+        (metric, hour): value for metric, hour, value in
+        MetricRollup.objects.filter(granularity=HOUR, period_start__gte=since, period_start__lt=live_start)
+        .values_list('metric', 'period_start', 'value')
+    }
+    hourly.update(_hour_counts(live_start, now + timedelta(microseconds=1)))
+
+    counts = DashboardCounts()
+    for (metric, hour), value in hourly.items():
+        if hour >= window_start:
+            counts.last_24h[metric] += value
+        if hour >= today_start:
+            counts.today[metric] += value
+            counts.by_day[today][metric] += value
+
+    first_day = today - timedelta(days=6)
+    for metric, period_start, value in (MetricRollup.objects
+                                        .filter(granularity=DAY, metric__in=DAILY_METRICS,
+                                                period_start__gte=day_start(first_day), period_start__lt=today_start)
+                                        .values_list('metric', 'period_start', 'value')):
+        counts.by_day[timezone.localtime(period_start).date()][metric] += value
+
+    past_total = (MetricRollup.objects.filter(granularity=DAY, metric=MESSAGES_IN, period_start__lt=today_start)
+                  .aggregate(total=Sum('value'))['total'])
+    before_rollups = (MetricRollup.objects.filter(metric=MESSAGES_IN_BEFORE_ROLLUPS, granularity=DAY)
+                      .values_list('value', flat=True).first())
+    counts.total_messages_in = (before_rollups or 0) + (past_total or 0) + counts.today[MESSAGES_IN]
+    return counts
+
+
+def rollup_range(days: int, now: Optional[datetime] = None) -> int:
+    """Compact every closed hour of the last `days` days (backfill)."""
+    end = hour_start(now or timezone.now())
+    return compact_hours(end - timedelta(days=days), end)
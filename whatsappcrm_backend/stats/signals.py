@@ -0,0 +1,22 @@
+# whatsappcrm_backend/stats/signals.py
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from conversations.models import Contact
+from flows.models import ContactFlowState
+from .rollups import FLOW_STARTS, HANDOVERS, record_event
+
+
+@receiver(post_save, sender=ContactFlowState)
+def flow_started(sender, instance, created, **kwargs):
+    """A new flow state is a flow start (see rollups.py)."""
+    if created:
+        record_event(FLOW_STARTS)
+
+
+@receiver(post_save, sender=Contact)
+def handover_requested(sender, instance, update_fields=None, **kwargs):
+    """Every handover path saves the contact with a new intervention_requested_at."""
+    if instance.needs_human_intervention and update_fields and 'intervention_requested_at' in update_fields:
+        record_event(HANDOVERS)
@@ -0,0 +1,16 @@
+# whatsappcrm_backend/stats/tasks.py
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="stats.rollup_metrics")
+def rollup_metrics_task():
+    """Compact the recent hours of dashboard counters into MetricRollup rows (rollups.py)."""
+    from .rollups import compact_recent_hours
+
+    hours = compact_recent_hours()
+    logger.info(f"[Stats Rollup] Compacted {hours} hour(s) of dashboard counters.")
+    return {'hours': hours}
@@ -5,13 +5,15 @@ from rest_framework.response import Response
 from rest_framework import permissions, status
 from django.utils import timezone
 from datetime import timedelta # Removed 'date' as it's not used directly here
-from django.db.models import Count, Avg, Q
-from django.db.models.functions import TruncDate
+from django.db.models import Count, Avg
 
 # Import models from your other apps
 from conversations.models import Contact, Message
 from flows.models import Flow # Removed FlowStep, ContactFlowState unless specifically needed for a stat here
 from meta_integration.models import MetaAppConfig
+from .rollups import (
+    FLOW_COMPLETIONS, FLOW_STARTS, HANDOVERS, MESSAGES_IN, MESSAGES_OUT, NEW_CONTACTS, dashboard_counts,
+)
 
 import logging
 logger = logging.getLogger(__name__)
@@ -19,16 +21,15 @@ logger = logging.getLogger(__name__)
 class DashboardSummaryStatsAPIView(APIView):
     """
     API View to provide a summary of statistics for the dashboard.
-    All timestamp comparisons are timezone-aware.
+    All timestamp comparisons are timezone-aware. Message, contact and flow
+    counters come from the hourly/daily rollups (stats/rollups.py); "today"
+    is the local day and "24h" the current hour and the 23 before it.
     """
     permission_classes = [permissions.IsAdminUser] # Or IsAdminUser if preferred
 
     def get(self, request, format=None):
         now = timezone.now()
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-        twenty_four_hours_ago = now - timedelta(hours=24)
-        seven_days_ago_start_of_day = today_start - timedelta(days=6)
+        counts = dashboard_counts(now)
 
         # --- Calculate Stats ---
 
@@ -44,24 +45,14 @@ class DashboardSummaryStatsAPIView(APIView):
         avg_steps_per_flow = round(avg_steps_data['avg_val'], 1) if avg_steps_data['avg_val'] else 0.0
 
         # Contact Stats
-        # CORRECTED: Use 'first_seen' instead of 'created_at'
-        new_contacts_today_count = Contact.objects.filter(
-            first_seen__gte=today_start, 
-            first_seen__lte=today_end
-        ).count()
+        new_contacts_today_count = counts.today[NEW_CONTACTS]
         total_contacts_count = Contact.objects.count()
         # Uses 'needs_human_intervention' which should now exist on Contact model
         pending_human_intervention_count = Contact.objects.filter(needs_human_intervention=True).count()
 
         # Message Stats
-        messages_sent_24h_count = Message.objects.filter(
-            direction='out', 
-            timestamp__gte=twenty_four_hours_ago
-        ).count()
-        messages_received_24h_count = Message.objects.filter(
-            direction='in',
-            timestamp__gte=twenty_four_hours_ago
-        ).count()
+        messages_sent_24h_count = counts.last_24h[MESSAGES_OUT]
+        messages_received_24h_count = counts.last_24h[MESSAGES_IN]
 
 
         # Active Conversations (Example: unique contacts with any message in the last 4 hours)
@@ -74,36 +65,28 @@ class DashboardSummaryStatsAPIView(APIView):
         # active_conversations_in_flow_count = ContactFlowState.objects.count()
 
 
-        # Flow Completions Today (Conceptual - requires your app to define what a "completion" is)
-        # E.g., if reaching certain 'end_flow' steps marks completion and you log it.
-        flow_completions_today_count = 0 # Placeholder - Replace with your actual query
+        # Flow Completions Today: flows that reached an 'end_flow' step.
+        flow_completions_today_count = counts.today[FLOW_COMPLETIONS]
 
         # --- Prepare Chart Data (Conceptual Examples) ---
 
         # Conversation Trends Data: Messages per day for the last 7 days
-        # This query groups messages by date and counts them.
-        message_trends = Message.objects.filter(timestamp__gte=seven_days_ago_start_of_day)\
-            .annotate(date=TruncDate('timestamp'))\
-            .values('date')\
-            .annotate(incoming_count=Count('id', filter=Q(direction='in')),
-                      outgoing_count=Count('id', filter=Q(direction='out')))\
-            .order_by('date')
-        
         conversation_trends_data = [
             {
-                "date": item['date'].strftime('%Y-%m-%d'), 
-                "incoming_messages": item['incoming_count'],
-                "outgoing_messages": item['outgoing_count'],
-                "total_messages": item['incoming_count'] + item['outgoing_count']
+                "date": day.strftime('%Y-%m-%d'),
+                "incoming_messages": day_counts[MESSAGES_IN],
+                "outgoing_messages": day_counts[MESSAGES_OUT],
+                "total_messages": day_counts[MESSAGES_IN] + day_counts[MESSAGES_OUT]
             }
-            for item in message_trends
+            for day, day_counts in sorted(counts.by_day.items())
+            if day_counts[MESSAGES_IN] or day_counts[MESSAGES_OUT]
         ]
 
         # Bot Performance Data (Conceptual - needs specific metrics from your system)
         bot_performance_data = {
             "automated_resolution_rate": 0.0, # Example: (flows_completed_without_handover / total_flows_started)
             "avg_bot_response_time_seconds": 0.0, # Needs tracking bot response times
-            "total_incoming_messages_processed": Message.objects.filter(direction='in').count(),
+            "total_incoming_messages_processed": counts.total_messages_in,
         }
         # You would need more detailed logic and potentially logging to calculate these accurately.
 
@@ -149,7 +132,9 @@ class DashboardSummaryStatsAPIView(APIView):
             'flow_insights': { # Data for the "Flow Insights" section
                 'active_flows_count': active_flows_count,
                 'total_flows_count': total_flows_count,
-                'flow_completions_today': flow_completions_today_count, # Placeholder
+                'flow_completions_today': flow_completions_today_count,
+                'flow_starts_today': counts.today[FLOW_STARTS],
+                'human_handovers_today': counts.today[HANDOVERS],
                 'avg_steps_per_flow': avg_steps_per_flow,
             },
             'charts_data': { # Data for charts
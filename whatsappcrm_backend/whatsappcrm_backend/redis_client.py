@@ -0,0 +1,112 @@
+# whatsappcrm_backend/whatsappcrm_backend/redis_client.py
+"""
+Shared, lazily-created Redis client for the small pieces of cross-process
+state the apps keep outside Postgres (cache version counters, queues, rate
+limiter buckets, ...).
+
+Uses the Celery broker's Redis (CELERY_BROKER_URL), the same instance
+football_data_app.bet_flow_handler already keeps its bet slips in. Callers are
+expected to treat Redis as best-effort and degrade gracefully when it is
+unreachable.
+
+Keys holding per-database state are built with database_key(), which puts
+the database name after the key's prefix, so a test database never reads or
+overwrites the live one's entries.
+
+Redis writes that publish database state -- a cache version bump, say --
+must not happen before that state is committed, or another process acts on
+rows it cannot see yet and caches them. after_commit() runs such a callback
+once the current transaction commits (at once outside one), and
+commit_pending() tells whether it is still waiting, so a reader in the same
+transaction knows not to cache what it reads.
+
+A cache built from rows is invalidated with delete_keys(): its keys are
+deleted when the write happens and again once the transaction commits. The
+first delete stops readers using the old entry; the second removes one a
+reader stored in between from the rows as they were before the commit.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        url = getattr(settings, 'CELERY_BROKER_URL', None) or 'redis://localhost:6379/0'
+        _redis_client = redis.from_url(url, decode_responses=True)
+    return _redis_client
+
+
+def database_key(template: str, *parts) -> str:
+    """`template` formatted with the database name and then `parts`."""
+    return template.format(connection.settings_dict.get('NAME') or 'default', *parts)
+
+
+def delete_keys(keys, description: str):
+    """Delete `keys` now and again once the current transaction commits (see
+    the module docstring); `description` names them in the warning logged
+    when Redis is unavailable."""
+    keys = list(keys)
+    if not keys:
+        return
+
+    def delete():
+        try:
+            get_redis().delete(*keys)
+        except Exception:
+            logger.warning(f"Redis unavailable invalidating {description}.", exc_info=True)
+
+    delete()
+    if connection.in_atomic_block:
+        transaction.on_commit(delete)
+
+
+def _pending(connection) -> set:
+    # On the connection, so it is per thread and per database alias.
+    if not hasattr(connection, 'pending_commit_callbacks'):
+        connection.pending_commit_callbacks = set()
+    return connection.pending_commit_callbacks
+
+
+def after_commit(callback, using=None):
+    """
+    Run `callback` once the current transaction commits; it is pending (see
+    commit_pending) until then. Registering the same callback several times
+    in one transaction runs it once. A rolled-back transaction discards it.
+    """
+    connection = transaction.get_connection(using)
+    pending = _pending(connection)
+    if not connection.in_atomic_block:
+        # Whatever was registered ran or was rolled back with its transaction.
+        pending.clear()
+        callback()
+        return
+    pending.add(callback)
+
+    def run():
+        if callback in pending:
+            pending.discard(callback)
+            callback()
+
+    transaction.on_commit(run, using=using)
+
+
+def commit_pending(callback, using=None) -> bool:
+    """Whether `callback` was registered with after_commit() in the current
+    transaction and has not run yet."""
+    connection = transaction.get_connection(using)
+    pending = _pending(connection)
+    if not connection.in_atomic_block:
+        # Whatever was registered ran or was rolled back with its transaction.
+        pending.clear()
+        return False
+    # After a rollback inside the same thread this can over-report, which
+    # only costs a reader its caching until the next commit.
+    return callback in pending
@@ -256,6 +256,19 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
 # Celery Beat Schedule for periodic tasks
 CELERY_BEAT_SCHEDULE = {
+    'drain-meta-webhook-stream': {
+        'task': 'meta_integration.drain_webhook_stream_task',
+        # Safety net for META_WEBHOOK_FAST_ACK: the webhook view triggers a drain
+        # on every burst, this only catches a lost trigger or entries left
+        # unacknowledged by a crashed worker. A no-op when the stream is empty.
+        'schedule': crontab(minute='*'),
+    },
+    'sweep-flow-lanes': {
+        'task': 'flows.sweep_flow_lanes_task',
+        # Only does anything with FLOW_PROCESSING_LANES > 0: restarts a
+        # per-contact lane whose worker died with messages still queued.
+        'schedule': crontab(minute='*'),
+    },
     'cleanup-idle-conversations': {
         'task': 'flows.cleanup_idle_conversations_task',
         # Runs every 5 minutes to check for idle sessions (5 min timeout, matching reference repo)
@@ -284,8 +297,9 @@ CELERY_BEAT_SCHEDULE = {
         # (crontab has no sub-minute resolution); the task itself is a cheap
         # no-op whenever nothing is currently live, so idle ticks cost nothing.
         # A single call covers every live fixture in one request, so this
-        # doesn't scale with fixture count -- only tighten below 1 minute via
-        # a dedicated long-running task if your plan's rate limit allows it.
+        # doesn't scale with fixture count. For sub-minute in-play prices run
+        # `manage.py run_live_odds_poller` as its own process; this task skips
+        # its ticks while the poller's heartbeat is alive.
         'schedule': crontab(minute='*'),
     },
     'dispatch-football-odds-v3': {
@@ -301,10 +315,93 @@ CELERY_BEAT_SCHEDULE = {
         # fetch-football-odds-v3 cycle's events have settled.
         'schedule': crontab(minute='7,22,37,52'),
     },
+    'prebuild-fixtures-pdfs': {
+        'task': 'football_data_app.prebuild_fixtures_pdfs',
+        # Safety net for the prebuild queued after pre-match odds refreshes
+        # (football_data_app/fixtures_pdf.py); also deletes expired PDFs.
+        # Builds nothing when the fixtures and odds have not changed.
+        'schedule': crontab(minute='*/15'),
+    },
+    'reconcile-wallet-ledger': {
+        'task': 'customer_data.reconcile_wallet_ledger',
+        # Checks every wallet's balance against its last snapshot plus the
+        # ledger entries since (customer_data/ledger.py), logs mismatches and
+        # snapshots the wallets that agree. Off-peak, once a day.
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'check-limit-counters': {
+        'task': 'customer_data.check_limit_counters',
+        # Compares the rolling 24h deposit/stake counters behind the daily
+        # limits with the transactions they count (customer_data/compliance.py)
+        # and drops any that drifted.
+        'schedule': crontab(minute=20),
+    },
+    'rollup-dashboard-metrics': {
+        'task': 'stats.rollup_metrics',
+        # Recomputes the recent hours of the dashboard counters
+        # (stats/rollups.py); the dashboard counts only the hours since the
+        # last run from the message tables.
+        'schedule': crontab(minute='*/15'),
+    },
+    'maintain-message-partitions': {
+        'task': 'conversations.maintain_message_partitions',
+        # Creates the coming months' message partitions and archives and
+        # drops the expired ones (conversations/partitions.py, archive.py).
+        # A no-op until the table has been partitioned.
+        'schedule': crontab(hour=4, minute=15),
+    },
 }
 
 # --- Application-Specific Settings ---
+# Fast-ack webhook ingestion: the webhook view only verifies the signature and
+# queues the body on a Redis stream; a Celery task writes events in batches of
+# META_WEBHOOK_BATCH_SIZE (see meta_integration/webhook_ingest.py).
+META_WEBHOOK_FAST_ACK = os.getenv('META_WEBHOOK_FAST_ACK', 'False') == 'True'
+META_WEBHOOK_BATCH_SIZE = int(os.getenv('META_WEBHOOK_BATCH_SIZE', '200'))
+# A queued webhook that keeps failing is given up on (logged as a 'failed'
+# WebhookEventLog) after this many deliveries.
+META_WEBHOOK_MAX_DELIVERIES = int(os.getenv('META_WEBHOOK_MAX_DELIVERIES', '5'))
+# Number of per-contact processing lanes for incoming messages (0 = off, every
+# message goes straight to the shared process_flow_for_message_task). A
+# contact's messages are processed serially, in order, on one lane; lanes run
+# in parallel (see flows/lanes.py).
+FLOW_PROCESSING_LANES = int(os.getenv('FLOW_PROCESSING_LANES', '0'))
+# Outgoing fan-out (meta_integration/sender.py): Messages per
+# send_whatsapp_messages_batch_task, and concurrent sends per batch over the
+# config's pooled keep-alive Graph API session.
+META_SEND_BATCH_SIZE = int(os.getenv('META_SEND_BATCH_SIZE', '100'))
+META_SEND_CONCURRENCY = int(os.getenv('META_SEND_CONCURRENCY', '16'))
+# A batch send failing with a 429, a 5xx or a connection error is re-queued
+# after META_SEND_RETRY_BACKOFF_SECONDS, doubled per attempt, up to
+# META_SEND_MAX_RETRIES times before the messages are marked failed.
+META_SEND_MAX_RETRIES = int(os.getenv('META_SEND_MAX_RETRIES', '4'))
+META_SEND_RETRY_BACKOFF_SECONDS = float(os.getenv('META_SEND_RETRY_BACKOFF_SECONDS', '15'))
+# Outbound token buckets (meta_integration/throttle.py): messages/second per
+# sending phone number and per (phone number, recipient) pair, with burst
+# sizes. Sends over the rate are deferred, not failed. 0 rate = no throttle.
+META_SEND_RATE_PER_SECOND = float(os.getenv('META_SEND_RATE_PER_SECOND', '80'))
+META_SEND_BURST = float(os.getenv('META_SEND_BURST', '80'))
+META_SEND_PAIR_RATE_PER_SECOND = float(os.getenv('META_SEND_PAIR_RATE_PER_SECOND', '0.17'))
+META_SEND_PAIR_BURST = float(os.getenv('META_SEND_PAIR_BURST', '10'))
+# WhatsApp Flow data_exchange endpoint (meta_integration/views.py): Meta fails
+# the screen if we do not answer within ~10s, so a handler still running after
+# WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS is answered with a "try again" screen
+# instead (bet placement excepted: it always runs to completion). Handlers run
+# on a pool of WHATSAPP_FLOW_HANDLER_WORKERS threads.
+WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS = float(os.getenv('WHATSAPP_FLOW_RESPONSE_BUDGET_SECONDS', '8'))
+WHATSAPP_FLOW_HANDLER_WORKERS = int(os.getenv('WHATSAPP_FLOW_HANDLER_WORKERS', '8'))
+# Tickets settled per process_ticket_settlement_batch_task: each batch is one
+# transaction with one aggregated wallet credit per user (football_data_app/settlement.py).
+SETTLEMENT_TICKET_BATCH_SIZE = int(os.getenv('SETTLEMENT_TICKET_BATCH_SIZE', '500'))
 CONVERSATION_EXPIRY_DAYS = int(os.getenv('CONVERSATION_EXPIRY_DAYS', '60'))
+# Once `manage.py partition_messages` has split conversations_message into
+# monthly partitions (conversations/partitions.py), a month older than
+# CONVERSATION_EXPIRY_DAYS is written to MESSAGE_ARCHIVE_DIR as gzipped JSONL
+# and dropped (conversations/archive.py). Keep the directory out of MEDIA_ROOT:
+# it holds raw message payloads. MESSAGE_PARTITION_MONTHS_AHEAD future months
+# are kept created.
+MESSAGE_ARCHIVE_DIR = os.getenv('MESSAGE_ARCHIVE_DIR', str(BASE_DIR / 'message_archive'))
+MESSAGE_PARTITION_MONTHS_AHEAD = int(os.getenv('MESSAGE_PARTITION_MONTHS_AHEAD', '2'))
 SESSION_IDLE_TIMEOUT_MINUTES = int(os.getenv('SESSION_IDLE_TIMEOUT_MINUTES', '5'))  # Flow session timeout
 # How long a WhatsApp contact stays logged in (ContactSession) with no activity
 # before they must log in again. Gates access to requires_login flows (betting,
@@ -422,6 +519,60 @@ API_FOOTBALL_V3_CURRENT_SEASON = int(os.environ.get('API_FOOTBALL_V3_CURRENT_SEA
 # - Pro: 30000 req/day, 100 req/min
 # - Ultra: 300000 req/day, 300 req/min
 API_FOOTBALL_MAX_REQUESTS_PER_MINUTE = int(os.environ.get('API_FOOTBALL_MAX_REQUESTS_PER_MINUTE', '300'))
+# Requests that may go out back to back before GCRA spacing applies; live odds
+# may use all of it, lower-priority lanes a share (football_data_app/rate_limiter.py).
+API_FOOTBALL_RATE_LIMIT_BURST = int(os.environ.get('API_FOOTBALL_RATE_LIMIT_BURST', '30'))
+# Longest a request waits inline for its slot; beyond this the task is
+# rescheduled with a countdown instead of holding the worker.
+API_FOOTBALL_RATE_LIMIT_MAX_INLINE_WAIT = float(os.environ.get('API_FOOTBALL_RATE_LIMIT_MAX_INLINE_WAIT', '1.0'))
+# Concurrent page fetches for paginated endpoints (each page still takes a rate limiter slot).
+API_FOOTBALL_PAGE_CONCURRENCY = int(os.environ.get('API_FOOTBALL_PAGE_CONCURRENCY', '4'))
+# Long-running live odds poller (football_data_app/live_odds_poller.py). Its
+# interval shortens from MAX to MIN seconds as more fixtures are live, never
+# uses more than BUDGET_SHARE of API_FOOTBALL_MAX_REQUESTS_PER_MINUTE, and
+# falls back to IDLE seconds when nothing is live.
+API_FOOTBALL_LIVE_ODDS_MIN_INTERVAL = float(os.environ.get('API_FOOTBALL_LIVE_ODDS_MIN_INTERVAL', '5'))
+API_FOOTBALL_LIVE_ODDS_MAX_INTERVAL = float(os.environ.get('API_FOOTBALL_LIVE_ODDS_MAX_INTERVAL', '30'))
+API_FOOTBALL_LIVE_ODDS_IDLE_INTERVAL = float(os.environ.get('API_FOOTBALL_LIVE_ODDS_IDLE_INTERVAL', '60'))
+API_FOOTBALL_LIVE_ODDS_BUDGET_SHARE = float(os.environ.get('API_FOOTBALL_LIVE_ODDS_BUDGET_SHARE', '0.25'))
+# Seconds between re-reads of which fixtures are live.
+API_FOOTBALL_LIVE_ODDS_FIXTURE_REFRESH = int(os.environ.get('API_FOOTBALL_LIVE_ODDS_FIXTURE_REFRESH', '60'))
+# Seconds a successful API-Football response is served from the Redis response
+# cache, per kind of data (0 = don't cache). 'leagues' covers reference data
+# (leagues, teams, standings, bookmakers); 'live' covers /odds/live and live=all.
+API_FOOTBALL_CACHE_TTLS = {
+    'leagues': int(os.environ.get('API_FOOTBALL_CACHE_TTL_LEAGUES', str(6 * 3600))),
+    'fixtures': int(os.environ.get('API_FOOTBALL_CACHE_TTL_FIXTURES', '120')),
+    'odds': int(os.environ.get('API_FOOTBALL_CACHE_TTL_ODDS', '300')),
+    'live': int(os.environ.get('API_FOOTBALL_CACHE_TTL_LIVE', '15')),
+}
+# Longest the bettable-fixture snapshot behind the browse screens is served
+# before a rebuild (football_data_app/fixture_snapshot.py); it is also dropped
+# on odds/status changes and expires at the next listed kickoff.
+BETTABLE_SNAPSHOT_TTL = int(os.environ.get('BETTABLE_SNAPSHOT_TTL', '60'))
+# Longest a fixture's cached market/outcome screens live
+# (football_data_app/market_screens.py); they are replaced as soon as the
+# fixture's odds version changes.
+MARKET_SCREENS_TTL = int(os.environ.get('MARKET_SCREENS_TTL', '60'))
+# Longest a player's cached ticket-placement context (user, wallet, betting
+# controls; customer_data/player_context.py) is served. It is also dropped
+# whenever the contact, profile or controls are saved.
+PLAYER_CONTEXT_TTL = int(os.environ.get('PLAYER_CONTEXT_TTL', '300'))
+# Closed hours each dashboard rollup run recomputes (stats/rollups.py), so
+# messages stored late still land in their hour.
+STATS_ROLLUP_RECOMPUTE_HOURS = int(os.environ.get('STATS_ROLLUP_RECOMPUTE_HOURS', '3'))
+# Fixtures PDF cache (football_data_app/fixtures_pdf.py): documents are named
+# after a hash of the fixtures and odds they show. A burst of odds refreshes
+# queues one prebuild of the all-leagues document for the next
+# FIXTURES_PDF_PREBUILD_DAYS_AHEAD days, PREBUILD_DELAY seconds later; PDFs
+# not served for RETENTION seconds are deleted.
+FIXTURES_PDF_PREBUILD_DAYS_AHEAD = int(os.environ.get('FIXTURES_PDF_PREBUILD_DAYS_AHEAD', '10'))
+FIXTURES_PDF_PREBUILD_DELAY_SECONDS = int(os.environ.get('FIXTURES_PDF_PREBUILD_DELAY_SECONDS', '60'))
+FIXTURES_PDF_RETENTION_SECONDS = int(os.environ.get('FIXTURES_PDF_RETENTION_SECONDS', '3600'))
+# Wallet ledger (customer_data/ledger.py): balance snapshots only cover
+# ledger entries older than this, so no transaction that could still commit
+# an entry before the snapshot's cut-off is open.
+LEDGER_SNAPSHOT_SETTLE_SECONDS = int(os.environ.get('LEDGER_SNAPSHOT_SETTLE_SECONDS', '300'))
 
 # API-Football v3 Operational Parameters
 API_FOOTBALL_V3_LEAD_TIME_DAYS = 7  # How many days ahead to fetch fixtures